@@ -0,0 +1,65 @@
+"""add_conversation_summaries_table
+
+Revision ID: c5d8e2f1a3b7
+Revises: a1b2c3d4e5f6
+Create Date: 2026-10-17 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5d8e2f1a3b7'
+down_revision = 'a1b2c3d4e5f6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('conversation_summaries',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('owner_id', sa.Integer(), nullable=False, comment='会话所属用户ID'),
+    sa.Column('peer_id', sa.Integer(), nullable=True, comment='对方用户ID（点对点会话）'),
+    sa.Column('room_id', sa.Integer(), nullable=True, comment='房间ID（房间会话）'),
+    sa.Column('last_message_id', sa.Integer(), nullable=True, comment='最后一条消息ID'),
+    sa.Column('last_message_at', sa.DateTime(), nullable=False, comment='最后一条消息时间'),
+    sa.Column('unread_count', sa.Integer(), nullable=False, server_default='0', comment='未读消息数'),
+    sa.Column('updated_at', sa.DateTime(), nullable=False, server_default=sa.text('now()'), comment='更新时间'),
+    sa.ForeignKeyConstraint(['owner_id'], ['users.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['peer_id'], ['users.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['room_id'], ['rooms.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['last_message_id'], ['messages.id'], ondelete='SET NULL'),
+    sa.PrimaryKeyConstraint('id'),
+    comment='会话摘要表'
+    )
+    op.create_index(op.f('ix_conversation_summaries_id'), 'conversation_summaries', ['id'], unique=False)
+    op.create_index(
+        'ix_conversation_summaries_owner_last',
+        'conversation_summaries',
+        ['owner_id', sa.text('last_message_at DESC'), sa.text('last_message_id DESC')],
+        unique=False,
+    )
+    op.create_index(
+        'uq_conversation_summaries_owner_peer',
+        'conversation_summaries',
+        ['owner_id', 'peer_id'],
+        unique=True,
+        postgresql_where=sa.text('room_id IS NULL'),
+    )
+    op.create_index(
+        'uq_conversation_summaries_owner_room',
+        'conversation_summaries',
+        ['owner_id', 'room_id'],
+        unique=True,
+        postgresql_where=sa.text('room_id IS NOT NULL'),
+    )
+    # 存量数据请执行 scripts/backfill_conversation_summaries.py 回填
+
+
+def downgrade() -> None:
+    op.drop_index('uq_conversation_summaries_owner_room', table_name='conversation_summaries')
+    op.drop_index('uq_conversation_summaries_owner_peer', table_name='conversation_summaries')
+    op.drop_index('ix_conversation_summaries_owner_last', table_name='conversation_summaries')
+    op.drop_index(op.f('ix_conversation_summaries_id'), table_name='conversation_summaries')
+    op.drop_table('conversation_summaries')
@@ -0,0 +1,42 @@
+"""add_message_history_composite_indexes
+
+Revision ID: d9e4f6a2b8c1
+Revises: c5d8e2f1a3b7
+Create Date: 2026-10-17 11:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'd9e4f6a2b8c1'
+down_revision = 'c5d8e2f1a3b7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # messages 表较大，使用 CONCURRENTLY 建索引避免锁表（需在事务外执行）
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_messages_sender_receiver_created',
+            'messages',
+            ['sender_id', 'receiver_id', 'created_at', 'id'],
+            unique=False,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.create_index(
+            'ix_messages_room_created',
+            'messages',
+            ['room_id', 'created_at', 'id'],
+            unique=False,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_messages_room_created', table_name='messages', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_messages_sender_receiver_created', table_name='messages', postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,45 @@
+"""add_file_blobs_content_addressed_storage
+
+Revision ID: e7a3c9d1f5b2
+Revises: d9e4f6a2b8c1
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7a3c9d1f5b2'
+down_revision = 'd9e4f6a2b8c1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('file_blobs',
+    sa.Column('content_hash', sa.String(length=64), nullable=False, comment='内容哈希（SHA-256 十六进制）'),
+    sa.Column('blob_path', sa.String(length=500), nullable=False, comment='存储路径（相对 uploads 目录）'),
+    sa.Column('file_size', sa.Integer(), nullable=False, comment='文件大小（字节）'),
+    sa.Column('ref_count', sa.Integer(), nullable=False, server_default='0', comment='引用该内容的 File 记录数，为 0 时可回收'),
+    sa.Column('created_at', sa.DateTime(), nullable=False, server_default=sa.text('now()'), comment='首次写入时间'),
+    sa.PrimaryKeyConstraint('content_hash'),
+    comment='文件内容块表'
+    )
+    op.create_index(
+        'ix_file_blobs_unreferenced',
+        'file_blobs',
+        ['content_hash'],
+        unique=False,
+        postgresql_where=sa.text('ref_count <= 0'),
+    )
+    op.add_column('files', sa.Column('content_hash', sa.String(length=64), nullable=True, comment='内容哈希（SHA-256，存于 file_blobs；旧文件为空）'))
+    op.create_index(op.f('ix_files_content_hash'), 'files', ['content_hash'], unique=False)
+    # 旧文件保持原路径、content_hash 为空，不参与去重与回收
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_files_content_hash'), table_name='files')
+    op.drop_column('files', 'content_hash')
+    op.drop_index('ix_file_blobs_unreferenced', table_name='file_blobs')
+    op.drop_table('file_blobs')
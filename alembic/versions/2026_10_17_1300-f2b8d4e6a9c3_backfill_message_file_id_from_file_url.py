@@ -0,0 +1,33 @@
+"""backfill_message_file_id_from_file_url
+
+Revision ID: f2b8d4e6a9c3
+Revises: e7a3c9d1f5b2
+Create Date: 2026-10-17 13:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2b8d4e6a9c3'
+down_revision = 'e7a3c9d1f5b2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # /files/download 鉴权改为按 messages.file_id 索引查询，回填只有 file_url 的存量消息
+    # file_url 形如 /api/v1/files/download?file_type=image&stored_filename=<uuid>.<ext>
+    op.execute("""
+        UPDATE messages AS m
+        SET file_id = f.id
+        FROM files AS f
+        WHERE m.file_id IS NULL
+          AND m.file_url LIKE '%stored_filename=%'
+          AND f.stored_filename = substring(m.file_url from 'stored_filename=([^&#]+)')
+    """)
+
+
+def downgrade() -> None:
+    # 回填的 file_id 与 file_url 指向同一文件，保留不回退
+    pass
@@ -0,0 +1,112 @@
+"""add_conversation_sequences
+
+Revision ID: a4c7e9b2d6f1
+Revises: f2b8d4e6a9c3
+Create Date: 2026-10-17 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4c7e9b2d6f1'
+down_revision = 'f2b8d4e6a9c3'
+branch_labels = None
+depends_on = None
+
+# 与 app/core/conversation_sequence.py 中 conversation_key() 一致
+CONVERSATION_KEY_SQL = """
+    CASE WHEN room_id IS NOT NULL THEN 'room:' || room_id
+         ELSE 'direct:' || least(sender_id, receiver_id) || ':' || greatest(sender_id, receiver_id)
+    END
+"""
+
+# 存量消息编号每批的消息数
+NUMBERING_BATCH_SIZE = 20000
+
+
+def upgrade() -> None:
+    op.add_column('messages', sa.Column('seq', sa.Integer(), nullable=True, comment='会话内序号（每个会话单调递增，由 conversation_sequences 分配）'))
+    op.create_table('conversation_sequences',
+    sa.Column('conversation_key', sa.String(length=64), nullable=False, comment='会话键：room:{房间ID} 或 direct:{较小用户ID}:{较大用户ID}'),
+    sa.Column('last_seq', sa.Integer(), nullable=False, server_default='0', comment='已分配的最大序号'),
+    sa.PrimaryKeyConstraint('conversation_key'),
+    comment='会话序号计数器表'
+    )
+    op.add_column('conversation_summaries', sa.Column('last_message_seq', sa.Integer(), nullable=False, server_default='0', comment='最后一条消息的会话序号'))
+    op.add_column('conversation_summaries', sa.Column('delivered_seq', sa.Integer(), nullable=False, server_default='0', comment='已送达游标：客户端确认收到的最大会话序号'))
+
+    # messages 表较大：存量消息按 id 区间分批编号，每批独立提交，避免整表改写期间长时间阻塞写入
+    with op.get_context().autocommit_block():
+        _number_messages_in_batches(op.get_bind())
+        # 升级前的消息视为已送达，避免首次重连补发全部历史
+        op.execute("""
+            UPDATE conversation_summaries AS cs
+            SET last_message_seq = m.seq, delivered_seq = m.seq
+            FROM messages AS m
+            WHERE m.id = cs.last_message_id AND m.seq IS NOT NULL
+        """)
+        # 使用 CONCURRENTLY 建索引避免锁表（需在事务外执行）
+        op.create_index(
+            'ix_messages_room_seq', 'messages', ['room_id', 'seq'], unique=False,
+            postgresql_concurrently=True, if_not_exists=True,
+        )
+        op.create_index(
+            'ix_messages_sender_receiver_seq', 'messages', ['sender_id', 'receiver_id', 'seq'], unique=False,
+            postgresql_concurrently=True, if_not_exists=True,
+        )
+
+
+def _number_messages_in_batches(connection) -> None:
+    """
+    按 id 升序分批为 seq 为空的消息编号（消息 id 与写入顺序一致）
+
+    每批一条语句：先在 conversation_sequences 中为批内各会话累加条数，再以累加后的 last_seq 倒推批内序号，
+    编号与计数器在同一事务内提交，批与批之间不持有 messages 的行锁
+    """
+    after_id = 0
+    while True:
+        upto_id = connection.execute(sa.text("""
+            SELECT max(id) FROM (
+                SELECT id FROM messages WHERE id > :after_id ORDER BY id LIMIT :batch_size
+            ) AS batch
+        """), {"after_id": after_id, "batch_size": NUMBERING_BATCH_SIZE}).scalar()
+        if upto_id is None:
+            break
+        connection.execute(sa.text(f"""
+            WITH batch AS (
+                SELECT id, conversation_key,
+                       row_number() OVER (PARTITION BY conversation_key ORDER BY id) AS rn,
+                       count(*) OVER (PARTITION BY conversation_key) AS total
+                FROM (
+                    SELECT id, {CONVERSATION_KEY_SQL} AS conversation_key
+                    FROM messages
+                    WHERE id > :after_id AND id <= :upto_id AND seq IS NULL
+                      AND (room_id IS NOT NULL OR receiver_id IS NOT NULL)
+                ) AS numbered
+            ),
+            counters AS (
+                INSERT INTO conversation_sequences (conversation_key, last_seq)
+                SELECT conversation_key, count(*) FROM batch GROUP BY conversation_key
+                ON CONFLICT (conversation_key)
+                DO UPDATE SET last_seq = conversation_sequences.last_seq + excluded.last_seq
+                RETURNING conversation_key, last_seq
+            )
+            UPDATE messages AS m
+            SET seq = c.last_seq - b.total + b.rn
+            FROM batch AS b
+            JOIN counters AS c ON c.conversation_key = b.conversation_key
+            WHERE m.id = b.id
+        """), {"after_id": after_id, "upto_id": upto_id})
+        after_id = upto_id
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_messages_sender_receiver_seq', table_name='messages', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_messages_room_seq', table_name='messages', postgresql_concurrently=True, if_exists=True)
+    op.drop_column('conversation_summaries', 'delivered_seq')
+    op.drop_column('conversation_summaries', 'last_message_seq')
+    op.drop_table('conversation_sequences')
+    op.drop_column('messages', 'seq')
@@ -0,0 +1,43 @@
+"""add_conversation_sync_seq
+
+Revision ID: b8e1d3f5a7c2
+Revises: a4c7e9b2d6f1
+Create Date: 2026-10-17 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b8e1d3f5a7c2'
+down_revision = 'a4c7e9b2d6f1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute("CREATE SEQUENCE IF NOT EXISTS conversation_summaries_sync_seq")
+    # 存量摘要行按默认值逐行取号
+    op.add_column('conversation_summaries', sa.Column(
+        'sync_seq', sa.BigInteger(), nullable=False,
+        server_default=sa.text("nextval('conversation_summaries_sync_seq')"),
+        comment='同步序号：摘要行每次变更取 conversation_summaries_sync_seq 新值'
+    ))
+    op.create_index('ix_conversation_summaries_owner_sync', 'conversation_summaries', ['owner_id', 'sync_seq'], unique=False)
+    # messages 表较大，使用 CONCURRENTLY 建索引避免锁表（需在事务外执行）
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_messages_sender_read_at', 'messages', ['sender_id', 'read_at', 'id'], unique=False,
+            postgresql_where=sa.text('read_at IS NOT NULL'),
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_messages_sender_read_at', table_name='messages', postgresql_concurrently=True, if_exists=True)
+    op.drop_index('ix_conversation_summaries_owner_sync', table_name='conversation_summaries')
+    op.drop_column('conversation_summaries', 'sync_seq')
+    op.execute("DROP SEQUENCE IF EXISTS conversation_summaries_sync_seq")
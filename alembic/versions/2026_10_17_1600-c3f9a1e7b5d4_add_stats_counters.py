@@ -0,0 +1,33 @@
+"""add_stats_counters
+
+Revision ID: c3f9a1e7b5d4
+Revises: b8e1d3f5a7c2
+Create Date: 2026-10-17 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3f9a1e7b5d4'
+down_revision = 'b8e1d3f5a7c2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # 计数值由应用启动后的首次对账填充（app/core/stats_rollup.py）
+    op.create_table('stats_counters',
+    sa.Column('name', sa.String(length=64), nullable=False, comment='计数器名称'),
+    sa.Column('scope', sa.BigInteger(), nullable=False, server_default='0', comment='计数范围：0 为全局，按用户统计时为用户ID，按天统计时为 YYYYMMDD'),
+    sa.Column('value', sa.BigInteger(), nullable=False, server_default='0', comment='计数值'),
+    sa.Column('updated_at', sa.DateTime(), nullable=False, server_default=sa.text('now()'), comment='最后一次累加或对账时间'),
+    sa.Column('reconciled_at', sa.DateTime(), nullable=True, comment='最后一次按源表重新统计的时间'),
+    sa.PrimaryKeyConstraint('name', 'scope'),
+    comment='统计计数器表'
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('stats_counters')
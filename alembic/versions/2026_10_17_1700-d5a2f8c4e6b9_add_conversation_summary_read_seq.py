@@ -0,0 +1,36 @@
+"""add_conversation_summary_read_seq
+
+Revision ID: d5a2f8c4e6b9
+Revises: c3f9a1e7b5d4
+Create Date: 2026-10-17 17:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd5a2f8c4e6b9'
+down_revision = 'c3f9a1e7b5d4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('conversation_summaries', sa.Column('read_seq', sa.Integer(), nullable=False, server_default='0', comment='已读水位：房间会话中该成员已读到的最大会话序号'))
+
+    # 房间会话：水位取最近 unread_count 条非自己发送的消息之前的那一条，使水位之后的未读数与现有 unread_count 一致
+    op.execute("""
+        UPDATE conversation_summaries AS cs
+        SET read_seq = coalesce((
+            SELECT m.seq FROM messages AS m
+            WHERE m.room_id = cs.room_id AND m.sender_id <> cs.owner_id AND m.seq IS NOT NULL
+            ORDER BY m.seq DESC
+            OFFSET cs.unread_count LIMIT 1
+        ), 0)
+        WHERE cs.room_id IS NOT NULL
+    """)
+
+
+def downgrade() -> None:
+    op.drop_column('conversation_summaries', 'read_seq')
@@ -13,14 +13,20 @@ from pydantic import BaseModel, Field
 
 from app.core.i18n import i18n, get_language_from_request
 from app.core.permissions import (
-    is_super_admin, is_admin, check_user_not_disabled,
+    is_super_admin, is_admin, check_user_not_disabled, get_super_admin_user,
     filter_visible_users, ROLE_ROOM_OWNER, ROLE_ADMIN, SUPER_ADMIN_USERNAME
 )
 from app.core.operation_log import log_operation
 from app.core.security import get_password_hash
 from app.db.session import get_db
+from app.db.read_replica import get_read_db, replica_router
 from app.db.models import User, Room, OperationLog, SystemConfig
 from app.api.v1.auth import get_current_user
+from app.core.user_cache import AuthUser, user_auth_cache
+from app.core.stats_rollup import (
+    stats_rollup, USERS_TOTAL, USERS_ONLINE, DEVICES_TOTAL, ROOMS_TOTAL, ROOMS_ACTIVE,
+    INVITATIONS_TOTAL, INVITATIONS_ACTIVE
+)
 from loguru import logger
 
 router = APIRouter()
@@ -80,7 +86,7 @@ class OperationLogResponse(BaseModel):
 
 # ==================== 权限检查 ====================
 
-def require_super_admin(current_user: User):
+def require_super_admin(current_user: AuthUser):
     """要求超级管理员权限"""
     if not is_super_admin(current_user):
         raise HTTPException(
@@ -100,65 +106,30 @@ class SystemStatsResponse(BaseModel):
     active_rooms: int = Field(..., description="活跃房间数")
     total_invitations: int = Field(..., description="总邀请码数")
     active_invitations: int = Field(..., description="有效邀请码数")
+    stale_after: datetime = Field(..., description="统计有效截止时间（UTC），之后应重新获取")
 
 
 @router.get("/stats", response_model=SystemStatsResponse)
 async def get_system_stats(
     request: Request,
-    current_user: User = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db)
+    current_user: AuthUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    read_db: AsyncSession = Depends(get_read_db)
 ):
     """
     获取系统统计信息（仅超级管理员）
     
-    返回用户数、设备数、房间数等统计信息
+    返回用户数、设备数、房间数等统计信息（读取统计计数器，见 app/core/stats_rollup.py；操作日志写入主库）
     """
     require_super_admin(current_user)
     lang = current_user.language or get_language_from_request(request)
     check_user_not_disabled(current_user, lang)
     
-    # 统计用户数
-    from sqlalchemy import func
-    total_users_result = await db.execute(select(func.count(User.id)))
-    total_users = total_users_result.scalar() or 0
-    
-    # 统计在线用户数
-    online_users_result = await db.execute(
-        select(func.count(User.id)).where(User.is_online == True)
+    # 读取统计计数器（写入时累加、定时对账）
+    counters = await stats_rollup.read(
+        read_db, USERS_TOTAL, USERS_ONLINE, DEVICES_TOTAL, ROOMS_TOTAL, ROOMS_ACTIVE,
+        INVITATIONS_TOTAL, INVITATIONS_ACTIVE
     )
-    online_users = online_users_result.scalar() or 0
-    
-    # 统计设备数
-    from app.db.models import UserDevice
-    total_devices_result = await db.execute(select(func.count(UserDevice.id)))
-    total_devices = total_devices_result.scalar() or 0
-    
-    # 统计房间数
-    from app.db.models import Room
-    total_rooms_result = await db.execute(select(func.count(Room.id)))
-    total_rooms = total_rooms_result.scalar() or 0
-    
-    # 统计活跃房间数
-    active_rooms_result = await db.execute(
-        select(func.count(Room.id)).where(Room.is_active == True)
-    )
-    active_rooms = active_rooms_result.scalar() or 0
-    
-    # 统计邀请码数
-    from app.db.models import InvitationCode
-    total_invitations_result = await db.execute(select(func.count(InvitationCode.id)))
-    total_invitations = total_invitations_result.scalar() or 0
-    
-    # 统计有效邀请码数
-    active_invitations_result = await db.execute(
-        select(func.count(InvitationCode.id)).where(
-            and_(
-                InvitationCode.is_active == True,
-                InvitationCode.is_revoked == False
-            )
-        )
-    )
-    active_invitations = active_invitations_result.scalar() or 0
     
     # 记录操作日志
     await log_operation(
@@ -171,20 +142,82 @@ async def get_system_stats(
     await db.commit()
     
     return SystemStatsResponse(
-        total_users=total_users,
-        online_users=online_users,
-        total_devices=total_devices,
-        total_rooms=total_rooms,
-        active_rooms=active_rooms,
-        total_invitations=total_invitations,
-        active_invitations=active_invitations
+        total_users=counters[USERS_TOTAL],
+        online_users=counters[USERS_ONLINE],
+        total_devices=counters[DEVICES_TOTAL],
+        total_rooms=counters[ROOMS_TOTAL],
+        active_rooms=counters[ROOMS_ACTIVE],
+        total_invitations=counters[INVITATIONS_TOTAL],
+        active_invitations=counters[INVITATIONS_ACTIVE],
+        stale_after=stats_rollup.stale_after(),
     )
 
 
+@router.get("/runtime-stats")
+async def get_runtime_stats(
+    request: Request,
+    current_user: AuthUser = Depends(get_current_user)
+):
+    """
+    获取本 worker 的运行时计数器（仅超级管理员）
+
+    包括在线状态写回的批次大小/延迟、在线状态推送的帧数、用户鉴权缓存与房间成员关系缓存命中率、消息批量写入的批次大小、
+    Socket.io 事件限流的放行/拒绝数、各编码（JSON / MessagePack）的连接数、
+    事件循环延迟、数据库连接池取连接耗时、只读副本路由与统计计数器写入/对账等，多 worker 部署时各 worker 独立统计
+    """
+    require_super_admin(current_user)
+    lang = current_user.language or get_language_from_request(request)
+    check_user_not_disabled(current_user, lang)
+
+    from app.core.presence_fanout import presence_fanout
+    from app.core.presence_writer import presence_writer
+    from app.core.message_ingest import message_ingest
+    from app.core.room_membership import room_membership
+    from app.core.event_rate_limit import event_rate_limiter
+    from app.core.socketio import sio
+    from app.core.runtime_metrics import loop_monitor
+    from app.db.session import pool_stats
+
+    return {
+        "presence_writer": presence_writer.stats(),
+        "presence_fanout": dict(presence_fanout.stats),
+        "user_auth_cache": user_auth_cache.stats(),
+        "room_membership": room_membership.stats(),
+        "message_ingest": message_ingest.stats(),
+        "event_rate_limit": event_rate_limiter.stats(),
+        "socketio_serializer": sio.serializer_stats(),
+        "event_loop": loop_monitor.stats(),
+        "db_pool": pool_stats(),
+        "read_replica": replica_router.stats(),
+        "stats_rollup": stats_rollup.stats(),
+    }
+
+
+@router.get("/db-pool-stats")
+async def get_db_pool_stats(
+    request: Request,
+    current_user: AuthUser = Depends(get_current_user)
+):
+    """
+    获取本 worker 的数据库连接池指标（仅超级管理员）
+
+    - size / checked_out / idle / overflow：常驻连接数、已借出、空闲、当前溢出连接数（实时值）
+    - wait：取连接耗时（排队等待空闲连接、新建溢出连接都计入），timeouts 为等待超时次数
+    - peak_checked_out / peak_overflow / overflow_checkouts：启动以来的借出峰值、溢出峰值与使用溢出连接的取连接次数
+    """
+    require_super_admin(current_user)
+    lang = current_user.language or get_language_from_request(request)
+    check_user_not_disabled(current_user, lang)
+
+    from app.db.session import pool_stats
+
+    return pool_stats()
+
+
 @router.get("/room-owners", response_model=List[UserResponse])
 async def list_room_owners(
     request: Request,
-    current_user: User = Depends(get_current_user),
+    current_user: AuthUser = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=100)
@@ -246,7 +279,7 @@ async def update_room_owner(
     owner_id: int,
     owner_data: RoomOwnerUpdate,
     request: Request,
-    current_user: User = Depends(get_current_user),
+    current_user: AuthUser = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """
@@ -291,6 +324,7 @@ async def update_room_owner(
         owner.is_disabled = owner_data.is_disabled
     
     await db.commit()
+    await user_auth_cache.invalidate(owner.id)
     await db.refresh(owner)
     
     # 记录操作日志
@@ -332,7 +366,7 @@ async def toggle_user_status(
     user_id: int,
     is_disabled: bool = Query(..., description="是否禁用（True=禁用，False=启用）"),
     request: Request = None,
-    current_user: User = Depends(get_current_user),
+    current_user: AuthUser = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """
@@ -372,6 +406,7 @@ async def toggle_user_status(
     
     user.is_disabled = is_disabled
     await db.commit()
+    await user_auth_cache.invalidate(user.id)
     await db.refresh(user)
     
     # 记录操作日志
@@ -406,7 +441,7 @@ async def toggle_user_status(
 async def disable_room(
     room_id: str,
     request: Request,
-    current_user: User = Depends(get_current_user),
+    current_user: AuthUser = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """
@@ -430,8 +465,11 @@ async def disable_room(
             detail=i18n.t("room.not_found", lang=lang)
         )
     
+    was_active = room.is_active
     room.is_active = False
     await db.commit()
+    if was_active:
+        stats_rollup.add(ROOMS_ACTIVE, -1)
     await db.refresh(room)
     
     # 记录操作日志
@@ -454,7 +492,7 @@ async def disable_room(
 async def delete_room(
     room_id: str,
     request: Request,
-    current_user: User = Depends(get_current_user),
+    current_user: AuthUser = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """
@@ -482,8 +520,16 @@ async def delete_room(
     room_id_for_log = room.id
     
     # 删除房间（级联删除参与者）
+    was_active = room.is_active
     await db.delete(room)
     await db.commit()
+    stats_rollup.add(ROOMS_TOTAL, -1)
+    if was_active:
+        stats_rollup.add(ROOMS_ACTIVE, -1)
+    
+    # 参与者的连接退出该聊天房间，并清除成员关系缓存
+    from app.core.socketio import close_chat_room
+    await close_chat_room(room_id_for_log)
     
     # 记录操作日志
     await log_operation(
@@ -501,8 +547,9 @@ async def delete_room(
 @router.get("/operation-logs", response_model=List[OperationLogResponse])
 async def list_operation_logs(
     request: Request,
-    current_user: User = Depends(get_current_user),
+    current_user: AuthUser = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
+    read_db: AsyncSession = Depends(get_read_db),
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
     operation_type: Optional[str] = Query(None, description="操作类型：create/read/update/delete"),
@@ -512,7 +559,7 @@ async def list_operation_logs(
     """
     获取操作日志列表（仅超级管理员）
     
-    记录所有增删改查操作的时间和IP
+    记录所有增删改查操作的时间和IP（从只读副本查询，查看记录本身写入主库）
     """
     require_super_admin(current_user)
     lang = current_user.language or get_language_from_request(request)
@@ -533,7 +580,7 @@ async def list_operation_logs(
         query = query.where(and_(*conditions))
     query = query.order_by(OperationLog.created_at.desc()).offset(skip).limit(limit)
     
-    result = await db.execute(query)
+    result = await read_db.execute(query)
     logs = result.scalars().all()
     
     # 记录操作日志（查看日志本身）
@@ -587,7 +634,7 @@ class SystemConfigListResponse(BaseModel):
 @router.get("/system-configs", response_model=SystemConfigListResponse)
 async def get_system_configs(
     request: Request,
-    current_user = Depends(is_super_admin),  # 移除类型注解以修复 FastAPI 错误
+    current_user: AuthUser = Depends(get_super_admin_user),
     db: AsyncSession = Depends(get_db)
 ):
     """
@@ -615,7 +662,7 @@ async def update_system_config(
     config_key: str,
     config_data: SystemConfigUpdate,
     request: Request,
-    current_user = Depends(is_super_admin),  # 移除类型注解以修复 FastAPI 错误
+    current_user: AuthUser = Depends(get_super_admin_user),
     db: AsyncSession = Depends(get_db)
 ):
     """
@@ -690,7 +737,7 @@ async def update_system_config(
 async def create_admin(
     admin_data: AdminCreate,
     request: Request,
-    current_user: User = Depends(get_current_user),
+    current_user: AuthUser = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """
@@ -743,6 +790,7 @@ async def create_admin(
     
     db.add(new_admin)
     await db.commit()
+    stats_rollup.add(USERS_TOTAL)
     await db.refresh(new_admin)
     
     # 记录操作日志
@@ -775,7 +823,7 @@ async def create_admin(
 @router.get("/admins", response_model=List[UserResponse])
 async def list_admins(
     request: Request,
-    current_user: User = Depends(get_current_user),
+    current_user: AuthUser = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=100)
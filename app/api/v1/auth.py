@@ -18,6 +18,8 @@ from app.core.security import (
     decode_token
 )
 from app.core.i18n import i18n, get_language_from_request
+from app.core.user_cache import AuthUser, user_auth_cache
+from app.core.stats_rollup import stats_rollup, USERS_TOTAL, USERS_ONLINE
 from app.db.session import get_db
 from app.db.models import User
 
@@ -75,14 +77,8 @@ class UserResponse(BaseModel):
 
 # ==================== 辅助函数 ====================
 
-async def get_current_user(
-    token: str = Depends(oauth2_scheme),
-    db: AsyncSession = Depends(get_db)
-) -> User:
-    """
-    获取当前登录用户
-    用于依赖注入，验证 JWT 令牌并返回用户对象
-    """
+def _user_id_from_token(token: str) -> int:
+    """验证 JWT 令牌并返回用户ID，无效时抛出 401"""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Invalid authentication credentials",
@@ -99,9 +95,39 @@ async def get_current_user(
     
     # sub是字符串，需要转换为整数
     try:
-        user_id = int(user_id_str)
+        return int(user_id_str)
     except (ValueError, TypeError):
         raise credentials_exception
+
+
+async def get_current_user(
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_db)
+) -> AuthUser:
+    """
+    获取当前登录用户
+    用于依赖注入，验证 JWT 令牌并返回鉴权用户快照（id/username/nickname/role/is_admin/is_disabled/language）
+    快照来自 user_auth_cache，命中时不查询数据库；需要修改用户或读取其他字段时使用 get_current_db_user
+    """
+    user = await user_auth_cache.load(db, _user_id_from_token(token))
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid authentication credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return user
+
+
+async def get_current_db_user(
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_db)
+) -> User:
+    """
+    获取当前登录用户的完整 User 对象（绑定到本次请求的数据库会话）
+    用于需要修改当前用户或读取鉴权快照以外字段的接口
+    """
+    user_id = _user_id_from_token(token)
     
     # 从数据库获取用户
     from sqlalchemy import select
@@ -109,7 +135,11 @@ async def get_current_user(
     user = result.scalar_one_or_none()
     
     if user is None:
-        raise credentials_exception
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid authentication credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
     
     return user
 
@@ -135,7 +165,7 @@ async def get_agreement(request: Request):
 @router.post("/agree-terms")
 async def agree_terms(
     request_data: AgreeTermsRequest,
-    current_user: User = Depends(get_current_user),
+    current_user: User = Depends(get_current_db_user),
     db: AsyncSession = Depends(get_db)
 ):
     """
@@ -271,6 +301,7 @@ async def register(
     
     db.add(new_user)
     await db.commit()
+    stats_rollup.add(USERS_TOTAL)
     await db.refresh(new_user)
     
     # 注册成功后自动登录：更新用户状态并生成 token
@@ -278,6 +309,7 @@ async def register(
     new_user.is_online = True
     new_user.updated_at = now_naive
     await db.commit()
+    stats_rollup.add(USERS_ONLINE)
     
     # 生成令牌（sub必须是字符串）
     from app.core.security import create_access_token, create_refresh_token
@@ -349,12 +381,15 @@ async def login(
     from datetime import timezone
     now_naive = datetime.now(timezone.utc).replace(tzinfo=None)
     
+    was_online = user.is_online
     user.last_active_at = now_naive
     user.is_online = True
     # 确保 updated_at 是 naive datetime（事件监听器也会处理，但这里显式设置更安全）
     user.updated_at = now_naive
     
     await db.commit()
+    if not was_online:
+        stats_rollup.add(USERS_ONLINE)
     await db.refresh(user)
     
     # 生成令牌（sub必须是字符串）
@@ -442,7 +477,7 @@ async def refresh_token(
 
 @router.get("/me", response_model=UserResponse)
 async def get_current_user_info(
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_db_user)
 ):
     """
     获取当前登录用户信息
@@ -494,7 +529,7 @@ async def confirm_scan(
 @router.post("/logout")
 async def logout(
     request: Request,
-    current_user: User = Depends(get_current_user),
+    current_user: User = Depends(get_current_db_user),
     db: AsyncSession = Depends(get_db)
 ):
     """
@@ -503,11 +538,14 @@ async def logout(
     更新用户在线状态
     """
     from datetime import datetime, timezone
+    was_online = current_user.is_online
     current_user.is_online = False
     now_naive = datetime.now(timezone.utc).replace(tzinfo=None)
     current_user.last_active_at = now_naive
     # 强制设置 updated_at 为 naive datetime
     current_user.updated_at = now_naive
     await db.commit()
+    if was_online:
+        stats_rollup.add(USERS_ONLINE, -1)
     
     return {"message": i18n.get("auth.logout.success", current_user.language)}
@@ -7,15 +7,21 @@ from datetime import datetime
 from typing import List, Optional
 from fastapi import APIRouter, Depends, HTTPException, status, Request, Query
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, and_, or_, desc
+from sqlalchemy import select, and_, or_, desc
 from sqlalchemy.orm import selectinload
 from pydantic import BaseModel, Field
 
 from app.core.i18n import i18n, get_language_from_request
 from app.core.permissions import check_user_not_disabled
 from app.db.session import get_db
-from app.db.models import User, Call, Room, RoomParticipant
+from app.db.read_replica import get_read_db
+from app.db.models import Call, Room, RoomParticipant
 from app.api.v1.auth import get_current_user
+from app.core.user_cache import AuthUser
+from app.core.stats_rollup import (
+    stats_rollup, call_deltas, CALL_COUNTERS,
+    CALLS_TOTAL, CALLS_VIDEO, CALLS_AUDIO, CALLS_CONNECTED, CALLS_MISSED, CALLS_DURATION
+)
 from loguru import logger
 
 router = APIRouter()
@@ -69,6 +75,7 @@ class CallStatsResponse(BaseModel):
     audio_calls: int
     connected_calls: int
     missed_calls: int
+    stale_after: datetime = Field(..., description="统计有效截止时间（UTC），之后应重新获取")
 
 
 # ==================== API 路由 ====================
@@ -77,7 +84,7 @@ class CallStatsResponse(BaseModel):
 async def create_call(
     call_data: CallCreate,
     request: Request,
-    current_user: User = Depends(get_current_user),
+    current_user: AuthUser = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """
@@ -114,6 +121,7 @@ async def create_call(
     
     db.add(new_call)
     await db.commit()
+    stats_rollup.record_call(new_call)
     await db.refresh(new_call)
     
     # 加载关联数据
@@ -140,7 +148,7 @@ async def create_call(
 @router.get("/", response_model=List[CallResponse])
 async def get_calls(
     request: Request,
-    current_user: User = Depends(get_current_user),
+    current_user: AuthUser = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
     skip: int = Query(0, ge=0, description="跳过记录数"),
     limit: int = Query(100, ge=1, le=100, description="返回记录数"),
@@ -208,7 +216,7 @@ async def get_calls(
 async def get_call(
     call_id: int,
     request: Request,
-    current_user: User = Depends(get_current_user),
+    current_user: AuthUser = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """
@@ -263,7 +271,7 @@ async def update_call(
     call_id: int,
     call_data: CallUpdate,
     request: Request,
-    current_user: User = Depends(get_current_user),
+    current_user: AuthUser = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """
@@ -292,7 +300,8 @@ async def update_call(
             detail=i18n.t("call.access_denied", lang=lang) or "无权访问此通话记录"
         )
     
-    # 更新字段
+    # 更新字段（统计计数器按更新前后的差值调整）
+    previous = call_deltas(call)
     if call_data.call_status is not None:
         call.call_status = call_data.call_status
     if call_data.start_time is not None:
@@ -307,6 +316,7 @@ async def update_call(
         call.duration = int(duration_delta.total_seconds())
     
     await db.commit()
+    stats_rollup.record_call(call, previous)
     await db.refresh(call)
     
     # 加载关联数据
@@ -333,72 +343,24 @@ async def update_call(
 @router.get("/stats/summary", response_model=CallStatsResponse)
 async def get_call_stats(
     request: Request,
-    current_user: User = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db)
+    current_user: AuthUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_read_db)
 ):
     """
-    获取通话统计信息
+    获取通话统计信息（读取统计计数器，见 app/core/stats_rollup.py）
     """
     lang = current_user.language or get_language_from_request(request)
     check_user_not_disabled(current_user, lang)
     
-    # 查询条件：用户是发起者或接收者
-    base_condition = or_(
-        Call.caller_id == current_user.id,
-        Call.callee_id == current_user.id
-    )
-    
-    # 总通话数
-    total_result = await db.execute(
-        select(func.count(Call.id)).where(base_condition)
-    )
-    total_calls = total_result.scalar() or 0
-    
-    # 视频通话数
-    video_result = await db.execute(
-        select(func.count(Call.id)).where(
-            and_(base_condition, Call.call_type == "video")
-        )
-    )
-    video_calls = video_result.scalar() or 0
-    
-    # 音频通话数
-    audio_result = await db.execute(
-        select(func.count(Call.id)).where(
-            and_(base_condition, Call.call_type == "audio")
-        )
-    )
-    audio_calls = audio_result.scalar() or 0
-    
-    # 已接通通话数
-    connected_result = await db.execute(
-        select(func.count(Call.id)).where(
-            and_(base_condition, Call.call_status == "connected")
-        )
-    )
-    connected_calls = connected_result.scalar() or 0
-    
-    # 未接通话数
-    missed_result = await db.execute(
-        select(func.count(Call.id)).where(
-            and_(base_condition, Call.call_status == "missed")
-        )
-    )
-    missed_calls = missed_result.scalar() or 0
-    
-    # 总时长
-    duration_result = await db.execute(
-        select(func.sum(Call.duration)).where(
-            and_(base_condition, Call.duration.isnot(None))
-        )
-    )
-    total_duration = int(duration_result.scalar() or 0)
+    # 读取按用户维护的统计计数器（用户是发起者或接收者的通话）
+    counters = await stats_rollup.read(db, *((name, current_user.id) for name in CALL_COUNTERS))
     
     return CallStatsResponse(
-        total_calls=total_calls,
-        total_duration=total_duration,
-        video_calls=video_calls,
-        audio_calls=audio_calls,
-        connected_calls=connected_calls,
-        missed_calls=missed_calls,
+        total_calls=counters[CALLS_TOTAL],
+        total_duration=counters[CALLS_DURATION],
+        video_calls=counters[CALLS_VIDEO],
+        audio_calls=counters[CALLS_AUDIO],
+        connected_calls=counters[CALLS_CONNECTED],
+        missed_calls=counters[CALLS_MISSED],
+        stale_after=stats_rollup.stale_after(),
     )
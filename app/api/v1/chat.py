@@ -3,20 +3,42 @@
 实现消息历史查询、会话管理等功能
 """
 
-from typing import List, Optional
-from datetime import datetime
+import base64
+from typing import List, Optional, Tuple
+from datetime import datetime, timedelta, timezone
 from fastapi import APIRouter, Depends, HTTPException, status, Request, Query
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, and_, or_, desc
+from sqlalchemy import select, func, and_, or_, desc, case, cast, null, literal_column, tuple_, union_all, Integer
 from sqlalchemy.orm import selectinload
 from pydantic import BaseModel, Field
 
 from app.core.i18n import i18n, get_language_from_request
 from app.core.permissions import is_super_admin, check_user_not_disabled
 from app.core.operation_log import log_operation
+from app.core.conversation_summary import record_message
+from app.core.read_receipts import mark_read_by_ids, mark_read_up_to
+from app.core.conversation_sequence import assign_sequences
+from app.core.stats_rollup import (
+    stats_rollup, day_scope, MESSAGES_TOTAL, MESSAGES_UNREAD, MESSAGES_P2P, MESSAGES_ROOM, MESSAGES_DAY
+)
+from app.core.file_access import resolve_message_file_id
+from app.core.room_membership import room_membership, chat_room_name
+from app.core.chat_sync import (
+    SyncCursor,
+    decode_sync_cursor,
+    encode_sync_cursor,
+    initial_sync_cursor,
+    load_message_delta,
+    load_read_receipt_delta,
+    load_summary_delta,
+    settled_position,
+)
+from app.core.config import settings
 from app.db.session import get_db
-from app.db.models import User, Message, Room, RoomParticipant, File
+from app.db.read_replica import get_read_db
+from app.db.models import User, Message, Room, RoomParticipant, File, ConversationSummary
 from app.api.v1.auth import get_current_user
+from app.core.user_cache import AuthUser
 from loguru import logger
 
 router = APIRouter()
@@ -35,6 +57,7 @@ class MessageResponse(BaseModel):
     is_read: bool
     read_at: Optional[datetime] = None
     created_at: datetime
+    seq: Optional[int] = None  # 会话内序号（重连补发与 ack_delivered 使用）
     sender_nickname: Optional[str] = None
     receiver_nickname: Optional[str] = None
     room_name: Optional[str] = None
@@ -52,10 +75,11 @@ class MessageResponse(BaseModel):
 
 class MessageListResponse(BaseModel):
     """消息列表响应模型"""
-    total: int
+    total: Optional[int] = Field(None, description="消息总数（游标模式下不统计，为空）")
     messages: List[MessageResponse]
     page: int
     limit: int
+    has_more: Optional[bool] = Field(None, description="游标模式下是否还有更多消息")
 
 
 class MessageSinceResponse(BaseModel):
@@ -75,14 +99,40 @@ class ConversationResponse(BaseModel):
     unread_count: int = 0
 
 
+class ConversationSyncDelta(ConversationResponse):
+    """会话摘要变化（批量同步）"""
+    last_message_id: Optional[int] = None
+    last_message_seq: int = 0
+
+
+class ReadReceiptDelta(BaseModel):
+    """已读回执变化（当前用户发送的消息被对方标记已读）"""
+    message_id: int
+    receiver_id: Optional[int] = None
+    room_id: Optional[int] = None
+    read_at: datetime
+
+
+class SyncResponse(BaseModel):
+    """批量增量同步响应模型"""
+    messages: List[MessageResponse] = Field(..., description="新消息（按消息ID升序）")
+    read_receipts: List[ReadReceiptDelta] = Field(..., description="自己发送的消息的已读变化")
+    conversations: List[ConversationSyncDelta] = Field(..., description="变化的会话摘要（最后消息、未读数）")
+    cursor: str = Field(..., description="下次同步使用的游标")
+    has_more: bool = Field(..., description="是否还有未返回的变化（为 true 时立即用新游标继续拉取）")
+
+
 class ConversationListResponse(BaseModel):
     """会话列表响应模型"""
     conversations: List[ConversationResponse]
+    next_cursor: Optional[str] = Field(None, description="下一页游标（为空表示没有更多会话）")
 
 
 class MarkReadRequest(BaseModel):
-    """标记已读请求模型"""
-    message_ids: List[int] = Field(..., description="消息ID列表")
+    """标记已读请求模型（message_ids 与 peer_id + up_to_id 二选一）"""
+    message_ids: List[int] = Field(default_factory=list, description="消息ID列表")
+    peer_id: Optional[int] = Field(None, description="水位模式：对方用户ID")
+    up_to_id: Optional[int] = Field(None, ge=1, description="水位模式：把对方发给自己、ID 不大于该值的消息全部标记已读")
 
 
 class SendMessageRequest(BaseModel):
@@ -96,6 +146,58 @@ class SendMessageRequest(BaseModel):
     file_name: Optional[str] = Field(None, max_length=255, description="文件名（与 file_url 配合）")
 
 
+# ==================== 查询构建 ====================
+
+def _pair_condition(user_a: int, user_b: int):
+    """两个用户之间的点对点消息（命中 ix_messages_sender_receiver_created）"""
+    return or_(
+        and_(Message.sender_id == user_a, Message.receiver_id == user_b),
+        and_(Message.sender_id == user_b, Message.receiver_id == user_a),
+    )
+
+
+def _message_keyset_query(
+    conditions: list,
+    cursor_id: int,
+    cursor_created_at: Optional[datetime],
+    ascending: bool,
+    limit: int,
+):
+    """
+    按 (created_at, id) 键集分页的消息查询，不使用 OFFSET
+
+    Args:
+        conditions: 过滤条件
+        cursor_id: 游标消息ID（before_id / after_id）
+        cursor_created_at: 游标消息的发送时间（消息不存在时为 None，退化为按 ID 比较）
+        ascending: True 取游标之后的消息（旧到新），False 取游标之前的消息（新到旧）
+        limit: 每页数量（多取一条用于判断 has_more）
+    """
+    if cursor_created_at is None:
+        cursor_condition = Message.id > cursor_id if ascending else Message.id < cursor_id
+    else:
+        sort_key = tuple_(Message.created_at, Message.id)
+        anchor = tuple_(cursor_created_at, cursor_id)
+        cursor_condition = sort_key > anchor if ascending else sort_key < anchor
+
+    if ascending:
+        order_by = (Message.created_at.asc(), Message.id.asc())
+    else:
+        order_by = (Message.created_at.desc(), Message.id.desc())
+
+    return (
+        select(Message)
+        .options(
+            selectinload(Message.sender),
+            selectinload(Message.receiver),
+            selectinload(Message.room)
+        )
+        .where(and_(*conditions, cursor_condition))
+        .order_by(*order_by)
+        .limit(limit + 1)
+    )
+
+
 # ==================== API 路由 ====================
 
 @router.get("/messages", response_model=MessageListResponse)
@@ -107,14 +209,23 @@ async def get_messages(
     room_id: Optional[int] = Query(None, description="筛选房间ID（房间群聊）"),
     start_time: Optional[datetime] = Query(None, description="开始时间"),
     end_time: Optional[datetime] = Query(None, description="结束时间"),
-    current_user: User = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db)
+    before_id: Optional[int] = Query(None, ge=1, description="游标模式：返回该消息之前的消息（新到旧）"),
+    after_id: Optional[int] = Query(None, ge=0, description="游标模式：返回该消息之后的消息（旧到新）"),
+    current_user: AuthUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    read_db: AsyncSession = Depends(get_read_db)
 ):
     """
     获取消息列表
     
     超级管理员：可以查看所有消息
     普通用户：只能查看与自己相关的消息（发送或接收）
+    
+    分页方式：
+    - 页码模式（默认）：page + limit，返回 total
+    - 游标模式：传 before_id 或 after_id，按 (created_at, id) 键集分页，不执行 OFFSET 与 count，返回 has_more
+    
+    消息从只读副本查询（见 get_read_db），操作日志写入主库
     """
     
     lang = current_user.language or get_language_from_request(request)
@@ -152,20 +263,12 @@ async def get_messages(
                     Message.receiver_id == user_id
                 )
             )
+        elif user_id == current_user.id:
+            # 普通用户查看自己：与自己相关的消息（已由权限条件限定）
+            pass
         else:
             # 普通用户只能查看与自己的对话
-            conditions.append(
-                and_(
-                    or_(
-                        Message.sender_id == user_id,
-                        Message.receiver_id == user_id
-                    ),
-                    or_(
-                        Message.sender_id == current_user.id,
-                        Message.receiver_id == current_user.id
-                    )
-                )
-            )
+            conditions.append(_pair_condition(current_user.id, user_id))
     
     if room_id:
         # 房间群聊消息
@@ -191,30 +294,51 @@ async def get_messages(
     if end_time:
         conditions.append(Message.created_at <= end_time)
     
-    # 查询总数
-    count_query = select(func.count(Message.id))
-    if conditions:
-        count_query = count_query.where(and_(*conditions))
-    
-    total_result = await db.execute(count_query)
-    total = total_result.scalar() or 0
-    
-    # 查询消息列表（带关联）
-    query = select(Message).options(
-        selectinload(Message.sender),
-        selectinload(Message.receiver),
-        selectinload(Message.room)
-    ).order_by(desc(Message.created_at))
-    
-    if conditions:
-        query = query.where(and_(*conditions))
-    
-    # 分页
-    offset = (page - 1) * limit
-    query = query.offset(offset).limit(limit)
+    if before_id is not None and after_id is not None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="不能同时指定 before_id 和 after_id"
+        )
     
-    result = await db.execute(query)
-    messages = result.scalars().all()
+    total = None
+    has_more = None
+    cursor_id = before_id if before_id is not None else after_id
+    if cursor_id is not None:
+        # 游标模式：按主键取游标消息的发送时间，再按 (created_at, id) 键集分页
+        cursor_created_at = (await read_db.execute(
+            select(Message.created_at).where(Message.id == cursor_id)
+        )).scalar_one_or_none()
+        result = await read_db.execute(
+            _message_keyset_query(conditions, cursor_id, cursor_created_at, after_id is not None, limit)
+        )
+        messages = result.scalars().all()
+        has_more = len(messages) > limit
+        messages = messages[:limit]
+    else:
+        # 查询总数
+        count_query = select(func.count(Message.id))
+        if conditions:
+            count_query = count_query.where(and_(*conditions))
+        
+        total_result = await read_db.execute(count_query)
+        total = total_result.scalar() or 0
+        
+        # 查询消息列表（带关联）
+        query = select(Message).options(
+            selectinload(Message.sender),
+            selectinload(Message.receiver),
+            selectinload(Message.room)
+        ).order_by(desc(Message.created_at), desc(Message.id))
+        
+        if conditions:
+            query = query.where(and_(*conditions))
+        
+        # 分页
+        offset = (page - 1) * limit
+        query = query.offset(offset).limit(limit)
+        
+        result = await read_db.execute(query)
+        messages = result.scalars().all()
     
     # 转换为响应模型
     message_list = []
@@ -229,6 +353,7 @@ async def get_messages(
             is_read=msg.is_read,
             read_at=msg.read_at,
             created_at=msg.created_at,
+            seq=msg.seq,
             sender_nickname=msg.sender.nickname if msg.sender else None,
             receiver_nickname=msg.receiver.nickname if msg.receiver else None,
             room_name=msg.room.room_name if msg.room else None,
@@ -255,7 +380,8 @@ async def get_messages(
         total=total,
         messages=message_list,
         page=page,
-        limit=limit
+        limit=limit,
+        has_more=has_more
     )
 
 
@@ -266,7 +392,7 @@ async def get_messages_since(
     user_id: Optional[int] = Query(None, description="点对点会话对方用户ID"),
     room_id: Optional[int] = Query(None, description="房间ID（群聊）"),
     limit: int = Query(200, ge=1, le=500, description="最多返回的消息数量"),
-    current_user: User = Depends(get_current_user),
+    current_user: AuthUser = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
 ):
     """
@@ -297,33 +423,13 @@ async def get_messages_since(
     if user_id:
         if is_super_admin(current_user):
             # 超级管理员：拉取与指定 user_id 相关的消息
-            conditions.append(
-                or_(
-                    and_(
-                        Message.sender_id == current_user.id,
-                        Message.receiver_id == user_id,
-                    ),
-                    and_(
-                        Message.sender_id == user_id,
-                        Message.receiver_id == current_user.id,
-                    ),
-                )
-            )
+            conditions.append(_pair_condition(current_user.id, user_id))
         else:
             # 普通用户：只能拉取“自己 <-> 对方”的消息
             conditions.append(
                 and_(
                     Message.room_id.is_(None),
-                    or_(
-                        and_(
-                            Message.sender_id == current_user.id,
-                            Message.receiver_id == user_id,
-                        ),
-                        and_(
-                            Message.sender_id == user_id,
-                            Message.receiver_id == current_user.id,
-                        ),
-                    ),
+                    _pair_condition(current_user.id, user_id),
                 )
             )
 
@@ -378,6 +484,7 @@ async def get_messages_since(
                 is_read=msg.is_read,
                 read_at=msg.read_at,
                 created_at=msg.created_at,
+                seq=msg.seq,
                 sender_nickname=msg.sender.nickname if msg.sender else None,
                 receiver_nickname=msg.receiver.nickname
                 if msg.receiver
@@ -396,11 +503,151 @@ async def get_messages_since(
     return MessageSinceResponse(messages=response_messages, last_message_id=max_id)
 
 
+@router.get("/sync", response_model=SyncResponse)
+async def sync_conversations(
+    request: Request,
+    cursor: Optional[str] = Query(None, description="上次同步返回的游标（不传表示首次同步）"),
+    current_user: AuthUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    批量增量同步（客户端从后台恢复时使用）
+
+    一个游标覆盖当前用户的全部会话，一次返回：
+    - messages：点对点与所在房间的新消息
+    - read_receipts：自己发送的消息的已读变化
+    - conversations：最后消息或未读数发生变化的会话摘要
+
+    三类变化各自按用户分页，单次数量受 SYNC_MAX_MESSAGES / SYNC_MAX_READ_RECEIPTS / SYNC_MAX_CONVERSATIONS 限制；
+    has_more 为 true 时用返回的 cursor 继续拉取。游标只越过早于 SYNC_SETTLE_SECONDS 的变化，
+    最近的变化可能在下次同步中重复出现，客户端按消息ID / 会话去重。
+
+    首次同步（不带游标）返回完整会话列表，消息与已读回执从当前开始，历史消息按会话通过 /chat/messages 加载。
+    """
+    lang = current_user.language or get_language_from_request(request)
+    check_user_not_disabled(current_user, lang)
+
+    now = datetime.utcnow()
+    if cursor:
+        try:
+            position = decode_sync_cursor(cursor)
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="无效的同步游标"
+            )
+    else:
+        position = await initial_sync_cursor(db, now)
+    settle_before = now - timedelta(seconds=settings.SYNC_SETTLE_SECONDS)
+
+    room_ids = await room_membership.rooms_of(db, current_user.id)
+    message_rows = await load_message_delta(
+        db, current_user.id, room_ids, position.message_id, settings.SYNC_MAX_MESSAGES
+    )
+    receipt_rows = await load_read_receipt_delta(
+        db, current_user.id, (position.read_at, position.read_id), settings.SYNC_MAX_READ_RECEIPTS
+    )
+    summary_rows = await load_summary_delta(
+        db, current_user.id, position.summary_seq, settings.SYNC_MAX_CONVERSATIONS
+    )
+
+    # 每类变化多取一条判断是否还有更多；只有本页全部已稳定时才提示继续拉取，否则客户端稍后再同步
+    has_more = False
+    message_more = len(message_rows) > settings.SYNC_MAX_MESSAGES
+    message_rows = message_rows[:settings.SYNC_MAX_MESSAGES]
+    message_id, settled = settled_position(
+        message_rows, lambda row: row[0].id, lambda row: row[0].created_at, position.message_id, settle_before
+    )
+    has_more |= message_more and settled
+
+    receipt_more = len(receipt_rows) > settings.SYNC_MAX_READ_RECEIPTS
+    receipt_rows = receipt_rows[:settings.SYNC_MAX_READ_RECEIPTS]
+    read_position, settled = settled_position(
+        receipt_rows, lambda row: (row.read_at, row.id), lambda row: row.read_at,
+        (position.read_at, position.read_id), settle_before
+    )
+    has_more |= receipt_more and settled
+
+    summary_more = len(summary_rows) > settings.SYNC_MAX_CONVERSATIONS
+    summary_rows = summary_rows[:settings.SYNC_MAX_CONVERSATIONS]
+    summary_seq, settled = settled_position(
+        summary_rows, lambda row: row.sync_seq, lambda row: row.updated_at, position.summary_seq, settle_before
+    )
+    has_more |= summary_more and settled
+
+    messages = [
+        MessageResponse(
+            id=msg.id,
+            sender_id=msg.sender_id,
+            receiver_id=msg.receiver_id,
+            room_id=msg.room_id,
+            message=msg.message,
+            message_type=msg.message_type,
+            is_read=msg.is_read,
+            read_at=msg.read_at,
+            created_at=msg.created_at,
+            seq=msg.seq,
+            sender_nickname=sender_nickname,
+            receiver_nickname=receiver_nickname,
+            room_name=room_name,
+            file_id=msg.file_id,
+            file_url=msg.file_url,
+            file_name=msg.file_name,
+            file_size=msg.file_size,
+            duration=msg.duration,
+            extra_data=msg.extra_data,
+        )
+        for msg, sender_nickname, receiver_nickname, room_name in message_rows
+    ]
+    read_receipts = [
+        ReadReceiptDelta(message_id=row.id, receiver_id=row.receiver_id, room_id=row.room_id, read_at=row.read_at)
+        for row in receipt_rows
+    ]
+    conversations = []
+    for row in summary_rows:
+        if row.room_id is not None:
+            conversations.append(ConversationSyncDelta(
+                room_id=row.room_id,
+                room_name=row.room_name or f"房间{row.room_id}",
+                last_message=row.last_message,
+                last_message_time=row.last_message_time,
+                unread_count=row.unread_count or 0,
+                last_message_id=row.last_message_id,
+                last_message_seq=row.last_message_seq or 0,
+            ))
+        else:
+            conversations.append(ConversationSyncDelta(
+                user_id=row.user_id,
+                user_nickname=row.nickname or f"用户{row.user_id}",
+                last_message=row.last_message,
+                last_message_time=row.last_message_time,
+                unread_count=row.unread_count or 0,
+                last_message_id=row.last_message_id,
+                last_message_seq=row.last_message_seq or 0,
+            ))
+
+    next_cursor = encode_sync_cursor(SyncCursor(
+        message_id=message_id,
+        summary_seq=summary_seq,
+        read_at=read_position[0],
+        read_id=read_position[1],
+    ))
+
+    # 不记录操作日志，作为高频同步接口保持轻量
+    return SyncResponse(
+        messages=messages,
+        read_receipts=read_receipts,
+        conversations=conversations,
+        cursor=next_cursor,
+        has_more=has_more,
+    )
+
+
 @router.get("/messages/{message_id}", response_model=MessageResponse)
 async def get_message(
     message_id: int,
     request: Request,
-    current_user: User = Depends(get_current_user),
+    current_user: AuthUser = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """
@@ -440,6 +687,7 @@ async def get_message(
         is_read=message.is_read,
         read_at=message.read_at,
         created_at=message.created_at,
+        seq=message.seq,
         sender_nickname=message.sender.nickname if message.sender else None,
         receiver_nickname=message.receiver.nickname if message.receiver else None,
         room_name=message.room.room_name if message.room else None,
@@ -456,7 +704,7 @@ async def get_message(
 async def send_message(
     request_data: SendMessageRequest,
     request: Request,
-    current_user: User = Depends(get_current_user),
+    current_user: AuthUser = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """
@@ -525,16 +773,7 @@ async def send_message(
         
         # 超级管理员可以发送到任意房间，普通用户需要验证参与者身份
         if not is_super_admin(current_user):
-            participant_result = await db.execute(
-                select(RoomParticipant).where(
-                    RoomParticipant.room_id == request_data.room_id,
-                    RoomParticipant.user_id == current_user.id,
-                    RoomParticipant.is_active == True
-                )
-            )
-            participant = participant_result.scalar_one_or_none()
-            
-            if not participant:
+            if not await room_membership.is_member(db, request_data.room_id, current_user.id):
                 raise HTTPException(
                     status_code=status.HTTP_403_FORBIDDEN,
                     detail=i18n.get("room.not_participant", lang)
@@ -556,6 +795,9 @@ async def send_message(
         message_content = message_content or request_data.file_url
 
     file_id_val = file_info.id if file_info else None
+    if file_id_val is None and request_data.file_url:
+        # 关联 files 表，下载鉴权按 messages.file_id 索引查询
+        file_id_val = await resolve_message_file_id(db, request_data.file_url, current_user.id)
     file_url_val = file_info.file_url if file_info else (request_data.file_url or None)
     file_name_val = file_info.filename if file_info else (request_data.file_name or None)
     file_size_val = file_info.file_size if file_info else None
@@ -576,8 +818,13 @@ async def send_message(
         duration=duration_val,
     )
     
+    # 同一事务内分配会话序号并更新会话摘要
+    await assign_sequences(db, [db_message])
     db.add(db_message)
+    await db.flush()
+    await record_message(db, db_message)
     await db.commit()
+    stats_rollup.record_messages([db_message])
     await db.refresh(db_message)
     
     # 加载关联数据
@@ -585,14 +832,15 @@ async def send_message(
     
     # 通过 Socket.io 实时推送消息
     try:
-        from app.core.socketio import sio, connected_users
+        from app.core.socketio import sio, is_user_online
         from datetime import timezone as tz
         
         if request_data.receiver_id:
             # 点对点消息：发送给接收者
-            if request_data.receiver_id in connected_users:
+            if await is_user_online(request_data.receiver_id):
                 message_data = {
                     'id': db_message.id,
+                    'seq': db_message.seq,
                     'sender_id': current_user.id,
                     'sender_nickname': current_user.nickname,
                     'receiver_id': request_data.receiver_id,
@@ -622,48 +870,39 @@ async def send_message(
 
                 await sio.emit('message', message_data, room=f"user_{request_data.receiver_id}")
         elif request_data.room_id:
-            # 房间群聊：发送给所有参与者
-            participants_result = await db.execute(
-                select(RoomParticipant).where(
-                    RoomParticipant.room_id == request_data.room_id,
-                    RoomParticipant.is_active == True
-                )
-            )
-            participants = participants_result.scalars().all()
-            
-            for participant in participants:
-                if participant.user_id in connected_users:
-                    message_data = {
-                        'id': db_message.id,
-                        'sender_id': current_user.id,
-                        'sender_nickname': current_user.nickname,
-                        'room_id': request_data.room_id,
-                        'room_name': room.room_name,
-                        'message': message_content,
-                        'message_type': request_data.message_type,
-                        'is_read': False,
-                        'created_at': now.isoformat()
-                    }
-                    if file_info:
-                        message_data['file_id'] = file_info.id
-                        message_data['file_url'] = file_info.file_url
-                        message_data['file_name'] = file_info.filename
-                        message_data['file_size'] = file_info.file_size
-                        if file_info.duration:
-                            message_data['duration'] = file_info.duration
-                        if file_info.width and file_info.height:
-                            message_data['width'] = file_info.width
-                            message_data['height'] = file_info.height
-                    elif file_url_val:
-                        message_data['file_url'] = file_url_val
-                        if file_name_val:
-                            message_data['file_name'] = file_name_val
-                        if file_size_val is not None:
-                            message_data['file_size'] = file_size_val
-                        if duration_val is not None:
-                            message_data['duration'] = duration_val
-
-                    await sio.emit('message', message_data, room=f"user_{participant.user_id}")
+            # 房间群聊：载荷构建一次，对聊天房间 emit 一次（参与者的连接已加入该 Socket.io 房间，离线成员不在房间内）
+            message_data = {
+                'id': db_message.id,
+                'seq': db_message.seq,
+                'sender_id': current_user.id,
+                'sender_nickname': current_user.nickname,
+                'room_id': request_data.room_id,
+                'room_name': room.room_name,
+                'message': message_content,
+                'message_type': request_data.message_type,
+                'is_read': False,
+                'created_at': now.isoformat()
+            }
+            if file_info:
+                message_data['file_id'] = file_info.id
+                message_data['file_url'] = file_info.file_url
+                message_data['file_name'] = file_info.filename
+                message_data['file_size'] = file_info.file_size
+                if file_info.duration:
+                    message_data['duration'] = file_info.duration
+                if file_info.width and file_info.height:
+                    message_data['width'] = file_info.width
+                    message_data['height'] = file_info.height
+            elif file_url_val:
+                message_data['file_url'] = file_url_val
+                if file_name_val:
+                    message_data['file_name'] = file_name_val
+                if file_size_val is not None:
+                    message_data['file_size'] = file_size_val
+                if duration_val is not None:
+                    message_data['duration'] = duration_val
+
+            await sio.emit('message', message_data, room=chat_room_name(request_data.room_id))
     except Exception as e:
         logger.warning(f"Socket.io 推送消息失败（消息已保存到数据库）: {e}")
     
@@ -693,6 +932,7 @@ async def send_message(
         is_read=db_message.is_read,
         read_at=db_message.read_at,
         created_at=db_message.created_at,
+        seq=db_message.seq,
         sender_nickname=db_message.sender.nickname if db_message.sender else None,
         receiver_nickname=db_message.receiver.nickname if db_message.receiver else None,
         room_name=db_message.room.room_name if db_message.room else None,
@@ -710,7 +950,7 @@ async def send_message(
 async def mark_messages_read(
     request_data: MarkReadRequest,
     request: Request,
-    current_user: User = Depends(get_current_user),
+    current_user: AuthUser = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """
@@ -723,36 +963,39 @@ async def mark_messages_read(
     lang = current_user.language or get_language_from_request(request)
     check_user_not_disabled(current_user, lang)
     
-    # 批量更新消息已读状态
+    watermark = request_data.peer_id is not None and request_data.up_to_id is not None
+    if not request_data.message_ids and not watermark:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="必须指定 message_ids 或 peer_id + up_to_id"
+        )
+    
     # 确保使用不带时区的 datetime（数据库字段是 TIMESTAMP WITHOUT TIME ZONE）
-    # 使用 datetime.utcnow() 直接获取不带时区的 UTC 时间，避免时区转换问题
-    now = datetime.utcnow()  # 直接返回 naive datetime，无时区信息
+    now = datetime.utcnow()
     
-    # 权限控制：普通用户只能标记接收者是自己的消息
-    if is_super_admin(current_user):
-        # 超级管理员可以标记任意消息
-        result = await db.execute(
-            select(Message).where(Message.id.in_(request_data.message_ids))
-        )
+    # 一条 UPDATE ... RETURNING 按发送者分组，同一事务内扣减会话未读数
+    # 权限控制：普通用户只能标记接收者是自己的消息，超级管理员可以标记任意消息（水位模式只针对自己）
+    admin = is_super_admin(current_user)
+    if watermark:
+        group = await mark_read_up_to(db, current_user.id, request_data.peer_id, request_data.up_to_id, now)
+        groups = [group] if group is not None else []
     else:
-        # 普通用户只能标记接收者是自己的消息
-        result = await db.execute(
-            select(Message).where(
-                Message.id.in_(request_data.message_ids),
-                Message.receiver_id == current_user.id
-            )
+        groups = await mark_read_by_ids(
+            db, current_user.id, request_data.message_ids, now, any_receiver=admin
         )
-    
-    messages = result.scalars().all()
-    
-    updated_count = 0
-    for msg in messages:
-        if not msg.is_read:
-            msg.is_read = True
-            msg.read_at = now  # 使用不带时区的 datetime
-            updated_count += 1
-    
     await db.commit()
+    updated_count = sum(group.count for group in groups)
+    stats_rollup.record_messages_read(updated_count)
+    
+    # 通知发送者（每个发送者一帧 messages_read）
+    try:
+        from app.core.socketio import emit_read_receipts
+        await emit_read_receipts(
+            groups, current_user.id, now.replace(tzinfo=timezone.utc).isoformat(),
+            request_data.up_to_id if watermark else None
+        )
+    except Exception as e:
+        logger.warning(f"推送已读回执失败: {e}")
     
     # 记录操作日志
     await log_operation(
@@ -760,7 +1003,12 @@ async def mark_messages_read(
         user=current_user,
         operation_type="update",
         resource_type="messages",
-        operation_detail={"updated_count": updated_count, "message_ids": request_data.message_ids},
+        operation_detail={
+            "updated_count": updated_count,
+            "message_ids": request_data.message_ids,
+            "peer_id": request_data.peer_id,
+            "up_to_id": request_data.up_to_id,
+        },
         request=request
     )
     await db.commit()
@@ -768,217 +1016,216 @@ async def mark_messages_read(
     return {"message": f"已标记 {updated_count} 条消息为已读", "updated_count": updated_count}
 
 
+def _encode_conversation_cursor(last_message_time: datetime, last_message_id: int) -> str:
+    """将会话排序键编码为不透明游标"""
+    raw = f"{last_message_time.isoformat()}|{last_message_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def _decode_conversation_cursor(cursor: str) -> Tuple[datetime, int]:
+    """解析会话游标，格式无效时抛出 ValueError"""
+    raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+    time_part, id_part = raw.rsplit("|", 1)
+    return datetime.fromisoformat(time_part), int(id_part)
+
+
+def _conversation_list_query(
+    current_user_id: int,
+    cursor: Optional[Tuple[datetime, int]] = None,
+    limit: Optional[int] = None,
+):
+    """
+    从消息表实时构建全部会话的列表查询（单条 SQL，仅超级管理员使用；普通用户读取会话摘要表）
+
+    点对点会话按 (较小用户ID, 较大用户ID) 分区、房间会话按 room_id 分区，
+    用窗口函数一次扫描同时取出每个会话的最后一条消息（row_number = 1）与未读数（count FILTER），
+    再 UNION 后关联 users / rooms 取显示名称，按 (最后消息时间, 最后消息ID) 倒序做键集分页
+
+    点对点未读数统计较大用户ID作为接收者的消息，房间未读数为 0
+    """
+    # ---------- 点对点会话 ----------
+    user1 = func.least(Message.sender_id, Message.receiver_id)
+    user2 = func.greatest(Message.sender_id, Message.receiver_id)
+
+    p2p_ranked = select(
+        user1.label("user1_id"),
+        user2.label("user2_id"),
+        Message.id.label("message_id"),
+        Message.message,
+        Message.created_at,
+        func.row_number().over(
+            partition_by=(user1, user2),
+            order_by=(Message.created_at.desc(), Message.id.desc()),
+        ).label("rn"),
+        func.count(Message.id).filter(
+            and_(Message.receiver_id == user2, Message.is_read == False)
+        ).over(partition_by=(user1, user2)).label("unread_count"),
+    ).where(Message.room_id.is_(None), Message.receiver_id.isnot(None)).subquery("p2p_ranked")
+
+    # 对方用户：当前用户不在会话中（超级管理员查看他人会话）时显示较大用户ID
+    peer_id = case(
+        (p2p_ranked.c.user1_id == current_user_id, p2p_ranked.c.user2_id),
+        (p2p_ranked.c.user2_id == current_user_id, p2p_ranked.c.user1_id),
+        else_=p2p_ranked.c.user2_id,
+    )
+    p2p = select(
+        peer_id.label("user_id"),
+        cast(null(), Integer).label("room_id"),
+        p2p_ranked.c.message.label("last_message"),
+        p2p_ranked.c.created_at.label("last_message_time"),
+        p2p_ranked.c.message_id.label("last_message_id"),
+        p2p_ranked.c.unread_count,
+    ).where(p2p_ranked.c.rn == 1)
+
+    # ---------- 房间会话 ----------
+    room_ranked = select(
+        Message.room_id,
+        Message.id.label("message_id"),
+        Message.message,
+        Message.created_at,
+        func.row_number().over(
+            partition_by=Message.room_id,
+            order_by=(Message.created_at.desc(), Message.id.desc()),
+        ).label("rn"),
+        literal_column("0").label("unread_count"),
+    ).where(Message.room_id.isnot(None)).subquery("room_ranked")
+
+    rooms = select(
+        cast(null(), Integer).label("user_id"),
+        room_ranked.c.room_id,
+        room_ranked.c.message.label("last_message"),
+        room_ranked.c.created_at.label("last_message_time"),
+        room_ranked.c.message_id.label("last_message_id"),
+        room_ranked.c.unread_count,
+    ).where(room_ranked.c.rn == 1)
+
+    # ---------- 合并、取名称、键集分页 ----------
+    conversations = union_all(p2p, rooms).subquery("conversations")
+    query = (
+        select(conversations, User.nickname, Room.room_name)
+        .outerjoin(User, User.id == conversations.c.user_id)
+        .outerjoin(Room, Room.id == conversations.c.room_id)
+        # 跳过不存在的房间
+        .where(or_(conversations.c.room_id.is_(None), Room.id.isnot(None)))
+        .order_by(
+            conversations.c.last_message_time.desc(),
+            conversations.c.last_message_id.desc(),
+        )
+    )
+    if cursor:
+        query = query.where(
+            tuple_(conversations.c.last_message_time, conversations.c.last_message_id)
+            < tuple_(cursor[0], cursor[1])
+        )
+    if limit:
+        # 多取一条用于判断是否还有下一页
+        query = query.limit(limit + 1)
+    return query
+
+
+def _conversation_summary_query(
+    owner_id: int,
+    cursor: Optional[Tuple[datetime, int]] = None,
+    limit: Optional[int] = None,
+):
+    """
+    从会话摘要表读取用户的会话列表
+
+    走 (owner_id, last_message_at DESC, last_message_id DESC) 索引，
+    最后消息内容、对方昵称与房间名称均按主键关联取得；返回列与 _conversation_list_query 一致
+    """
+    query = (
+        select(
+            ConversationSummary.peer_id.label("user_id"),
+            ConversationSummary.room_id,
+            Message.message.label("last_message"),
+            ConversationSummary.last_message_at.label("last_message_time"),
+            ConversationSummary.last_message_id,
+            ConversationSummary.unread_count,
+            User.nickname,
+            Room.room_name,
+        )
+        .outerjoin(Message, Message.id == ConversationSummary.last_message_id)
+        .outerjoin(User, User.id == ConversationSummary.peer_id)
+        .outerjoin(Room, Room.id == ConversationSummary.room_id)
+        .where(ConversationSummary.owner_id == owner_id)
+        .order_by(
+            ConversationSummary.last_message_at.desc(),
+            ConversationSummary.last_message_id.desc(),
+        )
+    )
+    if cursor:
+        query = query.where(
+            tuple_(ConversationSummary.last_message_at, ConversationSummary.last_message_id)
+            < tuple_(cursor[0], cursor[1])
+        )
+    if limit:
+        # 多取一条用于判断是否还有下一页
+        query = query.limit(limit + 1)
+    return query
+
+
 @router.get("/conversations", response_model=ConversationListResponse)
 async def get_conversations(
     request: Request,
-    current_user: User = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db)
+    limit: Optional[int] = Query(None, ge=1, le=500, description="每页会话数（不传则返回全部会话）"),
+    cursor: Optional[str] = Query(None, description="分页游标（上一页返回的 next_cursor）"),
+    current_user: AuthUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    read_db: AsyncSession = Depends(get_read_db)
 ):
     """
-    获取会话列表
+    获取会话列表（按最后消息时间倒序，支持游标分页）
     
-    超级管理员：返回所有会话
-    普通用户：返回与自己相关的会话
+    超级管理员：返回所有会话（从消息表实时聚合）
+    普通用户：返回与自己相关的会话（读取会话摘要表）
+    会话从只读副本查询（见 get_read_db），操作日志写入主库
     """
     
     lang = current_user.language or get_language_from_request(request)
     check_user_not_disabled(current_user, lang)
     
-    conversations = []
-    
-    # 获取点对点会话（按用户分组）
-    # 权限控制：普通用户只能看到与自己相关的会话
-    if is_super_admin(current_user):
-        # 超级管理员：查询所有点对点会话
-        user_pairs_query = select(
-            Message.sender_id,
-            Message.receiver_id,
-            func.max(Message.created_at).label('last_time')
-        ).where(
-            Message.room_id.is_(None)
-        ).group_by(
-            Message.sender_id,
-            Message.receiver_id
-        )
-    else:
-        # 普通用户：只查询与自己相关的会话
-        user_pairs_query = select(
-            Message.sender_id,
-            Message.receiver_id,
-            func.max(Message.created_at).label('last_time')
-        ).where(
-            and_(
-                Message.room_id.is_(None),
-                or_(
-                    Message.sender_id == current_user.id,
-                    Message.receiver_id == current_user.id
-                )
-            )
-        ).group_by(
-            Message.sender_id,
-            Message.receiver_id
-        )
-    
-    user_pairs_result = await db.execute(user_pairs_query)
-    user_pairs = user_pairs_result.all()
-    
-    # 处理用户对，去重并获取最后一条消息
-    user_conversations = {}
-    for sender_id, receiver_id, last_time in user_pairs:
-        if receiver_id:
-            # 创建会话键（较小的ID在前，确保唯一）
-            key = tuple(sorted([sender_id, receiver_id]))
-            if key not in user_conversations or user_conversations[key][2] < last_time:
-                user_conversations[key] = (sender_id, receiver_id, last_time)
-    
-    # 获取每个会话的最后一条消息和未读数
-    for (user1_id, user2_id), (sender_id, receiver_id, last_time) in user_conversations.items():
-        # 确定当前用户在这个会话中的对方用户ID
-        if user1_id == current_user.id:
-            other_user_id = user2_id
-        elif user2_id == current_user.id:
-            other_user_id = user1_id
-        else:
-            # 超级管理员查看其他用户的会话时，显示 user2_id
-            other_user_id = user2_id
-        
-        # 获取最后一条消息
-        last_msg_result = await db.execute(
-            select(Message).where(
-                and_(
-                    Message.room_id.is_(None),
-                    or_(
-                        and_(Message.sender_id == user1_id, Message.receiver_id == user2_id),
-                        and_(Message.sender_id == user2_id, Message.receiver_id == user1_id)
-                    )
-                )
-            ).order_by(desc(Message.created_at)).limit(1)
-        )
-        last_msg = last_msg_result.scalar_one_or_none()
-        
-        # 获取未读消息数（当前用户作为接收者的未读消息）
-        if is_super_admin(current_user):
-            # 超级管理员：统计 user2_id 作为接收者的未读消息
-            unread_result = await db.execute(
-                select(func.count(Message.id)).where(
-                    and_(
-                        Message.room_id.is_(None),
-                        Message.receiver_id == user2_id,
-                        Message.sender_id == user1_id,
-                        Message.is_read == False
-                    )
-                )
-            )
-        else:
-            # 普通用户：统计自己作为接收者的未读消息
-            unread_result = await db.execute(
-                select(func.count(Message.id)).where(
-                    and_(
-                        Message.room_id.is_(None),
-                        Message.receiver_id == current_user.id,
-                        or_(
-                            Message.sender_id == user1_id,
-                            Message.sender_id == user2_id
-                        ),
-                        Message.is_read == False
-                    )
-                )
+    cursor_key = None
+    if cursor:
+        try:
+            cursor_key = _decode_conversation_cursor(cursor)
+        except (ValueError, UnicodeDecodeError):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="无效的分页游标"
             )
-        unread_count = unread_result.scalar() or 0
-        
-        # 获取对方用户信息
-        user_result = await db.execute(
-            select(User).where(User.id == other_user_id)
-        )
-        user = user_result.scalar_one_or_none()
-        
-        conversations.append(ConversationResponse(
-            user_id=other_user_id,
-            user_nickname=user.nickname if user else f"用户{other_user_id}",
-            last_message=last_msg.message if last_msg else None,
-            last_message_time=last_msg.created_at if last_msg else last_time,
-            unread_count=unread_count
-        ))
     
-    # 获取房间会话
-    # 权限控制：普通用户只能看到自己参与的房间
     if is_super_admin(current_user):
-        # 超级管理员：查询所有房间会话
-        rooms_query = select(
-            Message.room_id,
-            func.max(Message.created_at).label('last_time')
-        ).where(
-            Message.room_id.isnot(None)
-        ).group_by(
-            Message.room_id
-        )
+        query = _conversation_list_query(current_user.id, cursor_key, limit)
     else:
-        # 普通用户：只查询自己参与的房间
-        rooms_query = select(
-            Message.room_id,
-            func.max(Message.created_at).label('last_time')
-        ).where(
-            and_(
-                Message.room_id.isnot(None),
-                Message.room_id.in_(
-                    select(RoomParticipant.room_id).where(
-                        RoomParticipant.user_id == current_user.id,
-                        RoomParticipant.is_active == True
-                    )
-                )
-            )
-        ).group_by(
-            Message.room_id
-        )
+        query = _conversation_summary_query(current_user.id, cursor_key, limit)
+    result = await read_db.execute(query)
+    rows = result.all()
     
-    rooms_result = await db.execute(rooms_query)
-    room_pairs = rooms_result.all()
+    next_cursor = None
+    if limit and len(rows) > limit:
+        rows = rows[:limit]
+        last_row = rows[-1]
+        next_cursor = _encode_conversation_cursor(last_row.last_message_time, last_row.last_message_id)
     
-    for room_id, last_time in room_pairs:
-        # 获取最后一条消息
-        last_msg_result = await db.execute(
-            select(Message).where(Message.room_id == room_id)
-            .order_by(desc(Message.created_at)).limit(1)
-        )
-        last_msg = last_msg_result.scalar_one_or_none()
-        
-        # 获取房间信息
-        room_result = await db.execute(
-            select(Room).where(Room.id == room_id)
-        )
-        room = room_result.scalar_one_or_none()
-        
-        if not room:
-            continue  # 跳过不存在的房间
-        
-        # 统计未读消息数（当前用户未读的房间消息）
-        # 未读消息：房间内发送时间晚于用户加入时间的消息，且发送者不是当前用户
-        if is_super_admin(current_user):
-            # 超级管理员：暂不统计未读数
-            unread_count = 0
+    conversations = []
+    for row in rows:
+        if row.room_id is not None:
+            conversations.append(ConversationResponse(
+                room_id=row.room_id,
+                room_name=row.room_name or f"房间{row.room_id}",
+                last_message=row.last_message,
+                last_message_time=row.last_message_time,
+                unread_count=row.unread_count or 0
+            ))
         else:
-            # 普通用户：统计房间内未读消息（发送者不是自己）
-            unread_result = await db.execute(
-                select(func.count(Message.id)).where(
-                    and_(
-                        Message.room_id == room_id,
-                        Message.sender_id != current_user.id,
-                        Message.is_read == False
-                    )
-                )
-            )
-            unread_count = unread_result.scalar() or 0
-        
-        conversations.append(ConversationResponse(
-            room_id=room_id,
-            room_name=room.room_name if room else f"房间{room_id}",
-            last_message=last_msg.message if last_msg else None,
-            last_message_time=last_msg.created_at if last_msg else last_time,
-            unread_count=unread_count
-        ))
-    
-    # 按最后消息时间排序
-    conversations.sort(key=lambda x: x.last_message_time or datetime.min, reverse=True)
+            conversations.append(ConversationResponse(
+                user_id=row.user_id,
+                user_nickname=row.nickname or f"用户{row.user_id}",
+                last_message=row.last_message,
+                last_message_time=row.last_message_time,
+                unread_count=row.unread_count or 0
+            ))
     
     # 记录操作日志
     await log_operation(
@@ -990,17 +1237,19 @@ async def get_conversations(
     )
     await db.commit()
     
-    return ConversationListResponse(conversations=conversations)
+    return ConversationListResponse(conversations=conversations, next_cursor=next_cursor)
 
 
 @router.get("/stats", status_code=status.HTTP_200_OK)
 async def get_chat_stats(
     request: Request,
-    current_user: User = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db)
+    current_user: AuthUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_read_db)
 ):
     """
-    获取聊天统计信息（仅超级管理员）
+    获取聊天统计信息（仅超级管理员，读取统计计数器，见 app/core/stats_rollup.py）
+    
+    stale_after 之后应重新获取
     """
     if not is_super_admin(current_user):
         raise HTTPException(
@@ -1011,39 +1260,17 @@ async def get_chat_stats(
     lang = current_user.language or get_language_from_request(request)
     check_user_not_disabled(current_user, lang)
     
-    # 总消息数
-    total_messages_result = await db.execute(select(func.count(Message.id)))
-    total_messages = total_messages_result.scalar() or 0
-    
-    # 未读消息数
-    unread_messages_result = await db.execute(
-        select(func.count(Message.id)).where(Message.is_read == False)
-    )
-    unread_messages = unread_messages_result.scalar() or 0
-    
-    # 点对点消息数
-    p2p_messages_result = await db.execute(
-        select(func.count(Message.id)).where(Message.room_id.is_(None))
-    )
-    p2p_messages = p2p_messages_result.scalar() or 0
-    
-    # 房间消息数
-    room_messages_result = await db.execute(
-        select(func.count(Message.id)).where(Message.room_id.isnot(None))
-    )
-    room_messages = room_messages_result.scalar() or 0
-    
-    # 今日消息数
-    today_start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
-    today_messages_result = await db.execute(
-        select(func.count(Message.id)).where(Message.created_at >= today_start)
+    # 读取统计计数器（当日消息数按 UTC 日期计数）
+    today = day_scope(datetime.utcnow())
+    counters = await stats_rollup.read(
+        db, MESSAGES_TOTAL, MESSAGES_UNREAD, MESSAGES_P2P, MESSAGES_ROOM, (MESSAGES_DAY, today)
     )
-    today_messages = today_messages_result.scalar() or 0
     
     return {
-        "total_messages": total_messages,
-        "unread_messages": unread_messages,
-        "p2p_messages": p2p_messages,
-        "room_messages": room_messages,
-        "today_messages": today_messages
+        "total_messages": counters[MESSAGES_TOTAL],
+        "unread_messages": counters[MESSAGES_UNREAD],
+        "p2p_messages": counters[MESSAGES_P2P],
+        "room_messages": counters[MESSAGES_ROOM],
+        "today_messages": counters[MESSAGES_DAY],
+        "stale_after": stats_rollup.stale_after().isoformat(),
     }
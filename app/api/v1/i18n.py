@@ -9,7 +9,8 @@ from pydantic import BaseModel, Field
 
 from app.core.i18n import i18n, SUPPORTED_LANGUAGES, get_language_from_request
 from app.db.session import get_db
-from app.api.v1.auth import get_current_user
+from app.api.v1.auth import get_current_db_user
+from app.core.user_cache import user_auth_cache
 from app.db.models import User
 from typing import Optional
 
@@ -63,7 +64,7 @@ async def get_supported_languages(
 async def switch_language(
     request_data: LanguageSwitchRequest,
     request: Request,
-    current_user: User = Depends(get_current_user),
+    current_user: User = Depends(get_current_db_user),
     db: AsyncSession = Depends(get_db)
 ):
     """
@@ -82,6 +83,7 @@ async def switch_language(
     # 更新用户语言偏好
     current_user.language = normalized_lang
     await db.commit()
+    await user_auth_cache.invalidate(current_user.id)
     
     return LanguageSwitchResponse(
         message=i18n.get("i18n.switch_success", normalized_lang),
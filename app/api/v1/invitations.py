@@ -18,6 +18,8 @@ from app.db.session import get_db
 from app.db.models import User, InvitationCode
 from app.api.v1.auth import get_current_user
 from app.api.v1.users import require_admin
+from app.core.user_cache import AuthUser
+from app.core.stats_rollup import stats_rollup, INVITATIONS_TOTAL, INVITATIONS_ACTIVE
 
 router = APIRouter()
 
@@ -91,7 +93,7 @@ def generate_invitation_code(length: int = 12) -> str:
 async def create_invitation_code(
     code_data: InvitationCodeCreate,
     request: Request,
-    current_user: User = Depends(require_admin),
+    current_user: AuthUser = Depends(require_admin),
     db: AsyncSession = Depends(get_db)
 ):
     """
@@ -147,6 +149,8 @@ async def create_invitation_code(
     
     db.add(new_code)
     await db.commit()
+    stats_rollup.add(INVITATIONS_TOTAL)
+    stats_rollup.add(INVITATIONS_ACTIVE)
     await db.refresh(new_code)
     
     # 安全访问 revoked_at 字段（兼容旧数据库）
@@ -174,7 +178,7 @@ async def get_invitation_codes(
     code: Optional[str] = Query(None, description="搜索邀请码"),
     is_active: Optional[bool] = Query(None, description="筛选激活状态"),
     is_revoked: Optional[bool] = Query(None, description="筛选撤回状态"),
-    current_user: User = Depends(require_admin),
+    current_user: AuthUser = Depends(require_admin),
     db: AsyncSession = Depends(get_db)
 ):
     """
@@ -243,7 +247,7 @@ async def get_invitation_codes(
 async def delete_invitation_code(
     code_id: int,
     request: Request,
-    current_user: User = Depends(require_admin),
+    current_user: AuthUser = Depends(require_admin),
     db: AsyncSession = Depends(get_db)
 ):
     """
@@ -263,8 +267,12 @@ async def delete_invitation_code(
         )
     
     # 删除邀请码
+    was_active = code.is_active and not code.is_revoked
     await db.delete(code)
     await db.commit()
+    stats_rollup.add(INVITATIONS_TOTAL, -1)
+    if was_active:
+        stats_rollup.add(INVITATIONS_ACTIVE, -1)
     
     return None
 
@@ -273,7 +281,7 @@ async def delete_invitation_code(
 async def get_invitation_code(
     code_id: int,
     request: Request,
-    current_user: User = Depends(require_admin),
+    current_user: AuthUser = Depends(require_admin),
     db: AsyncSession = Depends(get_db)
 ):
     """
@@ -372,7 +380,7 @@ async def verify_invitation_code(
 async def revoke_invitation_code(
     code_id: int,
     request: Request,
-    current_user: User = Depends(require_admin),
+    current_user: AuthUser = Depends(require_admin),
     db: AsyncSession = Depends(get_db)
 ):
     """
@@ -398,12 +406,15 @@ async def revoke_invitation_code(
         )
     
     # 撤回邀请码
+    was_active = code.is_active
     code.is_revoked = True
     code.is_active = False
     # 安全设置 revoked_at 字段（如果字段存在）
     if hasattr(code, 'revoked_at'):
         code.revoked_at = datetime.now(timezone.utc).replace(tzinfo=None)
     await db.commit()
+    if was_active:
+        stats_rollup.add(INVITATIONS_ACTIVE, -1)
     await db.refresh(code)
     
     # 安全访问 revoked_at 字段（兼容旧数据库）
@@ -427,7 +438,7 @@ async def revoke_invitation_code(
 async def get_invitation_code_usage(
     code_id: int,
     request: Request,
-    current_user: User = Depends(require_admin),
+    current_user: AuthUser = Depends(require_admin),
     db: AsyncSession = Depends(get_db)
 ):
     """
@@ -14,8 +14,9 @@ from pydantic import BaseModel, Field
 from app.core.i18n import i18n, get_language_from_request
 from app.core.permissions import check_user_not_disabled
 from app.db.session import get_db
-from app.db.models import User, Notification
+from app.db.models import Notification
 from app.api.v1.auth import get_current_user
+from app.core.user_cache import AuthUser
 from loguru import logger
 
 router = APIRouter()
@@ -61,7 +62,7 @@ async def get_notifications(
     type_filter: Optional[str] = Query(None, description="筛选通知类型"),
     limit: int = Query(50, ge=1, le=100, description="返回数量"),
     request: Request = None,
-    current_user: User = Depends(get_current_user),
+    current_user: AuthUser = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """
@@ -125,7 +126,7 @@ async def get_notifications(
 async def mark_notifications_read(
     request_data: MarkReadRequest,
     request: Request,
-    current_user: User = Depends(get_current_user),
+    current_user: AuthUser = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """
@@ -163,7 +164,7 @@ async def mark_notifications_read(
 async def delete_notification(
     notification_id: int,
     request: Request,
-    current_user: User = Depends(get_current_user),
+    current_user: AuthUser = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """
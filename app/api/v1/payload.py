@@ -14,8 +14,9 @@ from pydantic import BaseModel, Field
 from app.core.i18n import i18n, get_language_from_request
 from app.core.config import settings
 from app.db.session import get_db
-from app.db.models import User, UserDataPayload
+from app.db.models import UserDataPayload
 from app.api.v1.auth import get_current_user
+from app.core.user_cache import AuthUser
 
 router = APIRouter()
 
@@ -129,7 +130,7 @@ def merge_sensitive_data(existing_data: Optional[Dict[str, Any]], new_data: Dict
 async def upload_payload(
     payload_data: PayloadUpload,
     request: Request,
-    current_user: User = Depends(get_current_user),
+    current_user: AuthUser = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """
@@ -249,7 +250,7 @@ async def upload_payload(
 @router.get("/", response_model=List[PayloadResponse])
 async def get_payloads(
     request: Request,
-    current_user: User = Depends(get_current_user),
+    current_user: AuthUser = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """
@@ -288,7 +289,7 @@ async def update_payload(
     payload_id: int,
     payload_data: PayloadUpdate,
     request: Request,
-    current_user: User = Depends(get_current_user),
+    current_user: AuthUser = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """
@@ -377,7 +378,7 @@ async def update_payload(
 async def delete_payload(
     payload_id: int,
     request: Request,
-    current_user: User = Depends(get_current_user),
+    current_user: AuthUser = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """
@@ -412,7 +413,7 @@ async def delete_payload(
 async def toggle_payload(
     toggle_data: PayloadToggle,
     request: Request,
-    current_user: User = Depends(get_current_user),
+    current_user: AuthUser = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """
@@ -25,8 +25,9 @@ from app.core.i18n import i18n, get_language_from_request
 from app.core.security import rsa_encrypt, rsa_decrypt, simple_encrypt, simple_decrypt, create_jitsi_token, create_access_token
 from app.core.config import settings
 from app.db.session import get_db
-from app.db.models import User, QRCodeScan, SystemConfig
+from app.db.models import QRCodeScan, SystemConfig
 from app.api.v1.auth import get_current_user
+from app.core.user_cache import AuthUser
 from loguru import logger
 import qrcode
 from qrcode.constants import ERROR_CORRECT_H, ERROR_CORRECT_M, ERROR_CORRECT_L
@@ -347,7 +348,7 @@ async def get_rsa_public_key():
 async def generate_qrcode(
     qr_data: QRCodeGenerate,
     request: Request,
-    current_user: User = Depends(get_current_user),
+    current_user: AuthUser = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """
@@ -559,7 +560,7 @@ async def get_room_qrcode(
     room_id: str,
     qrcode_type: Optional[str] = None,  # 可选参数：encrypted 或 plain
     request: Request = None,
-    current_user: User = Depends(get_current_user),
+    current_user: AuthUser = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """
@@ -790,7 +791,7 @@ async def get_room_qrcode_image(
     room_id: str,
     qrcode_type: Optional[str] = None,  # 可选参数：encrypted 或 plain
     request: Request = None,
-    current_user: User = Depends(get_current_user),
+    current_user: AuthUser = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """
@@ -1020,7 +1021,7 @@ async def get_room_qrcode_image(
 @router.get("/auth")
 async def get_auth_qrcode(
     request: Request,
-    current_user: User = Depends(get_current_user),
+    current_user: AuthUser = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
 ):
     """
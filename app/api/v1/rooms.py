@@ -19,7 +19,7 @@ from loguru import logger
 from app.core.permissions import check_user_not_disabled
 from app.db.session import get_db
 from app.db.models import User, QRCodeScan
-from app.api.v1.auth import get_current_user
+from app.api.v1.auth import get_current_db_user
 
 router = APIRouter()
 
@@ -314,7 +314,7 @@ async def join_room(
     room_id: str,
     join_data: RoomJoin,
     request: Request,
-    current_user: User = Depends(get_current_user),
+    current_user: User = Depends(get_current_db_user),
     db: AsyncSession = Depends(get_db)
 ):
     """
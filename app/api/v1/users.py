@@ -13,7 +13,9 @@ from pydantic import BaseModel, Field, EmailStr
 from app.core.i18n import i18n, get_language_from_request
 from app.db.session import get_db
 from app.db.models import User
-from app.api.v1.auth import get_current_user
+from app.api.v1.auth import get_current_user, get_current_db_user
+from app.core.user_cache import AuthUser, user_auth_cache
+from app.core.stats_rollup import stats_rollup, USERS_TOTAL, USERS_ONLINE
 from app.core.security import get_password_hash, verify_password
 
 router = APIRouter()
@@ -63,7 +65,7 @@ class PasswordChange(BaseModel):
 
 # ==================== 辅助函数 ====================
 
-async def require_admin(current_user: User = Depends(get_current_user)) -> User:
+async def require_admin(current_user: AuthUser = Depends(get_current_user)) -> AuthUser:
     """要求管理员权限"""
     if not current_user.is_admin:
         raise HTTPException(
@@ -79,7 +81,7 @@ async def require_admin(current_user: User = Depends(get_current_user)) -> User:
 async def update_current_user(
     user_data: UserUpdate,
     request: Request,
-    current_user: User = Depends(get_current_user),
+    current_user: User = Depends(get_current_db_user),
     db: AsyncSession = Depends(get_db)
 ):
     """
@@ -115,6 +117,7 @@ async def update_current_user(
     
     # updated_at 会通过事件监听器自动更新
     await db.commit()
+    await user_auth_cache.invalidate(current_user.id)
     await db.refresh(current_user)
     
     return {
@@ -135,7 +138,7 @@ async def update_current_user(
 async def change_password(
     password_data: PasswordChange,
     request: Request,
-    current_user: User = Depends(get_current_user),
+    current_user: User = Depends(get_current_db_user),
     db: AsyncSession = Depends(get_db)
 ):
     """
@@ -166,7 +169,7 @@ async def get_users(
     search: Optional[str] = Query(None, description="搜索关键词（手机号、用户名）"),
     is_online: Optional[bool] = Query(None, description="筛选在线状态"),
     is_admin: Optional[bool] = Query(None, description="筛选管理员"),
-    current_user: User = Depends(require_admin),
+    current_user: AuthUser = Depends(require_admin),
     db: AsyncSession = Depends(get_db)
 ):
     """
@@ -238,7 +241,7 @@ async def get_users(
 async def get_user(
     user_id: int,
     request: Request,
-    current_user: User = Depends(require_admin),
+    current_user: AuthUser = Depends(require_admin),
     db: AsyncSession = Depends(get_db)
 ):
     """
@@ -276,7 +279,7 @@ async def update_user(
     user_id: int,
     user_data: UserUpdate,
     request: Request,
-    current_user: User = Depends(require_admin),
+    current_user: AuthUser = Depends(require_admin),
     db: AsyncSession = Depends(get_db)
 ):
     """
@@ -336,6 +339,7 @@ async def update_user(
     
     user.updated_at = datetime.now(timezone.utc).replace(tzinfo=None)
     await db.commit()
+    await user_auth_cache.invalidate(user.id)
     await db.refresh(user)
     
     return {
@@ -358,7 +362,7 @@ async def update_user(
 async def delete_user(
     user_id: int,
     request: Request,
-    current_user: User = Depends(require_admin),
+    current_user: AuthUser = Depends(require_admin),
     db: AsyncSession = Depends(get_db)
 ):
     """
@@ -383,7 +387,13 @@ async def delete_user(
             detail=i18n.get("user.not_found", lang)
         )
     
+    was_online = user.is_online
     await db.delete(user)
     await db.commit()
+    # 级联删除的设备、消息等由统计对账修正
+    stats_rollup.add(USERS_TOTAL, -1)
+    if was_online:
+        stats_rollup.add(USERS_ONLINE, -1)
+    await user_auth_cache.invalidate(user_id)
     
     return None
@@ -0,0 +1,153 @@
+"""
+内容寻址文件存储模块
+文件内容按 SHA-256 存于 uploads/blobs/<前2位>/<3-4位>/<哈希>，相同内容只写一次；
+file_blobs.ref_count 记录引用该内容的 File 记录数，最后一个 File 删除后回收磁盘文件。
+
+并发约定：
+- 写入：先在事务内 acquire_blob（行锁 / 插入），再 place_blob 放置磁盘文件，最后提交；
+  提交失败时在回滚前用 discard_placed_blob 删除本次新写入的磁盘文件，不留下没有 file_blobs 行的内容块
+- 回收：collect_blobs 在删除 ref_count=0 的行后、提交前删除磁盘文件；并发写入者的 acquire_blob
+  会等待该行锁，提交后发现磁盘文件已不存在，由 place_blob 重新写入
+"""
+
+import asyncio
+import os
+from pathlib import Path
+from typing import Iterable, List
+
+from loguru import logger
+from sqlalchemy import delete, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.file_storage import UPLOAD_BASE_DIR, commit_temp_file
+from app.db.models import FileBlob, File as FileModel
+
+
+def blob_relative_path(content_hash: str) -> str:
+    """内容哈希对应的存储路径（相对 uploads 目录）"""
+    return f"blobs/{content_hash[:2]}/{content_hash[2:4]}/{content_hash}"
+
+
+def blob_absolute_path(content_hash: str) -> Path:
+    return UPLOAD_BASE_DIR / blob_relative_path(content_hash)
+
+
+async def acquire_blob(db: AsyncSession, content_hash: str, file_size: int) -> str:
+    """
+    引用计数 +1（不存在则创建），需与 File 记录写入在同一事务
+
+    Returns:
+        存储路径（相对 uploads 目录）
+    """
+    blob_path = blob_relative_path(content_hash)
+    stmt = pg_insert(FileBlob).values(
+        content_hash=content_hash,
+        blob_path=blob_path,
+        file_size=file_size,
+        ref_count=1,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[FileBlob.content_hash],
+        set_={"ref_count": FileBlob.ref_count + 1},
+    )
+    await db.execute(stmt)
+    return blob_path
+
+
+def _place_blob(temp_path: Path, target_path: Path) -> bool:
+    if target_path.exists():
+        try:
+            temp_path.unlink()
+        except FileNotFoundError:
+            pass
+        return False
+    return True
+
+
+async def place_blob(temp_path: Path, content_hash: str) -> bool:
+    """
+    将临时文件放置为内容块；内容已存在时直接删除临时文件（不再 fsync / 重复占用磁盘）
+
+    Returns:
+        True 表示新写入，False 表示命中已有内容
+    """
+    target_path = blob_absolute_path(content_hash)
+    if not await asyncio.to_thread(_place_blob, temp_path, target_path):
+        return False
+    await commit_temp_file(temp_path, target_path)
+    return True
+
+
+async def discard_placed_blob(content_hash: str):
+    """删除 place_blob 新写入的内容块（写入事务回滚前调用，此时仍持有 file_blobs 行锁）"""
+    await asyncio.to_thread(_unlink_blobs, [blob_absolute_path(content_hash)])
+
+
+async def release_blob(db: AsyncSession, content_hash: str) -> bool:
+    """
+    引用计数 -1，需与 File 记录删除在同一事务
+
+    Returns:
+        是否已无引用（提交后应调用 collect_blobs 回收）
+    """
+    result = await db.execute(
+        update(FileBlob)
+        .where(FileBlob.content_hash == content_hash)
+        .values(ref_count=FileBlob.ref_count - 1)
+        .returning(FileBlob.ref_count)
+    )
+    remaining = result.scalar_one_or_none()
+    return remaining is not None and remaining <= 0
+
+
+async def delete_file_records(db: AsyncSession, files: Iterable[FileModel]) -> List[str]:
+    """
+    删除 File 记录并释放其内容引用（不提交）
+
+    Returns:
+        已无引用的内容哈希列表，调用方提交后交给 collect_blobs
+    """
+    unreferenced = []
+    for file_record in files:
+        content_hash = file_record.content_hash
+        await db.delete(file_record)
+        if content_hash and await release_blob(db, content_hash):
+            unreferenced.append(content_hash)
+    return unreferenced
+
+
+def _unlink_blobs(paths: List[Path]):
+    for path in paths:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+
+async def collect_blobs(content_hashes: Iterable[str]) -> int:
+    """
+    回收无引用的内容块（独立事务）：删除 ref_count<=0 的行与磁盘文件
+
+    Returns:
+        回收的内容块数
+    """
+    content_hashes = list(set(content_hashes))
+    if not content_hashes:
+        return 0
+
+    from app.db.session import unit_of_work
+
+    async with unit_of_work() as session:
+        result = await session.execute(
+            delete(FileBlob)
+            .where(FileBlob.content_hash.in_(content_hashes), FileBlob.ref_count <= 0)
+            .returning(FileBlob.content_hash)
+        )
+        collected = [row[0] for row in result.all()]
+        # 提交前删除磁盘文件，保证并发写入者在行锁释放后看到的磁盘状态与表一致
+        await asyncio.to_thread(_unlink_blobs, [blob_absolute_path(h) for h in collected])
+    if collected:
+        logger.info(f"已回收无引用内容块 {len(collected)} 个")
+    return len(collected)
+
@@ -0,0 +1,168 @@
+"""
+批量增量同步模块
+客户端从后台恢复时用一个不透明游标一次拉取全部会话的变化（/chat/sync），不再逐会话调用 /chat/messages/since。
+
+游标包含三个按用户分页的位置，各自独立键集分页、每次有上限：
+- 新消息：用户的点对点消息与所在房间的消息，按消息ID（全局递增）
+- 会话摘要：conversation_summaries.sync_seq（摘要行每次变更取新值，含未读数变化）
+- 已读回执：用户自己发送的消息按 (read_at, id)
+
+ID / 序号在事务开始时分配、提交时才可见，较晚分配的可能先提交；
+因此游标只前进到早于 SYNC_SETTLE_SECONDS 的位置，更新的条目本次返回、下次可能重复返回，客户端按ID去重。
+"""
+
+import base64
+import json
+from datetime import datetime
+from typing import Callable, FrozenSet, List, NamedTuple, Sequence, Tuple
+
+from sqlalchemy import and_, func, or_, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from app.db.models import ConversationSummary, Message, Room, User
+
+_CURSOR_VERSION = 1
+
+
+class SyncCursor(NamedTuple):
+    """同步位置：已同步到的消息ID、摘要 sync_seq、已读回执 (read_at, id)"""
+    message_id: int
+    summary_seq: int
+    read_at: datetime
+    read_id: int
+
+
+def encode_sync_cursor(cursor: SyncCursor) -> str:
+    """将同步位置编码为不透明游标"""
+    raw = json.dumps({
+        "v": _CURSOR_VERSION,
+        "m": cursor.message_id,
+        "s": cursor.summary_seq,
+        "r": cursor.read_at.isoformat(),
+        "ri": cursor.read_id,
+    }, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_sync_cursor(value: str) -> SyncCursor:
+    """解析同步游标，格式无效时抛出 ValueError"""
+    try:
+        data = json.loads(base64.urlsafe_b64decode(value.encode()).decode())
+        if data.get("v") != _CURSOR_VERSION:
+            raise ValueError("不支持的同步游标版本")
+        return SyncCursor(int(data["m"]), int(data["s"]), datetime.fromisoformat(data["r"]), int(data["ri"]))
+    except (KeyError, TypeError, AttributeError, UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ValueError("无效的同步游标") from e
+
+
+async def initial_sync_cursor(db: AsyncSession, now: datetime) -> SyncCursor:
+    """
+    首次同步的起点：会话摘要从头返回（即完整会话列表），消息与已读回执从当前开始
+
+    历史消息仍按会话通过 /chat/messages 分页加载
+    """
+    max_id = (await db.execute(select(func.coalesce(func.max(Message.id), 0)))).scalar() or 0
+    return SyncCursor(message_id=max_id, summary_seq=0, read_at=now, read_id=0)
+
+
+def settled_position(items: Sequence, position: Callable, changed_at: Callable, current, settle_before: datetime):
+    """
+    游标可前进到的位置：按顺序取早于 settle_before 的连续前缀的最后一项
+
+    Returns:
+        (新位置, 是否全部已稳定)
+    """
+    for item in items:
+        if changed_at(item) > settle_before:
+            return current, False
+        current = position(item)
+    return current, True
+
+
+async def load_message_delta(
+    db: AsyncSession,
+    user_id: int,
+    room_ids: FrozenSet[int],
+    after_id: int,
+    limit: int,
+) -> List[Tuple]:
+    """
+    用户的点对点消息与所在房间消息中ID大于 after_id 的部分，按ID升序，至多 limit + 1 条
+
+    发送者昵称、接收者昵称与房间名称在同一条查询中关联取得
+
+    Returns:
+        [(Message, sender_nickname, receiver_nickname, room_name)]
+    """
+    sender = aliased(User)
+    receiver = aliased(User)
+    conversations = [
+        and_(Message.room_id.is_(None), or_(Message.sender_id == user_id, Message.receiver_id == user_id)),
+    ]
+    if room_ids:
+        conversations.append(Message.room_id.in_(sorted(room_ids)))
+    result = await db.execute(
+        select(Message, sender.nickname, receiver.nickname, Room.room_name)
+        .outerjoin(sender, sender.id == Message.sender_id)
+        .outerjoin(receiver, receiver.id == Message.receiver_id)
+        .outerjoin(Room, Room.id == Message.room_id)
+        .where(Message.id > after_id, or_(*conversations))
+        .order_by(Message.id.asc())
+        .limit(limit + 1)
+    )
+    return list(result.all())
+
+
+async def load_summary_delta(db: AsyncSession, owner_id: int, after_seq: int, limit: int) -> List:
+    """
+    sync_seq 大于 after_seq 的会话摘要（走 ix_conversation_summaries_owner_sync），按 sync_seq 升序，至多 limit + 1 行
+
+    最后消息内容、对方昵称与房间名称按主键关联取得
+    """
+    result = await db.execute(
+        select(
+            ConversationSummary.peer_id.label("user_id"),
+            ConversationSummary.room_id,
+            Message.message.label("last_message"),
+            ConversationSummary.last_message_at.label("last_message_time"),
+            ConversationSummary.last_message_id,
+            ConversationSummary.last_message_seq,
+            ConversationSummary.unread_count,
+            ConversationSummary.sync_seq,
+            ConversationSummary.updated_at,
+            User.nickname,
+            Room.room_name,
+        )
+        .outerjoin(Message, Message.id == ConversationSummary.last_message_id)
+        .outerjoin(User, User.id == ConversationSummary.peer_id)
+        .outerjoin(Room, Room.id == ConversationSummary.room_id)
+        .where(ConversationSummary.owner_id == owner_id, ConversationSummary.sync_seq > after_seq)
+        .order_by(ConversationSummary.sync_seq.asc())
+        .limit(limit + 1)
+    )
+    return list(result.all())
+
+
+async def load_read_receipt_delta(
+    db: AsyncSession,
+    sender_id: int,
+    after: Tuple[datetime, int],
+    limit: int,
+) -> List:
+    """
+    用户自己发送的消息中 (read_at, id) 在 after 之后被标记已读的部分（走 ix_messages_sender_read_at），
+    按 (read_at, id) 升序，至多 limit + 1 行
+    """
+    result = await db.execute(
+        select(Message.id, Message.receiver_id, Message.room_id, Message.read_at)
+        .where(
+            Message.sender_id == sender_id,
+            Message.read_at.isnot(None),
+            tuple_(Message.read_at, Message.id) > tuple_(after[0], after[1]),
+        )
+        .order_by(Message.read_at.asc(), Message.id.asc())
+        .limit(limit + 1)
+    )
+    return list(result.all())
+
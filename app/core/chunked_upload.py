@@ -0,0 +1,274 @@
+"""
+Socket.io 分片上传模块
+客户端通过 upload_start / upload_chunk / upload_commit 以二进制分片上传文件，
+替代把整个文件编码为 base64 数据 URI 放进 send_message：
+- 分片在线程池中追加写入临时文件，不阻塞事件循环
+- 写入同时增量计算 SHA-256，提交时无需再读一遍文件
+- 上传会话按用户归属，断线重连后可通过 upload_start(upload_id=...) 取得已接收偏移量续传
+- 每个用户同时最多 CHUNKED_UPLOAD_MAX_SESSIONS_PER_USER 个未完成的上传；
+  后台任务每 CHUNKED_UPLOAD_SWEEP_INTERVAL 秒清理空闲超时的会话与遗留的临时文件
+- 提交时将临时文件存入内容寻址存储（相同内容只保存一份）并创建 File 记录
+
+注意：上传会话保存在当前 worker 内存中，多 worker 部署时续传需要会话粘滞（sticky session）
+"""
+
+import asyncio
+import hashlib
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, Optional, Set
+
+from loguru import logger
+
+from app.core.config import settings
+from app.core.file_dump import resolve_file_type, store_temp_file
+from app.core.file_storage import UPLOAD_TMP_DIR, remove_file
+
+
+class ChunkedUploadError(Exception):
+    """分片上传错误（消息直接返回给客户端）"""
+
+    def __init__(self, message: str, offset: Optional[int] = None):
+        super().__init__(message)
+        self.message = message
+        self.offset = offset
+
+
+class UploadSession:
+    """单个文件的上传会话"""
+
+    __slots__ = (
+        'upload_id', 'user_id', 'file_name', 'mime_type', 'file_type', 'total_size',
+        'offset', 'hasher', 'temp_path', 'updated_at', 'lock',
+    )
+
+    def __init__(self, user_id: int, file_name: str, mime_type: str, file_type: str, total_size: int):
+        self.upload_id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.file_name = file_name
+        self.mime_type = mime_type
+        self.file_type = file_type
+        self.total_size = total_size
+        self.offset = 0
+        self.hasher = hashlib.sha256()
+        self.temp_path = UPLOAD_TMP_DIR / f"{self.upload_id}.part"
+        self.updated_at = time.monotonic()
+        # 同一上传的分片串行写入，保证偏移量与哈希顺序一致
+        self.lock = asyncio.Lock()
+
+    def to_dict(self) -> Dict:
+        return {
+            'upload_id': self.upload_id,
+            'offset': self.offset,
+            'file_size': self.total_size,
+            'chunk_size': settings.CHUNKED_UPLOAD_CHUNK_SIZE,
+        }
+
+
+def _create_temp_file(path: Path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.touch()
+
+
+def _write_chunk(path: Path, offset: int, data: bytes, hasher) -> None:
+    """写入分片（线程池中执行）；写入成功后才更新哈希，失败重试时从 offset 覆盖"""
+    with open(path, 'r+b') as f:
+        f.seek(offset)
+        f.write(data)
+        f.truncate()
+    hasher.update(data)
+
+
+def _remove_stale_temp_files(max_age: float, keep: Set[Path]) -> int:
+    """清理超过 max_age 秒未修改、且不属于本 worker 进行中会话的临时文件（进程重启或其他 worker 遗留）"""
+    if not UPLOAD_TMP_DIR.exists():
+        return 0
+    removed = 0
+    deadline = time.time() - max_age
+    for path in UPLOAD_TMP_DIR.glob("*.part"):
+        if path in keep:
+            continue
+        try:
+            if path.stat().st_mtime < deadline:
+                path.unlink()
+                removed += 1
+        except OSError:
+            pass
+    return removed
+
+
+class ChunkedUploadManager:
+    """分片上传会话管理"""
+
+    def __init__(self):
+        self._sessions: Dict[str, UploadSession] = {}
+        self._sweep_task: Optional[asyncio.Task] = None
+
+    async def start_sweeper(self):
+        """启动定期清理（启动时先清理一次进程重启前遗留的临时文件）"""
+        if self._sweep_task is None:
+            await self.sweep()
+            self._sweep_task = asyncio.create_task(self._sweep_loop())
+
+    async def stop_sweeper(self):
+        """停止定期清理（未完成上传的临时文件由下次启动时清理）"""
+        if self._sweep_task:
+            self._sweep_task.cancel()
+            try:
+                await self._sweep_task
+            except asyncio.CancelledError:
+                pass
+            self._sweep_task = None
+
+    async def _sweep_loop(self):
+        while True:
+            try:
+                await asyncio.sleep(settings.CHUNKED_UPLOAD_SWEEP_INTERVAL)
+                await self.sweep()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"分片上传清理错误: {e}", exc_info=True)
+
+    async def sweep(self) -> int:
+        """
+        清理空闲超时的上传会话与遗留的临时文件
+
+        Returns:
+            删除的遗留临时文件数
+        """
+        await self._expire_sessions()
+        keep = {session.temp_path for session in self._sessions.values()}
+        removed = await asyncio.to_thread(_remove_stale_temp_files, settings.CHUNKED_UPLOAD_SESSION_TTL, keep)
+        if removed:
+            logger.info(f"已清理遗留的分片上传临时文件 {removed} 个")
+        return removed
+
+    async def start(
+        self,
+        user_id: int,
+        file_name: str,
+        file_size: int,
+        mime_type: Optional[str] = None,
+        message_type: Optional[str] = None,
+        upload_id: Optional[str] = None,
+    ) -> UploadSession:
+        """
+        开始上传或续传
+
+        Args:
+            user_id: 上传者用户ID
+            file_name: 原始文件名
+            file_size: 文件总字节数
+            mime_type: MIME 类型
+            message_type: 消息类型（image/audio/voice/video/file）
+            upload_id: 续传时传入之前的上传ID
+
+        Returns:
+            上传会话（续传时 offset 为服务器已接收的字节数）
+        """
+        await self._expire_sessions()
+
+        if upload_id:
+            session = self._sessions.get(upload_id)
+            if session is None or session.user_id != user_id:
+                raise ChunkedUploadError('上传会话不存在或已过期')
+            session.updated_at = time.monotonic()
+            return session
+
+        if not isinstance(file_size, int) or file_size <= 0:
+            raise ChunkedUploadError('文件大小无效')
+        if file_size > settings.CHUNKED_UPLOAD_MAX_SIZE:
+            max_size_mb = settings.CHUNKED_UPLOAD_MAX_SIZE / (1024 * 1024)
+            raise ChunkedUploadError(f'文件过大，最大支持 {max_size_mb:.0f}MB')
+        max_sessions = settings.CHUNKED_UPLOAD_MAX_SESSIONS_PER_USER
+        if max_sessions and sum(1 for s in self._sessions.values() if s.user_id == user_id) >= max_sessions:
+            raise ChunkedUploadError(f'未完成的上传过多（最多 {max_sessions} 个），请先完成或取消之前的上传')
+
+        mime_type = mime_type or 'application/octet-stream'
+        file_type = resolve_file_type(message_type or '', mime_type)
+        session = UploadSession(user_id, file_name or '', mime_type, file_type, file_size)
+        await asyncio.to_thread(_create_temp_file, session.temp_path)
+        self._sessions[session.upload_id] = session
+        logger.info(f"分片上传开始: upload_id={session.upload_id}, user={user_id}, size={file_size}, type={file_type}")
+        return session
+
+    async def write_chunk(self, user_id: int, upload_id: str, offset: int, data: bytes) -> UploadSession:
+        """
+        写入一个分片
+
+        offset 必须等于服务器已接收字节数；不一致时抛出 ChunkedUploadError 并附带服务器偏移量，
+        客户端据此从正确位置继续发送（重复发送的分片会被拒绝而不会重复写入）
+        """
+        session = self._get(user_id, upload_id)
+        if not isinstance(data, (bytes, bytearray)) or not data:
+            raise ChunkedUploadError('分片数据必须为非空二进制', session.offset)
+        if len(data) > settings.CHUNKED_UPLOAD_MAX_CHUNK_SIZE:
+            raise ChunkedUploadError('分片过大', session.offset)
+
+        async with session.lock:
+            if offset != session.offset:
+                raise ChunkedUploadError('分片偏移量不匹配', session.offset)
+            if session.offset + len(data) > session.total_size:
+                raise ChunkedUploadError('分片超出文件大小', session.offset)
+            await asyncio.to_thread(_write_chunk, session.temp_path, offset, bytes(data), session.hasher)
+            session.offset += len(data)
+            session.updated_at = time.monotonic()
+        return session
+
+    async def commit(self, user_id: int, upload_id: str, sha256: Optional[str] = None) -> Dict:
+        """
+        提交上传：校验大小与哈希，存入内容寻址存储并创建 File 记录（保存失败时会话已结束，需重新上传）
+
+        Returns:
+            包含 file_id, file_url, file_name, file_size, mime_type, sha256 的字典
+        """
+        session = self._get(user_id, upload_id)
+        async with session.lock:
+            if session.offset != session.total_size:
+                raise ChunkedUploadError('文件尚未上传完整', session.offset)
+            digest = session.hasher.hexdigest()
+            if sha256 and sha256.lower() != digest:
+                await self._discard(session)
+                raise ChunkedUploadError('文件校验失败，请重新上传')
+            self._sessions.pop(upload_id, None)
+
+        file_info = await store_temp_file(
+            session.temp_path, session.total_size, digest, user_id,
+            session.file_type, session.mime_type, session.file_name or None
+        )
+        if file_info is None:
+            # 临时文件已删除，需要重新上传
+            raise ChunkedUploadError('保存文件失败，请重新上传')
+        logger.info(f"分片上传完成: upload_id={upload_id}, file_id={file_info['file_id']}, size={session.total_size}")
+        return file_info
+
+    async def abort(self, user_id: int, upload_id: str):
+        """取消上传并删除临时文件"""
+        session = self._get(user_id, upload_id)
+        async with session.lock:
+            await self._discard(session)
+
+    def _get(self, user_id: int, upload_id: str) -> UploadSession:
+        session = self._sessions.get(upload_id) if upload_id else None
+        if session is None or session.user_id != user_id:
+            raise ChunkedUploadError('上传会话不存在或已过期')
+        return session
+
+    async def _discard(self, session: UploadSession):
+        self._sessions.pop(session.upload_id, None)
+        await remove_file(session.temp_path)
+
+    async def _expire_sessions(self):
+        """清理空闲超时的上传会话（定期清理与新上传开始时执行）"""
+        ttl = settings.CHUNKED_UPLOAD_SESSION_TTL
+        now = time.monotonic()
+        expired = [s for s in self._sessions.values() if now - s.updated_at > ttl and not s.lock.locked()]
+        for session in expired:
+            await self._discard(session)
+            logger.info(f"分片上传会话已过期: upload_id={session.upload_id}, user={session.user_id}")
+
+
+# 全局分片上传管理实例
+chunked_uploads = ChunkedUploadManager()
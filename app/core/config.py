@@ -45,6 +45,24 @@ class Settings(BaseSettings):
     DB_POOL_RECYCLE: int = Field(default=3600, description="数据库连接回收时间（秒）")
     DB_ECHO: bool = Field(default=False, description="是否打印 SQL 语句（调试用）")
     
+    # 只读副本配置（历史消息、会话列表、统计、操作日志等只读接口）
+    DATABASE_READ_URL: Optional[str] = Field(
+        default=None,
+        description="只读副本异步连接串（postgresql+asyncpg://...），为空时只读接口使用主库"
+    )
+    DB_READ_POOL_SIZE: int = Field(default=20, description="只读副本连接池大小")
+    DB_READ_MAX_OVERFLOW: int = Field(default=10, description="只读副本连接池最大溢出数")
+    READ_REPLICA_MAX_LAG: float = Field(default=5.0, description="只读副本最大复制延迟（秒），超过时读请求回退到主库")
+    READ_REPLICA_CHECK_INTERVAL: float = Field(default=2.0, description="只读副本复制延迟检查间隔（秒）")
+    READ_YOUR_WRITES_WINDOW: float = Field(
+        default=10.0,
+        description="读己之写窗口（秒）：用户写入后该时间内其读请求使用主库，应不小于 READ_REPLICA_MAX_LAG"
+    )
+    READ_YOUR_WRITES_REDIS_ENABLED: bool = Field(
+        default=False,
+        description="读己之写登记是否存于 Redis（多 worker 部署时在集群内共享）"
+    )
+    
     @property
     def DATABASE_URL(self) -> str:
         """构建 PostgreSQL 异步连接串"""
@@ -159,7 +177,118 @@ class Settings(BaseSettings):
         description="Socket.io CORS 源（逗号分隔）"
     )
     SOCKETIO_ASYNC_MODE: str = Field(default="aiohttp", description="Socket.io 异步模式")
+    SOCKETIO_REDIS_ENABLED: bool = Field(
+        default=False,
+        description="是否通过 Redis 在 worker/节点间转发 Socket.io 消息并共享在线状态（多 worker 部署必须开启）"
+    )
+    SOCKETIO_REDIS_CHANNEL: str = Field(default="mop_socketio", description="Socket.io Redis 发布/订阅频道名")
+    SOCKETIO_MSGPACK_ENABLED: bool = Field(
+        default=True,
+        description="是否允许客户端使用 MessagePack 编码（按连接协商，使用 msgpack 解析器的客户端生效，JSON 客户端不受影响；需安装 msgpack）"
+    )
+    SOCKETIO_LEGACY_READ_RECEIPTS: bool = Field(
+        default=True,
+        description="兼容旧客户端：推送 messages_read 的同时逐条推送已弃用的 message_read（点对点消息），计划于 2027-01-31 移除"
+    )
+    PRESENCE_HEARTBEAT_INTERVAL: int = Field(default=10, description="在线状态 worker 心跳间隔（秒）")
+    PRESENCE_WORKER_TTL: int = Field(default=30, description="worker 心跳超时时间（秒），超时后其会话被视为离线")
+    PRESENCE_BATCH_INTERVAL: float = Field(default=0.5, description="在线状态变化合并推送间隔（秒）")
+    PRESENCE_OFFLINE_GRACE: float = Field(default=15.0, description="断线宽限期（秒），期内重连不推送上下线")
+    PRESENCE_ROOM_SUBSCRIPTIONS: bool = Field(
+        default=False,
+        description="在线状态是否同时推送给同一活跃房间的成员（默认只推送给已接受的好友）"
+    )
+    PRESENCE_WRITE_INTERVAL: float = Field(default=2.0, description="在线状态批量写回 users 表的间隔（秒）")
+    
+    # ==================== Socket.io 事件限流配置 ====================
+    SOCKETIO_RATE_LIMIT_ENABLED: bool = Field(default=True, description="是否启用 Socket.io 事件限流")
+    SOCKETIO_RATE_LIMITS: str = Field(
+        default=(
+            "send_message=10/30,mark_message_read=10/30,ack_delivered=20/60,get_online_friends=1/5,"
+            "call_invitation=0.5/5,call_invitation_response=1/5,upload_chunk=200/400,*=20/50"
+        ),
+        description="单个连接的令牌桶（事件名=每秒速率/突发容量，逗号分隔；* 为其余事件共用，速率 0 表示不限流）"
+    )
+    SOCKETIO_USER_RATE_LIMITS: str = Field(
+        default=(
+            "send_message=20/60,mark_message_read=20/60,ack_delivered=40/120,get_online_friends=2/10,"
+            "call_invitation=1/10,call_invitation_response=2/10,upload_chunk=400/800,*=50/100"
+        ),
+        description="单个用户全部连接合计的令牌桶（格式同 SOCKETIO_RATE_LIMITS）"
+    )
+    SOCKETIO_MAX_INFLIGHT_PER_SID: int = Field(
+        default=16,
+        description="单个连接同时处理中的事件数上限（背压），超出时直接拒绝，0 表示不限制"
+    )
+    SOCKETIO_RATE_LIMIT_MAX_BUCKETS: int = Field(default=200000, description="本 worker 令牌桶最大数量（LRU 淘汰）")
+    SOCKETIO_RATE_LIMIT_REDIS_ENABLED: bool = Field(
+        default=False,
+        description="用户级令牌桶是否存于 Redis（多 worker 部署时在集群内合计，Redis 不可用时降级为本 worker）"
+    )
+    
+    # ==================== 用户鉴权缓存配置 ====================
+    USER_CACHE_LOCAL_TTL: int = Field(default=60, description="用户鉴权缓存进程内过期时间（秒）")
+    USER_CACHE_MAX_SIZE: int = Field(default=10000, description="用户鉴权缓存进程内最大条目数（LRU 淘汰）")
+    USER_CACHE_REDIS_ENABLED: bool = Field(
+        default=False,
+        description="是否启用 Redis 共享鉴权缓存层（失效通过发布/订阅同步到所有 worker）"
+    )
+    USER_CACHE_REDIS_TTL: int = Field(default=600, description="用户鉴权缓存 Redis 过期时间（秒）")
+    
+    # ==================== 房间成员关系缓存配置 ====================
+    ROOM_MEMBERSHIP_CACHE_TTL: int = Field(
+        default=60,
+        description="房间成员关系缓存过期时间（秒），其他 worker 变更参与者后最长在此时间内生效"
+    )
+    ROOM_MEMBERSHIP_CACHE_MAX_SIZE: int = Field(default=10000, description="房间成员关系缓存最大用户数（LRU 淘汰）")
+    
+    # ==================== 消息写入批处理配置 ====================
+    MESSAGE_INGEST_BATCH_SIZE: int = Field(default=500, description="Socket.io 消息批量写入每批最大条数")
+    MESSAGE_INGEST_MAX_DELAY_MS: float = Field(
+        default=2.0,
+        description="有并发发送时，收到第一条消息后继续收集同批消息的最长等待（毫秒），0 表示只合并已排队的消息"
+    )
+    
+    # ==================== 重连补发配置 ====================
+    RESUME_BATCH_SIZE: int = Field(default=100, description="重连补发每批 message_backlog 的最大消息数")
+    RESUME_MAX_MESSAGES: int = Field(
+        default=2000,
+        description="单次重连最多补发的消息数，超出时 backlog_complete.truncated 为 true，客户端改用 HTTP 增量接口"
+    )
+    RESUME_MAX_CONVERSATIONS: int = Field(default=200, description="单次重连最多补发的会话数（最近活跃优先）")
     
+    # ==================== 批量增量同步配置 ====================
+    SYNC_MAX_MESSAGES: int = Field(default=500, description="/chat/sync 单次最多返回的新消息数")
+    SYNC_MAX_CONVERSATIONS: int = Field(default=200, description="/chat/sync 单次最多返回的会话摘要变化数")
+    SYNC_MAX_READ_RECEIPTS: int = Field(default=500, description="/chat/sync 单次最多返回的已读回执变化数")
+    SYNC_SETTLE_SECONDS: float = Field(
+        default=5.0,
+        description="同步游标只前进到早于该时间（秒）的变化，防止晚提交的事务被跳过；更新的变化会在下次重复返回"
+    )
+    
+    # ==================== 运行时指标配置 ====================
+    RUNTIME_METRICS_WINDOW: int = Field(default=2048, description="事件循环延迟、连接池等待等分位数统计保留的最近样本数")
+    LOOP_LAG_SAMPLE_INTERVAL: float = Field(default=0.25, description="事件循环延迟采样间隔（秒），0 表示不采样")
+    LOOP_LAG_STALL_THRESHOLD: float = Field(default=0.1, description="事件循环延迟超过该值（秒）时计为一次阻塞并记录警告")
+    
+    # ==================== 统计汇总配置 ====================
+    STATS_ROLLUP_FLUSH_INTERVAL: float = Field(
+        default=2.0,
+        description="统计计数器增量写入间隔（秒），也是统计接口 stale_after 相对当前时间的偏移"
+    )
+    STATS_ROLLUP_RECONCILE_INTERVAL: int = Field(
+        default=600,
+        description="统计计数器按源表对账间隔（秒），修正未登记增量的写入路径造成的偏差"
+    )
+    
+    # ==================== 分片上传配置 ====================
+    CHUNKED_UPLOAD_CHUNK_SIZE: int = Field(default=256 * 1024, description="Socket.io 分片上传建议分片大小（字节）")
+    CHUNKED_UPLOAD_MAX_CHUNK_SIZE: int = Field(default=1024 * 1024, description="Socket.io 分片上传单个分片最大字节数")
+    CHUNKED_UPLOAD_MAX_SIZE: int = Field(default=200 * 1024 * 1024, description="Socket.io 分片上传单个文件最大字节数")
+    CHUNKED_UPLOAD_SESSION_TTL: int = Field(default=3600, description="分片上传会话空闲超时（秒），超时后临时文件被清理，无法续传")
+    CHUNKED_UPLOAD_SWEEP_INTERVAL: int = Field(default=300, description="分片上传清理间隔（秒）：清理空闲超时的会话与遗留的临时文件")
+    CHUNKED_UPLOAD_MAX_SESSIONS_PER_USER: int = Field(default=4, description="每个用户同时未完成的分片上传数上限（0 表示不限制）")
+
     @field_validator("JWT_SECRET_KEY")
     @classmethod
     def validate_jwt_secret(cls, v: str) -> str:
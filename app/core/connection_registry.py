@@ -0,0 +1,81 @@
+"""
+Socket.io 本地连接注册表
+同时维护 user_id -> {sid: 连接记录} 与 sid -> 连接记录 两个索引，事件处理器按 sid 查找用户为 O(1)
+"""
+
+from typing import Dict, Optional, Tuple
+
+
+class ConnectionRecord:
+    """
+    单个 Socket 连接的会话信息，只保留事件处理器需要的字段
+
+    不保存用户对象与连接时间：数万连接时逐连接的 dict、datetime 与用户快照占用大量内存而无人读取；
+    需要其他用户字段时请通过 user_auth_cache 按 user_id 获取
+    """
+
+    __slots__ = ("user_id", "nickname", "is_super_admin")
+
+    def __init__(self, user_id: int, nickname: Optional[str] = None, is_super_admin: bool = False):
+        self.user_id = user_id
+        self.nickname = nickname
+        self.is_super_admin = is_super_admin
+
+    def __repr__(self) -> str:
+        return f"ConnectionRecord(user_id={self.user_id})"
+
+
+class ConnectionRegistry:
+    """
+    本 worker 的 Socket 连接注册表
+
+    by_user: {user_id: {sid: ConnectionRecord}}（即 socketio.connected_users）
+    by_sid:  {sid: ConnectionRecord}（反向索引，与 by_user 共享同一记录对象）
+    """
+
+    __slots__ = ("by_user", "by_sid")
+
+    def __init__(self):
+        self.by_user: Dict[int, Dict[str, ConnectionRecord]] = {}
+        self.by_sid: Dict[str, ConnectionRecord] = {}
+
+    def add(self, sid: str, record: ConnectionRecord):
+        """登记连接"""
+        self.by_user.setdefault(record.user_id, {})[sid] = record
+        self.by_sid[sid] = record
+
+    def remove(self, sid: str) -> Tuple[Optional[int], bool]:
+        """
+        移除连接
+
+        Returns:
+            (user_id, 该用户在本 worker 是否已无连接)；sid 未登记时返回 (None, False)
+        """
+        record = self.by_sid.pop(sid, None)
+        if record is None:
+            return None, False
+        user_id = record.user_id
+        sockets = self.by_user.get(user_id)
+        if sockets is None:
+            return user_id, True
+        sockets.pop(sid, None)
+        if not sockets:
+            del self.by_user[user_id]
+            return user_id, True
+        return user_id, False
+
+    def user_id_of(self, sid: str) -> Optional[int]:
+        """按 sid 查找用户ID"""
+        record = self.by_sid.get(sid)
+        return record.user_id if record is not None else None
+
+    def record_of(self, sid: str) -> Optional[ConnectionRecord]:
+        """按 sid 查找连接记录"""
+        return self.by_sid.get(sid)
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self.by_user
+
+    def __len__(self) -> int:
+        """本 worker 的连接总数"""
+        return len(self.by_sid)
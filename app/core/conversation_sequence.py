@@ -0,0 +1,139 @@
+"""
+会话序号与送达游标模块
+每个会话（房间 / 点对点用户对）的消息按 messages.seq 单调编号，计数器存于 conversation_sequences，
+写入消息时在同一事务内分配；每个用户每个会话的已送达游标存于 conversation_summaries.delivered_seq，
+由客户端 ack_delivered 推进。重连（connect 的 auth 带 resume）时只补发 (delivered_seq, last_message_seq]
+区间内的消息，客户端不再逐会话轮询 /chat/messages/since。
+"""
+
+from collections import Counter
+from typing import Iterable, List, Optional, Tuple
+
+from sqlalchemy import and_, func, or_, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.models import ConversationSequence, ConversationSummary, Message
+
+
+def conversation_key(room_id: Optional[int], sender_id: int, receiver_id: Optional[int]) -> Optional[str]:
+    """会话键（与迁移 a4c7e9b2d6f1 的 SQL 表达式一致），既无房间也无接收者时返回 None"""
+    if room_id:
+        return f"room:{room_id}"
+    if receiver_id:
+        return f"direct:{min(sender_id, receiver_id)}:{max(sender_id, receiver_id)}"
+    return None
+
+
+def _message_key(message: Message) -> Optional[str]:
+    return conversation_key(message.room_id, message.sender_id, message.receiver_id)
+
+
+async def assign_sequences(db: AsyncSession, messages: Iterable[Message]):
+    """
+    写入消息前分配会话序号（与消息写入为同一事务）
+
+    批内全部会话合并为一条 upsert ... RETURNING；计数器行锁持有到事务提交，
+    并发事务对同一会话按提交顺序取号。同一会话内按传入顺序编号。
+    """
+    messages = list(messages)
+    counts = Counter(key for key in map(_message_key, messages) if key)
+    if not counts:
+        return
+    # 固定加锁顺序，避免多会话批次之间死锁
+    rows = [{"conversation_key": key, "last_seq": counts[key]} for key in sorted(counts)]
+    stmt = pg_insert(ConversationSequence).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[ConversationSequence.conversation_key],
+        set_={"last_seq": ConversationSequence.last_seq + stmt.excluded.last_seq},
+    ).returning(ConversationSequence.conversation_key, ConversationSequence.last_seq)
+    result = await db.execute(stmt)
+    next_seq = {key: last_seq - counts[key] + 1 for key, last_seq in result.all()}
+    for message in messages:
+        key = _message_key(message)
+        if key:
+            message.seq = next_seq[key]
+            next_seq[key] += 1
+
+
+def _conversation_filter(owner_id: int, room_id: Optional[int], peer_id: Optional[int]):
+    if room_id:
+        return and_(ConversationSummary.owner_id == owner_id, ConversationSummary.room_id == room_id)
+    return and_(
+        ConversationSummary.owner_id == owner_id,
+        ConversationSummary.room_id.is_(None),
+        ConversationSummary.peer_id == peer_id,
+    )
+
+
+async def advance_delivered(
+    db: AsyncSession,
+    owner_id: int,
+    acks: Iterable[Tuple[Optional[int], Optional[int], int]],
+) -> int:
+    """
+    推进已送达游标（只前进不后退，不超过会话最后序号）
+
+    Args:
+        acks: (room_id, peer_id, seq)，同一会话多次确认取最大值
+
+    Returns:
+        更新的会话数
+    """
+    latest = {}
+    for room_id, peer_id, seq in acks:
+        key = (room_id, None) if room_id else (None, peer_id)
+        latest[key] = max(latest.get(key, 0), seq)
+
+    updated = 0
+    for (room_id, peer_id), seq in latest.items():
+        result = await db.execute(
+            update(ConversationSummary)
+            .where(
+                _conversation_filter(owner_id, room_id, peer_id),
+                ConversationSummary.delivered_seq < seq,
+            )
+            .values(delivered_seq=func.least(seq, ConversationSummary.last_message_seq))
+        )
+        updated += result.rowcount
+    return updated
+
+
+async def load_undelivered(db: AsyncSession, owner_id: int, limit: int) -> List[ConversationSummary]:
+    """有未送达消息的会话（最近活跃的优先），至多 limit 个"""
+    result = await db.execute(
+        select(ConversationSummary)
+        .where(
+            ConversationSummary.owner_id == owner_id,
+            ConversationSummary.last_message_seq > ConversationSummary.delivered_seq,
+        )
+        .order_by(ConversationSummary.last_message_at.desc())
+        .limit(limit)
+    )
+    return list(result.scalars().all())
+
+
+async def fetch_backlog(db: AsyncSession, summary: ConversationSummary, after_seq: int, limit: int) -> List[Message]:
+    """读取会话中序号在 (after_seq, last_message_seq] 内的消息，按序号升序，至多 limit 条"""
+    if summary.room_id:
+        conversation = Message.room_id == summary.room_id
+    else:
+        owner_id, peer_id = summary.owner_id, summary.peer_id
+        conversation = and_(
+            Message.room_id.is_(None),
+            or_(
+                and_(Message.sender_id == owner_id, Message.receiver_id == peer_id),
+                and_(Message.sender_id == peer_id, Message.receiver_id == owner_id),
+            ),
+        )
+    result = await db.execute(
+        select(Message)
+        .where(
+            conversation,
+            Message.seq > after_seq,
+            Message.seq <= summary.last_message_seq,
+        )
+        .order_by(Message.seq.asc())
+        .limit(limit)
+    )
+    return list(result.scalars().all())
@@ -0,0 +1,309 @@
+"""
+会话摘要维护模块
+消息写入与已读回执时，在调用方的同一事务内更新 conversation_summaries，
+会话列表接口直接按 (owner_id, last_message_at) 索引读取，无需从 messages 表实时聚合；
+每次变更同时取新的 sync_seq，批量同步接口（/chat/sync）据此读取变化的会话
+
+房间消息的 is_read 为所有成员共用，房间未读数改按每个成员自己的已读水位 read_seq 扣减：
+成员标记房间消息已读时把水位推进到其中最大的会话序号，扣减水位之间非自己发送的消息数
+"""
+
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Iterable, Optional, Tuple
+
+from sqlalchemy import Integer, DateTime, case, func, literal, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.models import ConversationSummary, Message, RoomParticipant, conversation_sync_seq
+
+_SUMMARY_COLUMNS = [
+    "owner_id", "peer_id", "room_id", "last_message_id", "last_message_at", "unread_count",
+    "last_message_seq", "delivered_seq", "read_seq", "updated_at",
+]
+
+
+def _naive_utc(value: Optional[datetime]) -> datetime:
+    """数据库字段为 TIMESTAMP WITHOUT TIME ZONE，统一转为不带时区的 UTC 时间"""
+    if value is None:
+        return datetime.utcnow()
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _on_conflict_merge(stmt, is_room: bool):
+    """冲突时合并：仅当新消息ID更大时覆盖最后消息与序号，未读数累加；已送达游标只由 ack 推进"""
+    excluded = stmt.excluded
+    is_newer = excluded.last_message_id > func.coalesce(ConversationSummary.last_message_id, 0)
+    return stmt.on_conflict_do_update(
+        index_elements=[ConversationSummary.owner_id, ConversationSummary.room_id if is_room else ConversationSummary.peer_id],
+        index_where=ConversationSummary.room_id.isnot(None) if is_room else ConversationSummary.room_id.is_(None),
+        set_={
+            "last_message_id": case((is_newer, excluded.last_message_id), else_=ConversationSummary.last_message_id),
+            "last_message_at": case((is_newer, excluded.last_message_at), else_=ConversationSummary.last_message_at),
+            "last_message_seq": case((is_newer, excluded.last_message_seq), else_=ConversationSummary.last_message_seq),
+            "unread_count": ConversationSummary.unread_count + excluded.unread_count,
+            "updated_at": excluded.updated_at,
+            "sync_seq": conversation_sync_seq.next_value(),
+        },
+    )
+
+
+async def record_message(db: AsyncSession, message: Message):
+    """
+    消息写入后更新会话摘要（调用前需 flush 以获得消息ID）
+
+    点对点：更新发送者与接收者各自的会话行，接收者未读数 +1
+    房间：更新房间内所有活跃参与者的会话行，除发送者外未读数 +1（新建行的已读水位从本条消息之前开始）
+
+    Args:
+        db: 数据库会话（与消息写入为同一事务）
+        message: 已 flush 的消息对象
+    """
+    now = datetime.utcnow()
+    created_at = _naive_utc(message.created_at)
+    # 新建的摘要行从本条消息之前开始计送达游标（未编号的消息序号为 0）
+    seq = message.seq or 0
+    delivered = max(seq - 1, 0)
+
+    if message.room_id:
+        participants = (
+            select(
+                RoomParticipant.user_id,
+                literal(None, Integer),
+                literal(message.room_id, Integer),
+                literal(message.id, Integer),
+                literal(created_at, DateTime),
+                case((RoomParticipant.user_id == message.sender_id, 0), else_=1),
+                literal(seq, Integer),
+                literal(delivered, Integer),
+                literal(delivered, Integer),
+                literal(now, DateTime),
+            )
+            .where(
+                RoomParticipant.room_id == message.room_id,
+                RoomParticipant.is_active == True
+            )
+            .distinct()
+        )
+        stmt = pg_insert(ConversationSummary).from_select(_SUMMARY_COLUMNS, participants)
+        await db.execute(_on_conflict_merge(stmt, is_room=True))
+        return
+
+    if not message.receiver_id:
+        return
+
+    rows = [{
+        "owner_id": message.sender_id,
+        "peer_id": message.receiver_id,
+        "room_id": None,
+        "last_message_id": message.id,
+        "last_message_at": created_at,
+        "unread_count": 0,
+        "last_message_seq": seq,
+        "delivered_seq": delivered,
+        "read_seq": 0,
+        "updated_at": now,
+    }]
+    if message.receiver_id != message.sender_id:
+        rows.append({
+            "owner_id": message.receiver_id,
+            "peer_id": message.sender_id,
+            "room_id": None,
+            "last_message_id": message.id,
+            "last_message_at": created_at,
+            "unread_count": 1,
+            "last_message_seq": seq,
+            "delivered_seq": delivered,
+            "read_seq": 0,
+            "updated_at": now,
+        })
+    stmt = pg_insert(ConversationSummary).values(rows)
+    await db.execute(_on_conflict_merge(stmt, is_room=False))
+
+
+async def record_messages(db: AsyncSession, messages: Iterable[Message]):
+    """
+    批量写入的消息更新会话摘要（消息写入批处理使用，结果与逐条调用 record_message 相同）
+
+    同一语句不能重复更新同一摘要行，因此先按会话合并：点对点消息合并为一条 upsert，
+    每个房间一条 upsert（未读数 = 房间内新消息数 - 该参与者自己发送的条数）
+
+    Args:
+        db: 数据库会话（与消息写入为同一事务）
+        messages: 已获得ID的消息对象
+    """
+    now = datetime.utcnow()
+    # {(owner_id, peer_id): [last_message_id, last_message_at, last_message_seq, 批内最小序号, unread_count]}
+    direct = {}
+    # {room_id: [last_message_id, last_message_at, last_message_seq, 批内最小序号, 消息数, Counter(sender_id)]}
+    rooms = {}
+
+    for message in messages:
+        created_at = _naive_utc(message.created_at)
+        seq = message.seq or 0
+        if message.room_id:
+            entry = rooms.setdefault(message.room_id, [0, created_at, 0, seq, 0, Counter()])
+            if message.id > entry[0]:
+                entry[0], entry[1], entry[2] = message.id, created_at, seq
+            entry[3] = min(entry[3], seq)
+            entry[4] += 1
+            entry[5][message.sender_id] += 1
+            continue
+        if not message.receiver_id:
+            continue
+        owners = [(message.sender_id, message.receiver_id, 0)]
+        if message.receiver_id != message.sender_id:
+            owners.append((message.receiver_id, message.sender_id, 1))
+        for owner_id, peer_id, unread in owners:
+            entry = direct.setdefault((owner_id, peer_id), [0, created_at, 0, seq, 0])
+            if message.id > entry[0]:
+                entry[0], entry[1], entry[2] = message.id, created_at, seq
+            entry[3] = min(entry[3], seq)
+            entry[4] += unread
+
+    if direct:
+        rows = [{
+            "owner_id": owner_id,
+            "peer_id": peer_id,
+            "room_id": None,
+            "last_message_id": last_id,
+            "last_message_at": last_at,
+            "unread_count": unread,
+            "last_message_seq": last_seq,
+            "delivered_seq": max(first_seq - 1, 0),
+            "read_seq": 0,
+            "updated_at": now,
+        } for (owner_id, peer_id), (last_id, last_at, last_seq, first_seq, unread) in direct.items()]
+        stmt = pg_insert(ConversationSummary).values(rows)
+        await db.execute(_on_conflict_merge(stmt, is_room=False))
+
+    for room_id, (last_id, last_at, last_seq, first_seq, total, sent_by) in rooms.items():
+        own_messages = case(
+            *[(RoomParticipant.user_id == sender_id, count) for sender_id, count in sent_by.items()],
+            else_=0,
+        )
+        participants = (
+            select(
+                RoomParticipant.user_id,
+                literal(None, Integer),
+                literal(room_id, Integer),
+                literal(last_id, Integer),
+                literal(last_at, DateTime),
+                literal(total, Integer) - own_messages,
+                literal(last_seq, Integer),
+                literal(max(first_seq - 1, 0), Integer),
+                literal(max(first_seq - 1, 0), Integer),
+                literal(now, DateTime),
+            )
+            .where(
+                RoomParticipant.room_id == room_id,
+                RoomParticipant.is_active == True
+            )
+            .distinct()
+        )
+        stmt = pg_insert(ConversationSummary).from_select(_SUMMARY_COLUMNS, participants)
+        await db.execute(_on_conflict_merge(stmt, is_room=True))
+
+
+async def apply_read_receipts(
+    db: AsyncSession,
+    reader_id: int,
+    read_messages: Iterable[Tuple[int, Optional[int], Optional[int]]],
+):
+    """
+    点对点消息被标记已读后扣减会话未读数
+
+    Args:
+        db: 数据库会话（与已读更新为同一事务）
+        reader_id: 执行已读操作的用户ID
+        read_messages: 本次由未读变为已读的消息 (sender_id, receiver_id, room_id)
+    """
+    await apply_read_counts(db, reader_id, [(*message, 1) for message in read_messages])
+
+
+async def apply_read_counts(
+    db: AsyncSession,
+    reader_id: int,
+    read_groups: Iterable[Tuple[int, Optional[int], Optional[int], int]],
+):
+    """
+    按分组扣减点对点会话未读数（已读回执按发送者分组后使用）
+
+    房间消息的 is_read 为所有成员共用，只有第一个标记的成员能把它从未读变为已读，
+    房间未读数由 advance_room_reads 按成员自己的已读水位扣减，这里忽略房间分组
+
+    Args:
+        db: 数据库会话（与已读更新为同一事务）
+        reader_id: 执行已读操作的用户ID
+        read_groups: (sender_id, receiver_id, room_id, 本次由未读变为已读的条数)
+    """
+    decrements = Counter()
+    for sender_id, receiver_id, room_id, count in read_groups:
+        if not room_id and receiver_id:
+            decrements[(receiver_id, sender_id)] += count
+
+    for (owner_id, peer_id), count in decrements.items():
+        await db.execute(
+            update(ConversationSummary)
+            .where(
+                ConversationSummary.owner_id == owner_id,
+                ConversationSummary.room_id.is_(None),
+                ConversationSummary.peer_id == peer_id,
+            )
+            .values(
+                unread_count=func.greatest(ConversationSummary.unread_count - count, 0),
+                updated_at=datetime.utcnow(),
+                sync_seq=conversation_sync_seq.next_value(),
+            )
+        )
+
+
+async def advance_room_reads(db: AsyncSession, reader_id: int, message_ids: Iterable[int]):
+    """
+    成员标记房间消息已读：按房间把该成员的已读水位推进到所标记消息中最大的会话序号，
+    未读数扣减原水位与新水位之间非自己发送的消息数（与共用的 is_read 是否变化无关）
+
+    一条 UPDATE ... FROM：按ID取出房间消息的最大序号，只更新该成员自己的摘要行，
+    因此不是房间成员（没有摘要行）或水位已更靠后时不产生任何变化
+
+    Args:
+        db: 数据库会话（与已读更新为同一事务）
+        reader_id: 执行已读操作的用户ID
+        message_ids: 本次标记的消息ID（点对点消息被忽略）
+    """
+    message_ids = list(message_ids)
+    if not message_ids:
+        return
+    targets = (
+        select(Message.room_id, func.max(Message.seq).label("up_to_seq"))
+        .where(Message.id.in_(message_ids), Message.room_id.isnot(None))
+        .group_by(Message.room_id)
+        .subquery("room_reads")
+    )
+    newly_read = (
+        select(func.count())
+        .where(
+            Message.room_id == ConversationSummary.room_id,
+            Message.seq > ConversationSummary.read_seq,
+            Message.seq <= targets.c.up_to_seq,
+            Message.sender_id != reader_id,
+        )
+        .scalar_subquery()
+    )
+    await db.execute(
+        update(ConversationSummary)
+        .where(
+            ConversationSummary.owner_id == reader_id,
+            ConversationSummary.room_id == targets.c.room_id,
+            ConversationSummary.read_seq < targets.c.up_to_seq,
+        )
+        .values(
+            unread_count=func.greatest(ConversationSummary.unread_count - newly_read, 0),
+            read_seq=targets.c.up_to_seq,
+            updated_at=datetime.utcnow(),
+            sync_seq=conversation_sync_seq.next_value(),
+        )
+    )
@@ -0,0 +1,264 @@
+"""
+Socket.io 事件限流模块
+按事件类型配置令牌桶，同时限制单个连接（sid）与单个用户（全部连接合计）的事件速率，
+并限制单个连接同时处理中的事件数（背压），超出时拒绝事件而不访问数据库
+
+- 连接级令牌桶与处理中计数只存于本 worker（连接只属于一个 worker）
+- 用户级令牌桶默认存于本 worker；启用 SOCKETIO_RATE_LIMIT_REDIS_ENABLED 后在集群内共享，
+  Redis 不可用时降级为本 worker 令牌桶
+"""
+
+import time
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from app.core.config import settings
+
+# Redis 键前缀
+RATE_LIMIT_KEY_PREFIX = "mop:ratelimit"
+
+# 通配事件类型：未单独配置的事件使用该令牌桶
+DEFAULT_EVENT = "*"
+
+# 原子取令牌：HASH 保存 tokens / ts，按经过时间补充后尝试扣减，返回 {是否允许, 需等待毫秒数}
+_TAKE_TOKEN_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+local wait_ms = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+else
+    wait_ms = math.ceil((1 - tokens) / rate * 1000)
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+return {allowed, wait_ms}
+"""
+
+
+def parse_limits(spec: str) -> Dict[str, Tuple[float, float]]:
+    """
+    解析限流配置
+
+    格式：事件名=每秒速率/突发容量，逗号分隔，如 "send_message=5/20,*=20/50"；
+    速率为 0 表示不限流，格式无效的项记录警告后忽略
+
+    Returns:
+        {事件名: (每秒速率, 突发容量)}
+    """
+    limits = {}
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        try:
+            event, value = item.split("=", 1)
+            rate, burst = value.split("/", 1)
+            limits[event.strip()] = (float(rate), max(float(burst), 1.0))
+        except ValueError:
+            logger.warning(f"忽略格式无效的限流配置项: {item}")
+    return limits
+
+
+class RateLimitDecision:
+    """限流结果：rejected 为 None 表示允许，否则为拒绝原因（sid / user / inflight）"""
+
+    __slots__ = ("rejected", "retry_after")
+
+    def __init__(self, rejected: Optional[str] = None, retry_after: float = 0.0):
+        self.rejected = rejected
+        self.retry_after = retry_after
+
+    @property
+    def allowed(self) -> bool:
+        return self.rejected is None
+
+
+_ALLOWED = RateLimitDecision()
+
+
+class EventRateLimiter:
+    """Socket.io 事件限流器（连接级 + 用户级令牌桶，连接级处理中上限）"""
+
+    def __init__(self):
+        self.sid_limits: Dict[str, Tuple[float, float]] = {}
+        self.user_limits: Dict[str, Tuple[float, float]] = {}
+        # {(sid, 桶名) 或 (user_id, 桶名): [tokens, 最后补充时间]}，按最近使用排序
+        self._buckets: "OrderedDict[tuple, List[float]]" = OrderedDict()
+        # {sid: 处理中的事件数}
+        self._inflight: Dict[str, int] = {}
+        # {sid: {event: 最近一次发送 rate_limited 帧的时间}}
+        self._notified: Dict[str, Dict[str, float]] = {}
+        self._redis = None
+        self._take_script = None
+        self.counters = {"allowed": 0, "throttled": 0, "redis_errors": 0}
+        self.throttled_by_event: Counter = Counter()
+        self.throttled_by_scope: Counter = Counter()
+        self.reload()
+
+    def reload(self):
+        """按当前配置重新解析各事件的令牌桶参数"""
+        self.sid_limits = parse_limits(settings.SOCKETIO_RATE_LIMITS)
+        self.user_limits = parse_limits(settings.SOCKETIO_USER_RATE_LIMITS)
+
+    async def start(self):
+        """连接 Redis（未启用共享用户级限流时仅使用本 worker 令牌桶）"""
+        self.reload()
+        if not settings.SOCKETIO_RATE_LIMIT_REDIS_ENABLED:
+            logger.info("Socket.io 事件限流使用本 worker 令牌桶（未启用 SOCKETIO_RATE_LIMIT_REDIS_ENABLED）")
+            return
+
+        import redis.asyncio as aioredis
+
+        self._redis = aioredis.from_url(
+            settings.REDIS_URL,
+            socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+            socket_connect_timeout=settings.REDIS_SOCKET_CONNECT_TIMEOUT,
+            decode_responses=True,
+        )
+        self._take_script = self._redis.register_script(_TAKE_TOKEN_SCRIPT)
+        logger.info("Socket.io 用户级事件限流使用 Redis 共享令牌桶")
+
+    async def stop(self):
+        if self._redis is not None:
+            await self._redis.close()
+            self._redis = None
+        self._buckets.clear()
+        self._inflight.clear()
+        self._notified.clear()
+
+    # ==================== 令牌桶 ====================
+
+    @staticmethod
+    def _limit_for(limits: Dict[str, Tuple[float, float]], event: str) -> Optional[Tuple[str, float, float]]:
+        """事件对应的令牌桶 (桶名, 速率, 容量)；未单独配置的事件共用通配令牌桶，不限流时返回 None"""
+        name = event if event in limits else DEFAULT_EVENT
+        limit = limits.get(name)
+        if not limit or limit[0] <= 0:
+            return None
+        return (name, *limit)
+
+    def _take_local(self, key: tuple, rate: float, burst: float) -> float:
+        """
+        从本地令牌桶取一个令牌
+
+        Returns:
+            0 表示取到令牌，否则为需要等待的秒数
+        """
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [burst, now]
+        else:
+            bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            self._buckets.move_to_end(key)
+        # 淘汰最久未使用的令牌桶（被淘汰的桶下次视为已满，多为早已补满的空闲桶）
+        while len(self._buckets) > settings.SOCKETIO_RATE_LIMIT_MAX_BUCKETS:
+            self._buckets.popitem(last=False)
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return 0.0
+        return (1 - bucket[0]) / rate
+
+    async def _take_user(self, user_id: int, name: str, rate: float, burst: float) -> float:
+        if self._redis is None:
+            return self._take_local((user_id, name), rate, burst)
+        try:
+            allowed, wait_ms = await self._take_script(
+                keys=[f"{RATE_LIMIT_KEY_PREFIX}:{user_id}:{name}"],
+                args=[rate, burst, time.time()],
+            )
+            return 0.0 if int(allowed) else int(wait_ms) / 1000
+        except Exception as e:
+            self.counters["redis_errors"] += 1
+            if self.counters["redis_errors"] % 1000 == 1:
+                logger.warning(f"Redis 限流失败，降级为本 worker 令牌桶: {e}")
+            return self._take_local((user_id, name), rate, burst)
+
+    # ==================== 对外接口 ====================
+
+    async def acquire(self, sid: str, user_id: Optional[int], event: str) -> RateLimitDecision:
+        """
+        事件处理前调用：检查处理中上限与令牌桶，允许时登记为处理中（处理完毕后必须调用 release）
+
+        检查顺序为处理中上限、连接级、用户级，任一拒绝即不再扣减后续令牌桶
+        """
+        if not settings.SOCKETIO_RATE_LIMIT_ENABLED:
+            return _ALLOWED
+
+        inflight = self._inflight.get(sid, 0)
+        if inflight >= settings.SOCKETIO_MAX_INFLIGHT_PER_SID > 0:
+            return self._reject(event, "inflight", 0.0)
+
+        limit = self._limit_for(self.sid_limits, event)
+        if limit:
+            name, rate, burst = limit
+            wait = self._take_local((sid, name), rate, burst)
+            if wait:
+                return self._reject(event, "sid", wait)
+
+        if user_id:
+            limit = self._limit_for(self.user_limits, event)
+            if limit:
+                wait = await self._take_user(user_id, *limit)
+                if wait:
+                    return self._reject(event, "user", wait)
+
+        self._inflight[sid] = inflight + 1
+        self.counters["allowed"] += 1
+        return _ALLOWED
+
+    def release(self, sid: str):
+        """事件处理完毕（含异常）后调用"""
+        remaining = self._inflight.get(sid, 0) - 1
+        if remaining > 0:
+            self._inflight[sid] = remaining
+        else:
+            self._inflight.pop(sid, None)
+
+    def should_notify(self, sid: str, event: str) -> bool:
+        """同一连接同一事件每秒至多发送一次 rate_limited 帧，避免拒绝本身放大出站流量"""
+        now = time.monotonic()
+        notified = self._notified.setdefault(sid, {})
+        if now - notified.get(event, 0.0) < 1.0:
+            return False
+        notified[event] = now
+        return True
+
+    def forget_sid(self, sid: str):
+        """连接断开时清理连接级状态"""
+        self._inflight.pop(sid, None)
+        self._notified.pop(sid, None)
+        for name in self.sid_limits:
+            self._buckets.pop((sid, name), None)
+
+    def _reject(self, event: str, scope: str, retry_after: float) -> RateLimitDecision:
+        self.counters["throttled"] += 1
+        self.throttled_by_event[event] += 1
+        self.throttled_by_scope[scope] += 1
+        return RateLimitDecision(scope, retry_after)
+
+    def stats(self) -> dict:
+        """放行与拒绝计数（按事件与拒绝原因）"""
+        return {
+            **self.counters,
+            "throttled_by_event": dict(self.throttled_by_event),
+            "throttled_by_scope": dict(self.throttled_by_scope),
+            "buckets": len(self._buckets),
+            "inflight": sum(self._inflight.values()),
+            "distributed": self._redis is not None,
+        }
+
+
+# 全局事件限流器
+event_rate_limiter = EventRateLimiter()
@@ -0,0 +1,81 @@
+"""
+文件访问控制模块
+聊天文件的访问权限通过 messages.file_id 建立：消息写入时把 file_url 解析为文件ID，
+下载鉴权时按 messages.file_id 索引做一次 EXISTS 查询，不再对 file_url 做 LIKE 扫描
+"""
+
+from typing import Optional
+from urllib.parse import parse_qs, urlsplit
+
+from sqlalchemy import and_, exists, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.models import File as FileModel, Message, RoomParticipant
+
+
+def parse_stored_filename(file_url: Optional[str]) -> Optional[str]:
+    """
+    从下载 URL 中解析存储文件名
+
+    Args:
+        file_url: 形如 /api/v1/files/download?file_type=image&stored_filename=xxx.png 的 URL
+
+    Returns:
+        存储文件名，不是下载 URL 时返回 None
+    """
+    if not file_url or 'stored_filename=' not in file_url:
+        return None
+    values = parse_qs(urlsplit(file_url).query).get('stored_filename')
+    return values[0] if values else None
+
+
+async def user_can_access_file(db: AsyncSession, file_record: FileModel, user_id: int) -> bool:
+    """
+    检查用户是否有权访问文件
+
+    1. 公开文件：允许所有人访问
+    2. 上传者：允许访问
+    3. 引用该文件的聊天消息的发送者/接收者，或房间消息所在房间的参与者
+    """
+    if file_record.is_public or file_record.uploader_id == user_id:
+        return True
+
+    is_room_member = exists().where(
+        RoomParticipant.room_id == Message.room_id,
+        RoomParticipant.user_id == user_id
+    )
+    result = await db.execute(
+        select(
+            exists().where(
+                Message.file_id == file_record.id,
+                or_(
+                    Message.sender_id == user_id,
+                    Message.receiver_id == user_id,
+                    and_(Message.room_id.isnot(None), is_room_member)
+                )
+            )
+        )
+    )
+    return bool(result.scalar())
+
+
+async def resolve_message_file_id(db: AsyncSession, file_url: Optional[str], sender_id: int) -> Optional[int]:
+    """
+    将消息携带的 file_url 解析为文件ID，用于写入 messages.file_id
+
+    只有发送者本人可访问该文件时才关联（转发收到的文件可以，引用他人私有文件不行），
+    避免通过伪造 file_url 的消息取得文件访问权
+
+    Returns:
+        文件ID，无法解析或无权关联时返回 None
+    """
+    stored_filename = parse_stored_filename(file_url)
+    if not stored_filename:
+        return None
+    result = await db.execute(
+        select(FileModel).where(FileModel.stored_filename == stored_filename)
+    )
+    file_record = result.scalar_one_or_none()
+    if not file_record or not await user_can_access_file(db, file_record, sender_id):
+        return None
+    return file_record.id
@@ -3,22 +3,147 @@
 实现大文件的服务器端转储功能，避免 Socket.io 消息过大
 """
 
-import base64
+import binascii
 import uuid
 from pathlib import Path
 from typing import Optional, Dict
 from datetime import datetime, timezone
+from urllib.parse import quote
 from loguru import logger
 
+from app.core.file_storage import FileTooLargeError, decode_base64_to_temp, remove_file, stream_upload_to_temp
+
 # Socket.io 消息大小阈值（超过此值将触发文件转储）
 MESSAGE_SIZE_THRESHOLD = 4 * 1024 * 1024  # 4MB
 
 
+def resolve_file_type(message_type: str, mime_type: str) -> str:
+    """
+    确定文件类型
+    
+    Args:
+        message_type: 消息类型（image/audio/voice/video/file 或其他）
+        mime_type: MIME 类型
+    
+    Returns:
+        image/audio/video/file 之一
+    """
+    # 支持 'voice' 作为 'audio' 的别名
+    normalized_type = 'audio' if message_type == 'voice' else message_type
+    
+    if normalized_type in ['image', 'audio', 'video', 'file']:
+        return normalized_type
+    if mime_type.startswith('image/'):
+        return 'image'
+    if mime_type.startswith('audio/'):
+        return 'audio'
+    if mime_type.startswith('video/'):
+        return 'video'
+    # 对于未知类型，统一使用 'file' 而不是 'document'，确保前端能正确显示
+    return 'file'
+
+
+def resolve_file_ext(file_name: Optional[str]) -> str:
+    """一律按原始文件名扩展名，无预设允许列表，减少维护与资源消耗"""
+    if file_name and '.' in file_name:
+        return Path(file_name).suffix.lower()
+    return '.bin'
+
+
+def build_file_url(file_type: str, stored_filename: str) -> str:
+    """生成文件访问 URL（使用查询参数避免路径参数点号问题）"""
+    return f"/api/v1/files/download?file_type={quote(file_type)}&stored_filename={quote(stored_filename)}"
+
+
+async def store_temp_file(
+    temp_path: Path,
+    file_size: int,
+    content_hash: str,
+    sender_id: int,
+    file_type: str,
+    mime_type: str,
+    file_name: Optional[str] = None
+) -> Optional[Dict]:
+    """
+    将已写完的临时文件存入内容寻址存储并创建文件记录
+    
+    相同内容只在磁盘保存一份（uploads/blobs/...），每次发送仍创建独立的 File 记录与下载 URL
+    
+    Args:
+        temp_path: 临时文件路径（函数返回后已移动或删除）
+        file_size: 文件大小（字节）
+        content_hash: SHA-256 十六进制（写入临时文件时增量计算）
+        sender_id: 上传者用户ID
+        file_type: 文件类型 (image/audio/video/file)
+        mime_type: MIME 类型
+        file_name: 原始文件名
+    
+    Returns:
+        包含 file_id, file_url, file_name, file_size, mime_type, sha256 的字典；
+        数据库保存失败时返回 None（本次新写入的内容块已删除）
+    """
+    from app.db.session import unit_of_work
+    from app.db.models import File as FileModel
+    from app.core.blob_store import acquire_blob, discard_placed_blob, place_blob
+    
+    stored_filename = f"{uuid.uuid4()}{resolve_file_ext(file_name)}"
+    file_url = build_file_url(file_type, stored_filename)
+    
+    file_id = None
+    try:
+        async with unit_of_work() as session:
+            # 先取得内容引用（行锁），再放置磁盘文件，保证与回收并发时的一致性
+            blob_path = await acquire_blob(session, content_hash, file_size)
+            written = await place_blob(temp_path, content_hash)
+            try:
+                db_file = FileModel(
+                    uploader_id=sender_id,
+                    filename=file_name or stored_filename,  # 原始文件名
+                    stored_filename=stored_filename,
+                    file_path=blob_path,
+                    file_url=file_url,
+                    file_type=file_type,
+                    mime_type=mime_type,
+                    file_size=file_size,
+                    content_hash=content_hash,
+                    created_at=datetime.now(timezone.utc).replace(tzinfo=None)
+                )
+                session.add(db_file)
+                await session.flush()
+                await session.commit()
+            except Exception:
+                # 回滚前（仍持有行锁）删除本次新写入的内容块，并发写入者在回滚后会重新写入
+                if written:
+                    await discard_placed_blob(content_hash)
+                raise
+        file_id = db_file.id
+        logger.info(
+            f"文件已转储到数据库: ID={file_id}, blob={blob_path}, "
+            f"{'新写入' if written else '内容已存在，复用'}"
+        )
+    except Exception as db_error:
+        logger.error(f"保存文件记录到数据库失败: {db_error}", exc_info=True)
+    # 数据库失败时临时文件可能尚未移动
+    await remove_file(temp_path)
+    if file_id is None:
+        return None
+    
+    return {
+        'file_id': file_id,
+        'file_url': file_url,
+        'file_name': file_name or stored_filename,  # 使用原始文件名（如果提供）
+        'file_size': file_size,
+        'mime_type': mime_type,
+        'sha256': content_hash
+    }
+
+
 async def dump_large_file_to_storage(
     base64_data_uri: str,
     sender_id: int,
     message_type: str,
-    file_name: Optional[str] = None
+    file_name: Optional[str] = None,
+    max_size: Optional[int] = None
 ) -> Optional[Dict]:
     """
     将大文件的 base64 数据 URI 转储到服务器存储
@@ -27,6 +152,7 @@ async def dump_large_file_to_storage(
         base64_data_uri: base64 数据 URI (格式: data:image/png;base64,xxxxx)
         sender_id: 发送者用户ID
         message_type: 消息类型 (image/audio/video/file)
+        max_size: 解码后大小上限（字节），超过时不保存
     
     Returns:
         包含 file_id, file_url, file_name, file_size 的字典，失败返回 None
@@ -42,105 +168,65 @@ async def dump_large_file_to_storage(
         header = base64_data_uri[:comma_index]
         base64_string = base64_data_uri[comma_index + 1:]
         
-        # 解析 MIME 类型与扩展名：一律按原始文件名扩展名，无预设允许列表，减少维护与资源消耗
+        # 解析 MIME 类型
         mime_type = 'application/octet-stream'
-        file_ext = '.bin'
         if ';base64' in header:
             mime_part = header.split(';')[0]
             mime_type = mime_part.replace('data:', '')
-        if file_name and '.' in file_name:
-            file_ext = Path(file_name).suffix.lower()
         
-        # 解码 base64 数据
+        # 确定文件类型
+        file_type = resolve_file_type(message_type, mime_type)
+        
+        # 分段解码并写入临时文件（在线程池中执行，不阻塞事件循环）
         try:
-            file_bytes = base64.b64decode(base64_string)
-            file_size = len(file_bytes)
-        except Exception as e:
+            temp_path, file_size, file_hash = await decode_base64_to_temp(base64_string, max_size)
+        except binascii.Error as e:
             logger.error(f"Base64 解码失败: {e}")
             return None
+        except FileTooLargeError as e:
+            logger.warning(f"转储文件超过大小上限: {e.size} > {e.max_size}")
+            return None
         
-        # 确定文件类型
-        # 支持 'voice' 作为 'audio' 的别名
-        normalized_type = 'audio' if message_type == 'voice' else message_type
-        
-        if normalized_type not in ['image', 'audio', 'video', 'file']:
-            if mime_type.startswith('image/'):
-                file_type = 'image'
-            elif mime_type.startswith('audio/'):
-                file_type = 'audio'
-            elif mime_type.startswith('video/'):
-                file_type = 'video'
-            else:
-                # 对于未知类型，统一使用 'file' 而不是 'document'，确保前端能正确显示
-                file_type = 'file'
-        else:
-            file_type = normalized_type
-        
-        # 生成唯一文件名
-        stored_filename = f"{uuid.uuid4()}{file_ext}"
-        
-        # 确定存储目录（使用绝对路径）
-        # 获取项目根目录（从 app/core/file_dump.py 向上三级到项目根 /opt/mop）
-        PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
-        upload_base_dir = (PROJECT_ROOT / "uploads").resolve()
-        if file_type == 'image':
-            file_dir = upload_base_dir / "images" / str(sender_id)
-        elif file_type == 'audio':
-            file_dir = upload_base_dir / "audio" / str(sender_id)
-        elif file_type == 'video':
-            file_dir = upload_base_dir / "videos" / str(sender_id)
-        else:
-            file_dir = upload_base_dir / "files" / str(sender_id)
-        
-        file_dir.mkdir(parents=True, exist_ok=True)
-        file_path = file_dir / stored_filename
-        
-        # 保存文件
-        with open(file_path, 'wb') as f:
-            f.write(file_bytes)
-        
-        # 生成文件访问 URL（使用查询参数避免路径参数点号问题）
-        from urllib.parse import quote
-        file_url = f"/api/v1/files/download?file_type={quote(file_type)}&stored_filename={quote(stored_filename)}"
-        
-        # 保存文件记录到数据库
-        from app.db.session import get_db
-        from app.db.models import File as FileModel
-        from sqlalchemy import select
-        
-        file_id = None
-        async for session in get_db():
-            try:
-                db_file = FileModel(
-                    uploader_id=sender_id,
-                    filename=file_name or stored_filename,  # 原始文件名
-                    stored_filename=stored_filename,
-                    file_path=str(file_path.relative_to(upload_base_dir)),
-                    file_url=file_url,
-                    file_type=file_type,
-                    mime_type=mime_type,
-                    file_size=file_size,
-                    created_at=datetime.now(timezone.utc).replace(tzinfo=None)
-                )
-                session.add(db_file)
-                await session.commit()
-                await session.refresh(db_file)
-                file_id = db_file.id
-                logger.info(f"文件已转储到数据库: ID={file_id}, path={file_path}")
-                break
-            except Exception as db_error:
-                await session.rollback()
-                logger.error(f"保存文件记录到数据库失败: {db_error}", exc_info=True)
-                # 即使数据库保存失败，也返回文件信息（文件已保存到磁盘）
-        
-        return {
-            'file_id': file_id,
-            'file_url': file_url,
-            'file_name': file_name or stored_filename,  # 使用原始文件名（如果提供）
-            'file_size': file_size,
-            'mime_type': mime_type
-        }
+        # 存入内容寻址存储并保存文件记录到数据库
+        return await store_temp_file(
+            temp_path, file_size, file_hash, sender_id, file_type, mime_type, file_name
+        )
         
     except Exception as e:
         logger.error(f"转储文件失败: {e}", exc_info=True)
         return None
+
+
+async def store_uploaded_file(
+    upload,
+    sender_id: int,
+    message_type: str,
+    file_name: Optional[str] = None,
+    mime_type: Optional[str] = None,
+    max_size: Optional[int] = None
+) -> Optional[Dict]:
+    """
+    将 HTTP 上传的文件流式保存到服务器存储（不经过 base64，不整体读入内存）
+    
+    Args:
+        upload: FastAPI UploadFile
+        sender_id: 上传者用户ID
+        message_type: 消息类型 (image/audio/video/file)
+        file_name: 原始文件名
+        mime_type: MIME 类型
+        max_size: 大小上限（字节）
+    
+    Returns:
+        与 dump_large_file_to_storage 相同格式的字典，数据库保存失败时返回 None
+    
+    Raises:
+        FileTooLargeError: 超过大小上限（临时文件已删除）
+    """
+    mime_type = mime_type or 'application/octet-stream'
+    file_type = resolve_file_type(message_type, mime_type)
+    
+    temp_path, file_size, file_hash = await stream_upload_to_temp(upload, max_size)
+    
+    return await store_temp_file(
+        temp_path, file_size, file_hash, sender_id, file_type, mime_type, file_name
+    )
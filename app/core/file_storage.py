@@ -0,0 +1,208 @@
+"""
+异步文件存储模块
+上传与转储统一经此写盘：按固定大小分块在线程池中写入临时文件，边写边计算 SHA-256，
+写入过程中检查大小上限，完成后 fsync 并 os.replace 原子移动到目标路径。
+事件循环只负责调度，不直接执行磁盘 I/O、哈希或 base64 解码。
+"""
+
+import asyncio
+import base64
+import binascii
+import hashlib
+import os
+import uuid
+from pathlib import Path
+from typing import Optional, Tuple
+
+# 获取项目根目录（从 app/core/file_storage.py 向上三级到项目根 /opt/mop）
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+UPLOAD_BASE_DIR = (PROJECT_ROOT / "uploads").resolve()
+# 临时文件目录（与正式存储目录同一文件系统，保证 os.replace 原子）
+UPLOAD_TMP_DIR = UPLOAD_BASE_DIR / ".tmp"
+
+# 每次读取/写入的块大小
+STREAM_CHUNK_SIZE = 1024 * 1024  # 1MB
+# base64 每段解码后的字节数（解码持有 GIL，分段更小以降低事件循环延迟）
+BASE64_CHUNK_SIZE = 256 * 1024  # 256KB
+
+
+class FileTooLargeError(Exception):
+    """文件超过大小上限（写入中途发现，临时文件已删除）"""
+
+    def __init__(self, max_size: int, size: Optional[int] = None):
+        self.max_size = max_size
+        self.size = size
+        super().__init__(f"文件超过大小上限 {max_size} 字节")
+
+
+def _new_temp_path() -> Path:
+    UPLOAD_TMP_DIR.mkdir(parents=True, exist_ok=True)
+    return UPLOAD_TMP_DIR / f"{uuid.uuid4().hex}.part"
+
+
+def _remove_quietly(path: Path):
+    try:
+        path.unlink()
+    except FileNotFoundError:
+        pass
+
+
+def _write_and_hash(f, data: bytes, hasher):
+    f.write(data)
+    hasher.update(data)
+
+
+def _fsync_and_replace(temp_path: Path, target_path: Path):
+    """刷盘后原子移动到目标路径"""
+    target_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(temp_path, 'rb') as f:
+        os.fsync(f.fileno())
+    os.replace(temp_path, target_path)
+
+
+async def commit_temp_file(temp_path: Path, target_path: Path):
+    """将已写完的临时文件原子移动到目标路径（线程池中执行）"""
+    await asyncio.to_thread(_fsync_and_replace, temp_path, target_path)
+
+
+async def remove_file(path: Path):
+    """删除文件，不存在时忽略（线程池中执行）"""
+    await asyncio.to_thread(_remove_quietly, path)
+
+
+async def stream_upload_to_temp(
+    upload,
+    max_size: Optional[int] = None,
+    chunk_size: int = STREAM_CHUNK_SIZE
+) -> Tuple[Path, int, str]:
+    """
+    流式写入上传文件到临时文件（调用方负责 commit_temp_file 或 remove_file）
+
+    Args:
+        upload: 提供 async read(size) 的对象（如 FastAPI UploadFile）
+        max_size: 大小上限（字节），超过时抛出 FileTooLargeError
+        chunk_size: 每次读取的字节数
+
+    Returns:
+        (临时文件路径, 文件大小, SHA-256 十六进制)
+    """
+    temp_path = await asyncio.to_thread(_new_temp_path)
+    hasher = hashlib.sha256()
+    size = 0
+    f = await asyncio.to_thread(open, temp_path, 'wb')
+    try:
+        while True:
+            chunk = await upload.read(chunk_size)
+            if not chunk:
+                break
+            size += len(chunk)
+            if max_size is not None and size > max_size:
+                raise FileTooLargeError(max_size, size)
+            await asyncio.to_thread(_write_and_hash, f, chunk, hasher)
+        await asyncio.to_thread(f.close)
+    except BaseException:
+        await asyncio.to_thread(f.close)
+        await remove_file(temp_path)
+        raise
+    return temp_path, size, hasher.hexdigest()
+
+
+async def save_upload_stream(
+    upload,
+    target_path: Path,
+    max_size: Optional[int] = None,
+    chunk_size: int = STREAM_CHUNK_SIZE
+) -> Tuple[int, str]:
+    """
+    流式保存上传文件到目标路径
+
+    Returns:
+        (文件大小, SHA-256 十六进制)
+    """
+    temp_path, size, sha256 = await stream_upload_to_temp(upload, max_size, chunk_size)
+    try:
+        await commit_temp_file(temp_path, target_path)
+    except BaseException:
+        await remove_file(temp_path)
+        raise
+    return size, sha256
+
+
+def _write_base64_file(base64_string: str, temp_path: Path, max_size: Optional[int], chunk_size: int) -> Tuple[int, str]:
+    """
+    分段解码 base64 并写入（线程池中执行）
+
+    base64 解码、哈希期间持有 GIL，按小段处理以便事件循环线程及时获得调度；
+    不对整个字符串做 strip/replace 等整体拷贝
+    """
+    # 解码后的长度可由编码长度直接估算，明显超限时无需解码
+    if max_size is not None and len(base64_string) // 4 * 3 - 2 > max_size:
+        raise FileTooLargeError(max_size)
+
+    step = chunk_size // 3 * 4  # 4 的倍数，每段可独立解码
+    hasher = hashlib.sha256()
+    size = 0
+    carry = ''
+    with open(temp_path, 'wb') as f:
+        for start in range(0, len(base64_string), step):
+            segment = carry + base64_string[start:start + step]
+            if any(c in segment for c in ' \r\n\t'):
+                segment = ''.join(segment.split())
+            # 段末不足 4 个字符的部分留到下一段（仅在含空白字符时出现）
+            cut = len(segment) // 4 * 4
+            segment, carry = segment[:cut], segment[cut:]
+            data = base64.b64decode(segment)
+            size += len(data)
+            if max_size is not None and size > max_size:
+                raise FileTooLargeError(max_size, size)
+            f.write(data)
+            hasher.update(data)
+        if carry:
+            raise binascii.Error('base64 数据长度不正确')
+    return size, hasher.hexdigest()
+
+
+async def decode_base64_to_temp(
+    base64_string: str,
+    max_size: Optional[int] = None,
+    chunk_size: int = BASE64_CHUNK_SIZE
+) -> Tuple[Path, int, str]:
+    """
+    解码 base64 字符串到临时文件（解码、写入、哈希均在线程池中执行，调用方负责提交或删除）
+
+    Returns:
+        (临时文件路径, 文件大小, SHA-256 十六进制)
+
+    Raises:
+        FileTooLargeError: 解码后超过大小上限
+        binascii.Error: base64 数据无效
+    """
+    temp_path = await asyncio.to_thread(_new_temp_path)
+    try:
+        size, sha256 = await asyncio.to_thread(_write_base64_file, base64_string, temp_path, max_size, chunk_size)
+    except BaseException:
+        await remove_file(temp_path)
+        raise
+    return temp_path, size, sha256
+
+
+async def save_base64(
+    base64_string: str,
+    target_path: Path,
+    max_size: Optional[int] = None,
+    chunk_size: int = BASE64_CHUNK_SIZE
+) -> Tuple[int, str]:
+    """
+    解码 base64 字符串并保存到目标路径
+
+    Returns:
+        (文件大小, SHA-256 十六进制)
+    """
+    temp_path, size, sha256 = await decode_base64_to_temp(base64_string, max_size, chunk_size)
+    try:
+        await commit_temp_file(temp_path, target_path)
+    except BaseException:
+        await remove_file(temp_path)
+        raise
+    return size, sha256
+
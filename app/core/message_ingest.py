@@ -0,0 +1,223 @@
+"""
+消息写入批处理模块（group commit）
+Socket.io send_message 不再每条消息各开一个事务 add/commit/refresh：消息进入队列，由单个写入任务
+每 MESSAGE_INGEST_MAX_DELAY_MS 毫秒或攒够 MESSAGE_INGEST_BATCH_SIZE 条合并为一条多行
+INSERT ... RETURNING（连同会话摘要在同一事务内提交），提交后按顺序回填各条消息的ID，
+发送方等到ID后再推送。
+
+- 顺序：单一写入任务按入队顺序分批、逐批提交，批内 ID 按入队顺序分配，同一会话的消息顺序与入队顺序一致
+- 失败隔离：整批失败时逐条重试，只有出错的那条消息返回异常
+"""
+
+import asyncio
+import time
+from datetime import datetime
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+from loguru import logger
+from sqlalchemy import insert
+
+from app.core.config import settings
+from app.db.models import Message
+
+# 写入的消息字段（extra_data 为 JSONB，显式传 None 会存为 JSON null，不经此队列写入）
+_INSERT_FIELDS = (
+    "sender_id", "receiver_id", "room_id", "message", "message_type", "is_read", "created_at",
+    "file_id", "file_url", "file_name", "file_size", "duration", "seq",
+)
+
+# 停止写入任务的队列哨兵
+_STOP = None
+
+
+async def write_message_batch(messages: List[Message]):
+    """
+    一个事务内分配会话序号、写入一批消息并更新会话摘要，完成后为每个消息对象回填 id 与 seq，提交后登记统计增量
+
+    RETURNING 使用 sort_by_parameter_order，保证返回的 ID 与参数顺序一一对应
+    """
+    from app.db.session import unit_of_work
+    from app.core.conversation_sequence import assign_sequences
+    from app.core.conversation_summary import record_messages
+    from app.core.stats_rollup import stats_rollup
+
+    async with unit_of_work() as session:
+        await assign_sequences(session, messages)
+        rows = [{field: getattr(message, field) for field in _INSERT_FIELDS} for message in messages]
+        result = await session.execute(
+            insert(Message).returning(Message.id, sort_by_parameter_order=True),
+            rows,
+        )
+        for message, message_id in zip(messages, result.scalars().all()):
+            message.id = message_id
+        await record_messages(session, messages)
+    stats_rollup.record_messages(messages)
+
+
+class MessageIngest:
+    """
+    消息写入队列
+
+    队列元素：(消息对象, 等待ID的 Future, 入队的单调时钟)
+    """
+
+    def __init__(self, write_batch: Optional[Callable[[List[Message]], Awaitable[None]]] = None):
+        # 写入函数可替换（基准测试中模拟数据库提交）
+        self.write_batch = write_batch or write_message_batch
+        self._queue: Optional[asyncio.Queue] = None
+        self._writer_task: Optional[asyncio.Task] = None
+        self.counters = {
+            "submitted": 0,
+            "batches": 0,
+            "rows_written": 0,
+            "batch_failures": 0,
+            "failed": 0,
+            "last_batch_size": 0,
+            "max_batch_size": 0,
+            "last_commit_ms": 0.0,
+            "max_commit_ms": 0.0,
+            "max_wait_ms": 0.0,
+        }
+
+    async def submit(self, message: Message) -> Message:
+        """
+        入队一条消息，等待所在批次提交
+
+        Returns:
+            已回填 id 的消息对象
+
+        Raises:
+            写入失败时抛出数据库异常
+        """
+        self._ensure_writer()
+        if message.created_at is None:
+            # 入队时间即发送时间（批次提交时间不反映消息先后）
+            message.created_at = datetime.utcnow()
+        if message.is_read is None:
+            message.is_read = False
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((message, future, time.monotonic()))
+        self.counters["submitted"] += 1
+        return await future
+
+    @property
+    def pending_count(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def stats(self) -> dict:
+        """写入计数器（批次大小与提交耗时）"""
+        batches = self.counters["batches"]
+        return {
+            **self.counters,
+            "pending": self.pending_count,
+            "avg_batch_size": round(self.counters["rows_written"] / batches, 2) if batches else 0.0,
+        }
+
+    # ==================== 写入任务 ====================
+
+    def _ensure_writer(self):
+        if self._writer_task is None or self._writer_task.done():
+            self._queue = self._queue or asyncio.Queue()
+            self._writer_task = asyncio.create_task(self._writer_loop())
+
+    async def start(self):
+        """启动写入任务（未启动时首次 submit 也会自动启动）"""
+        self._ensure_writer()
+
+    async def stop(self):
+        """停止写入任务：已入队的消息全部写入后退出"""
+        if self._writer_task is None:
+            return
+        self._queue.put_nowait(_STOP)
+        try:
+            await self._writer_task
+        except asyncio.CancelledError:
+            pass
+        self._writer_task = None
+
+    async def _next_batch(self) -> Tuple[list, bool]:
+        """
+        取下一批：阻塞等待第一条，取走已排队的消息，至多 MESSAGE_INGEST_BATCH_SIZE 条；
+        上一批多于一条（有并发发送）时再等待至多 MESSAGE_INGEST_MAX_DELAY_MS 收集，单个发送者不额外等待
+
+        Returns:
+            (批次, 是否收到停止哨兵)
+        """
+        loop = asyncio.get_running_loop()
+        first = await self._queue.get()
+        if first is _STOP:
+            return [], True
+        batch = [first]
+        delay = settings.MESSAGE_INGEST_MAX_DELAY_MS / 1000 if self.counters["last_batch_size"] > 1 else 0
+        deadline = loop.time() + delay
+        while len(batch) < settings.MESSAGE_INGEST_BATCH_SIZE:
+            try:
+                item = self._queue.get_nowait()
+            except asyncio.QueueEmpty:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    async def _writer_loop(self):
+        while True:
+            try:
+                batch, stopping = await self._next_batch()
+                if batch:
+                    await self._write(batch)
+                if stopping:
+                    return
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"消息写入任务错误: {e}", exc_info=True)
+
+    async def _write(self, batch: list):
+        messages = [item[0] for item in batch]
+        start = time.monotonic()
+        try:
+            await self.write_batch(messages)
+        except Exception as e:
+            # 整批失败（如某条消息的外键失效）：逐条重试，只让出错的消息失败
+            self.counters["batch_failures"] += 1
+            logger.warning(f"消息批量写入失败（{len(batch)} 条），改为逐条写入: {e}")
+            for message, future, _ in batch:
+                try:
+                    await self.write_batch([message])
+                except Exception as single_error:
+                    self.counters["failed"] += 1
+                    if not future.done():
+                        future.set_exception(single_error)
+                    continue
+                self._count_rows(1)
+                if not future.done():
+                    future.set_result(message)
+            return
+
+        commit_ms = (time.monotonic() - start) * 1000
+        # 批内最早入队的消息从入队到提交完成的等待
+        wait_ms = (time.monotonic() - min(item[2] for item in batch)) * 1000
+        self._count_rows(len(batch))
+        self.counters["last_batch_size"] = len(batch)
+        self.counters["max_batch_size"] = max(self.counters["max_batch_size"], len(batch))
+        self.counters["last_commit_ms"] = round(commit_ms, 2)
+        self.counters["max_commit_ms"] = round(max(self.counters["max_commit_ms"], commit_ms), 2)
+        self.counters["max_wait_ms"] = round(max(self.counters["max_wait_ms"], wait_ms), 2)
+        for message, future, _ in batch:
+            if not future.done():
+                future.set_result(message)
+
+    def _count_rows(self, count: int):
+        self.counters["batches"] += 1
+        self.counters["rows_written"] += count
+
+
+# 全局消息写入队列
+message_ingest = MessageIngest()
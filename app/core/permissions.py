@@ -9,6 +9,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from app.db.models import User, Room
 from app.core.i18n import i18n
+from app.core.user_cache import AuthUser
 from app.api.v1.auth import get_current_user
 
 
@@ -215,24 +216,16 @@ def get_user_agent(request: Request) -> Optional[str]:
     return request.headers.get("User-Agent")
 
 
-async def is_super_admin(current_user: User = Depends(get_current_user)) -> User:
+async def get_super_admin_user(current_user: AuthUser = Depends(get_current_user)) -> AuthUser:
     """
     依赖项：要求超级管理员权限
     
     如果用户不是超级管理员，抛出 403 错误
     """
-    from app.api.v1.auth import get_current_user  # 延迟导入避免循环依赖
-    if not (current_user.role == ROLE_SUPER_ADMIN or current_user.username == SUPER_ADMIN_USERNAME):
+    if not is_super_admin(current_user):
         lang = current_user.language or "zh_TW"
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail=i18n.get("common.forbidden", lang) or "需要超级管理员权限"
         )
     return current_user
-async def is_super_admin(current_user: User = Depends(get_current_user)) -> User:
-    """依赖项：要求超级管理员权限"""
-    from app.api.v1.auth import get_current_user
-    if not (current_user.role == ROLE_SUPER_ADMIN or current_user.username == SUPER_ADMIN_USERNAME):
-        lang = current_user.language or "zh_TW"
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=i18n.get("common.forbidden", lang) or "需要超级管理员权限")
-    return current_user
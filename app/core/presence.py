@@ -0,0 +1,321 @@
+"""
+在线状态注册表
+单 worker 时使用进程内字典；启用 Redis 后在线状态在集群内共享，
+各 worker 定期写入心跳，宕机 worker 遗留的会话由存活 worker 清理；
+事件循环阻塞超时被误清理的 worker 在下次心跳时重新登记本地连接
+"""
+
+import asyncio
+import os
+import socket
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set
+
+from loguru import logger
+
+from app.core.config import settings
+
+# Redis 键前缀
+PRESENCE_KEY_PREFIX = "mop:presence"
+
+# 原子添加连接：写入 用户->连接 哈希、worker 连接集合与在线用户集合，返回该用户连接总数
+_ADD_SID_SCRIPT = """
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[3])
+redis.call('SADD', KEYS[2], ARGV[2] .. ':' .. ARGV[1])
+redis.call('SADD', KEYS[3], ARGV[2])
+return redis.call('HLEN', KEYS[1])
+"""
+
+# 原子移除连接：返回该用户剩余连接数，为 0 时同时从在线用户集合移除
+_REMOVE_SID_SCRIPT = """
+redis.call('HDEL', KEYS[1], ARGV[1])
+redis.call('SREM', KEYS[2], ARGV[2] .. ':' .. ARGV[1])
+local remaining = redis.call('HLEN', KEYS[1])
+if remaining == 0 then
+    redis.call('SREM', KEYS[3], ARGV[2])
+end
+return remaining
+"""
+
+
+def _user_key(user_id: int) -> str:
+    return f"{PRESENCE_KEY_PREFIX}:user:{user_id}"
+
+
+def _worker_key(worker_id: str) -> str:
+    return f"{PRESENCE_KEY_PREFIX}:worker:{worker_id}"
+
+
+_ONLINE_KEY = f"{PRESENCE_KEY_PREFIX}:online"
+_WORKERS_KEY = f"{PRESENCE_KEY_PREFIX}:workers"
+
+
+class PresenceRegistry:
+    """
+    在线状态注册表
+
+    Redis 数据布局：
+    - mop:presence:user:{user_id}     HASH  sid -> worker_id
+    - mop:presence:worker:{worker_id} SET   "user_id:sid"（用于清理宕机 worker）
+    - mop:presence:online             SET   在线用户ID
+    - mop:presence:workers            ZSET  worker_id -> 最后心跳时间戳
+    """
+
+    def __init__(self):
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        # 本 worker 的连接（Redis 不可用时作为降级视图）
+        self._local: Dict[int, Set[str]] = {}
+        self._redis = None
+        self._add_script = None
+        self._remove_script = None
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        # 会话被清理（宕机 worker、本 worker 关闭）后，用户在集群内完全离线时的回调
+        self.on_user_offline: Optional[Callable[[int], Awaitable[None]]] = None
+        # 被误清理的 worker 重新登记连接后，用户在集群内重新在线时的回调
+        self.on_user_online: Optional[Callable[[int], Awaitable[None]]] = None
+
+    @property
+    def is_distributed(self) -> bool:
+        """是否使用 Redis 共享在线状态"""
+        return self._redis is not None
+
+    async def start(self):
+        """连接 Redis 并启动 worker 心跳（未启用 Redis 时仅使用本地字典）"""
+        if not settings.SOCKETIO_REDIS_ENABLED:
+            logger.info("在线状态使用进程内注册表（未启用 SOCKETIO_REDIS_ENABLED）")
+            return
+
+        import redis.asyncio as aioredis
+
+        self._redis = aioredis.from_url(
+            settings.REDIS_URL,
+            socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+            socket_connect_timeout=settings.REDIS_SOCKET_CONNECT_TIMEOUT,
+            decode_responses=True,
+        )
+        self._add_script = self._redis.register_script(_ADD_SID_SCRIPT)
+        self._remove_script = self._redis.register_script(_REMOVE_SID_SCRIPT)
+        await self._redis.zadd(_WORKERS_KEY, {self.worker_id: time.time()})
+        self._heartbeat_task = asyncio.create_task(self._heartbeat_loop())
+        logger.info(f"在线状态使用 Redis 共享注册表，worker={self.worker_id}")
+
+    async def stop(self):
+        """移除本 worker 的全部会话（未调用 release 时在此触发离线回调）并断开 Redis"""
+        await self.release()
+        if self._redis is not None:
+            await self._redis.close()
+            self._redis = None
+
+    async def release(self):
+        """
+        关闭前移除本 worker 的全部会话，并对因此在集群内完全离线的用户触发离线回调
+        （同步数据库并通知好友；需在在线状态推送停止前调用）
+        """
+        if self._heartbeat_task:
+            self._heartbeat_task.cancel()
+            try:
+                await self._heartbeat_task
+            except asyncio.CancelledError:
+                pass
+            self._heartbeat_task = None
+
+        if self._redis is not None:
+            try:
+                offline_users = await self._reap_worker(self.worker_id)
+            except Exception as e:
+                logger.warning(f"清理本 worker 在线状态失败: {e}")
+                offline_users = []
+        else:
+            offline_users = list(self._local.keys())
+        self._local.clear()
+        if offline_users:
+            logger.info(f"本 worker 关闭，离线用户 {len(offline_users)} 个")
+        await self._notify(self.on_user_offline, offline_users)
+
+    # ==================== 连接增删 ====================
+
+    async def add(self, user_id: int, sid: str) -> int:
+        """
+        登记连接
+
+        Returns:
+            该用户在集群内的连接数
+        """
+        self._local.setdefault(user_id, set()).add(sid)
+        if self._redis is None:
+            return len(self._local[user_id])
+        try:
+            return int(await self._add_script(
+                keys=[_user_key(user_id), _worker_key(self.worker_id), _ONLINE_KEY],
+                args=[sid, user_id, self.worker_id],
+            ))
+        except Exception as e:
+            logger.error(f"Redis 登记连接失败，降级为本地视图: {e}")
+            return len(self._local[user_id])
+
+    async def remove(self, user_id: int, sid: str) -> int:
+        """
+        注销连接
+
+        Returns:
+            该用户在集群内剩余的连接数（0 表示已完全离线）
+        """
+        sids = self._local.get(user_id)
+        if sids is not None:
+            sids.discard(sid)
+            if not sids:
+                del self._local[user_id]
+        if self._redis is None:
+            return len(self._local.get(user_id, ()))
+        try:
+            return int(await self._remove_script(
+                keys=[_user_key(user_id), _worker_key(self.worker_id), _ONLINE_KEY],
+                args=[sid, user_id],
+            ))
+        except Exception as e:
+            logger.error(f"Redis 注销连接失败，降级为本地视图: {e}")
+            return len(self._local.get(user_id, ()))
+
+    # ==================== 查询 ====================
+
+    async def online_users(self) -> Set[int]:
+        """集群内所有在线用户ID"""
+        if self._redis is not None:
+            try:
+                return {int(uid) for uid in await self._redis.smembers(_ONLINE_KEY)}
+            except Exception as e:
+                logger.error(f"Redis 查询在线用户失败，降级为本地视图: {e}")
+        return set(self._local.keys())
+
+    async def is_online(self, user_id: int) -> bool:
+        """用户是否在集群内任一 worker 在线"""
+        if user_id in self._local:
+            return True
+        if self._redis is not None:
+            try:
+                return bool(await self._redis.sismember(_ONLINE_KEY, user_id))
+            except Exception as e:
+                logger.error(f"Redis 查询在线状态失败，降级为本地视图: {e}")
+        return False
+
+    async def filter_online(self, user_ids: Iterable[int]) -> List[int]:
+        """从给定用户中筛选出在线用户（保持输入顺序）"""
+        user_ids = list(user_ids)
+        if not user_ids:
+            return []
+        if self._redis is not None:
+            try:
+                flags = await self._redis.smismember(_ONLINE_KEY, user_ids)
+                return [uid for uid, flag in zip(user_ids, flags) if flag]
+            except Exception as e:
+                logger.error(f"Redis 批量查询在线状态失败，降级为本地视图: {e}")
+        return [uid for uid in user_ids if uid in self._local]
+
+    async def connection_count(self, user_id: int) -> int:
+        """用户在集群内的连接数"""
+        if self._redis is not None:
+            try:
+                return int(await self._redis.hlen(_user_key(user_id)))
+            except Exception as e:
+                logger.error(f"Redis 查询连接数失败，降级为本地视图: {e}")
+        return len(self._local.get(user_id, ()))
+
+    async def user_sids(self, user_id: int) -> List[str]:
+        """用户在集群内的全部连接 sid（用于让其所有连接进出 Socket.io 房间）"""
+        if self._redis is not None:
+            try:
+                return list(await self._redis.hkeys(_user_key(user_id)))
+            except Exception as e:
+                logger.error(f"Redis 查询用户连接失败，降级为本地视图: {e}")
+        return list(self._local.get(user_id, ()))
+
+    # ==================== 心跳与宕机清理 ====================
+
+    async def _heartbeat_loop(self):
+        """定期写入本 worker 心跳，并清理心跳超时的 worker"""
+        interval = settings.PRESENCE_HEARTBEAT_INTERVAL
+        while True:
+            try:
+                await asyncio.sleep(interval)
+                now = time.time()
+                if await self._redis.zadd(_WORKERS_KEY, {self.worker_id: now}):
+                    # 新增而不是更新：本 worker 已被当作宕机清理
+                    await self._reregister_local()
+                dead_workers = await self._redis.zrangebyscore(
+                    _WORKERS_KEY, "-inf", now - settings.PRESENCE_WORKER_TTL
+                )
+                for dead_worker in dead_workers:
+                    if dead_worker == self.worker_id:
+                        continue
+                    await self._reap_dead_worker(dead_worker)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"在线状态心跳错误: {e}", exc_info=True)
+
+    async def _reap_dead_worker(self, dead_worker: str):
+        """抢占清理权后清理宕机 worker，并对完全离线的用户触发回调"""
+        lock_key = f"{PRESENCE_KEY_PREFIX}:reap:{dead_worker}"
+        claimed = await self._redis.set(
+            lock_key, self.worker_id, nx=True, ex=settings.PRESENCE_WORKER_TTL
+        )
+        if not claimed:
+            return
+        offline_users = await self._reap_worker(dead_worker)
+        logger.warning(f"已清理宕机 worker {dead_worker} 的会话，离线用户 {len(offline_users)} 个")
+        await self._notify(self.on_user_offline, offline_users)
+
+    async def _reregister_local(self):
+        """
+        本 worker 心跳超时（如事件循环长时间阻塞）被其他 worker 清理后，重新登记本地连接，
+        并对清理期间被判定离线的用户触发上线回调
+        """
+        online_again = []
+        for user_id, sids in list(self._local.items()):
+            counts = [
+                int(await self._add_script(
+                    keys=[_user_key(user_id), _worker_key(self.worker_id), _ONLINE_KEY],
+                    args=[sid, user_id, self.worker_id],
+                ))
+                for sid in list(sids)
+            ]
+            # 登记首个连接后该用户只有这一个连接：清理时已被判定离线
+            if counts and counts[0] == 1:
+                online_again.append(user_id)
+        logger.warning(
+            f"本 worker 已被当作宕机清理，重新登记 {len(self._local)} 个用户的连接，"
+            f"重新上线用户 {len(online_again)} 个"
+        )
+        await self._notify(self.on_user_online, online_again)
+
+    @staticmethod
+    async def _notify(callback: Optional[Callable[[int], Awaitable[None]]], user_ids: Iterable[int]):
+        """逐个触发上下线回调，单个用户失败不影响其他用户"""
+        if callback is None:
+            return
+        for user_id in user_ids:
+            try:
+                await callback(user_id)
+            except Exception as e:
+                logger.error(f"在线状态回调失败 user={user_id}: {e}", exc_info=True)
+
+    async def _reap_worker(self, worker_id: str) -> List[int]:
+        """移除指定 worker 的全部会话，返回因此完全离线的用户ID"""
+        worker_key = _worker_key(worker_id)
+        offline_users = []
+        for member in await self._redis.smembers(worker_key):
+            uid_str, sid = member.split(":", 1)
+            remaining = await self._remove_script(
+                keys=[_user_key(uid_str), worker_key, _ONLINE_KEY],
+                args=[sid, uid_str],
+            )
+            if int(remaining) == 0:
+                offline_users.append(int(uid_str))
+        await self._redis.delete(worker_key)
+        await self._redis.zrem(_WORKERS_KEY, worker_id)
+        return offline_users
+
+
+# 全局在线状态注册表
+presence = PresenceRegistry()
@@ -0,0 +1,210 @@
+"""
+在线状态订阅推送模块
+用户上下线只推送给其订阅者（已接受的好友，可选同一活跃房间的成员），而不是广播给所有连接；
+状态变化先合并到待推送队列，每 PRESENCE_BATCH_INTERVAL 秒按订阅者聚合为一帧 presence_update 下发：
+
+    {"online": [用户ID...], "offline": [用户ID...], "timestamp": "..."}
+
+断线后在 PRESENCE_OFFLINE_GRACE 秒内重连（部署重启、网络切换）不推送任何变化，避免状态抖动。
+客户端初始快照仍通过 get_online_friends 获取，之后只应用增量帧。
+"""
+
+import asyncio
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set
+
+from loguru import logger
+from sqlalchemy import and_, or_, select
+from sqlalchemy.orm import aliased
+
+from app.core.config import settings
+from app.core.presence import presence
+
+# 用户ID -> 订阅者ID集合
+SubscriberMap = Dict[int, Set[int]]
+
+
+async def load_presence_subscribers(user_ids: List[int]) -> SubscriberMap:
+    """
+    批量查询用户的在线状态订阅者
+
+    Returns:
+        {用户ID: 订阅者ID集合}：已接受的好友；开启 PRESENCE_ROOM_SUBSCRIPTIONS 时
+        还包括同一活跃房间内的其他活跃成员
+    """
+    from app.db.session import unit_of_work
+    from app.db.models import Friendship, Room, RoomParticipant
+
+    wanted = set(user_ids)
+    subscribers: SubscriberMap = defaultdict(set)
+    async with unit_of_work(read_only=True) as session:
+        result = await session.execute(
+            select(Friendship.user_id, Friendship.friend_id).where(
+                Friendship.status == "accepted",
+                or_(Friendship.user_id.in_(wanted), Friendship.friend_id.in_(wanted))
+            )
+        )
+        for user_id, friend_id in result.all():
+            if user_id in wanted:
+                subscribers[user_id].add(friend_id)
+            if friend_id in wanted:
+                subscribers[friend_id].add(user_id)
+
+        if settings.PRESENCE_ROOM_SUBSCRIPTIONS:
+            member = aliased(RoomParticipant)
+            peer = aliased(RoomParticipant)
+            result = await session.execute(
+                select(member.user_id, peer.user_id)
+                .join(peer, and_(peer.room_id == member.room_id, peer.user_id != member.user_id))
+                .join(Room, Room.id == member.room_id)
+                .where(
+                    member.user_id.in_(wanted),
+                    member.is_active.is_(True),
+                    peer.is_active.is_(True),
+                    Room.is_active.is_(True)
+                )
+            )
+            for user_id, peer_id in result.all():
+                subscribers[user_id].add(peer_id)
+    return subscribers
+
+
+class PresenceFanout:
+    """
+    在线状态变化的合并与订阅推送
+
+    - mark_online / mark_offline 只修改内存队列，不做 I/O
+    - 下线先进入宽限期；宽限期内重连则上下线相互抵消，不产生任何推送
+    - flush 每批次查询一次订阅关系，每个在线订阅者最多收到一帧
+    """
+
+    def __init__(
+        self,
+        load_subscribers: Optional[Callable[[List[int]], Awaitable[SubscriberMap]]] = None,
+        filter_online: Optional[Callable[[Iterable[int]], Awaitable[List[int]]]] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self._load_subscribers = load_subscribers or load_presence_subscribers
+        self._filter_online = filter_online or presence.filter_online
+        self._clock = clock
+        # 待推送的上线用户
+        self._pending_online: Set[int] = set()
+        # 宽限期中的下线用户 -> 到期时间
+        self._offline_deadlines: Dict[int, float] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        # 下发一帧：(订阅者ID, 帧内容)，由 socketio 模块设置
+        self.send_frame: Optional[Callable[[int, dict], Awaitable[None]]] = None
+        self.stats = {"frames": 0, "flushes": 0, "suppressed": 0}
+
+    def mark_online(self, user_id: int):
+        """用户在集群内首个连接建立"""
+        if self._offline_deadlines.pop(user_id, None) is not None:
+            # 宽限期内重连：订阅者看到的一直是在线，不推送
+            self.stats["suppressed"] += 1
+            return
+        self._pending_online.add(user_id)
+
+    def mark_offline(self, user_id: int, immediate: bool = False):
+        """
+        用户在集群内已无连接
+
+        Args:
+            immediate: 跳过宽限期（宕机 worker 被清理时已等待过心跳超时）
+        """
+        if user_id in self._pending_online:
+            # 上线尚未推送就又下线：订阅者看到的一直是离线，不推送
+            self._pending_online.discard(user_id)
+            self.stats["suppressed"] += 1
+            return
+        grace = 0 if immediate else settings.PRESENCE_OFFLINE_GRACE
+        self._offline_deadlines[user_id] = self._clock() + grace
+
+    async def flush(self) -> int:
+        """
+        推送本批次的状态变化
+
+        Returns:
+            下发的帧数
+        """
+        now = self._clock()
+        online = self._pending_online
+        self._pending_online = set()
+        expired = [uid for uid, deadline in self._offline_deadlines.items() if deadline <= now]
+        for uid in expired:
+            del self._offline_deadlines[uid]
+        if expired:
+            # 宽限期内在其他 worker 上重连的用户仍在线，不推送下线
+            reconnected = set(await self._filter_online(expired))
+            self.stats["suppressed"] += len(reconnected)
+            offline = [uid for uid in expired if uid not in reconnected]
+        else:
+            offline = []
+        if not online and not offline:
+            return 0
+
+        changed = list(online) + offline
+        subscribers = await self._load_subscribers(changed)
+
+        # 按订阅者聚合：每个订阅者一帧
+        frames: Dict[int, Dict[str, List[int]]] = {}
+        for uid in changed:
+            key = "online" if uid in online else "offline"
+            for subscriber_id in subscribers.get(uid, ()):
+                frame = frames.get(subscriber_id)
+                if frame is None:
+                    frame = frames[subscriber_id] = {"online": [], "offline": []}
+                frame[key].append(uid)
+
+        recipients = await self._filter_online(frames.keys())
+        timestamp = datetime.now(timezone.utc).isoformat()
+        for subscriber_id in recipients:
+            frame = frames[subscriber_id]
+            frame["timestamp"] = timestamp
+            try:
+                await self.send_frame(subscriber_id, frame)
+            except Exception as e:
+                logger.error(f"推送在线状态失败 user={subscriber_id}: {e}")
+
+        self.stats["flushes"] += 1
+        self.stats["frames"] += len(recipients)
+        logger.debug(
+            f"在线状态推送：上线 {len(online)}，下线 {len(offline)}，帧 {len(recipients)}"
+        )
+        return len(recipients)
+
+    async def start(self):
+        """启动定时推送"""
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        """停止定时推送，并推送剩余变化（宽限期中的下线也立即推送，已在其他 worker 重连的用户仍会被过滤）"""
+        if self._flush_task:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        self._offline_deadlines = dict.fromkeys(self._offline_deadlines, float("-inf"))
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"关闭前推送在线状态失败: {e}")
+
+    async def _flush_loop(self):
+        interval = settings.PRESENCE_BATCH_INTERVAL
+        while True:
+            try:
+                await asyncio.sleep(interval)
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"在线状态推送错误: {e}", exc_info=True)
+
+
+# 全局在线状态推送器
+presence_fanout = PresenceFanout()
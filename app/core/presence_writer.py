@@ -0,0 +1,176 @@
+"""
+在线状态写回模块
+连接/断开不再各自开事务更新 users 表：状态变化先写入内存缓冲（同一用户多次上下线只保留最后一次），
+每 PRESENCE_WRITE_INTERVAL 秒合并为一条 UPDATE users ... FROM (VALUES ...) 批量写回（同时返回实际变化的在线状态，累加到统计计数器），
+应用关闭时在 lifespan 中做最后一次写回。
+多个 worker 各自缓冲，写回顺序不确定：只有状态变化时间不早于库中 last_active_at 的行才会写入，
+避免用户在 worker A 断开、在 worker B 重连后，A 较晚写回的离线覆盖 B 已写回的上线。
+"""
+
+import asyncio
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+from loguru import logger
+from sqlalchemy import Boolean, DateTime, Integer, column, or_, update, values
+
+from app.core.config import settings
+from app.db.models import User
+
+# 单条 UPDATE 的最大行数（每行 3 个绑定参数，asyncpg 单语句上限 32767 个）
+WRITE_BATCH_ROWS = 5000
+
+
+class PresenceWriter:
+    """
+    在线状态写回缓冲
+
+    缓冲格式：{user_id: (is_online, 状态变化时间, 首次入队的单调时钟)}
+    """
+
+    def __init__(self):
+        self._pending: Dict[int, Tuple[bool, datetime, float]] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+        self.counters = {
+            "enqueued": 0,
+            "collapsed": 0,
+            "flushes": 0,
+            "rows_written": 0,
+            "stale_skipped": 0,
+            "errors": 0,
+            "last_flush_size": 0,
+            "max_flush_size": 0,
+            "last_lag_ms": 0.0,
+            "max_lag_ms": 0.0,
+        }
+
+    def enqueue(self, user_id: int, is_online: bool):
+        """
+        记录用户在线状态变化（不做 I/O）
+        last_active_at 取状态变化时间：上线为连接时间，下线为最后一个连接断开的时间
+        """
+        changed_at = datetime.now(timezone.utc).replace(tzinfo=None)
+        previous = self._pending.get(user_id)
+        if previous is None:
+            self._pending[user_id] = (is_online, changed_at, time.monotonic())
+        else:
+            # 合并为最后一次状态，保留最早入队时间用于计算写回延迟
+            self._pending[user_id] = (is_online, changed_at, previous[2])
+            self.counters["collapsed"] += 1
+        self.counters["enqueued"] += 1
+
+    @property
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    def stats(self) -> dict:
+        """写回计数器（批次大小与延迟）"""
+        return {**self.counters, "pending": len(self._pending)}
+
+    async def flush(self) -> int:
+        """
+        将缓冲中的状态批量写回数据库
+
+        Returns:
+            写回的用户数（含因库中已有更新的状态而跳过的用户）
+        """
+        async with self._flush_lock:
+            if not self._pending:
+                return 0
+            batch = self._pending
+            self._pending = {}
+            oldest = min(entry[2] for entry in batch.values())
+
+            from app.db.session import unit_of_work
+            from app.core.stats_rollup import stats_rollup, USERS_ONLINE
+
+            rows = [(user_id, entry[0], entry[1]) for user_id, entry in batch.items()]
+            # 自连接 previous 读取更新前的 is_online，用于计算在线用户数的变化
+            previous = User.__table__.alias("previous")
+            online_delta = 0
+            updated = 0
+            try:
+                async with unit_of_work() as session:
+                    for start in range(0, len(rows), WRITE_BATCH_ROWS):
+                        changes = values(
+                            column("user_id", Integer),
+                            column("is_online", Boolean),
+                            column("last_active_at", DateTime),
+                            name="changes",
+                        ).data(rows[start:start + WRITE_BATCH_ROWS])
+                        result = await session.execute(
+                            update(User)
+                            .where(
+                                User.id == changes.c.user_id,
+                                previous.c.id == User.id,
+                                # 其他 worker 已写回更新的状态时跳过本行
+                                or_(
+                                    User.last_active_at.is_(None),
+                                    changes.c.last_active_at >= User.last_active_at,
+                                ),
+                            )
+                            .values(is_online=changes.c.is_online, last_active_at=changes.c.last_active_at)
+                            .returning(changes.c.is_online, previous.c.is_online.label("was_online"))
+                        )
+                        # 只统计实际更新的行
+                        written = result.all()
+                        updated += len(written)
+                        online_delta += sum(
+                            (1 if is_online else -1) for is_online, was_online in written
+                            if bool(is_online) != bool(was_online)
+                        )
+            except Exception as e:
+                # 写回失败：放回缓冲，期间的新状态优先
+                for user_id, entry in batch.items():
+                    newer = self._pending.get(user_id)
+                    self._pending[user_id] = (newer[0], newer[1], entry[2]) if newer else entry
+                self.counters["errors"] += 1
+                logger.error(f"在线状态批量写回失败（{len(batch)} 个用户，稍后重试）: {e}")
+                return 0
+
+            stats_rollup.add(USERS_ONLINE, online_delta)
+            lag_ms = (time.monotonic() - oldest) * 1000
+            self.counters["flushes"] += 1
+            self.counters["rows_written"] += updated
+            self.counters["stale_skipped"] += len(rows) - updated
+            self.counters["last_flush_size"] = len(rows)
+            self.counters["max_flush_size"] = max(self.counters["max_flush_size"], len(rows))
+            self.counters["last_lag_ms"] = round(lag_ms, 1)
+            self.counters["max_lag_ms"] = round(max(self.counters["max_lag_ms"], lag_ms), 1)
+            logger.debug(f"在线状态已批量写回 {len(rows)} 个用户，延迟 {lag_ms:.0f}ms")
+            return len(rows)
+
+    async def start(self):
+        """启动定时写回"""
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        """停止定时写回并写回剩余状态"""
+        if self._flush_task:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        written = await self.flush()
+        if written:
+            logger.info(f"关闭前写回在线状态 {written} 个用户")
+
+    async def _flush_loop(self):
+        interval = settings.PRESENCE_WRITE_INTERVAL
+        while True:
+            try:
+                await asyncio.sleep(interval)
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"在线状态写回错误: {e}", exc_info=True)
+
+
+# 全局在线状态写回缓冲
+presence_writer = PresenceWriter()
@@ -0,0 +1,152 @@
+"""
+已读回执模块
+标记已读合并为一条 UPDATE ... RETURNING（CTE）并在数据库内按发送者分组，
+每个发送者只推送一帧 messages_read，同一事务内按分组扣减会话未读数；
+房间消息的 is_read 为所有成员共用，房间未读数按成员自己的已读水位扣减（advance_room_reads）；
+弃用期内（SOCKETIO_LEGACY_READ_RECEIPTS）同时逐条推送旧的 message_read，水位模式也返回消息ID列表
+
+两种模式：
+- 按ID列表：{message_ids: [...]}，回执帧携带该发送者被标记的消息ID列表
+- 按水位：{peer_id, up_to_id}，把对方发给自己、ID 不大于 up_to_id 的未读消息全部标记已读，
+  不传输也不返回逐条消息ID，回执帧只携带 up_to_id
+"""
+
+from datetime import datetime
+from typing import Iterable, List, Optional
+
+from sqlalchemy import func, select, update
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.conversation_summary import advance_room_reads, apply_read_counts
+from app.db.models import Message
+
+
+def _grouped(newly_read, with_ids: bool):
+    """按 (发送者, 接收者, 房间) 分组汇总本次由未读变为已读的消息"""
+    columns = [
+        newly_read.c.sender_id,
+        newly_read.c.receiver_id,
+        newly_read.c.room_id,
+        func.max(newly_read.c.id).label("max_id"),
+        func.count().label("count"),
+    ]
+    if with_ids:
+        columns.append(func.array_agg(aggregate_order_by(newly_read.c.id, newly_read.c.id.asc())).label("message_ids"))
+    return (
+        select(*columns)
+        .group_by(newly_read.c.sender_id, newly_read.c.receiver_id, newly_read.c.room_id)
+        .order_by(newly_read.c.sender_id)
+    )
+
+
+def _mark_read(conditions: list, read_at: datetime):
+    return (
+        update(Message)
+        .where(*conditions, Message.is_read == False)
+        .values(is_read=True, read_at=read_at)
+        .returning(Message.id, Message.sender_id, Message.receiver_id, Message.room_id)
+        .cte("newly_read")
+    )
+
+
+async def mark_read_by_ids(
+    db: AsyncSession,
+    reader_id: int,
+    message_ids: Iterable[int],
+    read_at: datetime,
+    any_receiver: bool = False,
+) -> List:
+    """
+    按ID列表标记已读（与会话未读数扣减为同一事务，调用方提交）
+
+    其中的房间消息同时推进操作者在这些房间的已读水位并扣减其房间未读数，
+    不论共用的 is_read 是否已被其他成员标记
+
+    Args:
+        reader_id: 执行已读操作的用户ID
+        message_ids: 消息ID列表
+        read_at: 已读时间（不带时区的 UTC 时间）
+        any_receiver: 为 True 时不限制接收者（超级管理员），否则只标记接收者是自己的消息
+
+    Returns:
+        每个 (发送者, 接收者, 房间) 一行：sender_id, receiver_id, room_id, max_id, count, message_ids
+    """
+    message_ids = list(message_ids)
+    if not message_ids:
+        return []
+    conditions = [Message.id.in_(message_ids)]
+    if not any_receiver:
+        conditions.append(Message.receiver_id == reader_id)
+    result = await db.execute(_grouped(_mark_read(conditions, read_at), with_ids=True))
+    groups = list(result.all())
+    await apply_read_counts(db, reader_id, [(g.sender_id, g.receiver_id, g.room_id, g.count) for g in groups])
+    await advance_room_reads(db, reader_id, message_ids)
+    return groups
+
+
+async def mark_read_up_to(
+    db: AsyncSession,
+    reader_id: int,
+    peer_id: int,
+    up_to_id: int,
+    read_at: datetime,
+) -> Optional[object]:
+    """
+    按水位标记已读：对方发给自己、ID 不大于 up_to_id 的未读点对点消息（与会话未读数扣减为同一事务，调用方提交）
+
+    Returns:
+        sender_id, receiver_id, room_id, max_id, count（推送旧 message_read 时另有 message_ids）；
+        没有需要标记的消息时返回 None
+    """
+    conditions = [
+        Message.sender_id == peer_id,
+        Message.receiver_id == reader_id,
+        Message.room_id.is_(None),
+        Message.id <= up_to_id,
+    ]
+    result = await db.execute(
+        _grouped(_mark_read(conditions, read_at), with_ids=settings.SOCKETIO_LEGACY_READ_RECEIPTS)
+    )
+    group = result.one_or_none()
+    if group is None:
+        return None
+    await apply_read_counts(db, reader_id, [(group.sender_id, group.receiver_id, group.room_id, group.count)])
+    return group
+
+
+def receipt_frame(group, reader_id: int, read_at: str, up_to_id: Optional[int] = None) -> dict:
+    """
+    发给发送者的 messages_read 帧
+
+    Args:
+        group: mark_read_by_ids / mark_read_up_to 返回的分组
+        reader_id: 执行已读操作的用户ID（点对点消息为接收者）
+        read_at: 已读时间（带时区的 ISO 格式，用于前端显示）
+        up_to_id: 水位模式的 up_to_id（为空时携带消息ID列表）
+    """
+    frame = {
+        'read_by': group.receiver_id or reader_id,
+        'room_id': group.room_id,
+        'count': group.count,
+        'max_id': group.max_id,
+        'read_at': read_at,
+    }
+    if up_to_id is not None:
+        frame['up_to_id'] = up_to_id
+    else:
+        frame['message_ids'] = list(group.message_ids)
+    return frame
+
+
+def legacy_receipt_frames(group, read_at: str) -> List[dict]:
+    """
+    已弃用的逐条 message_read 帧（只有点对点消息，兼容未升级的旧客户端，计划于 2027-01-31 移除）
+    """
+    if not group.receiver_id or not getattr(group, "message_ids", None):
+        return []
+    return [
+        {'message_id': message_id, 'read_by': group.receiver_id, 'read_at': read_at}
+        for message_id in group.message_ids
+    ]
@@ -0,0 +1,97 @@
+"""
+房间成员关系缓存模块
+房间群聊不再每条消息查询全部参与者并逐个 emit：
+
+- 每个聊天房间对应一个 Socket.io 房间（chat_room_name），连接时加入用户所在的全部房间，
+  加入/离开房间时同步进出，发送消息时对该房间 emit 一次（载荷只序列化一次）
+- 发送者的成员校验由本缓存承担：按用户缓存其所在房间集合，未命中时一次按 user_id 索引的查询回填
+
+修改 RoomParticipant 后必须调用 room_membership.invalidate_user / invalidate_room（socketio 中的
+join_chat_room / leave_chat_room / close_chat_room 已包含）；其他 worker 的副本由 ROOM_MEMBERSHIP_CACHE_TTL 兜底过期。
+"""
+
+import time
+from collections import OrderedDict
+from typing import FrozenSet, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.db.models import RoomParticipant
+
+
+def chat_room_name(room_id: int) -> str:
+    """聊天房间对应的 Socket.io 房间名（与用户专属房间 user_{id} 区分）"""
+    return f"chat_room_{room_id}"
+
+
+class RoomMembershipCache:
+    """用户所在房间缓存（进程内 TTL + LRU）"""
+
+    def __init__(self):
+        # {user_id: (过期时间, 房间ID集合)}，按最近使用排序
+        self._local: "OrderedDict[int, Tuple[float, FrozenSet[int]]]" = OrderedDict()
+        self.counters = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    def _get_local(self, user_id: int):
+        entry = self._local.get(user_id)
+        if entry is None:
+            return None
+        expires_at, room_ids = entry
+        if expires_at <= time.monotonic():
+            del self._local[user_id]
+            return None
+        self._local.move_to_end(user_id)
+        return room_ids
+
+    def _put_local(self, user_id: int, room_ids: FrozenSet[int]):
+        self._local[user_id] = (time.monotonic() + settings.ROOM_MEMBERSHIP_CACHE_TTL, room_ids)
+        self._local.move_to_end(user_id)
+        while len(self._local) > settings.ROOM_MEMBERSHIP_CACHE_MAX_SIZE:
+            self._local.popitem(last=False)
+
+    async def rooms_of(self, db: AsyncSession, user_id: int) -> FrozenSet[int]:
+        """用户当前活跃参与的房间ID集合（未命中时查询并回填）"""
+        room_ids = self._get_local(user_id)
+        if room_ids is not None:
+            self.counters["hits"] += 1
+            return room_ids
+        self.counters["misses"] += 1
+        result = await db.execute(
+            select(RoomParticipant.room_id).where(
+                RoomParticipant.user_id == user_id,
+                RoomParticipant.is_active == True
+            )
+        )
+        room_ids = frozenset(result.scalars().all())
+        self._put_local(user_id, room_ids)
+        return room_ids
+
+    async def is_member(self, db: AsyncSession, room_id: int, user_id: int) -> bool:
+        """用户是否为房间的活跃参与者"""
+        return room_id in await self.rooms_of(db, user_id)
+
+    def invalidate_user(self, user_id: int):
+        """用户加入/离开房间后调用（数据库提交之后）"""
+        self._local.pop(user_id, None)
+        self.counters["invalidations"] += 1
+
+    def invalidate_room(self, room_id: int):
+        """房间删除或批量变更参与者后调用：清除包含该房间的全部缓存条目"""
+        stale = [user_id for user_id, (_, room_ids) in self._local.items() if room_id in room_ids]
+        for user_id in stale:
+            del self._local[user_id]
+        self.counters["invalidations"] += len(stale)
+
+    def stats(self) -> dict:
+        lookups = self.counters["hits"] + self.counters["misses"]
+        return {
+            **self.counters,
+            "size": len(self._local),
+            "hit_rate": round(self.counters["hits"] / lookups, 4) if lookups else 0.0,
+        }
+
+
+# 全局房间成员关系缓存
+room_membership = RoomMembershipCache()
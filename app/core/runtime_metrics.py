@@ -0,0 +1,128 @@
+"""
+运行时指标模块
+- 事件循环延迟：后台任务每 LOOP_LAG_SAMPLE_INTERVAL 秒 sleep 一次，实际唤醒比预期晚的部分即事件循环被阻塞的时长
+- 数据库连接池：每次从连接池取连接的耗时（排队等待空闲连接、新建溢出连接都计入）、超时次数、已借出与溢出连接的峰值
+
+分位数按最近 RUNTIME_METRICS_WINDOW 个样本计算，只统计本 worker，见 GET /api/v1/admin/runtime-stats
+"""
+
+import asyncio
+import math
+from collections import deque
+from typing import Optional, Sequence
+
+from loguru import logger
+
+from app.core.config import settings
+
+
+def percentile(sorted_values: Sequence[float], q: float) -> float:
+    """已排序样本的分位数（q 取 0~100，最近秩法），无样本时返回 0"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, math.ceil(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class LatencyWindow:
+    """耗时样本窗口：累计次数/总耗时/最大值 + 最近样本的分位数"""
+
+    def __init__(self, size: Optional[int] = None):
+        self.samples = deque(maxlen=size or settings.RUNTIME_METRICS_WINDOW)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float):
+        self.samples.append(seconds)
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def snapshot(self) -> dict:
+        """毫秒为单位的统计（avg / max 为累计值，p50 / p90 / p99 为最近样本）"""
+        recent = sorted(self.samples)
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total / self.count * 1000, 3) if self.count else 0.0,
+            "p50_ms": round(percentile(recent, 50) * 1000, 3),
+            "p90_ms": round(percentile(recent, 90) * 1000, 3),
+            "p99_ms": round(percentile(recent, 99) * 1000, 3),
+            "max_ms": round(self.max * 1000, 3),
+        }
+
+
+class EventLoopMonitor:
+    """事件循环延迟采样"""
+
+    def __init__(self):
+        self.lag = LatencyWindow()
+        self.stalls = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if settings.LOOP_LAG_SAMPLE_INTERVAL <= 0 or self._task is not None:
+            return
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"事件循环延迟采样已启动（间隔 {settings.LOOP_LAG_SAMPLE_INTERVAL}s）")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        interval = settings.LOOP_LAG_SAMPLE_INTERVAL
+        while True:
+            started = loop.time()
+            await asyncio.sleep(interval)
+            lag = max(0.0, loop.time() - started - interval)
+            self.lag.record(lag)
+            if lag >= settings.LOOP_LAG_STALL_THRESHOLD:
+                self.stalls += 1
+                if self.stalls % 100 == 1:
+                    logger.warning(f"事件循环阻塞 {lag * 1000:.0f}ms（累计 {self.stalls} 次）")
+
+    def stats(self) -> dict:
+        return {**self.lag.snapshot(), "stalls": self.stalls}
+
+
+class DbPoolMetrics:
+    """数据库连接池取连接耗时与使用峰值（由 app.db.session 的连接池记录）"""
+
+    def __init__(self):
+        self.wait = LatencyWindow()
+        self.timeouts = 0
+        self.peak_checked_out = 0
+        self.peak_overflow = 0
+        # 取连接时已在使用溢出连接（连接池常驻连接不够用）的次数
+        self.overflow_checkouts = 0
+
+    def record_checkout(self, wait: float, checked_out: int, overflow: int):
+        self.wait.record(wait)
+        if checked_out > self.peak_checked_out:
+            self.peak_checked_out = checked_out
+        if overflow > 0:
+            self.overflow_checkouts += 1
+            if overflow > self.peak_overflow:
+                self.peak_overflow = overflow
+
+    def stats(self) -> dict:
+        return {
+            "wait": self.wait.snapshot(),
+            "timeouts": self.timeouts,
+            "peak_checked_out": self.peak_checked_out,
+            "peak_overflow": self.peak_overflow,
+            "overflow_checkouts": self.overflow_checkouts,
+        }
+
+
+# 全局实例
+loop_monitor = EventLoopMonitor()
+db_pool_metrics = DbPoolMetrics()
@@ -5,21 +5,46 @@ Socket.io 服务器模块
 """
 
 import asyncio
+import functools
 from typing import Dict, Optional, Set, List
 from datetime import datetime, timezone, timedelta
 from loguru import logger
 import socketio
 
 from app.core.config import settings
-from app.db.session import db
-from app.db.models import User
+from app.core.presence import presence
+from app.core.presence_fanout import presence_fanout
+from app.core.presence_writer import presence_writer
+from app.core.room_membership import room_membership, chat_room_name
+from app.core.user_cache import user_auth_cache
+from app.core.connection_registry import ConnectionRecord, ConnectionRegistry
+from app.core.event_rate_limit import event_rate_limiter
+from app.core.socketio_serializer import SerializerAwareManager, SerializerAwareRedisManager, SerializerAwareServer
+from app.db.session import unit_of_work
+from app.db.read_replica import replica_router
+from app.core.stats_rollup import stats_rollup
+
+
+def _build_client_manager() -> socketio.AsyncManager:
+    """
+    构建 Socket.io 客户端管理器（广播时按连接的 JSON / MessagePack 编码分组，每种编码只编码一次）
+    启用 Redis 时，emit 经 Redis 发布/订阅转发到所有 worker，连接在任意 worker 上的用户都能收到
+    """
+    if not settings.SOCKETIO_REDIS_ENABLED:
+        return SerializerAwareManager()
+    logger.info(f"Socket.io 使用 Redis 消息队列，频道: {settings.SOCKETIO_REDIS_CHANNEL}")
+    return SerializerAwareRedisManager(settings.REDIS_URL, channel=settings.SOCKETIO_REDIS_CHANNEL)
+
 
 # 创建 Socket.io 服务器实例
 # 注意：对于 FastAPI，应该使用 'asgi' 模式
 # 统一使用 Engine.IO 心跳，不再维护应用层 ping/pong 与超时任务
 # 缩短离线判定：约 20+40=60s 内无 pong 即断开并触发 disconnect，在线状态及时更新
-sio = socketio.AsyncServer(
+# 编码按连接协商：使用 msgpack 解析器的客户端走 MessagePack 二进制帧，其余客户端保持 JSON
+sio = SerializerAwareServer(
     async_mode='asgi',
+    client_manager=_build_client_manager(),
+    msgpack_enabled=settings.SOCKETIO_MSGPACK_ENABLED,
     cors_allowed_origins=settings.SOCKETIO_CORS_ORIGINS.split(",") if settings.SOCKETIO_CORS_ORIGINS else "*",
     logger=True,
     engineio_logger=True,
@@ -31,13 +56,40 @@ sio = socketio.AsyncServer(
 # 创建 Socket.io 应用
 socketio_app = socketio.ASGIApp(sio)
 
-# 连接管理
-# 存储格式：{user_id: {socket_id: session_info}}
-connected_users: Dict[int, Dict[str, Dict]] = {}
+# 连接管理（仅本 worker 的连接）
+# 存储格式：{user_id: {socket_id: ConnectionRecord}}，并维护 sid -> ConnectionRecord 反向索引
+# 集群范围的在线状态由 app.core.presence 维护，查询请使用 get_online_users / is_user_online
+connections = ConnectionRegistry()
+connected_users: Dict[int, Dict[str, ConnectionRecord]] = connections.by_user
 
 # 离线判定已统一由 Engine.IO 的 ping_interval/ping_timeout 负责，不再使用应用层超时任务
 
 
+def rate_limited(handler):
+    """
+    客户端事件限流装饰器（置于 @sio.event 之下，事件名取处理函数名）
+
+    超出令牌桶或处理中上限时不执行处理函数：向该连接发送 rate_limited 帧（同一事件每秒至多一次），
+    并返回 {success: False, error: 'rate_limited', retry_after} 作为回调结果
+    """
+    event = handler.__name__
+
+    @functools.wraps(handler)
+    async def wrapper(sid, *args):
+        decision = await event_rate_limiter.acquire(sid, connections.user_id_of(sid), event)
+        if not decision.allowed:
+            payload = {'event': event, 'reason': decision.rejected, 'retry_after': round(decision.retry_after, 3)}
+            if event_rate_limiter.should_notify(sid, event):
+                await sio.emit('rate_limited', payload, room=sid)
+            return {'success': False, 'error': 'rate_limited', **payload}
+        try:
+            return await handler(sid, *args)
+        finally:
+            event_rate_limiter.release(sid)
+
+    return wrapper
+
+
 # ==================== 连接事件处理 ====================
 
 @sio.event
@@ -79,50 +131,55 @@ async def connect(sid, environ, auth):
             logger.warning(f"连接拒绝：Socket {sid} 无效的用户ID格式")
             return False
         
-        # 获取用户信息（使用异步数据库会话）
-        from app.db.session import get_db
-        from sqlalchemy import select
-        
-        user = None
-        async for session in get_db():
-            result = await session.execute(
-                select(User).where(User.id == user_id)
-            )
-            user = result.scalar_one_or_none()
-            break  # 只使用第一个会话
+        # 获取用户信息（鉴权缓存命中时不查询数据库）
+        room_ids = frozenset()
+        async with unit_of_work(read_only=True) as session:
+            user = await user_auth_cache.load(session, user_id)
+            if user:
+                room_ids = await room_membership.rooms_of(session, user_id)
         
         if not user:
             logger.warning(f"连接拒绝：用户 {user_id} 不存在")
             return False
         
-        # 存储连接信息
-        if user_id not in connected_users:
-            connected_users[user_id] = {}
-        
-        connected_users[user_id][sid] = {
-            'user_id': user_id,
-            'connected_at': datetime.now(timezone.utc),
-            'last_heartbeat': datetime.now(timezone.utc),
-            'user': user
-        }
+        # 存储连接信息（只保留事件处理器需要的字段）
+        from app.core.permissions import ROLE_SUPER_ADMIN, SUPER_ADMIN_USERNAME
+        connections.add(sid, ConnectionRecord(
+            user_id,
+            nickname=user.nickname,
+            is_super_admin=user.role == ROLE_SUPER_ADMIN or user.username == SUPER_ADMIN_USERNAME,
+        ))
+        connection_count = await presence.add(user_id, sid)
         
         # 更新用户在线状态
         await update_user_online_status(user_id, True)
         
         # 加入用户专属房间（用于定向推送）
         await sio.enter_room(sid, f"user_{user_id}")
+        # 加入所在聊天房间（房间消息对房间 emit 一次）
+        for room_id in room_ids:
+            await sio.enter_room(sid, chat_room_name(room_id))
         
         logger.info(f"用户 {user_id} (Socket {sid}) 已连接")
         
+        # 重连握手：auth 带 resume 时补发各会话 delivered_seq 之后的消息，客户端无需逐会话轮询
+        resume = bool(auth.get('resume'))
+        
         # 发送连接成功消息
         await sio.emit('connected', {
             'message': '连接成功',
             'user_id': user_id,
+            'resume': resume,
             'timestamp': datetime.now(timezone.utc).isoformat()
         }, room=sid)
+        if resume:
+            task = asyncio.create_task(_resume_delivery(sid, user_id))
+            _resume_tasks.add(task)
+            task.add_done_callback(_resume_tasks.discard)
         
-        # 广播用户上线通知（可选）
-        await broadcast_user_status(user_id, True)
+        # 集群内首个连接时通知订阅者上线
+        if connection_count == 1:
+            await broadcast_user_status(user_id, True)
         
         return True
         
@@ -140,27 +197,23 @@ async def disconnect(sid):
         sid: Socket ID
     """
     try:
-        user_id = None
+        # 查找并移除连接（用户在本 worker 无其他连接时同时清空用户记录）
+        user_id, _ = connections.remove(sid)
+        event_rate_limiter.forget_sid(sid)
         
-        # 查找并移除连接
-        for uid, sockets in connected_users.items():
-            if sid in sockets:
-                user_id = uid
-                del sockets[sid]
-                
-                # 如果用户没有其他连接，清空用户记录
-                if not sockets:
-                    del connected_users[uid]
-                    # 更新用户离线状态
-                    await update_user_online_status(uid, False)
-                    # 广播用户下线通知
-                    await broadcast_user_status(uid, False)
-                break
-        
-        if user_id:
-            logger.info(f"用户 {user_id} (Socket {sid}) 已断开连接")
-        else:
+        if not user_id:
             logger.warning(f"未找到 Socket {sid} 对应的用户")
+            return
+        
+        # 用户在集群内已无任何连接时才视为离线
+        remaining = await presence.remove(user_id, sid)
+        if remaining == 0:
+            # 更新用户离线状态
+            await update_user_online_status(user_id, False)
+            # 广播用户下线通知
+            await broadcast_user_status(user_id, False)
+        
+        logger.info(f"用户 {user_id} (Socket {sid}) 已断开连接")
             
     except Exception as e:
         logger.error(f"断开连接处理错误：{e}", exc_info=True)
@@ -175,58 +228,212 @@ async def disconnect(sid):
 async def update_user_online_status(user_id: int, is_online: bool):
     """
     更新用户在线状态到数据库
+    写入 presence_writer 缓冲，由其按 PRESENCE_WRITE_INTERVAL 批量写回 users 表
     
     Args:
         user_id: 用户ID
         is_online: 是否在线
     """
-    try:
-        from app.db.session import get_db
-        from sqlalchemy import select
-        from datetime import datetime, timezone
-        
-        async for session in get_db():
-            result = await session.execute(
-                select(User).where(User.id == user_id)
-            )
-            user = result.scalar_one_or_none()
-            
-            if user:
-                user.is_online = is_online
-                if is_online:
-                    user.last_active_at = datetime.now(timezone.utc).replace(tzinfo=None)
-                # updated_at 会通过事件监听器自动更新
-                await session.commit()
-                logger.debug(f"用户 {user_id} 在线状态已更新：{is_online}")
-            break  # 只使用第一个会话
-                
-    except Exception as e:
-        logger.error(f"更新用户在线状态错误：{e}", exc_info=True)
+    presence_writer.enqueue(user_id, is_online)
 
 
-async def broadcast_user_status(user_id: int, is_online: bool):
+async def broadcast_user_status(user_id: int, is_online: bool, immediate: bool = False):
     """
-    广播用户在线状态变化
+    通知订阅者用户在线状态变化
+    不再广播给所有连接：变化进入 presence_fanout 队列，按批次合并为 presence_update 帧
+    推送给好友（及可选的同房间成员），宽限期内重连不推送
     
     Args:
         user_id: 用户ID
         is_online: 是否在线
+        immediate: 下线时跳过宽限期
+    """
+    if is_online:
+        presence_fanout.mark_online(user_id)
+    else:
+        presence_fanout.mark_offline(user_id, immediate=immediate)
+
+
+async def _send_presence_frame(subscriber_id: int, frame: dict):
+    """向订阅者的用户房间下发一帧在线状态增量"""
+    await sio.emit('presence_update', frame, room=f"user_{subscriber_id}")
+
+
+presence_fanout.send_frame = _send_presence_frame
+
+
+# ==================== 聊天房间订阅管理 ====================
+
+async def join_chat_room(user_id: int, room_id: int):
     """
+    用户加入聊天房间后调用（RoomParticipant 提交之后）
+    让该用户在集群内的全部连接加入房间对应的 Socket.io 房间（其他 worker 上的连接由 Redis 管理器转发），
+    并清除其成员关系缓存
+    """
+    room_membership.invalidate_user(user_id)
+    for sid in await presence.user_sids(user_id):
+        try:
+            await sio.enter_room(sid, chat_room_name(room_id))
+        except Exception as e:
+            logger.warning(f"Socket {sid} 加入聊天房间 {room_id} 失败: {e}")
+
+
+async def leave_chat_room(user_id: int, room_id: int):
+    """用户离开聊天房间后调用（RoomParticipant 提交之后）"""
+    room_membership.invalidate_user(user_id)
+    for sid in await presence.user_sids(user_id):
+        try:
+            await sio.leave_room(sid, chat_room_name(room_id))
+        except Exception as e:
+            logger.warning(f"Socket {sid} 离开聊天房间 {room_id} 失败: {e}")
+
+
+async def close_chat_room(room_id: int):
+    """聊天房间删除后调用：所有连接退出对应的 Socket.io 房间并清除相关缓存"""
+    room_membership.invalidate_room(room_id)
     try:
-        # 广播到所有连接的客户端（除了用户自己）
-        await sio.emit('user_status', {
-            'user_id': user_id,
-            'is_online': is_online,
+        await sio.close_room(chat_room_name(room_id))
+    except Exception as e:
+        logger.warning(f"关闭聊天房间 {room_id} 失败: {e}")
+
+
+# ==================== 重连补发 ====================
+
+# 进行中的补发任务（持有引用，避免任务被回收）
+_resume_tasks: Set[asyncio.Task] = set()
+
+
+def _backlog_message_frame(message) -> dict:
+    """补发消息的载荷（字段与实时 message 事件一致）"""
+    frame = {
+        'id': message.id,
+        'seq': message.seq,
+        'from_user_id': message.sender_id,  # 兼容字段
+        'sender_id': message.sender_id,
+        'receiver_id': message.receiver_id,
+        'room_id': message.room_id,
+        'message': message.message,
+        'type': message.message_type,  # 兼容字段
+        'message_type': message.message_type,
+        'is_read': message.is_read,
+        'created_at': message.created_at.isoformat() if message.created_at else None,
+    }
+    for field in ('file_id', 'file_url', 'file_name', 'file_size', 'duration', 'extra_data'):
+        value = getattr(message, field)
+        if value is not None:
+            frame[field] = value
+    return frame
+
+
+async def _resume_delivery(sid: str, user_id: int):
+    """
+    补发未送达消息
+    按会话（最近活跃优先）读取 (delivered_seq, last_message_seq] 区间，每批至多 RESUME_BATCH_SIZE 条，
+    以 message_backlog 推送；总数超过 RESUME_MAX_MESSAGES 或会话数超过 RESUME_MAX_CONVERSATIONS 时停止，
+    backlog_complete.truncated 为 true，客户端对剩余会话改用 HTTP 增量接口。
+    游标只随客户端 ack_delivered 前进：未确认的消息下次重连会再次补发（客户端按 seq 去重）。
+    """
+    from app.core.conversation_sequence import load_undelivered, fetch_backlog
+    
+    sent = 0
+    conversations = 0
+    truncated = False
+    try:
+        async with unit_of_work(read_only=True) as session:
+            summaries = await load_undelivered(session, user_id, settings.RESUME_MAX_CONVERSATIONS + 1)
+            if len(summaries) > settings.RESUME_MAX_CONVERSATIONS:
+                summaries = summaries[:settings.RESUME_MAX_CONVERSATIONS]
+                truncated = True
+            member_rooms = await room_membership.rooms_of(session, user_id)
+            for summary in summaries:
+                # 已离开的房间不补发
+                if summary.room_id and summary.room_id not in member_rooms:
+                    continue
+                after_seq = summary.delivered_seq
+                while after_seq < summary.last_message_seq:
+                    if connections.user_id_of(sid) is None:
+                        return  # 连接已断开
+                    budget = min(settings.RESUME_BATCH_SIZE, settings.RESUME_MAX_MESSAGES - sent)
+                    if budget <= 0:
+                        truncated = True
+                        break
+                    messages = await fetch_backlog(session, summary, after_seq, budget)
+                    if not messages:
+                        break
+                    after_seq = messages[-1].seq
+                    sent += len(messages)
+                    await sio.emit('message_backlog', {
+                        'room_id': summary.room_id,
+                        'peer_id': summary.peer_id,
+                        'messages': [_backlog_message_frame(m) for m in messages],
+                        'to_seq': after_seq,
+                        'last_seq': summary.last_message_seq,
+                        'has_more': after_seq < summary.last_message_seq,
+                    }, room=sid)
+                if truncated:
+                    break
+                conversations += 1
+        await sio.emit('backlog_complete', {
+            'conversations': conversations,
+            'messages': sent,
+            'truncated': truncated,
             'timestamp': datetime.now(timezone.utc).isoformat()
-        }, skip_sid=None)  # 发送给所有客户端
-        
+        }, room=sid)
+        logger.info(f"用户 {user_id} (Socket {sid}) 重连补发 {conversations} 个会话 {sent} 条消息，截断={truncated}")
     except Exception as e:
-        logger.error(f"广播用户状态错误：{e}", exc_info=True)
+        logger.error(f"重连补发失败 user={user_id}: {e}", exc_info=True)
+        await sio.emit('backlog_complete', {
+            'conversations': conversations,
+            'messages': sent,
+            'truncated': True,
+            'timestamp': datetime.now(timezone.utc).isoformat()
+        }, room=sid)
+
+
+@sio.event
+@rate_limited
+async def ack_delivered(sid, data):
+    """
+    确认已收到消息（实时推送或补发），推进已送达游标
+    
+    Args:
+        data: {room_id | peer_id, seq}，或 {acks: [{room_id | peer_id, seq}, ...]} 批量确认；
+              seq 为该会话已连续收到的最大序号
+    
+    Returns:
+        {updated: 推进的会话数}（作为 Socket.io 回调返回）
+    """
+    user_id = connections.user_id_of(sid)
+    if not user_id:
+        return {'updated': 0}
+    items = data.get('acks') if isinstance(data, dict) and 'acks' in data else [data]
+    acks = []
+    for item in items or []:
+        try:
+            seq = int(item.get('seq'))
+            room_id = int(item['room_id']) if item.get('room_id') else None
+            peer_id = int(item['peer_id']) if item.get('peer_id') else None
+        except (AttributeError, TypeError, ValueError):
+            continue
+        if seq > 0 and (room_id or peer_id):
+            acks.append((room_id, peer_id, seq))
+    if not acks:
+        return {'updated': 0}
+    
+    from app.core.conversation_sequence import advance_delivered
+    try:
+        async with unit_of_work() as session:
+            updated = await advance_delivered(session, user_id, acks)
+        return {'updated': updated}
+    except Exception as e:
+        logger.error(f"推进已送达游标失败 user={user_id}: {e}", exc_info=True)
+        return {'updated': 0}
 
 
 # ==================== 实时消息推送 ====================
 
 @sio.event
+@rate_limited
 async def send_message(sid, data):
     """
     发送消息（客户端 -> 服务器）
@@ -238,11 +445,7 @@ async def send_message(sid, data):
     """
     try:
         # 获取发送者信息
-        sender_id = None
-        for uid, sockets in connected_users.items():
-            if sid in sockets:
-                sender_id = uid
-                break
+        sender_id = connections.user_id_of(sid)
         
         if not sender_id:
             await sio.emit('error', {
@@ -260,6 +463,8 @@ async def send_message(sid, data):
         file_size = data.get('file_size', 0)
         file_url = (data.get('file_url') or '').strip()
         duration = data.get('duration')  # 语音/视频时长（秒）
+        # 通过 upload_commit 分片上传完成的文件ID（整数；HTTP 图片上传返回的 photo_id 为字符串，不在此处理）
+        uploaded_file_id = data.get('file_id') if isinstance(data.get('file_id'), int) else None
         
         # 语音消息兜底：file_name 为 voice.webm 且为文件消息时，强制设为 audio
         if file_name == 'voice.webm' and msg_type not in ('audio', 'voice'):
@@ -275,7 +480,7 @@ async def send_message(sid, data):
         # 消息内容校验：文本/图片需有 message；文件/音频/视频可仅有 file_url（HTTP 上传成功时 message 为空）
         has_message = message is not None and (not isinstance(message, str) or message.strip())
         has_file_url = file_url and str(file_url).strip() and msg_type in ('file', 'audio', 'video')
-        if not has_message and not has_file_url:
+        if not has_message and not has_file_url and not uploaded_file_id:
             await sio.emit('error', {
                 'message': '缺少消息内容'
             }, room=sid)
@@ -283,6 +488,25 @@ async def send_message(sid, data):
         if message is None:
             message = ''
 
+        # 房间群聊：发送者须为房间活跃参与者（超级管理员除外），由成员关系缓存校验
+        if room_id and not target_user_id:
+            try:
+                room_id = int(room_id)
+            except (TypeError, ValueError):
+                await sio.emit('error', {
+                    'message': '无效的房间ID'
+                }, room=sid)
+                return
+            sender = connections.record_of(sid)
+            if not (sender and sender.is_super_admin):
+                async with unit_of_work(read_only=True) as session:
+                    is_member = await room_membership.is_member(session, room_id, sender_id)
+                if not is_member:
+                    await sio.emit('error', {
+                        'message': '您不是该房间的参与者'
+                    }, room=sid)
+                    return
+
         # 检查是否需要转储大文件
         message_content = message
         file_info = None
@@ -317,57 +541,70 @@ async def send_message(sid, data):
                     logger.info(f"{msg_type}文件已转储，file_url: {file_info.get('file_url')}")
             else:
                 logger.warning("文件转储失败，将尝试发送原始数据（可能超过 Socket.io 限制）")
+        elif uploaded_file_id:
+            # 引用分片上传的文件：只允许引用自己上传的文件
+            file_info = await get_uploaded_file_info(uploaded_file_id, sender_id)
+            if not file_info:
+                await sio.emit('error', {
+                    'message': '文件不存在或无权使用'
+                }, room=sid)
+                return
+            if msg_type == 'text':
+                msg_type = file_info['file_type']
         
-        # 保存消息到数据库
-        from app.db.session import get_db
+        # 保存消息到数据库：交给 message_ingest 与其他消息合并为一次批量写入，等待分配 ID 后再推送
         from app.db.models import Message
-        from sqlalchemy import select
-        
-        db_message = None
-        async for session in get_db():
+        from app.core.file_access import resolve_message_file_id
+        from app.core.message_ingest import message_ingest
+        
+        # 创建消息记录（使用处理后的消息内容）
+        db_message = Message(
+            sender_id=sender_id,
+            receiver_id=target_user_id if target_user_id else None,
+            room_id=room_id if room_id else None,
+            message=message_content,  # 使用处理后的内容（可能是 file_url）
+            message_type=msg_type,
+            is_read=False
+        )
+        
+        # 如果转储成功，添加文件信息
+        if file_info:
+            db_message.file_id = file_info.get('file_id')
+            db_message.file_url = file_info.get('file_url', '')
+            db_message.file_name = file_info.get('file_name', file_name) or file_name
+            db_message.file_size = file_info.get('file_size', file_size) or file_size
+        # 如果客户端已经通过 HTTP 上传了文件（提供了 file_url），使用客户端的 file_url
+        elif file_url and file_url.strip():
+            db_message.file_url = file_url
+            db_message.file_name = file_name or ('voice.webm' if msg_type == 'audio' else 'image')
+            db_message.file_size = file_size or 0
+            # 关联 files 表，下载鉴权按 messages.file_id 索引查询
+            async with unit_of_work(read_only=True) as session:
+                db_message.file_id = await resolve_message_file_id(session, file_url, sender_id)
+            logger.info(f"使用客户端提供的 file_url: {file_url}, file_name: {file_name}, file_size: {file_size}")
+        if duration is not None:
             try:
-                # 创建消息记录（使用处理后的消息内容）
-                db_message = Message(
-                    sender_id=sender_id,
-                    receiver_id=target_user_id if target_user_id else None,
-                    room_id=room_id if room_id else None,
-                    message=message_content,  # 使用处理后的内容（可能是 file_url）
-                    message_type=msg_type,
-                    is_read=False
-                )
-                
-                # 如果转储成功，添加文件信息
-                if file_info:
-                    db_message.file_id = file_info.get('file_id')
-                    db_message.file_url = file_info.get('file_url', '')
-                    db_message.file_name = file_info.get('file_name', file_name) or file_name
-                    db_message.file_size = file_info.get('file_size', file_size) or file_size
-                # 如果客户端已经通过 HTTP 上传了文件（提供了 file_url），使用客户端的 file_url
-                elif file_url and file_url.strip():
-                    db_message.file_url = file_url
-                    db_message.file_name = file_name or ('voice.webm' if msg_type == 'audio' else 'image')
-                    db_message.file_size = file_size or 0
-                    logger.info(f"使用客户端提供的 file_url: {file_url}, file_name: {file_name}, file_size: {file_size}")
-                if duration is not None:
-                    try:
-                        db_message.duration = int(duration)
-                    except (TypeError, ValueError):
-                        pass
-                session.add(db_message)
-                await session.commit()
-                await session.refresh(db_message)
-                logger.info(f"消息已保存到数据库: ID={db_message.id}, sender={sender_id}, receiver={target_user_id}, room={room_id}")
-                break
-            except Exception as db_error:
-                await session.rollback()
-                logger.error(f"保存消息到数据库失败: {db_error}", exc_info=True)
-                # 继续执行，即使数据库保存失败也尝试发送实时消息
+                db_message.duration = int(duration)
+            except (TypeError, ValueError):
+                pass
+        
+        try:
+            # 同一批次内同时更新会话摘要
+            await message_ingest.submit(db_message)
+            # 发送者随后通过 HTTP 拉取历史消息时读主库，保证能看到刚发送的消息
+            replica_router.mark_write(sender_id)
+            logger.info(f"消息已保存到数据库: ID={db_message.id}, sender={sender_id}, receiver={target_user_id}, room={room_id}")
+        except Exception as db_error:
+            logger.error(f"保存消息到数据库失败: {db_error}", exc_info=True)
+            # 继续执行，即使数据库保存失败也尝试发送实时消息
+            db_message = None
         
         # 发送实时消息
         if target_user_id:
             # 点对点消息：发送给目标用户和发送者自己（如果在线）
             message_data = {
                 'id': db_message.id if db_message else None,
+                'seq': db_message.seq if db_message else None,  # 会话序号，客户端据此 ack_delivered
                 'from_user_id': sender_id,  # 兼容字段
                 'sender_id': sender_id,  # 统一字段名
                 'receiver_id': target_user_id,  # 接收者ID
@@ -409,62 +646,46 @@ async def send_message(sid, data):
             if sender_id in connected_users:
                 await sio.emit('message', message_data, room=f"user_{sender_id}")
         elif room_id:
-            # 房间群聊：发送给房间内所有参与者
-            # 获取房间参与者
-            async for session in get_db():
+            # 房间群聊：发送者已通过成员校验，载荷只构建/序列化一次，对聊天房间 emit 一次
+            # （房间内所有参与者的连接在 connect / join_chat_room 时已加入该 Socket.io 房间，包括发送者自己）
+            room_message_data = {
+                'id': db_message.id if db_message else None,
+                'seq': db_message.seq if db_message else None,  # 会话序号，客户端据此 ack_delivered
+                'from_user_id': sender_id,  # 兼容字段
+                'sender_id': sender_id,  # 统一字段名
+                'room_id': room_id,
+                'message': message_content,  # 使用处理后的内容
+                'type': msg_type,  # 兼容字段
+                'message_type': msg_type,  # 统一字段名
+                'timestamp': datetime.now(timezone.utc).isoformat(),
+                'created_at': datetime.now(timezone.utc).isoformat()  # 兼容字段
+            }
+            
+            # 如果转储成功，添加文件信息
+            if file_info:
+                room_message_data['file_id'] = file_info.get('file_id')
+                room_message_data['file_url'] = file_info.get('file_url', '')
+                room_message_data['file_name'] = file_info.get('file_name', file_name) or file_name
+                room_message_data['file_size'] = file_info.get('file_size', file_size) or file_size
+                room_message_data['is_original'] = is_original
+                if file_info.get('mime_type'):
+                    room_message_data['mime_type'] = file_info.get('mime_type')
+                
+                # 保留原始 base64 作为缩略图（message_content 已经是原始 base64）
+                room_message_data['message'] = message_content  # 缩略图 base64
+            # 如果客户端已经通过 HTTP 上传了文件（提供了 file_url），添加文件信息
+            elif file_url and file_url.strip():
+                room_message_data['file_url'] = file_url
+                room_message_data['file_name'] = file_name or ('image' if msg_type == 'image' else ('voice.webm' if msg_type == 'audio' else 'file'))
+                room_message_data['file_size'] = file_size or 0
+                logger.info(f"返回房间消息时添加 file_url: {file_url}, file_name: {file_name}, file_size: {file_size}")
+            if duration is not None:
                 try:
-                    from app.db.models import RoomParticipant
-                    result = await session.execute(
-                        select(RoomParticipant).where(
-                            RoomParticipant.room_id == room_id,
-                            RoomParticipant.is_active == True
-                        )
-                    )
-                    participants = result.scalars().all()
-                    
-                    # 发送给所有参与者（包括发送者自己）
-                    room_message_data = {
-                        'id': db_message.id if db_message else None,
-                        'from_user_id': sender_id,  # 兼容字段
-                        'sender_id': sender_id,  # 统一字段名
-                        'room_id': room_id,
-                        'message': message_content,  # 使用处理后的内容
-                        'type': msg_type,  # 兼容字段
-                        'message_type': msg_type,  # 统一字段名
-                        'timestamp': datetime.now(timezone.utc).isoformat(),
-                        'created_at': datetime.now(timezone.utc).isoformat()  # 兼容字段
-                    }
-                    
-                    # 如果转储成功，添加文件信息
-                    if file_info:
-                        room_message_data['file_id'] = file_info.get('file_id')
-                        room_message_data['file_url'] = file_info.get('file_url', '')
-                        room_message_data['file_name'] = file_info.get('file_name', file_name) or file_name
-                        room_message_data['file_size'] = file_info.get('file_size', file_size) or file_size
-                        room_message_data['is_original'] = is_original
-                        if file_info.get('mime_type'):
-                            room_message_data['mime_type'] = file_info.get('mime_type')
-                        
-                        # 保留原始 base64 作为缩略图（message_content 已经是原始 base64）
-                        room_message_data['message'] = message_content  # 缩略图 base64
-                    # 如果客户端已经通过 HTTP 上传了文件（提供了 file_url），添加文件信息
-                    elif file_url and file_url.strip():
-                        room_message_data['file_url'] = file_url
-                        room_message_data['file_name'] = file_name or ('image' if msg_type == 'image' else ('voice.webm' if msg_type == 'audio' else 'file'))
-                        room_message_data['file_size'] = file_size or 0
-                        logger.info(f"返回房间消息时添加 file_url: {file_url}, file_name: {file_name}, file_size: {file_size}")
-                    if duration is not None:
-                        try:
-                            room_message_data['duration'] = int(duration)
-                        except (TypeError, ValueError):
-                            pass
-                    
-                    for participant in participants:
-                        await sio.emit('message', room_message_data, room=f"user_{participant.user_id}")
-                    break
-                except Exception as e:
-                    logger.error(f"获取房间参与者失败: {e}", exc_info=True)
-                    break
+                    room_message_data['duration'] = int(duration)
+                except (TypeError, ValueError):
+                    pass
+            
+            await sio.emit('message', room_message_data, room=chat_room_name(room_id))
         
         # 确认消息已发送
         await sio.emit('message_sent', {
@@ -481,22 +702,39 @@ async def send_message(sid, data):
         }, room=sid)
 
 
+async def emit_read_receipts(groups, reader_id: int, read_at: str, up_to_id: Optional[int] = None):
+    """
+    已读回执：每个发送者一帧 messages_read（mark_message_read 与 REST 标记已读共用）
+
+    弃用期内（SOCKETIO_LEGACY_READ_RECEIPTS）同时逐条推送旧的 message_read，已安装的旧版客户端只监听该事件
+    """
+    from app.core.read_receipts import legacy_receipt_frames, receipt_frame
+    for group in groups:
+        if group.sender_id and group.sender_id != reader_id:
+            room = f"user_{group.sender_id}"
+            await sio.emit('messages_read', receipt_frame(group, reader_id, read_at, up_to_id), room=room)
+            if settings.SOCKETIO_LEGACY_READ_RECEIPTS:
+                for frame in legacy_receipt_frames(group, read_at):
+                    await sio.emit('message_read', frame, room=room)
+
+
 @sio.event
+@rate_limited
 async def mark_message_read(sid, data):
     """
     标记消息为已读（客户端 -> 服务器）
     
     Args:
         sid: Socket ID
-        data: 消息数据 {message_ids: [id1, id2, ...]}
+        data: {message_ids: [id1, id2, ...]}，或水位模式 {peer_id, up_to_id}：
+              把 peer_id 发给自己、ID 不大于 up_to_id 的消息全部标记已读
+    
+    每个发送者收到一帧 messages_read（携带消息ID列表，水位模式携带 up_to_id；
+    弃用期内另逐条推送旧的 message_read），操作者收到 message_read_confirmed
     """
     try:
         # 获取当前用户信息
-        current_user_id = None
-        for uid, sockets in connected_users.items():
-            if sid in sockets:
-                current_user_id = uid
-                break
+        current_user_id = connections.user_id_of(sid)
         
         if not current_user_id:
             await sio.emit('error', {
@@ -504,81 +742,59 @@ async def mark_message_read(sid, data):
             }, room=sid)
             return
         
-        message_ids = data.get('message_ids', [])
-        if not message_ids:
+        data = data or {}
+        message_ids = data.get('message_ids') or []
+        try:
+            peer_id = int(data['peer_id']) if data.get('peer_id') else None
+            up_to_id = int(data['up_to_id']) if data.get('up_to_id') else None
+        except (TypeError, ValueError):
+            peer_id = up_to_id = None
+        watermark = peer_id is not None and up_to_id is not None
+        if not message_ids and not watermark:
             await sio.emit('error', {
                 'message': '缺少消息ID列表'
             }, room=sid)
             return
         
-        # 更新消息已读状态
-        from app.db.session import get_db
-        from app.db.models import Message
-        from sqlalchemy import select, update
+        from app.core.read_receipts import mark_read_by_ids, mark_read_up_to
         
-        updated_count = 0
         # 获取 UTC 时间（不带时区）- 数据库字段是 TIMESTAMP WITHOUT TIME ZONE
-        # 使用 datetime.utcnow() 直接获取不带时区的 UTC 时间，避免时区转换问题
-        now_naive = datetime.utcnow()  # 直接返回 naive datetime，无时区信息
-        now_utc = datetime.now(timezone.utc)  # 用于前端显示的 ISO 格式时间戳
+        now_naive = datetime.utcnow()
+        now_utc = now_naive.replace(tzinfo=timezone.utc)  # 用于前端显示的 ISO 格式时间戳
         
-        async for session in get_db():
-            try:
-                # 使用 SQLAlchemy 的 update() 直接更新，避免 ORM 对象的时区转换问题
-                # 直接执行 UPDATE 语句，确保 datetime 值不带时区
-                update_stmt = (
-                    update(Message)
-                    .where(
-                        Message.id.in_(message_ids),
-                        Message.receiver_id == current_user_id,
-                        Message.is_read == False
-                    )
-                    .values(
-                        is_read=True,
-                        read_at=now_naive  # 使用不带时区的 datetime
-                    )
-                )
-                
-                result = await session.execute(update_stmt)
-                updated_count = result.rowcount
-                
-                await session.commit()
-                logger.info(f"用户 {current_user_id} 标记了 {updated_count} 条消息为已读")
-                
-                # 查询已更新的消息，用于通知发送者
-                if updated_count > 0:
-                    result = await session.execute(
-                        select(Message).where(
-                            Message.id.in_(message_ids),
-                            Message.receiver_id == current_user_id,
-                            Message.is_read == True
-                        )
-                    )
-                    messages = result.scalars().all()
-                    
-                    # 通知发送者消息已读（点对点消息）
-                    for msg in messages:
-                        if msg.sender_id and msg.receiver_id:  # 点对点消息
-                            await sio.emit('message_read', {
-                                'message_id': msg.id,
-                                'read_by': current_user_id,
-                                'read_at': now_utc.isoformat()  # 使用带时区的 UTC 时间（用于前端显示）
-                            }, room=f"user_{msg.sender_id}")
-                
-                break
-            except Exception as db_error:
-                await session.rollback()
-                logger.error(f"标记消息已读失败: {db_error}", exc_info=True)
-                await sio.emit('error', {
-                    'message': f'标记已读失败：{str(db_error)}'
-                }, room=sid)
+        try:
+            # 一条 UPDATE ... RETURNING 按发送者分组，同一事务内扣减会话未读数
+            async with unit_of_work() as session:
+                if watermark:
+                    group = await mark_read_up_to(session, current_user_id, peer_id, up_to_id, now_naive)
+                    groups = [group] if group is not None else []
+                else:
+                    groups = await mark_read_by_ids(session, current_user_id, message_ids, now_naive)
+        except Exception as db_error:
+            logger.error(f"标记消息已读失败: {db_error}", exc_info=True)
+            await sio.emit('error', {
+                'message': f'标记已读失败：{str(db_error)}'
+            }, room=sid)
+            return
+        
+        updated_count = sum(group.count for group in groups)
+        # 房间消息即使共用的 is_read 未变化也会推进本人的已读水位
+        replica_router.mark_write(current_user_id)
+        if updated_count:
+            logger.info(f"用户 {current_user_id} 标记了 {updated_count} 条消息为已读")
+            stats_rollup.record_messages_read(updated_count)
+        await emit_read_receipts(groups, current_user_id, now_utc.isoformat(), up_to_id if watermark else None)
         
         # 确认已读操作
-        await sio.emit('message_read_confirmed', {
+        confirmed = {
             'updated_count': updated_count,
-            'message_ids': message_ids,
             'timestamp': now_utc.isoformat()  # 使用带时区的 UTC 时间（用于前端显示）
-        }, room=sid)
+        }
+        if watermark:
+            confirmed.update({'peer_id': peer_id, 'up_to_id': up_to_id})
+        else:
+            confirmed['message_ids'] = message_ids
+        await sio.emit('message_read_confirmed', confirmed, room=sid)
         
     except Exception as e:
         logger.error(f"标记消息已读错误：{e}", exc_info=True)
@@ -587,6 +803,182 @@ async def mark_message_read(sid, data):
         }, room=sid)
 
 
+# ==================== 分片上传 ====================
+# 协议：
+#   1. upload_start {file_name, file_size, mime_type, message_type}      -> upload_ready {upload_id, offset, chunk_size}
+#      续传：upload_start {upload_id}                                     -> upload_ready {upload_id, offset=已接收字节数}
+#   2. upload_chunk {upload_id, offset, data: <二进制>}（按顺序发送）     -> upload_progress {upload_id, offset}
+#   3. upload_commit {upload_id, sha256(可选)}                            -> upload_completed {file_id, file_url, ...}
+#   4. send_message {target_user_id/room_id, file_id, type}               引用已上传文件发送消息
+#   取消：upload_abort {upload_id}；任一步失败 -> upload_error {upload_id, message, offset}
+# 各事件同时以返回值作为 ack，客户端可任选事件或回调方式接收结果
+
+async def get_uploaded_file_info(file_id: int, uploader_id: int) -> Optional[dict]:
+    """
+    获取用户自己上传的文件信息（用于 send_message 引用分片上传的文件）
+    
+    Returns:
+        与 dump_large_file_to_storage 返回格式一致的字典，附带 file_type；不存在或非本人上传返回 None
+    """
+    from app.db.models import File as FileModel
+    from sqlalchemy import select
+    
+    async with unit_of_work(read_only=True) as session:
+        result = await session.execute(
+            select(FileModel).where(
+                FileModel.id == file_id,
+                FileModel.uploader_id == uploader_id
+            )
+        )
+        db_file = result.scalar_one_or_none()
+    if not db_file:
+        return None
+    return {
+        'file_id': db_file.id,
+        'file_url': db_file.file_url,
+        'file_name': db_file.filename,
+        'file_size': db_file.file_size,
+        'mime_type': db_file.mime_type,
+        'file_type': db_file.file_type
+    }
+
+
+async def _emit_upload_error(sid, upload_id: Optional[str], message: str, offset: Optional[int] = None) -> dict:
+    """发送分片上传错误（同时作为 ack 返回）"""
+    payload = {'upload_id': upload_id, 'message': message, 'offset': offset}
+    await sio.emit('upload_error', payload, room=sid)
+    return {'success': False, **payload}
+
+
+@sio.event
+@rate_limited
+async def upload_start(sid, data):
+    """
+    开始分片上传或查询续传偏移量（客户端 -> 服务器）
+    
+    Args:
+        sid: Socket ID
+        data: {file_name, file_size, mime_type, message_type} 或 {upload_id}（续传）
+    """
+    from app.core.chunked_upload import chunked_uploads, ChunkedUploadError
+    
+    data = data or {}
+    upload_id = data.get('upload_id')
+    user_id = connections.user_id_of(sid)
+    if not user_id:
+        return await _emit_upload_error(sid, upload_id, '未找到用户信息')
+    
+    try:
+        upload = await chunked_uploads.start(
+            user_id,
+            file_name=(data.get('file_name') or '').strip(),
+            file_size=data.get('file_size'),
+            mime_type=data.get('mime_type'),
+            message_type=data.get('message_type') or data.get('type'),
+            upload_id=upload_id,
+        )
+    except ChunkedUploadError as e:
+        return await _emit_upload_error(sid, upload_id, e.message, e.offset)
+    except Exception as e:
+        logger.error(f"开始分片上传错误：{e}", exc_info=True)
+        return await _emit_upload_error(sid, upload_id, f'开始上传失败：{str(e)}')
+    
+    payload = upload.to_dict()
+    await sio.emit('upload_ready', payload, room=sid)
+    return {'success': True, **payload}
+
+
+@sio.event
+@rate_limited
+async def upload_chunk(sid, data):
+    """
+    上传一个二进制分片（客户端 -> 服务器）
+    
+    Args:
+        sid: Socket ID
+        data: {upload_id, offset, data}，data 为二进制（Socket.io 二进制附件，不做 base64 编码）
+    """
+    from app.core.chunked_upload import chunked_uploads, ChunkedUploadError
+    
+    data = data or {}
+    upload_id = data.get('upload_id')
+    user_id = connections.user_id_of(sid)
+    if not user_id:
+        return await _emit_upload_error(sid, upload_id, '未找到用户信息')
+    
+    try:
+        upload = await chunked_uploads.write_chunk(user_id, upload_id, data.get('offset'), data.get('data'))
+    except ChunkedUploadError as e:
+        return await _emit_upload_error(sid, upload_id, e.message, e.offset)
+    except Exception as e:
+        logger.error(f"写入分片错误：{e}", exc_info=True)
+        return await _emit_upload_error(sid, upload_id, f'写入分片失败：{str(e)}')
+    
+    payload = {'upload_id': upload_id, 'offset': upload.offset, 'file_size': upload.total_size}
+    await sio.emit('upload_progress', payload, room=sid)
+    return {'success': True, **payload}
+
+
+@sio.event
+@rate_limited
+async def upload_commit(sid, data):
+    """
+    提交分片上传，生成文件记录（客户端 -> 服务器）
+    
+    Args:
+        sid: Socket ID
+        data: {upload_id, sha256}，sha256 可选，提供时与服务器计算结果比对
+    """
+    from app.core.chunked_upload import chunked_uploads, ChunkedUploadError
+    
+    data = data or {}
+    upload_id = data.get('upload_id')
+    user_id = connections.user_id_of(sid)
+    if not user_id:
+        return await _emit_upload_error(sid, upload_id, '未找到用户信息')
+    
+    try:
+        file_info = await chunked_uploads.commit(user_id, upload_id, data.get('sha256'))
+    except ChunkedUploadError as e:
+        return await _emit_upload_error(sid, upload_id, e.message, e.offset)
+    except Exception as e:
+        logger.error(f"提交分片上传错误：{e}", exc_info=True)
+        return await _emit_upload_error(sid, upload_id, f'提交上传失败：{str(e)}')
+    
+    payload = {'upload_id': upload_id, **file_info}
+    await sio.emit('upload_completed', payload, room=sid)
+    return {'success': True, **payload}
+
+
+@sio.event
+@rate_limited
+async def upload_abort(sid, data):
+    """
+    取消分片上传（客户端 -> 服务器）
+    
+    Args:
+        sid: Socket ID
+        data: {upload_id}
+    """
+    from app.core.chunked_upload import chunked_uploads, ChunkedUploadError
+    
+    data = data or {}
+    upload_id = data.get('upload_id')
+    user_id = connections.user_id_of(sid)
+    if not user_id:
+        return await _emit_upload_error(sid, upload_id, '未找到用户信息')
+    
+    try:
+        await chunked_uploads.abort(user_id, upload_id)
+    except ChunkedUploadError as e:
+        return await _emit_upload_error(sid, upload_id, e.message, e.offset)
+    except Exception as e:
+        logger.error(f"取消分片上传错误：{e}", exc_info=True)
+        return await _emit_upload_error(sid, upload_id, f'取消上传失败：{str(e)}')
+    
+    return {'success': True, 'upload_id': upload_id}
+
+
 # ==================== 系统指令下发 ====================
 
 async def send_system_command(user_id: int, command: str, data: Optional[dict] = None):
@@ -599,7 +991,7 @@ async def send_system_command(user_id: int, command: str, data: Optional[dict] =
         data: 指令数据（可选）
     """
     try:
-        if user_id in connected_users:
+        if await is_user_online(user_id):
             await sio.emit('system_command', {
                 'command': command,
                 'data': data or {},
@@ -652,7 +1044,7 @@ async def send_notification(user_id: int, notification_data: dict):
         notification_data: 通知数据
     """
     try:
-        if user_id in connected_users:
+        if await is_user_online(user_id):
             await sio.emit('notification', notification_data, room=f"user_{user_id}")
             logger.info(f"通知已发送到用户 {user_id}: {notification_data.get('type')}")
         else:
@@ -671,9 +1063,8 @@ async def broadcast_notification(notification_data: dict, target_user_ids: Optio
     """
     try:
         if target_user_ids:
-            for user_id in target_user_ids:
-                if user_id in connected_users:
-                    await sio.emit('notification', notification_data, room=f"user_{user_id}")
+            for user_id in await presence.filter_online(target_user_ids):
+                await sio.emit('notification', notification_data, room=f"user_{user_id}")
         else:
             # 广播给所有在线用户
             await sio.emit('notification', notification_data)
@@ -683,6 +1074,7 @@ async def broadcast_notification(notification_data: dict, target_user_ids: Optio
 
 
 @sio.event
+@rate_limited
 async def get_online_friends(sid, data):
     """
     获取在线好友列表（客户端请求）
@@ -693,11 +1085,7 @@ async def get_online_friends(sid, data):
     """
     try:
         # 获取当前用户ID
-        current_user_id = None
-        for uid, sockets in connected_users.items():
-            if sid in sockets:
-                current_user_id = uid
-                break
+        current_user_id = connections.user_id_of(sid)
         
         if not current_user_id:
             await sio.emit('error', {
@@ -706,14 +1094,13 @@ async def get_online_friends(sid, data):
             return
         
         # 获取好友列表（从数据库）
-        from app.db.session import get_db
         from app.db.models import Friendship
         from sqlalchemy import select, or_
         
         online_friends = []
-        async for session in get_db():
-            try:
-                # 查询好友关系
+        try:
+            # 查询好友关系
+            async with unit_of_work(read_only=True) as session:
                 result = await session.execute(
                     select(Friendship).where(
                         or_(
@@ -724,17 +1111,15 @@ async def get_online_friends(sid, data):
                     )
                 )
                 friendships = result.scalars().all()
-                
-                # 获取在线好友
-                for friendship in friendships:
-                    friend_id = friendship.friend_id if friendship.user_id == current_user_id else friendship.user_id
-                    if friend_id in connected_users:
-                        online_friends.append(friend_id)
-                
-                break
-            except Exception as e:
-                logger.error(f"获取在线好友失败: {e}", exc_info=True)
-                break
+            
+            # 获取在线好友（集群范围，不占用数据库连接）
+            friend_ids = [
+                friendship.friend_id if friendship.user_id == current_user_id else friendship.user_id
+                for friendship in friendships
+            ]
+            online_friends = await presence.filter_online(friend_ids)
+        except Exception as e:
+            logger.error(f"获取在线好友失败: {e}", exc_info=True)
         
         # 发送在线好友列表
         await sio.emit('online_friends', {
@@ -751,6 +1136,7 @@ async def get_online_friends(sid, data):
 
 
 @sio.event
+@rate_limited
 async def call_invitation(sid, data):
     """
     发送通话邀请（客户端 -> 服务器 -> 目标用户）
@@ -763,15 +1149,9 @@ async def call_invitation(sid, data):
         logger.info(f"收到通话邀请请求，Socket ID: {sid}, 数据: {data}")
         
         # 获取发送者信息
-        sender_id = None
-        sender_nickname = None
-        for uid, sockets in connected_users.items():
-            if sid in sockets:
-                sender_id = uid
-                user_obj = sockets[sid].get('user')
-                if user_obj:
-                    sender_nickname = getattr(user_obj, 'nickname', None)
-                break
+        sender_id = connections.user_id_of(sid)
+        record = connections.record_of(sid)
+        sender_nickname = record.nickname if record else None
         
         if not sender_id:
             logger.error(f"未找到发送者信息，Socket ID: {sid}")
@@ -802,7 +1182,6 @@ async def call_invitation(sid, data):
             return
         
         logger.info(f"目标用户ID: {target_user_id} (type={type(target_user_id).__name__}), 房间ID: {room_id}")
-        logger.info(f"当前在线用户: {list(connected_users.keys())}")
         
         invitation_data = {
             'room_id': room_id,
@@ -818,43 +1197,43 @@ async def call_invitation(sid, data):
         # 折中方案：以聊天消息形式发到双方，文案明确「点击进入房间」按钮
         system_message_text = f'📹 {caller_name} 邀请您进行视频通话，点击下方「进入房间」加入。'
         created_msg_id: Optional[int] = None
+        created_msg_seq: Optional[int] = None
         created_msg_at: Optional[datetime] = None
         
         # 始终创建系统消息并落库（对方离线时也能在聊天记录中看到邀请）
         try:
             from app.db.models import Message
-            from app.db.session import get_db
+            from app.core.conversation_summary import record_message
+            from app.core.conversation_sequence import assign_sequences
             
-            async for session in get_db():
-                try:
-                    db_system_message = Message(
-                        sender_id=sender_id,
-                        receiver_id=target_user_id,
-                        message=system_message_text,
-                        message_type='system',
-                        is_read=False,
-                        created_at=datetime.now(timezone.utc),
-                        extra_data={'call_invitation': invitation_data},
-                    )
-                    session.add(db_system_message)
-                    await session.commit()
-                    await session.refresh(db_system_message)
-                    created_msg_id = db_system_message.id
-                    created_msg_at = db_system_message.created_at
-                    logger.info(f"✓ 已创建通话邀请系统消息，ID={created_msg_id}，接收者={target_user_id}")
-                    break
-                except Exception as msg_error:
-                    await session.rollback()
-                    logger.error(f"创建系统消息失败: {msg_error}", exc_info=True)
-                    break
-        except Exception as e:
-            logger.warning(f"创建通话邀请系统消息失败: {e}")
+            async with unit_of_work() as session:
+                db_system_message = Message(
+                    sender_id=sender_id,
+                    receiver_id=target_user_id,
+                    message=system_message_text,
+                    message_type='system',
+                    is_read=False,
+                    created_at=datetime.now(timezone.utc),
+                    extra_data={'call_invitation': invitation_data},
+                )
+                await assign_sequences(session, [db_system_message])
+                session.add(db_system_message)
+                await session.flush()
+                await record_message(session, db_system_message)
+            stats_rollup.record_messages([db_system_message])
+            created_msg_id = db_system_message.id
+            created_msg_seq = db_system_message.seq
+            created_msg_at = db_system_message.created_at
+            logger.info(f"✓ 已创建通话邀请系统消息，ID={created_msg_id}，接收者={target_user_id}")
+        except Exception as msg_error:
+            logger.error(f"创建系统消息失败: {msg_error}", exc_info=True)
         
         # 构建系统消息 payload，并推送给发起方（双方都能在聊天里看到这条记录）
         system_message_data = None
         if created_msg_id is not None and created_msg_at is not None:
             system_message_data = {
                 'id': created_msg_id,
+                'seq': created_msg_seq,
                 'sender_id': sender_id,
                 'sender_nickname': caller_name,
                 'receiver_id': target_user_id,
@@ -869,8 +1248,8 @@ async def call_invitation(sid, data):
             logger.info(f"✓ 已通过 Socket 发送系统消息（通话邀请）给发起方 {sender_id}")
         
         # 对方不在线：已落库；仍发推送通知（对方上线/打开 App 时可收到）；通知发起方
-        if target_user_id not in connected_users:
-            logger.warning(f"用户 {target_user_id} 不在线，无法推送实时通话邀请。当前在线: {list(connected_users.keys())}")
+        if not await is_user_online(target_user_id):
+            logger.warning(f"用户 {target_user_id} 不在线，无法推送实时通话邀请")
             await sio.emit('error', {
                 'message': '对方不在线，无法发送通话邀请；已写入聊天记录，对方上线后可查看'
             }, room=sid)
@@ -886,8 +1265,7 @@ async def call_invitation(sid, data):
             # 对方离线也发送 FCM/APNs，设备上线或打开 App 时可收到通话邀请通知
             try:
                 from app.services.push_notification import send_video_call_push
-                from app.db.session import get_db
-                async for session in get_db():
+                async with unit_of_work(read_only=True) as session:
                     await send_video_call_push(
                         target_user_id=target_user_id,
                         caller_name=caller_name,
@@ -895,13 +1273,12 @@ async def call_invitation(sid, data):
                         invitation_data=invitation_data,
                         db_session=session,
                     )
-                    break
             except Exception as push_error:
                 logger.debug(f"对方离线时推送通知发送失败: {push_error}")
             return
         
-        target_sockets = connected_users.get(target_user_id, {})
-        logger.info(f"向用户 {target_user_id} 发送通话邀请，房间: user_{target_user_id}，连接数: {len(target_sockets)}")
+        target_connections = await get_user_connections(target_user_id)
+        logger.info(f"向用户 {target_user_id} 发送通话邀请，房间: user_{target_user_id}，连接数: {target_connections}")
         
         # 在线：先发「带接受/拒绝」的聊天消息，再发弹窗事件；被叫端用 system_message 可写入聊天
         if system_message_data is not None:
@@ -920,10 +1297,9 @@ async def call_invitation(sid, data):
         # 当 App 在后台或手机黑屏时，Socket 连接会被系统杀掉，必须通过推送通知来唤醒
         try:
             from app.services.push_notification import send_video_call_push
-            from app.db.session import get_db
             
             # 获取数据库会话并发送推送
-            async for session in get_db():
+            async with unit_of_work(read_only=True) as session:
                 await send_video_call_push(
                     target_user_id=target_user_id,
                     caller_name=caller_name,
@@ -931,7 +1307,6 @@ async def call_invitation(sid, data):
                     invitation_data=invitation_data,
                     db_session=session,
                 )
-                break
         except Exception as push_error:
             # 推送失败不影响 Socket 流程
             logger.debug(f"推送通知发送失败（不影响 Socket 流程）: {push_error}")
@@ -955,6 +1330,7 @@ async def call_invitation(sid, data):
 
 
 @sio.event
+@rate_limited
 async def call_invitation_response(sid, data):
     """
     通话邀请响应（接受/拒绝）
@@ -965,11 +1341,7 @@ async def call_invitation_response(sid, data):
     """
     try:
         # 获取当前用户ID
-        current_user_id = None
-        for uid, sockets in connected_users.items():
-            if sid in sockets:
-                current_user_id = uid
-                break
+        current_user_id = connections.user_id_of(sid)
         
         if not current_user_id:
             await sio.emit('error', {
@@ -998,19 +1370,19 @@ async def call_invitation_response(sid, data):
 
 # ==================== 工具函数 ====================
 
-def get_online_users() -> Set[int]:
+async def get_online_users() -> Set[int]:
     """
-    获取所有在线用户ID列表
+    获取所有在线用户ID列表（集群范围）
     
     Returns:
         在线用户ID集合
     """
-    return set(connected_users.keys())
+    return await presence.online_users()
 
 
-def is_user_online(user_id: int) -> bool:
+async def is_user_online(user_id: int) -> bool:
     """
-    检查用户是否在线
+    检查用户是否在线（集群范围）
     
     Args:
         user_id: 用户ID
@@ -1018,12 +1390,12 @@ def is_user_online(user_id: int) -> bool:
     Returns:
         是否在线
     """
-    return user_id in connected_users and len(connected_users[user_id]) > 0
+    return await presence.is_online(user_id)
 
 
-def get_user_connections(user_id: int) -> int:
+async def get_user_connections(user_id: int) -> int:
     """
-    获取用户的连接数
+    获取用户的连接数（集群范围）
     
     Args:
         user_id: 用户ID
@@ -1031,7 +1403,23 @@ def get_user_connections(user_id: int) -> int:
     Returns:
         连接数
     """
-    return len(connected_users.get(user_id, {}))
+    return await presence.connection_count(user_id)
+
+
+async def _on_user_reaped_offline(user_id: int):
+    """宕机或关闭的 worker 的会话被清理后，用户在集群内完全离线：同步数据库并广播"""
+    await update_user_online_status(user_id, False)
+    await broadcast_user_status(user_id, False, immediate=True)
+
+
+async def _on_user_restored_online(user_id: int):
+    """被误清理的 worker 重新登记连接后，用户重新在线：同步数据库并广播"""
+    await update_user_online_status(user_id, True)
+    await broadcast_user_status(user_id, True)
+
+
+presence.on_user_offline = _on_user_reaped_offline
+presence.on_user_online = _on_user_restored_online
 
 
 # ==================== 心跳监测（已统一为 Engine.IO） ====================
@@ -0,0 +1,163 @@
+"""
+Socket.io 线路编码模块
+按连接协商 JSON / MessagePack 两种编码：客户端使用 msgpack 解析器（如 socket.io-msgpack-parser）时，
+其 CONNECT 包是二进制帧，服务端据此把该连接标记为 msgpack，之后发给它的所有包（事件、ack、CONNECT 应答）
+都用 msgpack 编码；现有网页端与移动端仍发送 JSON 文本，编码保持不变
+
+- python-socketio 自带的 serializer='msgpack' 是整个服务器统一编码，会使 JSON 客户端无法连接，故在其上按连接区分
+- 广播到房间时每种编码只编码一次，再分发给使用该编码的连接
+- 未安装 msgpack 或未开启 SOCKETIO_MSGPACK_ENABLED 时只支持 JSON，收到二进制 CONNECT 包的连接会被断开
+"""
+
+import asyncio
+from typing import Set
+
+import socketio
+from engineio import packet as eio_packet
+from loguru import logger
+from socketio import packet
+
+# JSON 编码的二进制附件包类型在 msgpack 中直接内联为 bytes
+_PLAIN_PACKET_TYPES = {packet.BINARY_EVENT: packet.EVENT, packet.BINARY_ACK: packet.ACK}
+
+
+def load_msgpack_packet_class():
+    """加载 python-socketio 的 MsgPackPacket（依赖 msgpack，未安装时返回 None）"""
+    try:
+        from socketio.msgpack_packet import MsgPackPacket
+    except ImportError:
+        logger.warning("未安装 msgpack，Socket.io 只支持 JSON 编码（pip install msgpack）")
+        return None
+    return MsgPackPacket
+
+
+def encode_eio_packets(pkt) -> list:
+    """把 Socket.io 包编码为 Engine.IO MESSAGE 包列表（JSON 二进制事件会拆成多个包）"""
+    encoded = pkt.encode()
+    if not isinstance(encoded, list):
+        encoded = [encoded]
+    return [eio_packet.Packet(eio_packet.MESSAGE, p) for p in encoded]
+
+
+class SerializerAwareServer(socketio.AsyncServer):
+    """按连接选择 JSON / MessagePack 编码的 Socket.io 服务器"""
+
+    def __init__(self, *args, msgpack_enabled: bool = False, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.msgpack_packet_class = load_msgpack_packet_class() if msgpack_enabled else None
+        # 使用 msgpack 编码的 Engine.IO 会话
+        self._msgpack_eio_sids: Set[str] = set()
+        self.rejected_binary_connects = 0
+
+    def packet_class_for(self, eio_sid: str):
+        """该连接使用的包编码类"""
+        if eio_sid in self._msgpack_eio_sids:
+            return self.msgpack_packet_class
+        return self.packet_class
+
+    @property
+    def has_msgpack_connections(self) -> bool:
+        return bool(self._msgpack_eio_sids)
+
+    def _as_msgpack(self, pkt):
+        if isinstance(pkt, self.msgpack_packet_class):
+            return pkt
+        return self.msgpack_packet_class(
+            _PLAIN_PACKET_TYPES.get(pkt.packet_type, pkt.packet_type),
+            data=pkt.data, namespace=pkt.namespace, id=pkt.id,
+        )
+
+    async def _send_packet(self, eio_sid, pkt):
+        if eio_sid in self._msgpack_eio_sids:
+            pkt = self._as_msgpack(pkt)
+        await super()._send_packet(eio_sid, pkt)
+
+    async def _handle_eio_message(self, eio_sid, data):
+        # JSON 客户端只在二进制事件的附件中发送 bytes，其余 bytes 包都是 msgpack 编码
+        if isinstance(data, (bytes, bytearray)) and eio_sid not in self._binary_packet:
+            await self._handle_msgpack_message(eio_sid, data)
+        else:
+            await super()._handle_eio_message(eio_sid, data)
+
+    async def _handle_msgpack_message(self, eio_sid, data):
+        if self.msgpack_packet_class is None:
+            self.rejected_binary_connects += 1
+            logger.warning(f"收到 MessagePack 数据包但服务端未启用 msgpack 编码，断开连接: {eio_sid}")
+            await self.eio.disconnect(eio_sid)
+            return
+
+        pkt = self.msgpack_packet_class(encoded_packet=data)
+        if pkt.packet_type == packet.CONNECT:
+            # 先登记编码，CONNECT 应答即使用 msgpack
+            self._msgpack_eio_sids.add(eio_sid)
+            await self._handle_connect(eio_sid, pkt.namespace, pkt.data)
+        elif pkt.packet_type == packet.DISCONNECT:
+            await self._handle_disconnect(eio_sid, pkt.namespace)
+        elif pkt.packet_type == packet.EVENT:
+            await self._handle_event(eio_sid, pkt.namespace, pkt.id, pkt.data)
+        elif pkt.packet_type == packet.ACK:
+            await self._handle_ack(eio_sid, pkt.namespace, pkt.id, pkt.data)
+        else:
+            raise ValueError(f'Unexpected msgpack packet type: {pkt.packet_type}')
+
+    async def _handle_eio_disconnect(self, eio_sid):
+        try:
+            await super()._handle_eio_disconnect(eio_sid)
+        finally:
+            self._msgpack_eio_sids.discard(eio_sid)
+
+    def serializer_stats(self) -> dict:
+        """本 worker 各编码的连接数"""
+        msgpack_connections = len(self._msgpack_eio_sids)
+        return {
+            "msgpack_enabled": self.msgpack_packet_class is not None,
+            "msgpack_connections": msgpack_connections,
+            "json_connections": max(0, len(self.environ) - msgpack_connections),
+            "rejected_binary_connects": self.rejected_binary_connects,
+        }
+
+
+class SerializerAwareManager(socketio.AsyncManager):
+    """按连接编码分组广播：每种编码只编码一次"""
+
+    async def emit(self, event, data, namespace, room=None, skip_sid=None,
+                   callback=None, to=None, **kwargs):
+        server = self.server
+        # 没有 msgpack 连接或需要回调（每个连接单独编码，由 _send_packet 选择编码）时沿用原实现
+        if callback is not None or not getattr(server, "has_msgpack_connections", False):
+            return await super().emit(event, data, namespace, room=room, skip_sid=skip_sid,
+                                      callback=callback, to=to, **kwargs)
+
+        room = to or room
+        if namespace not in self.rooms:
+            return
+        if isinstance(data, tuple):
+            data = list(data)
+        elif data is not None:
+            data = [data]
+        else:
+            data = []
+        if not isinstance(skip_sid, list):
+            skip_sid = [skip_sid]
+
+        # {包编码类: Engine.IO 包列表}，按需编码
+        encoded = {}
+        tasks = []
+        for sid, eio_sid in self.get_participants(namespace, room):
+            if sid in skip_sid:
+                continue
+            packet_class = server.packet_class_for(eio_sid)
+            eio_pkts = encoded.get(packet_class)
+            if eio_pkts is None:
+                eio_pkts = encoded[packet_class] = encode_eio_packets(
+                    packet_class(packet.EVENT, namespace=namespace, data=[event] + data)
+                )
+            for p in eio_pkts:
+                tasks.append(asyncio.create_task(server._send_eio_packet(eio_sid, p)))
+        if tasks:
+            await asyncio.wait(tasks)
+
+
+class SerializerAwareRedisManager(socketio.AsyncRedisManager, SerializerAwareManager):
+    """经 Redis 转发的广播在各 worker 本地分发时同样按编码分组"""
+
@@ -0,0 +1,332 @@
+"""
+统计汇总模块
+/admin/stats、/chat/stats、/calls/stats/summary 不再每次对全表执行多条 COUNT(*)，改为按主键读取 stats_counters：
+
+- 增量：写入路径提交后调用 stats_rollup.add / record_*，增量只累加在内存中，
+  每 STATS_ROLLUP_FLUSH_INTERVAL 秒合并为一条 INSERT ... ON CONFLICT DO UPDATE 写入计数器表（不与业务写入争用同一行锁）
+- 对账：每 STATS_ROLLUP_RECONCILE_INTERVAL 秒按源表重新统计并覆盖计数器，修正未登记的写入路径
+  （级联删除、脚本、提交后进程退出等）造成的偏差；多 worker 时由 advisory 锁保证同一时间只有一个 worker 执行。
+  应用启动后立即对账一次，迁移后无需手动回填
+
+计数器范围（scope）：0 为全局，通话统计按用户（用户ID），当日消息数按天（YYYYMMDD，UTC）。
+统计接口返回 stale_after：其他 worker 的增量最多延迟一个写入间隔落库，此时间之后应重新获取。
+"""
+
+import asyncio
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional, Tuple, Union
+
+from loguru import logger
+from sqlalchemy import and_, delete, func, select, tuple_, union_all
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.db.models import Call, InvitationCode, Message, Room, StatsCounter, User, UserDevice
+from app.db.session import unit_of_work
+
+# 全局计数器
+USERS_TOTAL = "users_total"
+USERS_ONLINE = "users_online"
+DEVICES_TOTAL = "devices_total"
+ROOMS_TOTAL = "rooms_total"
+ROOMS_ACTIVE = "rooms_active"
+INVITATIONS_TOTAL = "invitations_total"
+INVITATIONS_ACTIVE = "invitations_active"
+MESSAGES_TOTAL = "messages_total"
+MESSAGES_UNREAD = "messages_unread"
+MESSAGES_P2P = "messages_p2p"
+MESSAGES_ROOM = "messages_room"
+# 按天计数器（scope 为 YYYYMMDD）
+MESSAGES_DAY = "messages_day"
+# 按用户计数器（scope 为用户ID，用户是发起者或接收者的通话）
+CALLS_TOTAL = "calls_total"
+CALLS_VIDEO = "calls_video"
+CALLS_AUDIO = "calls_audio"
+CALLS_CONNECTED = "calls_connected"
+CALLS_MISSED = "calls_missed"
+CALLS_DURATION = "calls_duration"
+CALL_COUNTERS = (CALLS_TOTAL, CALLS_VIDEO, CALLS_AUDIO, CALLS_CONNECTED, CALLS_MISSED, CALLS_DURATION)
+
+# 对账 advisory 锁键（多 worker 时只有一个 worker 对账）
+RECONCILE_LOCK_KEY = 7_301_002_025
+# 单条 upsert 的最大行数（每行 5 个绑定参数，asyncpg 单语句上限 32767 个）
+WRITE_BATCH_ROWS = 5000
+
+CounterKey = Union[str, Tuple[str, int]]
+
+
+def day_scope(moment: datetime) -> int:
+    """按天计数器的 scope（YYYYMMDD）"""
+    return moment.year * 10000 + moment.month * 100 + moment.day
+
+
+def call_deltas(call: Call) -> Dict[str, int]:
+    """一条通话对参与者各计数器的贡献（更新通话前取一次，提交后与新值一起传给 record_call）"""
+    deltas = {CALLS_TOTAL: 1, CALLS_DURATION: call.duration or 0}
+    if call.call_type == "video":
+        deltas[CALLS_VIDEO] = 1
+    elif call.call_type == "audio":
+        deltas[CALLS_AUDIO] = 1
+    if call.call_status == "connected":
+        deltas[CALLS_CONNECTED] = 1
+    elif call.call_status == "missed":
+        deltas[CALLS_MISSED] = 1
+    return deltas
+
+
+class StatsRollup:
+    """统计计数器：内存增量缓冲、定时写入与对账"""
+
+    def __init__(self):
+        # {(计数器名称, scope): 增量}
+        self._pending: Counter = Counter()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._next_reconcile = 0.0
+        self.counters = {
+            "added": 0,
+            "flushes": 0,
+            "rows_written": 0,
+            "errors": 0,
+            "reconciles": 0,
+            "last_reconcile_ms": 0.0,
+        }
+
+    # ==================== 登记增量（不做 I/O） ====================
+
+    def add(self, name: str, delta: int = 1, scope: int = 0):
+        """累加计数器增量（在写入事务提交后调用）"""
+        if delta:
+            self._pending[(name, scope)] += delta
+            self.counters["added"] += 1
+
+    def record_messages(self, messages: Iterable[Message]):
+        """新写入的消息"""
+        for message in messages:
+            self.add(MESSAGES_TOTAL)
+            self.add(MESSAGES_ROOM if message.room_id else MESSAGES_P2P)
+            if not message.is_read:
+                self.add(MESSAGES_UNREAD)
+            self.add(MESSAGES_DAY, 1, day_scope(message.created_at or datetime.utcnow()))
+
+    def record_messages_read(self, count: int):
+        """消息由未读变为已读（UPDATE ... RETURNING 实际翻转的条数）"""
+        self.add(MESSAGES_UNREAD, -count)
+
+    def record_call(self, call: Call, previous: Optional[Dict[str, int]] = None):
+        """新建通话，或更新通话后传入更新前的 call_deltas 登记差值"""
+        deltas = Counter(call_deltas(call))
+        deltas.subtract(previous or {})
+        for user_id in {call.caller_id, call.callee_id} - {None}:
+            for name, delta in deltas.items():
+                self.add(name, delta, user_id)
+
+    # ==================== 读取 ====================
+
+    async def read(self, session: AsyncSession, *keys: CounterKey) -> Dict[str, int]:
+        """
+        按主键读取计数器（含本 worker 尚未写入的增量），不存在的计数器为 0
+
+        Args:
+            keys: 计数器名称（全局）或 (计数器名称, scope)
+
+        Returns:
+            {计数器名称: 值}
+        """
+        pairs = [key if isinstance(key, tuple) else (key, 0) for key in keys]
+        result = await session.execute(
+            select(StatsCounter.name, StatsCounter.scope, StatsCounter.value)
+            .where(tuple_(StatsCounter.name, StatsCounter.scope).in_(pairs))
+        )
+        stored = {(name, scope): value for name, scope, value in result.all()}
+        return {name: int(stored.get((name, scope), 0)) + self._pending.get((name, scope), 0) for name, scope in pairs}
+
+    @staticmethod
+    def stale_after() -> datetime:
+        """统计结果的有效截止时间（UTC）"""
+        return datetime.utcnow() + timedelta(seconds=settings.STATS_ROLLUP_FLUSH_INTERVAL)
+
+    # ==================== 写入与对账 ====================
+
+    @staticmethod
+    def _upsert(rows, accumulate: bool):
+        stmt = pg_insert(StatsCounter).values(rows)
+        value = StatsCounter.value + stmt.excluded.value if accumulate else stmt.excluded.value
+        set_ = {"value": value, "updated_at": stmt.excluded.updated_at}
+        if not accumulate:
+            set_["reconciled_at"] = stmt.excluded.reconciled_at
+        return stmt.on_conflict_do_update(index_elements=[StatsCounter.name, StatsCounter.scope], set_=set_)
+
+    async def flush(self) -> int:
+        """
+        将缓冲中的增量写入计数器表
+
+        Returns:
+            写入的计数器行数
+        """
+        async with self._flush_lock:
+            batch = {key: delta for key, delta in self._pending.items() if delta}
+            self._pending = Counter()
+            if not batch:
+                return 0
+            now = datetime.utcnow()
+            # 固定加锁顺序，避免多 worker 同时写入时死锁
+            rows = [
+                {"name": name, "scope": scope, "value": delta, "updated_at": now}
+                for (name, scope), delta in sorted(batch.items())
+            ]
+            try:
+                async with unit_of_work() as session:
+                    for start in range(0, len(rows), WRITE_BATCH_ROWS):
+                        await session.execute(self._upsert(rows[start:start + WRITE_BATCH_ROWS], accumulate=True))
+            except Exception as e:
+                # 写入失败：放回缓冲，与期间的新增量合并
+                self._pending.update(batch)
+                self.counters["errors"] += 1
+                logger.error(f"统计计数器写入失败（{len(rows)} 行，稍后重试）: {e}")
+                return 0
+            self.counters["flushes"] += 1
+            self.counters["rows_written"] += len(rows)
+            return len(rows)
+
+    async def reconcile(self, force: bool = False) -> bool:
+        """
+        按源表重新统计并覆盖计数器
+
+        其他 worker 已在半个对账间隔内完成对账、或正在对账时跳过（force 时只在正在对账时跳过）
+
+        Returns:
+            是否执行了对账
+        """
+        # 本 worker 的增量先落库，避免对账后再次累加
+        await self.flush()
+        started = time.monotonic()
+        now = datetime.utcnow()
+        today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+
+        async with unit_of_work() as session:
+            locked = (await session.execute(select(func.pg_try_advisory_xact_lock(RECONCILE_LOCK_KEY)))).scalar()
+            if not locked:
+                return False
+            if not force:
+                last = (await session.execute(
+                    select(StatsCounter.reconciled_at).where(StatsCounter.name == USERS_TOTAL, StatsCounter.scope == 0)
+                )).scalar_one_or_none()
+                if last and now - last < timedelta(seconds=settings.STATS_ROLLUP_RECONCILE_INTERVAL / 2):
+                    return False
+
+            count = func.count()
+            system = (await session.execute(select(
+                select(count).select_from(User).scalar_subquery(),
+                select(count).select_from(User).where(User.is_online == True).scalar_subquery(),
+                select(count).select_from(UserDevice).scalar_subquery(),
+                select(count).select_from(Room).scalar_subquery(),
+                select(count).select_from(Room).where(Room.is_active == True).scalar_subquery(),
+                select(count).select_from(InvitationCode).scalar_subquery(),
+                select(count).select_from(InvitationCode).where(
+                    and_(InvitationCode.is_active == True, InvitationCode.is_revoked == False)
+                ).scalar_subquery(),
+            ))).one()
+            # 消息表只扫描一次
+            messages = (await session.execute(select(
+                count,
+                count.filter(Message.is_read == False),
+                count.filter(Message.room_id.is_(None)),
+                count.filter(Message.room_id.isnot(None)),
+                count.filter(Message.created_at >= today),
+            ).select_from(Message))).one()
+
+            # 每个用户作为发起者或接收者的通话（自己呼叫自己只计一次）
+            participants = union_all(
+                select(Call.caller_id.label("user_id"), Call.call_type, Call.call_status, Call.duration),
+                select(Call.callee_id, Call.call_type, Call.call_status, Call.duration).where(
+                    Call.callee_id.isnot(None), Call.callee_id != Call.caller_id
+                ),
+            ).subquery()
+            calls = (await session.execute(
+                select(
+                    participants.c.user_id,
+                    count,
+                    count.filter(participants.c.call_type == "video"),
+                    count.filter(participants.c.call_type == "audio"),
+                    count.filter(participants.c.call_status == "connected"),
+                    count.filter(participants.c.call_status == "missed"),
+                    func.coalesce(func.sum(participants.c.duration), 0),
+                )
+                .where(participants.c.user_id.isnot(None))
+                .group_by(participants.c.user_id)
+            )).all()
+
+            rows = [
+                {"name": name, "scope": 0, "value": value}
+                for name, value in zip(
+                    (USERS_TOTAL, USERS_ONLINE, DEVICES_TOTAL, ROOMS_TOTAL, ROOMS_ACTIVE,
+                     INVITATIONS_TOTAL, INVITATIONS_ACTIVE, MESSAGES_TOTAL, MESSAGES_UNREAD, MESSAGES_P2P, MESSAGES_ROOM),
+                    (*system, *messages[:4]),
+                )
+            ]
+            rows.append({"name": MESSAGES_DAY, "scope": day_scope(today), "value": messages[4]})
+            for user_id, *call_values in calls:
+                rows.extend({"name": name, "scope": user_id, "value": value} for name, value in zip(CALL_COUNTERS, call_values))
+            for row in rows:
+                row["updated_at"] = row["reconciled_at"] = now
+
+            # 已无通话的用户、两天前的按天计数器清除
+            await session.execute(delete(StatsCounter).where(StatsCounter.name.in_(CALL_COUNTERS)))
+            await session.execute(delete(StatsCounter).where(
+                StatsCounter.name == MESSAGES_DAY, StatsCounter.scope < day_scope(today - timedelta(days=1))
+            ))
+            for start in range(0, len(rows), WRITE_BATCH_ROWS):
+                await session.execute(self._upsert(rows[start:start + WRITE_BATCH_ROWS], accumulate=False))
+
+        elapsed_ms = (time.monotonic() - started) * 1000
+        self.counters["reconciles"] += 1
+        self.counters["last_reconcile_ms"] = round(elapsed_ms, 1)
+        logger.info(f"统计计数器已对账（{len(rows)} 行，{elapsed_ms:.0f}ms）")
+        return True
+
+    # ==================== 生命周期 ====================
+
+    async def start(self):
+        """启动定时写入与对账（启动后立即对账一次）"""
+        if self._task is None:
+            self._next_reconcile = 0.0
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """停止定时任务并写入剩余增量"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        written = await self.flush()
+        if written:
+            logger.info(f"关闭前写入统计计数器 {written} 行")
+
+    async def _run(self):
+        while True:
+            try:
+                if time.monotonic() >= self._next_reconcile:
+                    self._next_reconcile = time.monotonic() + settings.STATS_ROLLUP_RECONCILE_INTERVAL
+                    await self.reconcile()
+                await asyncio.sleep(settings.STATS_ROLLUP_FLUSH_INTERVAL)
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"统计计数器写入/对账错误: {e}", exc_info=True)
+                await asyncio.sleep(settings.STATS_ROLLUP_FLUSH_INTERVAL)
+
+    def stats(self) -> dict:
+        """增量写入与对账计数"""
+        return {**self.counters, "pending": sum(1 for delta in self._pending.values() if delta)}
+
+
+# 全局实例
+stats_rollup = StatsRollup()
@@ -0,0 +1,229 @@
+"""
+用户鉴权缓存模块
+HTTP 依赖 get_current_user、Socket.io connect 与 /files 下载鉴权共用，缓存鉴权所需的用户字段，
+命中时不再查询 users 表：
+
+- 进程内 TTL + LRU（USER_CACHE_LOCAL_TTL / USER_CACHE_MAX_SIZE）
+- 可选 Redis 层（USER_CACHE_REDIS_ENABLED）：各 worker 共享，失效通过发布/订阅通知所有 worker 清除本地副本
+
+修改角色、禁用状态、语言等字段后必须调用 user_auth_cache.invalidate(user_id)。
+"""
+
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from loguru import logger
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.db.models import User
+
+# Redis 键前缀与失效通知频道
+USER_CACHE_KEY_PREFIX = "mop:user_auth"
+_INVALIDATE_CHANNEL = f"{USER_CACHE_KEY_PREFIX}:invalidate"
+
+
+class AuthUser:
+    """
+    鉴权用户快照（只读）
+    字段与 User 同名，可直接传给 check_user_not_disabled / is_super_admin / log_operation 等函数；
+    需要其他字段或修改用户时请使用 get_current_db_user 获取完整的 User 对象
+    """
+
+    __slots__ = ("id", "username", "nickname", "role", "is_admin", "is_disabled", "language")
+
+    def __init__(self, id: int, username: Optional[str], nickname: Optional[str], role: Optional[str],
+                 is_admin: Optional[bool], is_disabled: Optional[bool], language: Optional[str]):
+        self.id = id
+        self.username = username
+        self.nickname = nickname
+        self.role = role
+        self.is_admin = is_admin
+        self.is_disabled = is_disabled
+        self.language = language
+
+    def to_dict(self) -> dict:
+        return {field: getattr(self, field) for field in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "AuthUser":
+        return cls(**{field: data.get(field) for field in cls.__slots__})
+
+    def __repr__(self) -> str:
+        return f"AuthUser(id={self.id}, role={self.role})"
+
+
+_AUTH_COLUMNS = tuple(getattr(User, field) for field in AuthUser.__slots__)
+
+
+def _user_key(user_id: int) -> str:
+    return f"{USER_CACHE_KEY_PREFIX}:{user_id}"
+
+
+class UserAuthCache:
+    """用户鉴权缓存（进程内 TTL/LRU + 可选 Redis）"""
+
+    def __init__(self):
+        # {user_id: (过期时间, AuthUser)}，按最近使用排序
+        self._local: "OrderedDict[int, Tuple[float, AuthUser]]" = OrderedDict()
+        self._redis = None
+        self._listener_task: Optional[asyncio.Task] = None
+        self.counters = {"local_hits": 0, "redis_hits": 0, "misses": 0, "invalidations": 0}
+
+    async def start(self):
+        """连接 Redis 并订阅失效通知（未启用时仅使用进程内缓存）"""
+        if not settings.USER_CACHE_REDIS_ENABLED:
+            logger.info("用户鉴权缓存使用进程内缓存（未启用 USER_CACHE_REDIS_ENABLED）")
+            return
+
+        import redis.asyncio as aioredis
+
+        self._redis = aioredis.from_url(
+            settings.REDIS_URL,
+            socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+            socket_connect_timeout=settings.REDIS_SOCKET_CONNECT_TIMEOUT,
+            decode_responses=True,
+        )
+        pubsub = self._redis.pubsub()
+        await pubsub.subscribe(_INVALIDATE_CHANNEL)
+        self._listener_task = asyncio.create_task(self._listen_invalidations(pubsub))
+        logger.info("用户鉴权缓存已启用 Redis 共享层")
+
+    async def stop(self):
+        if self._listener_task:
+            self._listener_task.cancel()
+            try:
+                await self._listener_task
+            except asyncio.CancelledError:
+                pass
+            self._listener_task = None
+        if self._redis is not None:
+            await self._redis.close()
+            self._redis = None
+        self._local.clear()
+
+    # ==================== 读写 ====================
+
+    def _get_local(self, user_id: int) -> Optional[AuthUser]:
+        entry = self._local.get(user_id)
+        if entry is None:
+            return None
+        expires_at, user = entry
+        if expires_at <= time.monotonic():
+            del self._local[user_id]
+            return None
+        self._local.move_to_end(user_id)
+        return user
+
+    def _put_local(self, user: AuthUser):
+        self._local[user.id] = (time.monotonic() + settings.USER_CACHE_LOCAL_TTL, user)
+        self._local.move_to_end(user.id)
+        while len(self._local) > settings.USER_CACHE_MAX_SIZE:
+            self._local.popitem(last=False)
+
+    async def get(self, user_id: int) -> Optional[AuthUser]:
+        """只查缓存，未命中返回 None"""
+        user = self._get_local(user_id)
+        if user is not None:
+            self.counters["local_hits"] += 1
+            return user
+        if self._redis is not None:
+            try:
+                raw = await self._redis.get(_user_key(user_id))
+            except Exception as e:
+                logger.warning(f"Redis 读取用户鉴权缓存失败: {e}")
+                raw = None
+            if raw:
+                user = AuthUser.from_dict(json.loads(raw))
+                self._put_local(user)
+                self.counters["redis_hits"] += 1
+                return user
+        return None
+
+    async def put(self, user: AuthUser):
+        self._put_local(user)
+        if self._redis is not None:
+            try:
+                await self._redis.set(
+                    _user_key(user.id), json.dumps(user.to_dict()), ex=settings.USER_CACHE_REDIS_TTL
+                )
+            except Exception as e:
+                logger.warning(f"Redis 写入用户鉴权缓存失败: {e}")
+
+    async def load(self, db: AsyncSession, user_id: int) -> Optional[AuthUser]:
+        """
+        获取鉴权用户：先查缓存，未命中时只查询鉴权字段并回填
+
+        Returns:
+            用户不存在时返回 None（不缓存不存在的用户）
+        """
+        user = await self.get(user_id)
+        if user is not None:
+            return user
+        self.counters["misses"] += 1
+        result = await db.execute(select(*_AUTH_COLUMNS).where(User.id == user_id))
+        row = result.one_or_none()
+        if row is None:
+            return None
+        user = AuthUser(*row)
+        await self.put(user)
+        return user
+
+    async def invalidate(self, user_id: int):
+        """用户鉴权字段变更或用户删除后调用（数据库提交之后）"""
+        self._local.pop(user_id, None)
+        self.counters["invalidations"] += 1
+        if self._redis is not None:
+            try:
+                await self._redis.delete(_user_key(user_id))
+                await self._redis.publish(_INVALIDATE_CHANNEL, str(user_id))
+            except Exception as e:
+                logger.error(f"Redis 失效用户鉴权缓存失败 user={user_id}: {e}")
+
+    async def _listen_invalidations(self, pubsub):
+        """接收其他 worker 的失效通知，清除本地副本；订阅断开时清空本地缓存后重新订阅"""
+        while True:
+            try:
+                async for message in pubsub.listen():
+                    if message.get("type") != "message":
+                        continue
+                    try:
+                        self._local.pop(int(message["data"]), None)
+                    except (TypeError, ValueError):
+                        continue
+            except asyncio.CancelledError:
+                await pubsub.close()
+                raise
+            except Exception as e:
+                # 断开期间可能错过失效通知，本地副本不再可信
+                logger.error(f"用户鉴权缓存失效订阅断开，清空本地缓存: {e}")
+                self._local.clear()
+                await asyncio.sleep(1)
+                try:
+                    await pubsub.close()
+                    pubsub = self._redis.pubsub()
+                    await pubsub.subscribe(_INVALIDATE_CHANNEL)
+                except Exception as e:
+                    logger.error(f"重新订阅用户鉴权缓存失效通知失败: {e}")
+
+    # ==================== 统计 ====================
+
+    def stats(self) -> dict:
+        """命中率与节省的数据库查询数（每次命中节省一次 users 查询）"""
+        hits = self.counters["local_hits"] + self.counters["redis_hits"]
+        lookups = hits + self.counters["misses"]
+        return {
+            **self.counters,
+            "size": len(self._local),
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "db_queries_saved": hits,
+            "db_queries_per_lookup": round(self.counters["misses"] / lookups, 4) if lookups else 0.0,
+        }
+
+
+# 全局用户鉴权缓存
+user_auth_cache = UserAuthCache()
@@ -3,7 +3,7 @@
 基于 Alembic 迁移文件自动生成
 """
 
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, Numeric, ForeignKey, JSON
+from sqlalchemy import Column, Integer, BigInteger, String, Boolean, DateTime, Text, Numeric, ForeignKey, JSON, Index, Sequence, text
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -220,6 +220,7 @@ class Message(Base):
     is_read = Column(Boolean, nullable=False, default=False, index=True, comment="是否已读")
     read_at = Column(DateTime, nullable=True, comment="已读时间")
     created_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True, comment="发送时间")
+    seq = Column(Integer, nullable=True, comment="会话内序号（每个会话单调递增，由 conversation_sequences 分配）")
     
     # 文件相关字段（图片/文件消息）
     file_id = Column(Integer, ForeignKey("files.id", ondelete="SET NULL"), nullable=True, index=True, comment="文件ID（关联files表）")
@@ -236,10 +237,72 @@ class Message(Base):
     file = relationship("File", foreign_keys=[file_id])
     
     __table_args__ = (
+        # 点对点历史：(发送者, 接收者) 等值过滤 + (created_at, id) 排序/游标
+        Index("ix_messages_sender_receiver_created", "sender_id", "receiver_id", "created_at", "id"),
+        # 房间历史：room_id 等值过滤 + (created_at, id) 排序/游标
+        Index("ix_messages_room_created", "room_id", "created_at", "id"),
+        # 重连补发：按会话序号区间读取
+        Index("ix_messages_room_seq", "room_id", "seq"),
+        Index("ix_messages_sender_receiver_seq", "sender_id", "receiver_id", "seq"),
+        # 批量同步：自己发送的消息按已读时间读取已读回执变化
+        Index("ix_messages_sender_read_at", "sender_id", "read_at", "id", postgresql_where=text("read_at IS NOT NULL")),
         {"comment": "聊天消息表"},
     )
 
 
+# 会话摘要同步序号：摘要行每次写入取新值，批量同步按 (owner_id, sync_seq) 读取变化的会话
+conversation_sync_seq = Sequence("conversation_summaries_sync_seq", metadata=Base.metadata)
+
+
+class ConversationSummary(Base):
+    """会话摘要模型（每个用户每个会话一行，随消息写入/已读同步维护，会话列表直接读取）"""
+    __tablename__ = "conversation_summaries"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    owner_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, comment="会话所属用户ID")
+    peer_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=True, comment="对方用户ID（点对点会话）")
+    room_id = Column(Integer, ForeignKey("rooms.id", ondelete="CASCADE"), nullable=True, comment="房间ID（房间会话）")
+    last_message_id = Column(Integer, ForeignKey("messages.id", ondelete="SET NULL"), nullable=True, comment="最后一条消息ID")
+    last_message_at = Column(DateTime, nullable=False, comment="最后一条消息时间")
+    unread_count = Column(Integer, nullable=False, default=0, comment="未读消息数")
+    last_message_seq = Column(Integer, nullable=False, default=0, comment="最后一条消息的会话序号")
+    delivered_seq = Column(Integer, nullable=False, default=0, comment="已送达游标：客户端确认收到的最大会话序号")
+    read_seq = Column(Integer, nullable=False, default=0, comment="已读水位：房间会话中该成员已读到的最大会话序号")
+    sync_seq = Column(BigInteger, nullable=False, server_default=conversation_sync_seq.next_value(),
+                      comment="同步序号：摘要行每次变更取 conversation_summaries_sync_seq 新值")
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow, comment="更新时间")
+    
+    # 关系
+    peer = relationship("User", foreign_keys=[peer_id])
+    room = relationship("Room")
+    last_message = relationship("Message", foreign_keys=[last_message_id])
+    
+    __table_args__ = (
+        # 会话列表：按所属用户、最后消息时间倒序读取
+        Index("ix_conversation_summaries_owner_last", "owner_id", text("last_message_at DESC"), text("last_message_id DESC")),
+        # 每个用户每个会话唯一（点对点与房间分别约束）
+        Index("uq_conversation_summaries_owner_peer", "owner_id", "peer_id", unique=True,
+              postgresql_where=text("room_id IS NULL")),
+        Index("uq_conversation_summaries_owner_room", "owner_id", "room_id", unique=True,
+              postgresql_where=text("room_id IS NOT NULL")),
+        # 批量同步：按所属用户读取同步序号之后变化的会话
+        Index("ix_conversation_summaries_owner_sync", "owner_id", "sync_seq"),
+        {"comment": "会话摘要表"},
+    )
+
+
+class ConversationSequence(Base):
+    """会话序号计数器（每个会话一行，写入消息时在同一事务内递增）"""
+    __tablename__ = "conversation_sequences"
+    
+    conversation_key = Column(String(64), primary_key=True, comment="会话键：room:{房间ID} 或 direct:{较小用户ID}:{较大用户ID}")
+    last_seq = Column(Integer, nullable=False, default=0, comment="已分配的最大序号")
+    
+    __table_args__ = (
+        {"comment": "会话序号计数器表"},
+    )
+
+
 class Friendship(Base):
     """好友关系模型"""
     __tablename__ = "friendships"
@@ -299,6 +362,7 @@ class File(Base):
     file_type = Column(String(50), nullable=False, index=True, comment="文件类型：image/audio/video/document等")
     mime_type = Column(String(100), nullable=False, comment="MIME类型")
     file_size = Column(Integer, nullable=False, comment="文件大小（字节）")
+    content_hash = Column(String(64), nullable=True, index=True, comment="内容哈希（SHA-256，存于 file_blobs；旧文件为空）")
     duration = Column(Integer, nullable=True, comment="时长（秒，用于音频/视频）")
     width = Column(Integer, nullable=True, comment="宽度（像素，用于图片/视频）")
     height = Column(Integer, nullable=True, comment="高度（像素，用于图片/视频）")
@@ -313,6 +377,22 @@ class File(Base):
     )
 
 
+class FileBlob(Base):
+    """文件内容块模型（按内容哈希去重存储，多个 File 记录可引用同一内容）"""
+    __tablename__ = "file_blobs"
+    
+    content_hash = Column(String(64), primary_key=True, comment="内容哈希（SHA-256 十六进制）")
+    blob_path = Column(String(500), nullable=False, comment="存储路径（相对 uploads 目录）")
+    file_size = Column(Integer, nullable=False, comment="文件大小（字节）")
+    ref_count = Column(Integer, nullable=False, default=0, comment="引用该内容的 File 记录数，为 0 时可回收")
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow, comment="首次写入时间")
+    
+    __table_args__ = (
+        Index("ix_file_blobs_unreferenced", "content_hash", postgresql_where=text("ref_count <= 0")),
+        {"comment": "文件内容块表"},
+    )
+
+
 class Call(Base):
     """通话记录模型"""
     __tablename__ = "calls"
@@ -337,3 +417,18 @@ class Call(Base):
     __table_args__ = (
         {"comment": "通话记录表"},
     )
+
+
+class StatsCounter(Base):
+    """统计计数器（写入时累加增量、定时对账，统计接口直接读取，见 app/core/stats_rollup.py）"""
+    __tablename__ = "stats_counters"
+    
+    name = Column(String(64), primary_key=True, comment="计数器名称")
+    scope = Column(BigInteger, primary_key=True, default=0, comment="计数范围：0 为全局，按用户统计时为用户ID，按天统计时为 YYYYMMDD")
+    value = Column(BigInteger, nullable=False, default=0, comment="计数值")
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, comment="最后一次累加或对账时间")
+    reconciled_at = Column(DateTime, nullable=True, comment="最后一次按源表重新统计的时间")
+    
+    __table_args__ = (
+        {"comment": "统计计数器表"},
+    )
@@ -0,0 +1,304 @@
+"""
+只读副本路由模块
+配置 DATABASE_READ_URL 后，历史消息、会话列表、统计、操作日志等只读接口通过 get_read_db 从只读副本查询，
+减少与聊天写入争用主库：
+
+- 复制延迟：后台任务每 READ_REPLICA_CHECK_INTERVAL 秒查询副本的回放延迟，
+  超过 READ_REPLICA_MAX_LAG、检查失败或长时间未检查时所有读请求回退到主库
+- 读己之写：用户提交写入后 READ_YOUR_WRITES_WINDOW 秒内，该用户的读请求使用主库，保证能读到自己刚写入的数据；
+  HTTP 请求通过会话事件自动登记（只写操作日志的请求不算写入），Socket.io 写入由事件处理器调用 mark_write 登记。
+  默认只在本 worker 生效，多 worker 部署时启用 READ_YOUR_WRITES_REDIS_ENABLED 在集群内共享
+
+未配置 DATABASE_READ_URL 时 get_read_db 直接使用主库，行为与 get_db 相同（但不提交）。
+"""
+
+import asyncio
+import time
+from collections import Counter
+from itertools import chain
+from typing import AsyncGenerator, Dict, Optional
+
+from fastapi import Request
+from loguru import logger
+from sqlalchemy import event, exc, text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from app.core.config import settings
+from app.core.security import decode_token
+from app.db.models import OperationLog
+from app.db.session import AsyncSessionLocal
+
+# Redis 键前缀
+READ_YOUR_WRITES_KEY_PREFIX = "mop:rw_sticky"
+
+# session.info 中的键：get_db 保存的请求、本事务是否有写入
+REQUEST_INFO_KEY = "request"
+_WROTE_INFO_KEY = "read_replica_wrote"
+
+# 副本回放延迟（秒）；不在恢复模式（普通实例）时为 0，已回放完收到的 WAL 时为 0
+_LAG_SQL = text("""
+SELECT pg_is_in_recovery(),
+       CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+            ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+       END
+""")
+
+
+def bearer_user_id(request: Optional[Request]) -> Optional[int]:
+    """从 Authorization: Bearer 令牌取用户ID，无令牌或令牌无效时返回 None（鉴权由 get_current_user 负责）"""
+    if request is None:
+        return None
+    authorization = request.headers.get("authorization") or ""
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    payload = decode_token(token.strip())
+    try:
+        return int(payload["sub"]) if payload else None
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class ReadReplicaRouter:
+    """只读副本连接、复制延迟监测与读己之写登记"""
+
+    def __init__(self):
+        self.engine = None
+        self.session_factory: Optional[async_sessionmaker] = None
+        self.available = False
+        self.lag: Optional[float] = None
+        self.last_checked = 0.0
+        self.last_error: Optional[str] = None
+        # {user_id: 读己之写截止时间（monotonic）}
+        self._sticky: Dict[int, float] = {}
+        self._next_sweep = 0.0
+        self._redis = None
+        self._task: Optional[asyncio.Task] = None
+        self._pending = set()
+        self.routed: Counter = Counter()
+        self.redis_errors = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.session_factory is not None
+
+    async def start(self):
+        """创建只读副本引擎并启动复制延迟检查（未配置 DATABASE_READ_URL 时读请求全部使用主库）"""
+        if not settings.DATABASE_READ_URL:
+            logger.info("未配置 DATABASE_READ_URL，只读接口使用主库")
+            return
+        self.engine = create_async_engine(
+            settings.DATABASE_READ_URL,
+            poolclass=AsyncAdaptedQueuePool,
+            pool_size=settings.DB_READ_POOL_SIZE,
+            max_overflow=settings.DB_READ_MAX_OVERFLOW,
+            pool_timeout=settings.DB_POOL_TIMEOUT,
+            pool_recycle=settings.DB_POOL_RECYCLE,
+            pool_pre_ping=True,
+            echo=settings.DB_ECHO,
+        )
+        self.session_factory = async_sessionmaker(
+            self.engine, class_=AsyncSession, expire_on_commit=False, autoflush=False
+        )
+        if settings.READ_YOUR_WRITES_REDIS_ENABLED:
+            import redis.asyncio as aioredis
+
+            self._redis = aioredis.from_url(
+                settings.REDIS_URL,
+                socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+                socket_connect_timeout=settings.REDIS_SOCKET_CONNECT_TIMEOUT,
+                decode_responses=True,
+            )
+        await self.check()
+        self._task = asyncio.create_task(self._run())
+        logger.info(
+            f"只读副本已启用（最大延迟 {settings.READ_REPLICA_MAX_LAG}s，读己之写窗口 {settings.READ_YOUR_WRITES_WINDOW}s，"
+            f"{'集群共享' if self._redis is not None else '本 worker'}）"
+        )
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._redis is not None:
+            await self._redis.close()
+            self._redis = None
+        if self.engine is not None:
+            await self.engine.dispose()
+            self.engine = None
+        self.session_factory = None
+        self.available = False
+        self._sticky.clear()
+
+    # ==================== 复制延迟 ====================
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(settings.READ_REPLICA_CHECK_INTERVAL)
+            await self.check()
+
+    async def check(self):
+        """查询副本回放延迟，失败时标记副本不可用"""
+        try:
+            async with self.engine.connect() as conn:
+                in_recovery, lag = (await conn.execute(_LAG_SQL)).one()
+            self.lag = float(lag or 0) if in_recovery else 0.0
+            if not self.available:
+                logger.info(f"只读副本可用（复制延迟 {self.lag:.3f}s）")
+            self.available = True
+            self.last_error = None
+        except Exception as e:
+            self.mark_unavailable(e)
+        self.last_checked = time.monotonic()
+
+    def mark_unavailable(self, error: Exception):
+        """副本连接失败：在下一次检查成功前所有读请求使用主库"""
+        if self.available or self.last_error is None:
+            logger.warning(f"只读副本不可用，读请求回退到主库: {error}")
+        self.available = False
+        self.last_error = str(error)
+
+    def fallback_reason(self) -> Optional[str]:
+        """副本当前不能使用的原因（disabled / unavailable / lag），可用时返回 None"""
+        if not self.enabled:
+            return "disabled"
+        # 检查任务停滞时不再信任上次的延迟
+        if not self.available or time.monotonic() - self.last_checked > settings.READ_REPLICA_CHECK_INTERVAL * 3:
+            return "unavailable"
+        if self.lag is None or self.lag > settings.READ_REPLICA_MAX_LAG:
+            return "lag"
+        return None
+
+    # ==================== 读己之写 ====================
+
+    def mark_write(self, user_id: Optional[int]):
+        """登记用户刚提交了写入：READ_YOUR_WRITES_WINDOW 秒内该用户的读请求使用主库（可在同步代码中调用）"""
+        if not user_id or not self.enabled:
+            return
+        now = time.monotonic()
+        self._sticky[user_id] = now + settings.READ_YOUR_WRITES_WINDOW
+        if now >= self._next_sweep:
+            self._sticky = {uid: until for uid, until in self._sticky.items() if until > now}
+            self._next_sweep = now + settings.READ_YOUR_WRITES_WINDOW
+        if self._redis is not None:
+            try:
+                task = asyncio.get_running_loop().create_task(self._publish_write(user_id))
+            except RuntimeError:
+                return
+            self._pending.add(task)
+            task.add_done_callback(self._pending.discard)
+
+    async def _publish_write(self, user_id: int):
+        try:
+            await self._redis.set(
+                f"{READ_YOUR_WRITES_KEY_PREFIX}:{user_id}", 1, px=int(settings.READ_YOUR_WRITES_WINDOW * 1000)
+            )
+        except Exception as e:
+            self._redis_failed("登记读己之写失败（仅本 worker 生效）", e)
+
+    async def is_sticky(self, user_id: Optional[int]) -> bool:
+        """用户是否在读己之写窗口内"""
+        if not user_id:
+            return False
+        until = self._sticky.get(user_id)
+        if until is not None and until > time.monotonic():
+            return True
+        if self._redis is None:
+            return False
+        try:
+            return bool(await self._redis.exists(f"{READ_YOUR_WRITES_KEY_PREFIX}:{user_id}"))
+        except Exception as e:
+            # 无法确认时使用主库，宁可多读主库也不返回旧数据
+            self._redis_failed("查询读己之写登记失败，使用主库", e)
+            return True
+
+    def _redis_failed(self, message: str, error: Exception):
+        self.redis_errors += 1
+        if self.redis_errors % 1000 == 1:
+            logger.warning(f"{message}: {error}")
+
+    # ==================== 路由 ====================
+
+    async def session_factory_for(self, user_id: Optional[int]) -> async_sessionmaker:
+        """选择本次读请求使用的会话工厂，按路由结果计数"""
+        reason = self.fallback_reason()
+        if reason is None and await self.is_sticky(user_id):
+            reason = "sticky"
+        self.routed[reason or "replica"] += 1
+        return self.session_factory if reason is None else AsyncSessionLocal
+
+    def stats(self) -> dict:
+        pool = self.engine.pool if self.engine is not None else None
+        return {
+            "enabled": self.enabled,
+            "available": self.available,
+            "lag_seconds": round(self.lag, 3) if self.lag is not None else None,
+            "last_error": self.last_error,
+            # replica 为走副本的请求数，其余为回退到主库的原因
+            "routed": dict(self.routed),
+            "sticky_users": len(self._sticky),
+            "distributed": self._redis is not None,
+            "redis_errors": self.redis_errors,
+            "pool_checked_out": pool.checkedout() if pool is not None else 0,
+        }
+
+
+# 全局实例
+replica_router = ReadReplicaRouter()
+
+
+# ==================== 写入登记（会话事件） ====================
+
+@event.listens_for(Session, "after_flush")
+def _track_flush(session, flush_context):
+    """ORM 写入（操作日志除外）标记本事务有写入"""
+    if any(not isinstance(obj, OperationLog) for obj in chain(session.new, session.dirty, session.deleted)):
+        session.info[_WROTE_INFO_KEY] = True
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _track_dml(orm_execute_state):
+    """insert / update / delete 语句标记本事务有写入"""
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info[_WROTE_INFO_KEY] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _mark_committed_writes(session):
+    """HTTP 请求提交写入后登记读己之写（用户取自 get_db 保存在 session.info 中的请求）"""
+    if session.info.pop(_WROTE_INFO_KEY, False) and replica_router.enabled:
+        replica_router.mark_write(bearer_user_id(session.info.get(REQUEST_INFO_KEY)))
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rolled_back_writes(session):
+    session.info.pop(_WROTE_INFO_KEY, None)
+
+
+# ==================== FastAPI 依赖 ====================
+
+async def get_read_db(request: Request) -> AsyncGenerator[AsyncSession, None]:
+    """
+    只读数据库会话依赖注入函数（从不提交）
+
+    副本可用、延迟未超限且当前用户不在读己之写窗口内时使用只读副本，否则使用主库；
+    需要写操作日志的接口另外注入 get_db，日志写入主库
+    """
+    factory = await replica_router.session_factory_for(bearer_user_id(request))
+    async with factory() as session:
+        try:
+            yield session
+        except Exception as e:
+            await session.rollback()
+            disconnected = isinstance(e, OSError) or (isinstance(e, exc.DBAPIError) and e.connection_invalidated)
+            if factory is not AsyncSessionLocal and disconnected:
+                replica_router.mark_unavailable(e)
+            raise
+        finally:
+            await session.close()
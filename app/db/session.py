@@ -3,17 +3,40 @@
 提供异步数据库会话和连接管理
 """
 
+import time
+
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
 from sqlalchemy.orm import declarative_base
-from sqlalchemy import text
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy import exc, text
 from contextlib import asynccontextmanager
 from typing import AsyncGenerator
 
+from fastapi import Request
+
 from app.core.config import settings
+from app.core.runtime_metrics import db_pool_metrics
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """记录每次取连接耗时与超时次数的连接池"""
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            connection = super().connect()
+        except exc.TimeoutError:
+            db_pool_metrics.timeouts += 1
+            db_pool_metrics.wait.record(time.perf_counter() - started)
+            raise
+        db_pool_metrics.record_checkout(time.perf_counter() - started, self.checkedout(), max(0, self.overflow()))
+        return connection
+
 
 # 创建异步数据库引擎
 engine = create_async_engine(
     settings.DATABASE_URL,
+    poolclass=InstrumentedQueuePool,
     pool_size=settings.DB_POOL_SIZE,
     max_overflow=settings.DB_MAX_OVERFLOW,
     pool_timeout=settings.DB_POOL_TIMEOUT,
@@ -53,12 +76,18 @@ class Database:
         await self.engine.dispose()
     
     @asynccontextmanager
-    async def get_session(self) -> AsyncGenerator[AsyncSession, None]:
-        """获取数据库会话上下文管理器"""
+    async def get_session(self, commit: bool = True) -> AsyncGenerator[AsyncSession, None]:
+        """
+        获取数据库会话上下文管理器
+
+        Args:
+            commit: 正常退出时是否提交（只读时传 False，退出时直接关闭会话归还连接）
+        """
         async with AsyncSessionLocal() as session:
             try:
                 yield session
-                await session.commit()
+                if commit:
+                    await session.commit()
             except Exception:
                 await session.rollback()
                 raise
@@ -70,12 +99,46 @@ class Database:
 db = Database()
 
 
-async def get_db() -> AsyncGenerator[AsyncSession, None]:
+@asynccontextmanager
+async def unit_of_work(read_only: bool = False) -> AsyncGenerator[AsyncSession, None]:
+    """
+    非 FastAPI 代码（Socket.io 事件处理器、后台任务）使用的数据库工作单元
+
+    退出 async with 时立即关闭会话并把连接归还连接池：正常退出时提交（read_only 时不提交），异常时回滚后向上抛出。
+    不要在这些代码中使用 `async for session in get_db(): ... break`：提前跳出生成器后会话要等垃圾回收才关闭，
+    负载高时长时间占用连接池中的连接
+
+    用法：
+        async with unit_of_work() as session:
+            session.add(obj)
+    """
+    async with db.get_session(commit=not read_only) as session:
+        yield session
+
+
+def pool_stats() -> dict:
+    """连接池实时状态（已借出、空闲、溢出连接数）与取连接耗时统计，只统计本 worker"""
+    pool = engine.pool
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "idle": pool.checkedin(),
+        "overflow": max(0, pool.overflow()),
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        **db_pool_metrics.stats(),
+    }
+
+
+async def get_db(request: Request = None) -> AsyncGenerator[AsyncSession, None]:
     """
     获取数据库会话依赖注入函数
     用于 FastAPI 的 Depends()
+
+    请求保存在 session.info 中，提交写入后据此登记读己之写（见 app.db.read_replica）
     """
     async with AsyncSessionLocal() as session:
+        if request is not None:
+            session.info["request"] = request
         try:
             yield session
             await session.commit()
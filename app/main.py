@@ -14,7 +14,17 @@ from pathlib import Path
 
 from app.core.config import settings
 from app.db.session import db
+from app.db.read_replica import replica_router
 from app.core.socketio import socketio_app, sio, start_heartbeat_monitor
+from app.core.presence import presence
+from app.core.presence_fanout import presence_fanout
+from app.core.presence_writer import presence_writer
+from app.core.message_ingest import message_ingest
+from app.core.user_cache import user_auth_cache
+from app.core.event_rate_limit import event_rate_limiter
+from app.core.runtime_metrics import loop_monitor
+from app.core.stats_rollup import stats_rollup
+from app.core.chunked_upload import chunked_uploads
 
 # 调试：打印CORS配置
 logger.info(f"CORS允许的源: {settings.cors_origins_list}")
@@ -66,6 +76,12 @@ async def lifespan(app: FastAPI):
         # 不抛出异常，允许应用启动（数据库可能未配置）
         logger.info("应用将在数据库未配置的情况下运行，某些功能可能不可用")
     
+    # 只读副本（未配置时只读接口使用主库）
+    try:
+        await replica_router.start()
+    except Exception as e:
+        logger.error(f"启动只读副本失败，只读接口使用主库: {e}")
+    
     # 启动 Socket.io 心跳监测
     try:
         start_heartbeat_monitor()
@@ -73,10 +89,96 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         logger.error(f"启动 Socket.io 心跳监测失败: {e}")
     
+    # 启动在线状态注册表（启用 Redis 时在集群内共享）
+    try:
+        await presence.start()
+    except Exception as e:
+        logger.error(f"启动在线状态注册表失败: {e}")
+    try:
+        await presence_fanout.start()
+    except Exception as e:
+        logger.error(f"启动在线状态推送失败: {e}")
+    try:
+        await presence_writer.start()
+    except Exception as e:
+        logger.error(f"启动在线状态写回失败: {e}")
+    try:
+        await user_auth_cache.start()
+    except Exception as e:
+        logger.error(f"启动用户鉴权缓存失败: {e}")
+    try:
+        await message_ingest.start()
+    except Exception as e:
+        logger.error(f"启动消息写入队列失败: {e}")
+    try:
+        await event_rate_limiter.start()
+    except Exception as e:
+        logger.error(f"启动 Socket.io 事件限流失败: {e}")
+    try:
+        await loop_monitor.start()
+    except Exception as e:
+        logger.error(f"启动事件循环延迟采样失败: {e}")
+    try:
+        await stats_rollup.start()
+    except Exception as e:
+        logger.error(f"启动统计计数器写入与对账失败: {e}")
+    try:
+        await chunked_uploads.start_sweeper()
+    except Exception as e:
+        logger.error(f"启动分片上传清理失败: {e}")
+    
     yield
     
     # 关闭时执行
     logger.info("正在关闭应用...")
+    try:
+        await chunked_uploads.stop_sweeper()
+    except Exception as e:
+        logger.error(f"停止分片上传清理时出错: {e}")
+    # 本 worker 的用户下线：在停止推送前写入离线状态并通知好友
+    try:
+        await presence.release()
+    except Exception as e:
+        logger.error(f"移除本 worker 在线会话时出错: {e}")
+    try:
+        await presence_fanout.stop()
+    except Exception as e:
+        logger.error(f"停止在线状态推送时出错: {e}")
+    try:
+        await presence.stop()
+    except Exception as e:
+        logger.error(f"关闭在线状态注册表时出错: {e}")
+    # 数据库关闭前写入队列中的消息
+    try:
+        await message_ingest.stop()
+    except Exception as e:
+        logger.error(f"写入排队消息时出错: {e}")
+    # 数据库关闭前写回缓冲中的在线状态
+    try:
+        await presence_writer.stop()
+    except Exception as e:
+        logger.error(f"写回在线状态时出错: {e}")
+    try:
+        await user_auth_cache.stop()
+    except Exception as e:
+        logger.error(f"关闭用户鉴权缓存时出错: {e}")
+    try:
+        await event_rate_limiter.stop()
+    except Exception as e:
+        logger.error(f"关闭 Socket.io 事件限流时出错: {e}")
+    try:
+        await loop_monitor.stop()
+    except Exception as e:
+        logger.error(f"停止事件循环延迟采样时出错: {e}")
+    # 数据库关闭前写入缓冲中的统计增量
+    try:
+        await stats_rollup.stop()
+    except Exception as e:
+        logger.error(f"写入统计计数器时出错: {e}")
+    try:
+        await replica_router.stop()
+    except Exception as e:
+        logger.error(f"关闭只读副本连接时出错: {e}")
     try:
         await db.close()
         logger.info("数据库连接已关闭")
@@ -39,7 +39,7 @@ class SocketProvider extends ChangeNotifier {
       StreamController<Map<String, dynamic>>.broadcast();
   Stream<Map<String, dynamic>> get messageStream => _messageStreamController.stream;
 
-  /// 全局 message_read 流（已读回执）
+  /// 全局已读回执流（messages_read 按消息展开）
   final StreamController<Map<String, dynamic>> _messageReadStreamController =
       StreamController<Map<String, dynamic>>.broadcast();
   Stream<Map<String, dynamic>> get messageReadStream => _messageReadStreamController.stream;
@@ -247,11 +247,21 @@ class SocketProvider extends ChangeNotifier {
       }
     });
 
-    // 统一监听 message_read，推入流
-    _socket!.on('message_read', (data) {
+    // 统一监听 messages_read（每个阅读者一帧），推入流：
+    // 携带消息ID列表时按条推送 {message_id, read_at}；水位模式原样推送（含 read_by、up_to_id）
+    _socket!.on('messages_read', (data) {
       if (data != null && data is Map) {
         final payload = Map<String, dynamic>.from(data as Map);
-        if (!_messageReadStreamController.isClosed) {
+        if (_messageReadStreamController.isClosed) return;
+        final messageIds = payload['message_ids'];
+        if (messageIds is List) {
+          for (final messageId in messageIds) {
+            _messageReadStreamController.add({
+              ...payload,
+              'message_id': messageId,
+            });
+          }
+        } else {
           _messageReadStreamController.add(payload);
         }
       }
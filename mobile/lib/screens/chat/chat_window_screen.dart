@@ -281,13 +281,20 @@ class _ChatWindowScreenState extends State<ChatWindowScreen> {
     _messageReadSubscription = socketProvider.messageReadStream.listen((data) {
       if (!mounted) return;
       final messageId = safeInt(data['message_id']);
-      if (messageId == null) return;
+      final upToId = safeInt(data['up_to_id']);
+      final readBy = safeInt(data['read_by']);
+      if (messageId == null && upToId == null) return;
       setState(() {
-        final index = _messages.indexWhere((msg) => safeInt(msg['id']) == messageId);
-        if (index != -1) {
-          _messages[index]['is_read'] = true;
+        for (final msg in _messages) {
+          final id = safeInt(msg['id']);
+          if (id == null) continue;
+          final matched = messageId != null
+              ? id == messageId
+              : id <= upToId! && safeInt(msg['receiver_id']) == readBy;
+          if (!matched) continue;
+          msg['is_read'] = true;
           if (data['read_at'] != null) {
-            _messages[index]['read_at'] = data['read_at'];
+            msg['read_at'] = data['read_at'];
           }
         }
       });
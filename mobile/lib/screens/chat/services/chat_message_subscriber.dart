@@ -112,9 +112,11 @@ class ChatMessageSubscriber {
     });
     
     // 监听消息已读状态更新
-    socketProvider.on('message_read', (data) {
-      if (data is Map<String, dynamic> && data['message_id'] != null) {
-        onMessageRead(data['message_id'] as int);
+    socketProvider.on('messages_read', (data) {
+      if (data is Map && data['message_ids'] is List) {
+        for (final messageId in data['message_ids'] as List) {
+          if (messageId is int) onMessageRead(messageId);
+        }
       }
     });
     
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+回填会话摘要表 conversation_summaries
+从 messages / room_participants 重新计算每个用户每个会话的最后消息与未读数。
+重建后各会话的已送达游标 delivered_seq 置为最后序号（重建前的消息不再重连补发）。
+房间会话保留各成员原有的已读水位 read_seq，按水位之后非自己发送的消息重新计算未读数；
+原来没有摘要行的成员视为已读到最后一条。
+执行 alembic upgrade 新建表后运行一次；清理聊天记录（如 clear_chat_messages.py）后也应重新运行。
+
+用法：
+    python scripts/backfill_conversation_summaries.py            # 清空并全量重建
+    python scripts/backfill_conversation_summaries.py --dry-run  # 只统计将写入的行数
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from sqlalchemy import text
+
+from app.db.session import db
+
+# 点对点：每条消息对发送者、接收者各产生一个视角，接收者视角的未读消息计入未读数
+P2P_SUMMARY_SQL = """
+    SELECT owner_id, peer_id, NULL::integer AS room_id,
+           (array_agg(id ORDER BY created_at DESC, id DESC))[1] AS last_message_id,
+           max(created_at) AS last_message_at,
+           count(*) FILTER (WHERE unread) AS unread_count,
+           coalesce(max(seq), 0) AS last_message_seq,
+           0 AS read_seq
+    FROM (
+        SELECT sender_id AS owner_id, receiver_id AS peer_id, id, created_at, seq, false AS unread
+        FROM messages WHERE room_id IS NULL AND receiver_id IS NOT NULL
+        UNION ALL
+        SELECT receiver_id, sender_id, id, created_at, seq, NOT is_read
+        FROM messages WHERE room_id IS NULL AND receiver_id IS NOT NULL AND receiver_id <> sender_id
+    ) AS p2p
+    GROUP BY owner_id, peer_id
+"""
+
+# 重建前各成员的房间已读水位（事务结束时删除）
+SAVE_ROOM_READS_SQL = """
+    CREATE TEMP TABLE previous_room_reads ON COMMIT DROP AS
+    SELECT owner_id, room_id, read_seq FROM conversation_summaries WHERE room_id IS NOT NULL
+"""
+
+# 房间：每个活跃参与者一行，原水位之后非自己发送的消息计入未读数（房间消息的 is_read 为所有成员共用，不能用于计数）
+ROOM_SUMMARY_SQL = """
+    SELECT rp.user_id AS owner_id, NULL::integer AS peer_id, m.room_id,
+           (array_agg(m.id ORDER BY m.created_at DESC, m.id DESC))[1] AS last_message_id,
+           max(m.created_at) AS last_message_at,
+           count(*) FILTER (WHERE m.sender_id <> rp.user_id AND m.seq > pr.read_seq) AS unread_count,
+           coalesce(max(m.seq), 0) AS last_message_seq,
+           coalesce(max(pr.read_seq), max(m.seq), 0) AS read_seq
+    FROM messages m
+    JOIN (
+        SELECT DISTINCT room_id, user_id FROM room_participants WHERE is_active = true
+    ) AS rp ON rp.room_id = m.room_id
+    LEFT JOIN previous_room_reads pr ON pr.owner_id = rp.user_id AND pr.room_id = m.room_id
+    WHERE m.room_id IS NOT NULL
+    GROUP BY rp.user_id, m.room_id
+"""
+
+
+async def backfill(dry_run: bool):
+    """清空并重建会话摘要（单事务，失败自动回滚）"""
+    await db.initialize()
+    try:
+        async with db.get_session() as session:
+            if dry_run:
+                await session.execute(text(SAVE_ROOM_READS_SQL))
+                p2p = (await session.execute(text(f"SELECT count(*) FROM ({P2P_SUMMARY_SQL}) s"))).scalar()
+                rooms = (await session.execute(text(f"SELECT count(*) FROM ({ROOM_SUMMARY_SQL}) s"))).scalar()
+                print(f"将写入点对点会话 {p2p} 行，房间会话 {rooms} 行")
+                return
+
+            started = time.perf_counter()
+            await session.execute(text("LOCK TABLE conversation_summaries IN EXCLUSIVE MODE"))
+            await session.execute(text(SAVE_ROOM_READS_SQL))
+            await session.execute(text("DELETE FROM conversation_summaries"))
+            for label, sql in (("点对点", P2P_SUMMARY_SQL), ("房间", ROOM_SUMMARY_SQL)):
+                result = await session.execute(text(f"""
+                    INSERT INTO conversation_summaries
+                        (owner_id, peer_id, room_id, last_message_id, last_message_at, unread_count,
+                         last_message_seq, delivered_seq, read_seq, updated_at)
+                    SELECT owner_id, peer_id, room_id, last_message_id, last_message_at, unread_count,
+                           last_message_seq, last_message_seq, read_seq, now()
+                    FROM ({sql}) AS s
+                """))
+                print(f"已写入{label}会话 {result.rowcount} 行")
+        print(f"回填完成，耗时 {time.perf_counter() - started:.1f}s")
+    finally:
+        await db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="回填会话摘要表")
+    parser.add_argument("--dry-run", action="store_true", help="只统计，不写入")
+    args = parser.parse_args()
+    asyncio.run(backfill(args.dry_run))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Socket.io 连接注册表内存基准测试
+用 tracemalloc 统计每个连接在注册表中占用的字节数：
+- 原始实现：每连接一个 dict（user_id、两个 datetime、完整的 User ORM 实例，含密码哈希等全部列）
+- 鉴权快照：每连接一个 dict（user_id、两个 datetime、AuthUser 快照）
+- 连接记录：ConnectionRecord（__slots__，仅 user_id / nickname / is_super_admin）
+
+每个连接对应一个不同的用户（最坏情况），sid 字符串由 Socket.io 服务器持有，不计入。
+
+用法：
+    python scripts/bench_connection_memory.py [--sizes 10000 100000]
+"""
+
+import argparse
+import gc
+import sys
+import tracemalloc
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.core.connection_registry import ConnectionRecord, ConnectionRegistry
+from app.core.user_cache import AuthUser
+from app.db.models import User
+
+PASSWORD_HASH = "$2b$12$" + "x" * 53
+
+
+class LegacyRegistry:
+    """旧注册表：{user_id: {sid: session_info}} + {sid: user_id}"""
+
+    def __init__(self):
+        self.by_user = {}
+        self.by_sid = {}
+
+    def add(self, user_id, sid, session_info):
+        self.by_user.setdefault(user_id, {})[sid] = session_info
+        self.by_sid[sid] = user_id
+
+
+def orm_user(user_id: int) -> User:
+    """与按 ID 查询得到的 User 实例字段一致（全部列）"""
+    now = datetime.utcnow()
+    return User(
+        id=user_id, phone=f"138{user_id:08d}", username=f"user{user_id}", password_hash=PASSWORD_HASH + str(user_id),
+        nickname=f"用户{user_id}", invitation_code=None, language="zh_CN", is_admin=False, role="user",
+        max_rooms=None, default_max_occupants=3, is_disabled=False, first_used_at=now, last_active_at=now,
+        is_online=True, latency_ms=None, agreed_at=now, created_at=now, updated_at=now,
+    )
+
+
+def auth_user(user_id: int) -> AuthUser:
+    return AuthUser(user_id, f"user{user_id}", f"用户{user_id}", "user", False, False, "zh_CN")
+
+
+def fill_legacy(sids, make_user):
+    registry = LegacyRegistry()
+    for user_id, sid in enumerate(sids, start=1):
+        registry.add(user_id, sid, {
+            'user_id': user_id,
+            'connected_at': datetime.now(timezone.utc),
+            'last_heartbeat': datetime.now(timezone.utc),
+            'user': make_user(user_id),
+        })
+    return registry
+
+
+def fill_records(sids):
+    registry = ConnectionRegistry()
+    for user_id, sid in enumerate(sids, start=1):
+        # 昵称来自鉴权快照，连接记录只保留引用；这里按每连接新建计入，与其他两种方式一致
+        registry.add(sid, ConnectionRecord(user_id, nickname=f"用户{user_id}", is_super_admin=False))
+    return registry
+
+
+def measure(build, sids) -> float:
+    """返回每个连接占用的字节数"""
+    gc.collect()
+    tracemalloc.start()
+    registry = build(sids)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del registry
+    gc.collect()
+    return current / len(sids)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Socket.io 连接注册表内存基准测试")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000], help="连接数")
+    args = parser.parse_args()
+
+    print("=" * 84)
+    print("Socket.io 连接注册表：每连接占用字节数（tracemalloc）")
+    print("=" * 84)
+    print(f"{'连接数':>8} | {'原始 (ORM User)':>16} | {'鉴权快照 (AuthUser)':>20} | {'连接记录':>10} | {'较原始节省':>10}")
+    print("-" * 84)
+
+    for size in args.sizes:
+        sids = [uuid.uuid4().hex[:20] for _ in range(size)]
+        legacy = measure(lambda s: fill_legacy(s, orm_user), sids)
+        snapshot = measure(lambda s: fill_legacy(s, auth_user), sids)
+        compact = measure(fill_records, sids)
+        print(f"{size:>8} | {legacy:>16.0f} | {snapshot:>20.0f} | {compact:>10.0f} | {1 - compact / legacy:>10.0%}")
+        print(f"{'':>8} | {legacy * size / 2**20:>14.1f}MB | {snapshot * size / 2**20:>18.1f}MB | "
+              f"{compact * size / 2**20:>8.1f}MB |")
+
+    print("-" * 84)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+会话列表查询基准测试
+在本地 PostgreSQL 中灌入约 100 万条消息作为背景数据，再为若干探针用户分别构造
+10 / 100 / 300 / 1000 个会话，测量 GET /chat/conversations 所用查询的耗时与查询次数。
+
+用法：
+    python scripts/bench_conversations.py --seed          # 灌入基准数据（仅需一次）
+    python scripts/bench_conversations.py                 # 运行基准测试（读取会话摘要表，需先执行回填脚本）
+    python scripts/bench_conversations.py --cleanup       # 删除基准数据
+
+注意：仅用于本地/测试库，基准用户手机号以 bench 开头。
+"""
+
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from sqlalchemy import text, event
+
+from app.db.session import db, engine
+from app.api.v1.chat import _conversation_summary_query
+
+BENCH_PHONE_PREFIX = "bench"
+PROBE_PHONE_PREFIX = "benchp"
+MESSAGES_PER_PROBE_CONVERSATION = 20
+
+
+async def seed(background_users: int, background_messages: int, probe_sizes):
+    """灌入背景用户、背景消息与探针用户会话"""
+    async with db.get_session() as session:
+        print(f"创建 {background_users} 个背景用户...")
+        await session.execute(text("""
+            INSERT INTO users (phone, username, password_hash, nickname, role, is_disabled, is_online,
+                               language, created_at, updated_at)
+            SELECT :prefix || g, 'bench_' || g, 'x', '基准用户' || g, 'user', false, false,
+                   'zh_TW', now(), now()
+            FROM generate_series(1, :n) g
+            ON CONFLICT (phone) DO NOTHING
+        """), {"prefix": BENCH_PHONE_PREFIX, "n": background_users})
+
+        print(f"灌入 {background_messages} 条背景消息...")
+        started = time.perf_counter()
+        await session.execute(text("""
+            WITH u AS (
+                SELECT array_agg(id ORDER BY id) AS ids, count(*)::int AS n
+                FROM users WHERE phone ~ '^bench[0-9]+$'
+            )
+            INSERT INTO messages (sender_id, receiver_id, message, message_type, is_read, created_at)
+            SELECT u.ids[1 + (g % u.n)],
+                   u.ids[1 + ((g % u.n) + 1 + (g / u.n) % (u.n - 1)) % u.n],
+                   '基准消息 ' || g, 'text', random() < 0.7,
+                   now() - make_interval(secs => g)
+            FROM u, generate_series(1, :count) g
+        """), {"count": background_messages})
+        print(f"  完成，耗时 {time.perf_counter() - started:.1f}s")
+
+        for size in probe_sizes:
+            phone = f"{PROBE_PHONE_PREFIX}{size}"
+            print(f"创建探针用户 {phone}（{size} 个会话）...")
+            await session.execute(text("""
+                INSERT INTO users (phone, username, password_hash, nickname, role, is_disabled, is_online,
+                                   language, created_at, updated_at)
+                VALUES (:phone, :phone, 'x', :phone, 'user', false, false, 'zh_TW', now(), now())
+                ON CONFLICT (phone) DO NOTHING
+            """), {"phone": phone})
+            await session.execute(text("""
+                WITH probe AS (SELECT id FROM users WHERE phone = :phone),
+                     peers AS (
+                         SELECT id, row_number() OVER (ORDER BY id) AS rn
+                         FROM users WHERE phone ~ '^bench[0-9]+$' ORDER BY id LIMIT :size
+                     )
+                INSERT INTO messages (sender_id, receiver_id, message, message_type, is_read, created_at)
+                SELECT CASE WHEN m % 2 = 0 THEN probe.id ELSE peers.id END,
+                       CASE WHEN m % 2 = 0 THEN peers.id ELSE probe.id END,
+                       '探针消息 ' || peers.rn || '-' || m, 'text', m < :per / 2,
+                       now() - make_interval(mins => (peers.rn * :per + m)::int)
+                FROM probe, peers, generate_series(1, :per) m
+            """), {"phone": phone, "size": size, "per": MESSAGES_PER_PROBE_CONVERSATION})
+
+    async with engine.begin() as conn:
+        await conn.execute(text("ANALYZE messages"))
+        await conn.execute(text("ANALYZE users"))
+    print("基准数据已就绪")
+
+
+async def cleanup():
+    """删除基准数据（messages.sender_id 非空，需先删消息再删用户）"""
+    async with db.get_session() as session:
+        await session.execute(text("""
+            DELETE FROM messages WHERE sender_id IN (SELECT id FROM users WHERE phone LIKE :p)
+                                    OR receiver_id IN (SELECT id FROM users WHERE phone LIKE :p)
+        """), {"p": f"{BENCH_PHONE_PREFIX}%"})
+        await session.execute(text("DELETE FROM users WHERE phone LIKE :p"), {"p": f"{BENCH_PHONE_PREFIX}%"})
+    print("基准数据已删除")
+
+
+async def run(probe_sizes, repeat: int, page_size: int):
+    """对每个探针用户测量会话列表查询耗时"""
+    statements = {"count": 0}
+
+    def _count_statement(*_args, **_kwargs):
+        statements["count"] += 1
+
+    event.listen(engine.sync_engine, "before_cursor_execute", _count_statement)
+
+    print("=" * 72)
+    print(f"{'会话数':>8} | {'首页 p50 (ms)':>14} | {'全量 p50 (ms)':>14} | {'返回会话':>8} | {'SQL 次数':>8}")
+    print("-" * 72)
+    async with db.get_session() as session:
+        for size in probe_sizes:
+            result = await session.execute(
+                text("SELECT id FROM users WHERE phone = :phone"),
+                {"phone": f"{PROBE_PHONE_PREFIX}{size}"}
+            )
+            user_id = result.scalar_one_or_none()
+            if user_id is None:
+                print(f"{size:>8} | 未找到探针用户，请先执行 --seed")
+                continue
+
+            timings = {}
+            returned = 0
+            for label, limit in (("page", page_size), ("full", None)):
+                samples = []
+                for _ in range(repeat):
+                    statements["count"] = 0
+                    started = time.perf_counter()
+                    rows = (await session.execute(_conversation_summary_query(user_id, None, limit))).all()
+                    samples.append((time.perf_counter() - started) * 1000)
+                    if label == "full":
+                        returned = len(rows)
+                timings[label] = statistics.median(samples)
+
+            print(f"{size:>8} | {timings['page']:>14.2f} | {timings['full']:>14.2f} | "
+                  f"{returned:>8} | {statements['count']:>8}")
+    print("-" * 72)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="会话列表查询基准测试")
+    parser.add_argument("--seed", action="store_true", help="灌入基准数据")
+    parser.add_argument("--cleanup", action="store_true", help="删除基准数据")
+    parser.add_argument("--users", type=int, default=2000, help="背景用户数")
+    parser.add_argument("--messages", type=int, default=1_000_000, help="背景消息数")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 300, 1000], help="探针用户会话数")
+    parser.add_argument("--repeat", type=int, default=5, help="每组重复次数")
+    parser.add_argument("--page-size", type=int, default=50, help="首页会话数")
+    args = parser.parse_args()
+
+    async def _main():
+        await db.initialize()
+        try:
+            if args.cleanup:
+                await cleanup()
+            elif args.seed:
+                await seed(args.users, args.messages, args.sizes)
+            else:
+                await run(args.sizes, args.repeat, args.page_size)
+        finally:
+            await db.close()
+
+    asyncio.run(_main())
+
+
+if __name__ == "__main__":
+    main()
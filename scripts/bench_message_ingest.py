@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+消息批量写入测试与基准
+校验 message_ingest 的顺序（ID 按入队顺序分配、同一会话内有序）、失败隔离、停止时写完队列，
+以及 record_messages 按会话合并语句；然后在 1 / 100 / 5000 个并发发送者下对比：
+
+- 逐条提交：每条消息独占一个连接，INSERT + 会话摘要 + COMMIT + REFRESH，每条一次 WAL 刷盘
+- 批量提交：message_ingest 合并为一条多行 INSERT ... RETURNING，每批一次 WAL 刷盘
+
+数据库以模拟延迟代替（--rtt-ms 每次往返、--fsync-ms 每次提交刷盘，刷盘串行），
+不需要真实数据库；结论是提交次数与排队的相对差异，绝对数值取决于实际硬件。
+
+用法：
+    python scripts/bench_message_ingest.py [--messages 2000] [--rtt-ms 0.2] [--fsync-ms 2]
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from loguru import logger
+
+from app.core.config import settings
+from app.core.conversation_summary import record_messages
+from app.core.message_ingest import MessageIngest
+from app.db.models import Message
+
+results = {"passed": 0, "failed": 0}
+
+
+def print_test(name, status, details=""):
+    """打印测试结果"""
+    status_symbol = "[通过]" if status else "[失败]"
+    print(f"{status_symbol} {name}")
+    if details:
+        print(f"   详情: {details}")
+    results["passed" if status else "failed"] += 1
+
+
+class SimulatedDatabase:
+    """模拟数据库：往返延迟 + 串行的 WAL 刷盘 + 连接池上限，自增分配消息ID"""
+
+    def __init__(self, rtt_ms: float, fsync_ms: float, pool_size: int):
+        self.rtt = rtt_ms / 1000
+        self.fsync = fsync_ms / 1000
+        self.pool = asyncio.Semaphore(pool_size)
+        self.wal = asyncio.Lock()
+        self.next_id = 1
+        self.commits = 0
+        self.fail_sender = None
+
+    def _assign_ids(self, messages):
+        if self.fail_sender is not None and any(m.sender_id == self.fail_sender for m in messages):
+            raise RuntimeError("模拟外键失败")
+        for message in messages:
+            message.id = self.next_id
+            self.next_id += 1
+
+    async def _commit(self):
+        async with self.wal:
+            await asyncio.sleep(self.fsync)
+            self.commits += 1
+
+    async def write_single(self, message):
+        """旧实现：add + flush、会话摘要、commit、refresh"""
+        async with self.pool:
+            await asyncio.sleep(self.rtt * 2)
+            self._assign_ids([message])
+            await self._commit()
+            await asyncio.sleep(self.rtt)
+
+    async def write_batch(self, messages):
+        """新实现：一条多行 INSERT ... RETURNING + 按会话合并的摘要语句 + commit"""
+        async with self.pool:
+            conversations = len({(m.room_id, frozenset((m.sender_id, m.receiver_id))) for m in messages})
+            await asyncio.sleep(self.rtt * (1 + min(conversations, 2)))
+            self._assign_ids(messages)
+            await self._commit()
+
+
+def make_message(sender_id: int, receiver_id: int, seq: int) -> Message:
+    return Message(sender_id=sender_id, receiver_id=receiver_id, message=f"{sender_id}:{seq}", message_type="text")
+
+
+class CapturingSession:
+    def __init__(self):
+        self.statements = 0
+
+    async def execute(self, stmt):
+        self.statements += 1
+
+
+async def run_checks():
+    original_delay = settings.MESSAGE_INGEST_MAX_DELAY_MS
+    settings.MESSAGE_INGEST_MAX_DELAY_MS = 2
+    try:
+        database = SimulatedDatabase(rtt_ms=0.1, fsync_ms=1, pool_size=10)
+        ingest = MessageIngest(write_batch=database.write_batch)
+        received = {}
+
+        async def sender(sender_id):
+            for seq in range(20):
+                message = await ingest.submit(make_message(sender_id, 1000 + sender_id % 5, seq))
+                received.setdefault(sender_id, []).append((seq, message.id))
+
+        await asyncio.gather(*(sender(uid) for uid in range(1, 51)))
+        ordered = all([mid for _, mid in items] == sorted(mid for _, mid in items) for items in received.values())
+        ids = sorted(mid for items in received.values() for _, mid in items)
+        print_test("每条消息都拿到唯一ID", ids == list(range(1, 1001)), f"count={len(ids)}")
+        print_test("同一发送者/会话内ID按发送顺序递增", ordered)
+        stats = ingest.stats()
+        print_test(
+            "并发发送时合并为批次",
+            stats["batches"] < stats["rows_written"] and database.commits == stats["batches"],
+            f"batches={stats['batches']}, rows={stats['rows_written']}, avg={stats['avg_batch_size']}",
+        )
+
+        database.fail_sender = 7
+        outcomes = await asyncio.gather(
+            *(ingest.submit(make_message(uid, 2000, 0)) for uid in range(5, 10)),
+            return_exceptions=True,
+        )
+        failed = [uid for uid, outcome in zip(range(5, 10), outcomes) if isinstance(outcome, Exception)]
+        print_test("整批失败时逐条重试，只有出错的消息失败", failed == [7], f"failed={failed}")
+        database.fail_sender = None
+
+        tasks = [asyncio.create_task(ingest.submit(make_message(uid, 3000, 0))) for uid in range(1, 31)]
+        await asyncio.sleep(0)
+        await ingest.stop()
+        print_test("停止时写完已入队的消息", all(t.done() and t.result().id for t in tasks), f"pending={ingest.pending_count}")
+    finally:
+        settings.MESSAGE_INGEST_MAX_DELAY_MS = original_delay
+
+    now = datetime.utcnow()
+    batch = [Message(id=i, sender_id=1 + i % 2, receiver_id=2 - i % 2, created_at=now) for i in range(1, 41)]
+    batch += [Message(id=100 + i, sender_id=i % 3 + 1, room_id=9 + i % 2, created_at=now) for i in range(20)]
+    session = CapturingSession()
+    await record_messages(session, batch)
+    print_test("会话摘要按会话合并（点对点一条 + 每个房间一条）", session.statements == 3, f"statements={session.statements}")
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+async def run_level(mode: str, senders: int, per_sender: int, args) -> dict:
+    database = SimulatedDatabase(args.rtt_ms, args.fsync_ms, args.pool_size)
+    ingest = MessageIngest(write_batch=database.write_batch)
+    latencies = []
+
+    async def sender(sender_id):
+        for seq in range(per_sender):
+            message = make_message(sender_id, sender_id + 1, seq)
+            start = time.perf_counter()
+            if mode == "single":
+                await database.write_single(message)
+            else:
+                await ingest.submit(message)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(sender(uid) for uid in range(1, senders + 1)))
+    elapsed = time.perf_counter() - start
+    await ingest.stop()
+    return {
+        "messages": len(latencies),
+        "rate": len(latencies) / elapsed,
+        "p50": percentile(latencies, 0.50) * 1000,
+        "p99": percentile(latencies, 0.99) * 1000,
+        "commits": database.commits,
+    }
+
+
+async def bench(args):
+    print("-" * 78)
+    print(f"模拟数据库：往返 {args.rtt_ms}ms，刷盘 {args.fsync_ms}ms（串行），连接池 {args.pool_size}")
+    print(f"{'并发发送者':<10}{'实现':<10}{'消息数':>8}{'消息/秒':>12}{'p50(ms)':>10}{'p99(ms)':>10}{'提交次数':>10}")
+    for senders in (1, 100, 5000):
+        per_sender = max(1, args.messages // senders)
+        rows = {}
+        for mode, label in (("single", "逐条提交"), ("batch", "批量提交")):
+            rows[mode] = await run_level(mode, senders, per_sender, args)
+            row = rows[mode]
+            print(f"{senders:<15}{label:<10}{row['messages']:>8}{row['rate']:>12.0f}"
+                  f"{row['p50']:>10.1f}{row['p99']:>10.1f}{row['commits']:>10}")
+        if senders > 1:
+            print_test(
+                f"{senders} 个并发发送者时批量提交吞吐更高、p99 更低",
+                rows["batch"]["rate"] > rows["single"]["rate"] and rows["batch"]["p99"] < rows["single"]["p99"],
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="消息批量写入测试与基准")
+    parser.add_argument("--messages", type=int, default=2000, help="每个并发级别的消息总数（至少每个发送者一条）")
+    parser.add_argument("--rtt-ms", type=float, default=0.2, help="模拟数据库往返延迟（毫秒）")
+    parser.add_argument("--fsync-ms", type=float, default=2.0, help="模拟每次提交的 WAL 刷盘耗时（毫秒）")
+    parser.add_argument("--pool-size", type=int, default=settings.DB_POOL_SIZE + settings.DB_MAX_OVERFLOW,
+                        help="模拟连接池大小")
+    args = parser.parse_args()
+
+    logger.disable("app.core.message_ingest")
+    asyncio.run(run_checks())
+    asyncio.run(bench(args))
+    print(f"\n通过 {results['passed']} 项，失败 {results['failed']} 项")
+    sys.exit(0 if results["failed"] == 0 else 1)
+
+
+if __name__ == "__main__":
+    main()
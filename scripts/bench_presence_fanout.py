@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+在线状态推送负载测试：模拟部署重启后的重连风暴
+N 个在线客户端在 1 秒内全部断开，随后按退避时间重连（少量客户端超过宽限期才回来），
+统计每秒下发给客户端的帧数：
+- 旧实现：每次上下线 emit 给所有连接（每个在线客户端收到一帧）
+- 订阅推送（无宽限期）：只推送给好友，按 PRESENCE_BATCH_INTERVAL 合并
+- 订阅推送（默认宽限期）：宽限期内重连不推送
+
+使用虚拟时钟与内存好友关系，不需要数据库与 Redis。
+
+用法：
+    python scripts/bench_presence_fanout.py [--clients 10000] [--friends 20]
+"""
+
+import argparse
+import asyncio
+import random
+import sys
+from collections import Counter, defaultdict
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from loguru import logger
+
+from app.core.config import settings
+from app.core.presence_fanout import PresenceFanout
+
+# 每批次的 debug 日志会淹没结果
+logger.disable("app.core.presence_fanout")
+
+
+def build_friend_graph(clients: int, friends: int):
+    """随机对称好友关系，平均每人约 friends 个好友"""
+    graph = defaultdict(set)
+    for uid in range(1, clients + 1):
+        for _ in range(friends // 2):
+            other = random.randint(1, clients)
+            if other != uid:
+                graph[uid].add(other)
+                graph[other].add(uid)
+    return graph
+
+
+def build_storm(clients: int, late_ratio: float):
+    """
+    重连风暴事件序列 [(时间, 用户ID, 是否上线)]
+    断开时间均匀分布在 [0, 1]s；重连延迟 0.5~8s，late_ratio 的客户端 20~30s 后才重连
+    """
+    events = []
+    for uid in range(1, clients + 1):
+        down = random.uniform(0, 1)
+        if random.random() < late_ratio:
+            up = down + random.uniform(20, 30)
+        else:
+            up = down + random.uniform(0.5, 8)
+        events.append((down, uid, False))
+        events.append((up, uid, True))
+    return events
+
+
+def run_legacy(clients: int, events):
+    """旧实现：每次状态变化广播给所有在线连接"""
+    online = clients
+    per_second = Counter()
+    for at, _, is_online in sorted(events):
+        online += 1 if is_online else -1
+        per_second[int(at)] += online
+    return per_second
+
+
+async def run_fanout(clients: int, events, graph, grace: float):
+    """订阅推送：按虚拟时钟驱动 mark_online / mark_offline 与定时 flush"""
+    settings.PRESENCE_OFFLINE_GRACE = grace
+    now = [0.0]
+    online = set(range(1, clients + 1))
+
+    async def load_subscribers(user_ids):
+        return {uid: graph[uid] for uid in user_ids}
+
+    async def filter_online(user_ids):
+        return [uid for uid in user_ids if uid in online]
+
+    per_second = Counter()
+
+    async def send_frame(subscriber_id, frame):
+        per_second[int(now[0])] += 1
+
+    fanout = PresenceFanout(load_subscribers=load_subscribers, filter_online=filter_online, clock=lambda: now[0])
+    fanout.send_frame = send_frame
+
+    events = sorted(events)
+    interval = settings.PRESENCE_BATCH_INTERVAL
+    end = events[-1][0] + grace + interval * 2
+    index = 0
+    tick = interval
+    while tick <= end:
+        while index < len(events) and events[index][0] <= tick:
+            at, uid, is_online = events[index]
+            now[0] = at
+            if is_online:
+                online.add(uid)
+                fanout.mark_online(uid)
+            else:
+                online.discard(uid)
+                fanout.mark_offline(uid)
+            index += 1
+        now[0] = tick
+        await fanout.flush()
+        tick += interval
+    return per_second, fanout.stats
+
+
+def report(name: str, per_second: Counter):
+    total = sum(per_second.values())
+    peak = max(per_second.values()) if per_second else 0
+    print(f"{name:<24} | {total:>14,} | {peak:>14,}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="在线状态推送重连风暴负载测试")
+    parser.add_argument("--clients", type=int, default=10000, help="在线客户端数")
+    parser.add_argument("--friends", type=int, default=20, help="平均好友数")
+    parser.add_argument("--late-ratio", type=float, default=0.05, help="超过宽限期才重连的客户端比例")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    graph = build_friend_graph(args.clients, args.friends)
+    events = build_storm(args.clients, args.late_ratio)
+    default_grace = settings.PRESENCE_OFFLINE_GRACE
+
+    print("=" * 60)
+    print(f"重连风暴：{args.clients} 客户端，平均好友 {args.friends}，"
+          f"合并间隔 {settings.PRESENCE_BATCH_INTERVAL}s")
+    print("=" * 60)
+    print(f"{'方案':<24} | {'总帧数':>14} | {'峰值帧/秒':>14}")
+    print("-" * 60)
+    report("全量广播（旧实现）", run_legacy(args.clients, events))
+    per_second, _ = asyncio.run(run_fanout(args.clients, events, graph, grace=0))
+    report("好友订阅 + 合并", per_second)
+    per_second, stats = asyncio.run(run_fanout(args.clients, events, graph, grace=default_grace))
+    report(f"好友订阅 + 合并 + 宽限{default_grace:g}s", per_second)
+    print("-" * 60)
+    print(f"宽限期内抵消的上下线：{stats['suppressed']:,}，推送批次：{stats['flushes']}")
+
+
+if __name__ == "__main__":
+    main()
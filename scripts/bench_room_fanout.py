@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+房间群聊推送测试与基准
+校验 room_membership 缓存（命中、失效、TTL、LRU）与 join_chat_room / leave_chat_room / close_chat_room
+对 Socket.io 房间的维护，然后对比向 N 人房间发送一条消息时：
+
+- 旧实现：逐个参与者 await sio.emit(room=user_{id})，每次各编码一次载荷
+- 新实现：对 chat_room_{id} emit 一次，载荷只编码一次
+
+使用进程内 Socket.io 管理器与计数的伪数据库会话，不需要数据库、Redis 与真实客户端。
+
+用法：
+    python scripts/bench_room_fanout.py [--members 500] [--messages 200]
+"""
+
+import argparse
+import asyncio
+import logging
+import sys
+import time
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import socketio
+
+from app.core.config import settings
+from app.core.presence import presence
+from app.core.room_membership import RoomMembershipCache, chat_room_name
+from app.core import socketio as sio_module
+
+# 关闭 Socket.io 的逐条进出房间/emit 日志，避免淹没基准输出
+logging.getLogger("socketio.server").setLevel(logging.WARNING)
+
+results = {"passed": 0, "failed": 0}
+
+
+def print_test(name, status, details=""):
+    """打印测试结果"""
+    status_symbol = "[通过]" if status else "[失败]"
+    print(f"{status_symbol} {name}")
+    if details:
+        print(f"   详情: {details}")
+    results["passed" if status else "failed"] += 1
+
+
+class FakeScalars:
+    def __init__(self, values):
+        self._values = values
+
+    def all(self):
+        return self._values
+
+
+class FakeResult:
+    def __init__(self, values):
+        self._values = values
+
+    def scalars(self):
+        return FakeScalars(self._values)
+
+
+class FakeSession:
+    """按 user_id 返回其活跃参与的房间ID，并统计查询次数"""
+
+    def __init__(self, memberships):
+        self.memberships = memberships
+        self.queries = 0
+
+    async def execute(self, stmt):
+        self.queries += 1
+        user_id = stmt.compile().params["user_id_1"]
+        return FakeResult(sorted(self.memberships.get(user_id, ())))
+
+
+class CountingPacket(socketio.packet.Packet):
+    """统计载荷编码次数"""
+
+    encodes = 0
+
+    def encode(self):
+        CountingPacket.encodes += 1
+        return super().encode()
+
+
+def make_server():
+    """进程内 Socket.io 服务器，发送只计数不走网络"""
+    server = socketio.AsyncServer(async_mode="asgi", logger=False, engineio_logger=False)
+    server.packet_class = CountingPacket
+    server.sent = 0
+
+    async def send_eio_packet(eio_sid, eio_pkt):
+        server.sent += 1
+
+    server._send_eio_packet = send_eio_packet
+    return server
+
+
+async def connect_clients(server, count):
+    """登记 count 个连接，返回 [(user_id, sid)]"""
+    clients = []
+    for user_id in range(1, count + 1):
+        sid = await server.manager.connect(f"eio-{user_id}", "/")
+        clients.append((user_id, sid))
+    return clients
+
+
+async def run_cache_checks():
+    memberships = {1: {10, 11}, 2: {10}, 3: set()}
+    session = FakeSession(memberships)
+    cache = RoomMembershipCache()
+
+    first = await cache.is_member(session, 10, 1)
+    second = await cache.is_member(session, 11, 1)
+    print_test(
+        "首次查询后同一用户的成员校验命中缓存",
+        first and second and session.queries == 1,
+        f"queries={session.queries}",
+    )
+    print_test("非成员校验失败", not await cache.is_member(session, 10, 3))
+
+    memberships[3] = {10}
+    stale = await cache.is_member(session, 10, 3)
+    cache.invalidate_user(3)
+    fresh = await cache.is_member(session, 10, 3)
+    print_test("加入房间并失效后立即生效", not stale and fresh, f"stale={stale}, fresh={fresh}")
+
+    memberships[1].discard(10)
+    memberships[2].discard(10)
+    cache.invalidate_room(10)
+    print_test(
+        "删除房间后清除包含该房间的全部条目",
+        not await cache.is_member(session, 10, 1) and not await cache.is_member(session, 10, 2),
+        f"size={cache.stats()['size']}",
+    )
+
+    original_ttl = settings.ROOM_MEMBERSHIP_CACHE_TTL
+    settings.ROOM_MEMBERSHIP_CACHE_TTL = 0.05
+    try:
+        await cache.rooms_of(session, 2)
+        cache.invalidate_user(2)
+        await cache.rooms_of(session, 2)
+        before = session.queries
+        time.sleep(0.06)
+        await cache.rooms_of(session, 2)
+        print_test("TTL 过期后重新查询", session.queries == before + 1, f"queries={session.queries - before}")
+    finally:
+        settings.ROOM_MEMBERSHIP_CACHE_TTL = original_ttl
+
+    original_size = settings.ROOM_MEMBERSHIP_CACHE_MAX_SIZE
+    settings.ROOM_MEMBERSHIP_CACHE_MAX_SIZE = 2
+    try:
+        lru = RoomMembershipCache()
+        for uid in (1, 2, 3):
+            await lru.rooms_of(session, uid)
+        print_test("LRU 限制缓存用户数", len(lru._local) == 2 and 1 not in lru._local, f"size={len(lru._local)}")
+    finally:
+        settings.ROOM_MEMBERSHIP_CACHE_MAX_SIZE = original_size
+
+
+async def run_room_checks():
+    """使用应用的 sio 校验聊天房间的进出与关闭"""
+    server = sio_module.sio
+    server.sent = 0
+
+    async def send_eio_packet(eio_sid, eio_pkt):
+        server.sent += 1
+
+    server._send_eio_packet = send_eio_packet
+    clients = await connect_clients(server, 3)
+    for user_id, sid in clients:
+        await presence.add(user_id, sid)
+    # 用户 1 有两个连接
+    extra_sid = await server.manager.connect("eio-1b", "/")
+    await presence.add(1, extra_sid)
+
+    room = chat_room_name(42)
+    await sio_module.join_chat_room(1, 42)
+    await sio_module.join_chat_room(2, 42)
+    members = {sid for sid, _ in server.manager.get_participants("/", room)}
+    print_test(
+        "join_chat_room 让用户的全部连接加入聊天房间",
+        members == {clients[0][1], extra_sid, clients[1][1]},
+        f"members={len(members)}",
+    )
+
+    await server.emit("message", {"room_id": 42}, room=room)
+    print_test("对聊天房间 emit 一次送达全部连接", server.sent == 3, f"sent={server.sent}")
+
+    await sio_module.leave_chat_room(2, 42)
+    members = {sid for sid, _ in server.manager.get_participants("/", room)}
+    print_test("leave_chat_room 后不再接收房间消息", clients[1][1] not in members, f"members={len(members)}")
+
+    await sio_module.close_chat_room(42)
+    print_test("close_chat_room 清空聊天房间", room not in server.manager.rooms.get("/", {}))
+
+    for user_id, sid in clients + [(1, extra_sid)]:
+        await presence.remove(user_id, sid)
+        await server.manager.disconnect(sid, "/")
+
+
+async def bench(members: int, messages: int):
+    payload = {
+        "id": 1,
+        "sender_id": 1,
+        "sender_nickname": "发送者",
+        "room_id": 7,
+        "room_name": "测试房间",
+        "message": "你好" * 50,
+        "message_type": "text",
+        "is_read": False,
+        "created_at": "2026-01-01T00:00:00",
+    }
+
+    # 旧实现：查询全部参与者后逐个 emit 到 user_{id}
+    server = make_server()
+    for user_id, sid in await connect_clients(server, members):
+        await server.enter_room(sid, f"user_{user_id}")
+    CountingPacket.encodes = 0
+    start = time.perf_counter()
+    for _ in range(messages):
+        for user_id in range(1, members + 1):
+            await server.emit("message", payload, room=f"user_{user_id}")
+    legacy_seconds = time.perf_counter() - start
+    legacy_encodes, legacy_sent = CountingPacket.encodes, server.sent
+
+    # 新实现：连接已加入 chat_room_{id}，每条消息 emit 一次
+    server = make_server()
+    room = chat_room_name(7)
+    for user_id, sid in await connect_clients(server, members):
+        await server.enter_room(sid, f"user_{user_id}")
+        await server.enter_room(sid, room)
+    CountingPacket.encodes = 0
+    start = time.perf_counter()
+    for _ in range(messages):
+        await server.emit("message", payload, room=room)
+    room_seconds = time.perf_counter() - start
+    room_encodes, room_sent = CountingPacket.encodes, server.sent
+
+    print_test("两种方式送达的帧数相同", legacy_sent == room_sent, f"legacy={legacy_sent}, room={room_sent}")
+    print_test("单次房间 emit 每条消息只编码一次", room_encodes == messages, f"encodes={room_encodes}")
+
+    print("-" * 60)
+    print(f"{members} 人房间发送 {messages} 条消息：")
+    print(f"  {'实现':<16}{'emit 调用':>12}{'载荷编码':>12}{'耗时(ms)':>12}{'每条(ms)':>12}")
+    print(f"  {'逐成员 emit':<16}{members * messages:>12}{legacy_encodes:>12}"
+          f"{legacy_seconds * 1000:>12.1f}{legacy_seconds * 1000 / messages:>12.3f}")
+    print(f"  {'房间单次 emit':<16}{messages:>12}{room_encodes:>12}"
+          f"{room_seconds * 1000:>12.1f}{room_seconds * 1000 / messages:>12.3f}")
+    if room_seconds:
+        print(f"  加速 {legacy_seconds / room_seconds:.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="房间群聊推送测试与基准")
+    parser.add_argument("--members", type=int, default=500, help="房间成员数（均在线）")
+    parser.add_argument("--messages", type=int, default=200, help="发送消息条数")
+    args = parser.parse_args()
+
+    asyncio.run(run_cache_checks())
+    asyncio.run(run_room_checks())
+    asyncio.run(bench(args.members, args.messages))
+    print(f"\n通过 {results['passed']} 项，失败 {results['failed']} 项")
+    sys.exit(0 if results["failed"] == 0 else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Socket.io 事件分发开销基准测试
+对比旧实现（遍历 connected_users 查找 sid 所属用户）与 ConnectionRegistry 反向索引的单次查找耗时
+
+用法：
+    python scripts/bench_socketio_dispatch.py [--sizes 1000 10000 100000] [--lookups 2000]
+"""
+
+import argparse
+import random
+import sys
+import time
+import uuid
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.core.connection_registry import ConnectionRecord, ConnectionRegistry
+
+
+def legacy_lookup(connected_users, sid):
+    """旧实现：O(连接总数) 线性扫描"""
+    for uid, sockets in connected_users.items():
+        if sid in sockets:
+            return uid
+    return None
+
+
+def build_registry(size: int) -> ConnectionRegistry:
+    """构造 size 个连接（约 1/4 用户多端在线）"""
+    registry = ConnectionRegistry()
+    user_id = 0
+    created = 0
+    while created < size:
+        user_id += 1
+        for _ in range(2 if user_id % 4 == 0 else 1):
+            if created >= size:
+                break
+            registry.add(uuid.uuid4().hex, ConnectionRecord(user_id))
+            created += 1
+    return registry
+
+
+def bench(func, sids) -> float:
+    """返回每次查找的平均耗时（微秒）"""
+    start = time.perf_counter()
+    for sid in sids:
+        func(sid)
+    return (time.perf_counter() - start) / len(sids) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Socket.io sid -> user 查找基准测试")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000], help="连接数")
+    parser.add_argument("--lookups", type=int, default=2000, help="每组测试的查找次数")
+    args = parser.parse_args()
+
+    print("=" * 64)
+    print("Socket.io 事件分发：sid -> user_id 查找耗时")
+    print("=" * 64)
+    print(f"{'连接数':>10} | {'线性扫描 (us)':>14} | {'反向索引 (us)':>14} | {'加速比':>8}")
+    print("-" * 64)
+
+    for size in args.sizes:
+        registry = build_registry(size)
+        all_sids = list(registry.by_sid.keys())
+        sids = [random.choice(all_sids) for _ in range(args.lookups)]
+
+        # 线性扫描在 10 万连接时很慢，按规模减少采样次数
+        legacy_sids = sids[: max(50, args.lookups * 1000 // size)]
+        legacy_us = bench(lambda sid: legacy_lookup(registry.by_user, sid), legacy_sids)
+        indexed_us = bench(registry.user_id_of, sids)
+
+        print(f"{size:>10} | {legacy_us:>14.2f} | {indexed_us:>14.3f} | {legacy_us / indexed_us:>7.0f}x")
+
+    print("-" * 64)
+
+
+if __name__ == "__main__":
+    main()
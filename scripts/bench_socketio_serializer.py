@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Socket.io 编码基准测试
+对比现有 JSON 文本编码与 MessagePack 编码在典型聊天帧上的体积与编解码耗时：
+- new_message：点对点文本消息（与 send_message 推送字段一致）
+- new_message(图片)：带文件信息与 base64 缩略图的消息
+- online_friends：在线好友列表
+- presence_update：合并后的上下线增量帧
+- messages_read：携带 100 个消息ID的已读回执
+- call_invitation：通话邀请
+
+体积为 Socket.io 包编码后的字节数（JSON 按 UTF-8 计），耗时为单帧编码/解码的平均微秒数。
+需要安装 msgpack。
+
+用法：
+    python scripts/bench_socketio_serializer.py [--iterations 20000]
+"""
+
+import argparse
+import base64
+import os
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from socketio import packet
+from socketio.msgpack_packet import MsgPackPacket
+
+
+def build_frames() -> dict:
+    """构造典型聊天帧（事件名 + 数据，与服务端推送格式一致）"""
+    now = datetime.now(timezone.utc).isoformat()
+    text_message = {
+        'id': 1823456, 'seq': 5312, 'from_user_id': 1024, 'sender_id': 1024, 'receiver_id': 2048,
+        'message': '晚上七点老地方见，记得带上周说的那份资料', 'type': 'text', 'message_type': 'text',
+        'timestamp': now, 'created_at': now,
+    }
+    image_message = {
+        **text_message, 'type': 'image', 'message_type': 'image',
+        'message': 'data:image/jpeg;base64,' + base64.b64encode(os.urandom(6 * 1024)).decode(),
+        'file_id': 99812, 'file_url': '/api/v1/files/media/99812', 'file_name': 'IMG_20261017_190211.jpg',
+        'file_size': 2348112, 'is_original': True, 'mime_type': 'image/jpeg',
+    }
+    friends = [
+        {'user_id': 10000 + i, 'username': f'user{10000 + i}', 'nickname': f'好友{i}', 'is_online': True}
+        for i in range(200)
+    ]
+    return {
+        'new_message': ['new_message', text_message],
+        'new_message(图片)': ['new_message', image_message],
+        'online_friends': ['online_friends', {'friends': friends, 'count': len(friends), 'timestamp': now}],
+        'presence_update': ['presence_update', {
+            'online': list(range(30001, 30041)), 'offline': list(range(40001, 40021)), 'timestamp': now,
+        }],
+        'messages_read': ['messages_read', {
+            'read_by': 2048, 'room_id': None, 'count': 100, 'max_id': 1823555, 'read_at': now,
+            'message_ids': list(range(1823456, 1823556)),
+        }],
+        'call_invitation': ['call_invitation', {
+            'room_id': 'r-7f3a9c2e', 'caller_id': 1024, 'caller_name': '张三', 'call_type': 'video',
+            'jitsi_url': 'https://meet.example.com/r-7f3a9c2e', 'jwt': 'e' * 360, 'timestamp': now,
+        }],
+    }
+
+
+def encoded_size(encoded) -> int:
+    if isinstance(encoded, list):
+        return sum(encoded_size(part) for part in encoded)
+    return len(encoded) if isinstance(encoded, (bytes, bytearray)) else len(encoded.encode())
+
+
+def bench(func, iterations: int) -> float:
+    """返回单次调用的平均耗时（微秒）"""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def measure(packet_class, data, iterations: int):
+    pkt = packet_class(packet.EVENT, data=data, namespace='/')
+    encoded = pkt.encode()
+    encode_us = bench(pkt.encode, iterations)
+    decode_us = bench(lambda: packet_class(encoded_packet=encoded), iterations)
+    return encoded_size(encoded), encode_us, decode_us
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Socket.io JSON / MessagePack 编码基准测试")
+    parser.add_argument("--iterations", type=int, default=20000, help="每帧编码/解码次数（大帧按体积减少）")
+    args = parser.parse_args()
+
+    print("=" * 104)
+    print("Socket.io 编码：JSON 文本 vs MessagePack")
+    print("=" * 104)
+    print(f"{'帧':<18} | {'JSON 字节':>9} | {'msgpack 字节':>12} | {'体积比':>6} | "
+          f"{'JSON 编码/解码 (us)':>20} | {'msgpack 编码/解码 (us)':>23}")
+    print("-" * 104)
+
+    total_json = total_msgpack = 0
+    for name, data in build_frames().items():
+        json_size = encoded_size(packet.Packet(packet.EVENT, data=data, namespace='/').encode())
+        iterations = max(200, args.iterations * 512 // max(512, json_size))
+        json_size, json_enc, json_dec = measure(packet.Packet, data, iterations)
+        msgpack_size, mp_enc, mp_dec = measure(MsgPackPacket, data, iterations)
+        total_json += json_size
+        total_msgpack += msgpack_size
+        print(f"{name:<18} | {json_size:>9} | {msgpack_size:>12} | {msgpack_size / json_size:>6.0%} | "
+              f"{json_enc:>9.2f} / {json_dec:>8.2f} | {mp_enc:>11.2f} / {mp_dec:>9.2f}")
+
+    print("-" * 104)
+    print(f"{'合计':<18} | {total_json:>9} | {total_msgpack:>12} | {total_msgpack / total_json:>6.0%} |")
+    print("注：图片消息的缩略图为 base64 文本，两种编码体积接近；改为直接发送 bytes 时 msgpack 内联二进制，"
+          "JSON 需拆成附件包")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+上传写盘对事件循环延迟的影响基准测试
+模拟 N 个并发 100MB 上传，同时以 10ms 间隔探测事件循环调度延迟，对比：
+- legacy：整体 await read() 后在事件循环上同步写盘并计算哈希（旧实现）
+- stream：app.core.file_storage.save_upload_stream 分块流式写入（线程池写盘 + 增量哈希）
+- base64：app.core.file_storage.save_base64 分段解码写入（Socket.io 转储路径）
+
+用法：
+    python scripts/bench_upload_event_loop.py [--uploads 4] [--size-mb 100] [--modes legacy stream base64]
+
+写入系统临时目录，结束后自动删除，不访问数据库。
+"""
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.core import file_storage
+
+BLOCK = os.urandom(1024 * 1024)
+
+
+class FakeUpload:
+    """模拟 UploadFile：async read(size)，数据按需生成，不整体占用内存"""
+
+    def __init__(self, size: int):
+        self.remaining = size
+
+    async def read(self, size: int = -1) -> bytes:
+        if self.remaining <= 0:
+            return b""
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        self.remaining -= size
+        # 模拟网络/临时文件读取的让出点
+        await asyncio.sleep(0)
+        blocks, rest = divmod(size, len(BLOCK))
+        return BLOCK * blocks + BLOCK[:rest]
+
+
+async def legacy_save(upload: FakeUpload, target: Path):
+    """旧实现：整体读入内存，事件循环上同步写盘、哈希"""
+    content = await upload.read()
+    with open(target, "wb") as f:
+        f.write(content)
+    return len(content), hashlib.sha256(content).hexdigest()
+
+
+async def lag_probe(stop: asyncio.Event, samples: list, interval: float = 0.01):
+    """每 interval 秒醒来一次，记录实际延迟超出量（毫秒）"""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, (loop.time() - expected) * 1000))
+
+
+async def run_mode(mode: str, uploads: int, size: int, work_dir: Path, b64_payload: str):
+    samples = []
+    stop = asyncio.Event()
+    probe = asyncio.create_task(lag_probe(stop, samples))
+    await asyncio.sleep(0.05)
+
+    async def one(i: int):
+        target = work_dir / f"{mode}_{i}.bin"
+        if mode == "legacy":
+            return await legacy_save(FakeUpload(size), target)
+        if mode == "stream":
+            return await file_storage.save_upload_stream(FakeUpload(size), target, size)
+        return await file_storage.save_base64(b64_payload, target, size)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(uploads)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await probe
+
+    for path in work_dir.glob(f"{mode}_*.bin"):
+        path.unlink()
+
+    samples.sort()
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))] if samples else 0.0
+    return {
+        "elapsed": elapsed,
+        "p50": statistics.median(samples) if samples else 0.0,
+        "p99": p99,
+        "max": samples[-1] if samples else 0.0,
+        "throughput": uploads * size / (1024 * 1024) / elapsed,
+    }
+
+
+async def main_async(args):
+    size = args.size_mb * 1024 * 1024
+    with tempfile.TemporaryDirectory() as tmp:
+        work_dir = Path(tmp)
+        # 临时目录与目标目录放在同一文件系统，os.replace 保持原子
+        file_storage.UPLOAD_TMP_DIR = work_dir / ".tmp"
+        b64_payload = ""
+        if "base64" in args.modes:
+            b64_payload = base64.b64encode(BLOCK * args.size_mb).decode()
+
+        print("=" * 78)
+        print(f"并发上传 {args.uploads} 个 × {args.size_mb}MB，事件循环探测间隔 10ms")
+        print("=" * 78)
+        print(f"{'模式':>8} | {'耗时 (s)':>9} | {'吞吐 (MB/s)':>11} | {'延迟 p50 (ms)':>13} | "
+              f"{'p99 (ms)':>9} | {'max (ms)':>9}")
+        print("-" * 78)
+        for mode in args.modes:
+            r = await run_mode(mode, args.uploads, size, work_dir, b64_payload)
+            print(f"{mode:>8} | {r['elapsed']:>9.2f} | {r['throughput']:>11.1f} | {r['p50']:>13.2f} | "
+                  f"{r['p99']:>9.2f} | {r['max']:>9.2f}")
+        print("-" * 78)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="上传写盘事件循环延迟基准测试")
+    parser.add_argument("--uploads", type=int, default=4, help="并发上传数")
+    parser.add_argument("--size-mb", type=int, default=100, help="单个文件大小（MB）")
+    parser.add_argument("--modes", nargs="+", choices=["legacy", "stream", "base64"],
+                        default=["legacy", "stream", "base64"], help="测试模式")
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+内容块引用计数校正与回收
+按 files.content_hash 重新统计 file_blobs.ref_count（覆盖直接 SQL 删除 files、级联删除等未经
+app.core.blob_store.delete_file_records 的情况），然后回收无引用的内容块及其磁盘文件。
+
+用法：
+    python scripts/gc_file_blobs.py            # 校正并回收
+    python scripts/gc_file_blobs.py --dry-run  # 只统计
+"""
+
+import argparse
+import asyncio
+import sys
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from sqlalchemy import text
+
+from app.db.session import db
+from app.core.blob_store import collect_blobs
+
+# 实际引用数与记录不一致的内容块
+DRIFT_SQL = """
+    SELECT b.content_hash, b.ref_count, COALESCE(f.cnt, 0) AS actual
+    FROM file_blobs b
+    LEFT JOIN (
+        SELECT content_hash, count(*) AS cnt FROM files
+        WHERE content_hash IS NOT NULL GROUP BY content_hash
+    ) f ON f.content_hash = b.content_hash
+    WHERE b.ref_count <> COALESCE(f.cnt, 0)
+"""
+
+
+async def run(dry_run: bool):
+    await db.initialize()
+    try:
+        async with db.get_session() as session:
+            stats = (await session.execute(text("""
+                SELECT count(*), COALESCE(sum(file_size), 0), COALESCE(sum(file_size::bigint * GREATEST(ref_count - 1, 0)), 0)
+                FROM file_blobs
+            """))).one()
+            print(f"内容块 {stats[0]} 个，占用 {stats[1] / 1024 / 1024:.1f}MB，去重节省 {stats[2] / 1024 / 1024:.1f}MB")
+
+            drift = (await session.execute(text(DRIFT_SQL))).all()
+            print(f"引用计数不一致 {len(drift)} 个")
+            if dry_run:
+                unreferenced = sum(1 for row in drift if row.actual == 0)
+                print(f"将回收 {unreferenced} 个（dry-run，未修改）")
+                return
+
+            # 行锁下按实际引用数校正，避免与并发上传互相覆盖
+            await session.execute(text("""
+                UPDATE file_blobs b SET ref_count = (
+                    SELECT count(*) FROM files f WHERE f.content_hash = b.content_hash
+                )
+                WHERE b.content_hash IN (SELECT content_hash FROM (""" + DRIFT_SQL + """) d)
+            """))
+            hashes = (await session.execute(
+                text("SELECT content_hash FROM file_blobs WHERE ref_count <= 0")
+            )).scalars().all()
+
+        collected = await collect_blobs(hashes)
+        print(f"已回收 {collected} 个内容块")
+    finally:
+        await db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="内容块引用计数校正与回收")
+    parser.add_argument("--dry-run", action="store_true", help="只统计，不修改")
+    args = parser.parse_args()
+    asyncio.run(run(args.dry_run))
+
+
+if __name__ == "__main__":
+    main()
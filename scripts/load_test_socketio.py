@@ -0,0 +1,469 @@
+#!/usr/bin/env python3
+"""
+Socket.io 压测工具
+在本地 Postgres 中准备压测账号（loadtest_ 前缀，相邻两个账号互为好友），用 create_access_token 签发真实 JWT，
+启动数千个 python-socketio 异步客户端连接服务端，按比例混合 send_message / mark_message_read / call_invitation
+与断线重连，统计：
+- 连接速率、连接耗时分位数、连接失败数
+- 端到端消息延迟（发送方发出 send_message 到好友收到 message 事件）分位数、送达率
+- 各事件的 ack 耗时分位数、被限流（rate_limited）与超时次数
+- 服务端事件循环延迟与数据库连接池取连接耗时（压测期间定时读取 GET /api/v1/admin/runtime-stats，需要超级管理员账号）
+
+客户端可分布到多个进程（--processes），互为好友的两个客户端总在同一进程内，端到端延迟使用同一时钟计算。
+
+用法：
+    # 1. 准备压测账号（使用 .env 中的 DATABASE_URL，应指向本地 Postgres）
+    python scripts/load_test_socketio.py setup --users 2000
+    # 2. 另开终端启动服务端（与本工具使用同一份 .env，JWT 密钥一致）
+    uvicorn app.main:app --host 127.0.0.1 --port 8000
+    # 3. 压测
+    python scripts/load_test_socketio.py run --url http://127.0.0.1:8000 --clients 2000 --duration 60 --processes 4
+    # 4. 清理压测账号及其消息
+    python scripts/load_test_socketio.py cleanup
+"""
+
+import argparse
+import asyncio
+import random
+import sys
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from loguru import logger
+
+from app.core.config import settings
+from app.core.runtime_metrics import percentile
+
+DEFAULT_PREFIX = "loadtest_"
+DEFAULT_MIX = "send_message=70,mark_message_read=20,call_invitation=5,reconnect=5"
+# 压测消息内容前缀，后接发送方 perf_counter 时间戳
+MESSAGE_MARKER = "loadtest:"
+
+
+# ==================== 账号准备 ====================
+
+async def setup_accounts(prefix: str, users: int):
+    """批量创建压测账号（已存在的跳过），相邻两个账号建立已接受的好友关系"""
+    import bcrypt
+    from sqlalchemy import delete, or_
+    from sqlalchemy.dialects.postgresql import insert
+
+    from app.db.models import Friendship, User
+    from app.db.session import db
+
+    password_hash = bcrypt.hashpw(b"loadtest", bcrypt.gensalt()).decode()
+    now = datetime.utcnow()
+    async with db.get_session() as session:
+        for start in range(0, users, 1000):
+            rows = [
+                {
+                    "phone": f"19900{index:06d}", "username": f"{prefix}{index:05d}", "password_hash": password_hash,
+                    "nickname": f"压测{index}", "language": "zh_CN", "role": "user", "is_admin": False,
+                    "is_disabled": False, "agreed_at": now, "created_at": now, "updated_at": now,
+                }
+                for index in range(start, min(users, start + 1000))
+            ]
+            await session.execute(insert(User).values(rows).on_conflict_do_nothing(index_elements=[User.phone]))
+
+        ids = await load_user_ids(session, prefix)
+        await session.execute(delete(Friendship).where(
+            or_(Friendship.user_id.in_(ids), Friendship.friend_id.in_(ids))
+        ))
+        pairs = [{"user_id": ids[i], "friend_id": ids[i + 1], "status": "accepted", "created_at": now, "updated_at": now}
+                 for i in range(0, len(ids) - 1, 2)]
+        for start in range(0, len(pairs), 1000):
+            await session.execute(insert(Friendship).values(pairs[start:start + 1000]))
+    print(f"[SUCCESS] 压测账号 {len(ids)} 个，好友对 {len(pairs)} 组（前缀 {prefix}）")
+
+
+async def cleanup_accounts(prefix: str):
+    """删除压测账号及其消息（消息的发送者外键不可为空，需先删除消息）"""
+    from sqlalchemy import delete, or_
+
+    from app.db.models import Message, User
+    from app.db.session import db
+
+    async with db.get_session() as session:
+        ids = await load_user_ids(session, prefix)
+        if not ids:
+            print("[INFO] 没有压测账号")
+            return
+        result = await session.execute(delete(Message).where(
+            or_(Message.sender_id.in_(ids), Message.receiver_id.in_(ids))
+        ))
+        await session.execute(delete(User).where(User.id.in_(ids)))
+    print(f"[SUCCESS] 已删除压测账号 {len(ids)} 个、消息 {result.rowcount} 条")
+
+
+async def load_user_ids(session, prefix: str) -> list:
+    from sqlalchemy import select
+
+    from app.db.models import User
+
+    result = await session.execute(
+        select(User.id).where(User.username.like(f"{prefix}%")).order_by(User.username)
+    )
+    return list(result.scalars().all())
+
+
+async def load_run_credentials(prefix: str, clients: int):
+    """签发压测账号与超级管理员的访问令牌"""
+    from sqlalchemy import or_, select
+
+    from app.core.permissions import ROLE_SUPER_ADMIN, SUPER_ADMIN_USERNAME
+    from app.core.security import create_access_token
+    from app.db.models import User
+    from app.db.session import db
+
+    async with db.get_session() as session:
+        ids = (await load_user_ids(session, prefix))[:clients]
+        admin_id = (await session.execute(
+            select(User.id).where(or_(User.role == ROLE_SUPER_ADMIN, User.username == SUPER_ADMIN_USERNAME)).limit(1)
+        )).scalar_one_or_none()
+    await db.close()
+
+    expires = timedelta(hours=6)
+    users = [(user_id, create_access_token({"sub": str(user_id)}, expires)) for user_id in ids]
+    admin_token = create_access_token({"sub": str(admin_id)}, expires) if admin_id else None
+    return users, admin_token
+
+
+# ==================== 模拟客户端（在子进程中运行） ====================
+
+class ShardStats:
+    """单个进程内的原始样本，汇总到主进程后计算分位数"""
+
+    def __init__(self):
+        self.connect_s = []
+        self.connected = 0
+        self.connect_errors = 0
+        self.reconnects = 0
+        self.disconnects = 0
+        self.e2e_s = []
+        self.sent = 0
+        self.received = 0
+        self.ack_s = defaultdict(list)
+        self.rate_limited = defaultdict(int)
+        self.timeouts = defaultdict(int)
+        self.errors = defaultdict(int)
+        self.server_errors = 0
+        self.connect_window = (0.0, 0.0)
+
+    def to_dict(self) -> dict:
+        return {key: (dict(value) if isinstance(value, defaultdict) else value) for key, value in vars(self).items()}
+
+
+class SimulatedClient:
+    """一个压测账号的 Socket.io 连接：发送事件、接收好友的消息并记录端到端延迟"""
+
+    def __init__(self, options: dict, user_id: int, peer_id: int, token: str, stats: ShardStats):
+        import socketio
+
+        self.options = options
+        self.user_id = user_id
+        self.peer_id = peer_id
+        self.token = token
+        self.stats = stats
+        self.unread = []
+        self.client = socketio.AsyncClient(reconnection=False)
+        self.client.on("message", self._on_message)
+        self.client.on("error", self._on_error)
+        self.client.on("disconnect", self._on_disconnect)
+
+    async def connect(self) -> bool:
+        started = time.perf_counter()
+        try:
+            await self.client.connect(
+                self.options["url"], auth={"token": self.token}, transports=["websocket"],
+                wait_timeout=self.options["timeout"],
+            )
+        except Exception:
+            self.stats.connect_errors += 1
+            return False
+        self.stats.connect_s.append(time.perf_counter() - started)
+        return True
+
+    async def close(self):
+        try:
+            await self.client.disconnect()
+        except Exception:
+            pass
+
+    async def _on_message(self, data):
+        if not isinstance(data, dict) or data.get("sender_id") != self.peer_id:
+            return
+        text = data.get("message")
+        if not isinstance(text, str):
+            return
+        if data.get("id"):
+            self.unread.append(data["id"])
+        if text.startswith(MESSAGE_MARKER):
+            self.stats.received += 1
+            self.stats.e2e_s.append(time.perf_counter() - float(text[len(MESSAGE_MARKER):]))
+
+    async def _on_error(self, data):
+        self.stats.server_errors += 1
+
+    async def _on_disconnect(self, *args):
+        self.stats.disconnects += 1
+
+    async def _call(self, event: str, data: dict):
+        started = time.perf_counter()
+        try:
+            reply = await self.client.call(event, data, timeout=self.options["timeout"])
+        except asyncio.TimeoutError:
+            self.stats.timeouts[event] += 1
+            return
+        except Exception:
+            self.stats.errors[event] += 1
+            return
+        if isinstance(reply, dict) and reply.get("error") == "rate_limited":
+            self.stats.rate_limited[event] += 1
+            return
+        self.stats.ack_s[event].append(time.perf_counter() - started)
+
+    async def act(self, action: str):
+        if not self.client.connected:
+            return
+        if action == "send_message":
+            self.stats.sent += 1
+            await self._call("send_message", {
+                "target_user_id": self.peer_id, "type": "text",
+                "message": f"{MESSAGE_MARKER}{time.perf_counter():.6f}",
+            })
+        elif action == "mark_message_read":
+            if self.unread:
+                up_to_id, self.unread = max(self.unread), []
+                await self._call("mark_message_read", {"peer_id": self.peer_id, "up_to_id": up_to_id})
+        elif action == "call_invitation":
+            await self._call("call_invitation", {
+                "target_user_id": self.peer_id, "room_id": f"loadtest-{uuid.uuid4().hex[:12]}",
+            })
+        elif action == "reconnect":
+            await self.close()
+            await asyncio.sleep(random.uniform(0.1, 1.0))
+            self.stats.reconnects += 1
+            await self.connect()
+
+    async def run(self, deadline: float, actions: list, weights: list):
+        rate = self.options["rate"]
+        while True:
+            await asyncio.sleep(random.expovariate(rate))
+            if time.monotonic() >= deadline:
+                return
+            await self.act(random.choices(actions, weights)[0])
+
+
+async def run_shard_async(options: dict, users: list) -> dict:
+    """在一个进程内运行一组客户端：按速率建立连接，压测 duration 秒后断开"""
+    stats = ShardStats()
+    peers = {}
+    for index in range(0, len(users) - 1, 2):
+        peers[users[index][0]], peers[users[index + 1][0]] = users[index + 1][0], users[index][0]
+    clients = [SimulatedClient(options, user_id, peers[user_id], token, stats)
+               for user_id, token in users if user_id in peers]
+
+    # 按连接速率错开建立连接
+    interval = 1.0 / options["connect_rate"] if options["connect_rate"] > 0 else 0.0
+    # 各进程的建连时间窗合并计算连接速率，使用墙上时钟
+    ramp_started = time.time()
+
+    async def connect_at(client, delay):
+        await asyncio.sleep(delay)
+        if await client.connect():
+            stats.connected += 1
+
+    await asyncio.gather(*[connect_at(client, i * interval) for i, client in enumerate(clients)])
+    stats.connect_window = (ramp_started, time.time())
+
+    actions, weights = zip(*options["mix"].items())
+    deadline = time.monotonic() + options["duration"]
+    await asyncio.gather(*[client.run(deadline, list(actions), list(weights)) for client in clients])
+    # 等待在途消息送达
+    await asyncio.sleep(min(5.0, options["timeout"]))
+    await asyncio.gather(*[client.close() for client in clients])
+    return stats.to_dict()
+
+
+def run_shard(options: dict, users: list) -> dict:
+    """子进程入口：提高文件描述符上限后运行一组客户端"""
+    try:
+        import resource
+
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except (ImportError, ValueError, OSError):
+        pass
+    logger.remove()
+    return asyncio.run(run_shard_async(options, users))
+
+
+# ==================== 服务端指标与报告 ====================
+
+async def poll_server_stats(url: str, admin_token: str, interval: float, stop: asyncio.Event) -> list:
+    """压测期间定时读取服务端运行时指标"""
+    import aiohttp
+
+    samples = []
+    started = time.monotonic()
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    async with aiohttp.ClientSession(headers=headers) as http:
+        while not stop.is_set():
+            try:
+                async with http.get(f"{url}{settings.API_V1_PREFIX}/admin/runtime-stats") as response:
+                    if response.status == 200:
+                        samples.append((time.monotonic() - started, await response.json()))
+                    else:
+                        logger.warning(f"读取服务端指标失败: HTTP {response.status}")
+            except Exception as e:
+                logger.warning(f"读取服务端指标失败: {e}")
+            try:
+                await asyncio.wait_for(stop.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+    return samples
+
+
+def merge_shards(shards: list) -> dict:
+    merged = {"connect_s": [], "e2e_s": [], "ack_s": defaultdict(list), "rate_limited": defaultdict(int),
+              "timeouts": defaultdict(int), "errors": defaultdict(int), "connect_window": [None, None]}
+    for shard in shards:
+        for key, value in shard.items():
+            if key in ("connect_s", "e2e_s"):
+                merged[key].extend(value)
+            elif key in ("ack_s", "rate_limited", "timeouts", "errors"):
+                for event, item in value.items():
+                    if key == "ack_s":
+                        merged[key][event].extend(item)
+                    else:
+                        merged[key][event] += item
+            elif key == "connect_window":
+                start, end = value
+                merged[key][0] = start if merged[key][0] is None else min(merged[key][0], start)
+                merged[key][1] = end if merged[key][1] is None else max(merged[key][1], end)
+            else:
+                merged[key] = merged.get(key, 0) + value
+    return merged
+
+
+def format_latency(samples: list) -> str:
+    values = sorted(samples)
+    return (f"p50={percentile(values, 50) * 1000:8.1f}ms  p90={percentile(values, 90) * 1000:8.1f}ms  "
+            f"p99={percentile(values, 99) * 1000:8.1f}ms  max={(values[-1] if values else 0) * 1000:8.1f}ms")
+
+
+def print_report(result: dict, server_samples: list, args):
+    print("=" * 96)
+    print(f"Socket.io 压测报告：{args.clients} 个客户端，{args.processes} 个进程，持续 {args.duration}s")
+    print("=" * 96)
+
+    connected = result.get("connected", 0)
+    start, end = result["connect_window"]
+    ramp = max(1e-6, (end or 0) - (start or 0))
+    print(f"[连接] 成功 {connected}，失败 {result.get('connect_errors', 0)}，"
+          f"建连耗时 {ramp:.1f}s，连接速率 {connected / ramp:.0f}/s，重连 {result.get('reconnects', 0)} 次，"
+          f"断开 {result.get('disconnects', 0)} 次")
+    print(f"       连接耗时  {format_latency(result['connect_s'])}")
+
+    sent, received = result.get("sent", 0), result.get("received", 0)
+    print(f"[消息] 发送 {sent}，送达 {received}（{received / sent:.1%}）" if sent else "[消息] 未发送消息")
+    print(f"       端到端    {format_latency(result['e2e_s'])}")
+
+    print("[事件 ack 耗时]")
+    for event in sorted(set(result["ack_s"]) | set(result["rate_limited"]) | set(result["timeouts"])):
+        print(f"  {event:<18} n={len(result['ack_s'][event]):<7} {format_latency(result['ack_s'][event])}  "
+              f"限流={result['rate_limited'][event]} 超时={result['timeouts'][event]} 失败={result['errors'][event]}")
+    print(f"[服务端 error 帧] {result.get('server_errors', 0)}")
+
+    if not server_samples:
+        print("[服务端] 未读取到运行时指标（需要超级管理员账号，且服务端可访问）")
+        return
+    print("[服务端] 事件循环延迟 / 连接池取连接耗时与借出、溢出连接数（每行为一次采样，分位数为最近窗口）")
+    print(f"  {'时间':>6} | {'循环 p99':>9} | {'循环 max':>9} | {'阻塞':>5} | {'连接池 p50':>10} | {'连接池 p99':>10} | "
+          f"{'借出':>5} | {'溢出':>5} | {'超时':>5}")
+    for elapsed, stats in server_samples:
+        loop, pool = stats.get("event_loop", {}), stats.get("db_pool", {})
+        wait = pool.get("wait", {})
+        print(f"  {elapsed:>5.0f}s | {loop.get('p99_ms', 0):>7.1f}ms | {loop.get('max_ms', 0):>7.1f}ms | "
+              f"{loop.get('stalls', 0):>5} | {wait.get('p50_ms', 0):>8.2f}ms | {wait.get('p99_ms', 0):>8.2f}ms | "
+              f"{pool.get('checked_out', 0):>5} | {pool.get('overflow', 0):>5} | {pool.get('timeouts', 0):>5}")
+
+
+async def run_load_test(args):
+    users, admin_token = await load_run_credentials(args.prefix, args.clients)
+    if len(users) < 2:
+        print(f"[ERROR] 压测账号不足，请先运行: python scripts/load_test_socketio.py setup --users {args.clients}")
+        return
+    if len(users) < args.clients:
+        print(f"[WARN] 只有 {len(users)} 个压测账号，按 {len(users)} 个客户端压测")
+        args.clients = len(users)
+    if not admin_token:
+        print("[WARN] 未找到超级管理员账号，不读取服务端指标")
+
+    mix = {}
+    for item in args.mix.split(","):
+        action, _, weight = item.partition("=")
+        mix[action.strip()] = float(weight or 1)
+    options = {
+        "url": args.url, "duration": args.duration, "rate": args.rate, "timeout": args.timeout,
+        "connect_rate": args.connect_rate / args.processes, "mix": mix,
+    }
+
+    # 好友两人分到同一进程
+    shards = [[] for _ in range(args.processes)]
+    for index in range(0, len(users) - 1, 2):
+        shards[(index // 2) % args.processes].extend(users[index:index + 2])
+
+    stop = asyncio.Event()
+    poller = asyncio.create_task(
+        poll_server_stats(args.url, admin_token, args.stats_interval, stop)
+    ) if admin_token else None
+    loop = asyncio.get_running_loop()
+    with ProcessPoolExecutor(max_workers=args.processes) as executor:
+        results = await asyncio.gather(*[
+            loop.run_in_executor(executor, run_shard, options, shard) for shard in shards if shard
+        ])
+    stop.set()
+    server_samples = await poller if poller else []
+    print_report(merge_shards(results), server_samples, args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Socket.io 压测工具")
+    parser.add_argument("--prefix", default=DEFAULT_PREFIX, help="压测账号用户名前缀")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    setup_parser = subparsers.add_parser("setup", help="在本地 Postgres 中创建压测账号与好友关系")
+    setup_parser.add_argument("--users", type=int, default=2000, help="压测账号数（取偶数，两两互为好友）")
+
+    subparsers.add_parser("cleanup", help="删除压测账号及其消息")
+
+    run_parser = subparsers.add_parser("run", help="运行压测")
+    run_parser.add_argument("--url", default="http://127.0.0.1:8000", help="服务端地址")
+    run_parser.add_argument("--clients", type=int, default=1000, help="客户端数")
+    run_parser.add_argument("--processes", type=int, default=1, help="客户端进程数（单进程数千连接时客户端自身会成为瓶颈）")
+    run_parser.add_argument("--duration", type=float, default=60, help="压测时长（秒，不含建连）")
+    run_parser.add_argument("--connect-rate", type=float, default=200, help="每秒新建连接数（所有进程合计）")
+    run_parser.add_argument("--rate", type=float, default=0.5, help="每个客户端每秒发起的动作数（泊松到达）")
+    run_parser.add_argument("--mix", default=DEFAULT_MIX, help="动作比例（send_message / mark_message_read / call_invitation / reconnect）")
+    run_parser.add_argument("--timeout", type=float, default=10, help="连接与 ack 超时（秒）")
+    run_parser.add_argument("--stats-interval", type=float, default=5, help="读取服务端指标的间隔（秒）")
+    args = parser.parse_args()
+
+    if args.command == "setup":
+        asyncio.run(setup_accounts(args.prefix, args.users))
+    elif args.command == "cleanup":
+        asyncio.run(cleanup_accounts(args.prefix))
+    else:
+        asyncio.run(run_load_test(args))
+
+
+if __name__ == "__main__":
+    main()
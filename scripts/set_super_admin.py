@@ -14,6 +14,7 @@ from app.db.session import db
 from app.db.models import User
 from sqlalchemy import select
 from app.core.permissions import SUPER_ADMIN_USERNAME, ROLE_SUPER_ADMIN
+from app.core.user_cache import user_auth_cache
 
 
 async def set_super_admin(username: str = None):
@@ -58,6 +59,11 @@ async def set_super_admin(username: str = None):
             await session.commit()
             await session.refresh(user)
             
+            # 清除鉴权缓存：启用 Redis 共享层时所有 worker 立即生效，否则在 USER_CACHE_LOCAL_TTL 秒内生效
+            await user_auth_cache.start()
+            await user_auth_cache.invalidate(user.id)
+            await user_auth_cache.stop()
+            
             print(f"[SUCCESS] 用户 '{target_username}' 已设置为超级管理员")
             print(f"  用户ID: {user.id}")
             print(f"  用户名: {user.username}")
@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""
+批量增量同步测试
+使用内存伪数据库校验 GET /chat/sync：
+- 游标编码/解码、无效游标返回 400
+- 首次同步返回完整会话列表，消息从当前开始
+- 一次请求覆盖全部会话（点对点 + 所在房间），不返回他人会话与未加入房间的消息
+- 三类变化按上限分页，has_more 循环拉取无遗漏、无重复
+- 最近的变化不越过（下次重复返回），本页未稳定时 has_more 为 false
+- 会话摘要写入与已读扣减都会取新的 sync_seq
+
+不需要数据库与 Redis。
+
+用法：
+    python scripts/test_chat_sync.py
+"""
+
+import asyncio
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+from types import SimpleNamespace
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from fastapi import HTTPException
+from sqlalchemy.dialects.postgresql import asyncpg
+
+from app.api.v1.chat import sync_conversations
+from app.core.chat_sync import SyncCursor, decode_sync_cursor, encode_sync_cursor
+from app.core.config import settings
+from app.core.conversation_summary import apply_read_receipts, record_message
+from app.core.room_membership import room_membership
+from app.core.user_cache import AuthUser
+from app.db.models import Message
+
+results = {"passed": 0, "failed": 0}
+
+USER_ID = 1
+NICKNAMES = {1: "我", 2: "张三", 3: "李四", 4: "王五"}
+ROOMS = {9: "项目组", 10: "未加入的房间"}
+
+
+def print_test(name, status, details=""):
+    """打印测试结果"""
+    status_symbol = "[通过]" if status else "[失败]"
+    print(f"{status_symbol} {name}")
+    if details:
+        print(f"   详情: {details}")
+    results["passed" if status else "failed"] += 1
+
+
+class FakeResult:
+    def __init__(self, rows=None, scalar=None):
+        self._rows = rows or []
+        self._scalar = scalar
+
+    def all(self):
+        return self._rows
+
+    def scalar(self):
+        return self._scalar
+
+    def scalars(self):
+        return FakeResult(rows=self._rows)
+
+
+class SyncDatabase:
+    """按编译后的 SQL 分派的内存数据库：messages / conversation_summaries / room_participants"""
+
+    def __init__(self):
+        self.messages = []
+        self.summaries = []
+        self.rooms = {9}
+        self.sync_seq = 0
+        self.queries = 0
+
+    def add_message(self, sender_id, receiver_id=None, room_id=None, created_at=None):
+        message = Message(
+            id=len(self.messages) + 1, sender_id=sender_id, receiver_id=receiver_id, room_id=room_id,
+            message=f"m{len(self.messages) + 1}", message_type="text", is_read=False,
+            created_at=created_at or datetime.utcnow() - timedelta(minutes=10),
+        )
+        self.messages.append(message)
+        return message
+
+    def touch_summary(self, peer_id=None, room_id=None, unread=0, updated_at=None):
+        self.sync_seq += 1
+        self.summaries = [s for s in self.summaries if (s.user_id, s.room_id) != (peer_id, room_id)]
+        last = self.messages[-1] if self.messages else None
+        self.summaries.append(SimpleNamespace(
+            user_id=peer_id, room_id=room_id, nickname=NICKNAMES.get(peer_id), room_name=ROOMS.get(room_id),
+            last_message=last.message if last else None, last_message_time=datetime.utcnow(),
+            last_message_id=last.id if last else None, last_message_seq=0, unread_count=unread,
+            sync_seq=self.sync_seq, updated_at=updated_at or datetime.utcnow() - timedelta(minutes=10),
+        ))
+
+    def mark_read(self, message, read_at=None):
+        message.is_read = True
+        message.read_at = read_at or datetime.utcnow()
+
+    async def execute(self, stmt):
+        self.queries += 1
+        compiled = stmt.compile(dialect=asyncpg.dialect())
+        sql, params = str(compiled), compiled.params
+        if "max(messages.id)" in sql:
+            return FakeResult(scalar=max((m.id for m in self.messages), default=0))
+        if "FROM room_participants" in sql:
+            return FakeResult(rows=sorted(self.rooms))
+        if "FROM conversation_summaries" in sql:
+            rows = sorted((s for s in self.summaries if s.sync_seq > params["sync_seq_1"]), key=lambda s: s.sync_seq)
+            return FakeResult(rows=rows[:params["param_1"]])
+        if "messages.read_at IS NOT NULL" in sql:
+            after = (params["param_1"], params["param_2"])
+            rows = sorted(
+                (SimpleNamespace(id=m.id, receiver_id=m.receiver_id, room_id=m.room_id, read_at=m.read_at)
+                 for m in self.messages
+                 if m.sender_id == params["sender_id_1"] and m.read_at and (m.read_at, m.id) > after),
+                key=lambda row: (row.read_at, row.id),
+            )
+            return FakeResult(rows=rows[:params["param_3"]])
+        user_id, room_ids = params["sender_id_1"], set(params.get("room_id_1") or [])
+        rows = [
+            (m, NICKNAMES.get(m.sender_id), NICKNAMES.get(m.receiver_id), ROOMS.get(m.room_id))
+            for m in self.messages
+            if m.id > params["id_1"] and (
+                (m.room_id is None and user_id in (m.sender_id, m.receiver_id)) or m.room_id in room_ids
+            )
+        ]
+        return FakeResult(rows=rows[:params["param_1"]])
+
+
+async def call_sync(database, cursor=None):
+    user = AuthUser(id=USER_ID, username="me", nickname="我", role="user", is_admin=False,
+                    is_disabled=False, language="zh_CN")
+    return await sync_conversations(request=None, cursor=cursor, current_user=user, db=database)
+
+
+async def sync_all(database, cursor):
+    """按 has_more 循环拉取，返回 (全部消息ID, 全部已读ID, 全部会话键, 最终游标, 请求次数)"""
+    message_ids, receipt_ids, conversations, calls = [], [], [], 0
+    while True:
+        calls += 1
+        response = await call_sync(database, cursor)
+        message_ids += [m.id for m in response.messages]
+        receipt_ids += [r.message_id for r in response.read_receipts]
+        conversations += [(c.user_id, c.room_id) for c in response.conversations]
+        cursor = response.cursor
+        if not response.has_more or calls > 50:
+            return message_ids, receipt_ids, conversations, cursor, calls
+
+
+async def run_cursor_checks():
+    position = SyncCursor(message_id=42, summary_seq=7, read_at=datetime(2026, 10, 17, 12, 0, 0, 123456), read_id=5)
+    print_test("游标编码后可还原", decode_sync_cursor(encode_sync_cursor(position)) == position)
+    invalid = 0
+    for value in ("not-a-cursor", "e30=", encode_sync_cursor(position)[:-6]):
+        try:
+            decode_sync_cursor(value)
+        except ValueError:
+            invalid += 1
+    print_test("格式无效的游标抛出 ValueError", invalid == 3, f"invalid={invalid}")
+    try:
+        await call_sync(SyncDatabase(), "bad")
+        print_test("无效游标返回 400", False)
+    except HTTPException as e:
+        print_test("无效游标返回 400", e.status_code == 400)
+
+
+async def run_sync_checks():
+    # 首次同步之后才发生的已读需立即可越过，本组检查不设稳定窗口
+    original_settle = settings.SYNC_SETTLE_SECONDS
+    settings.SYNC_SETTLE_SECONDS = 0
+    try:
+        await check_sync_round_trip()
+    finally:
+        settings.SYNC_SETTLE_SECONDS = original_settle
+
+
+async def check_sync_round_trip():
+    room_membership.invalidate_user(USER_ID)
+    database = SyncDatabase()
+    database.add_message(2, USER_ID)
+    database.add_message(USER_ID, 3)
+    database.touch_summary(peer_id=2, unread=1)
+    database.touch_summary(peer_id=3)
+    database.touch_summary(room_id=9)
+
+    first = await call_sync(database)
+    print_test(
+        "首次同步返回完整会话列表，消息从当前开始",
+        len(first.conversations) == 3 and not first.messages and decode_sync_cursor(first.cursor).message_id == 2,
+        f"conversations={len(first.conversations)}, messages={len(first.messages)}",
+    )
+
+    sent = database.add_message(USER_ID, 2)
+    database.add_message(2, USER_ID)
+    database.add_message(4, room_id=9)
+    database.add_message(3, 4)           # 他人之间的消息
+    database.add_message(4, room_id=10)  # 未加入的房间
+    database.add_message(3, USER_ID)
+    database.mark_read(sent)
+    database.touch_summary(peer_id=2, unread=2)
+    database.touch_summary(room_id=9, unread=1)
+
+    database.queries = 0
+    response = await call_sync(database, first.cursor)
+    print_test(
+        "一次请求返回全部会话的新消息（点对点 + 所在房间），按ID升序",
+        [m.id for m in response.messages] == [3, 4, 5, 8],
+        f"ids={[m.id for m in response.messages]}",
+    )
+    print_test(
+        "消息携带发送者 / 房间名称",
+        response.messages[2].room_name == "项目组" and response.messages[1].sender_nickname == "张三",
+    )
+    print_test("返回自己消息的已读回执", [r.message_id for r in response.read_receipts] == [3])
+    print_test(
+        "只返回变化的会话摘要",
+        [(c.user_id, c.room_id, c.unread_count) for c in response.conversations] == [(2, None, 2), (None, 9, 1)],
+    )
+    print_test("查询数与会话数无关（每类变化一条查询）", database.queries <= 4, f"queries={database.queries}")
+
+    again = await call_sync(database, response.cursor)
+    print_test(
+        "用新游标再次同步没有重复",
+        not again.messages and not again.read_receipts and not again.conversations and not again.has_more,
+    )
+
+
+async def run_paging_checks():
+    original = (settings.SYNC_MAX_MESSAGES, settings.SYNC_MAX_CONVERSATIONS, settings.SYNC_MAX_READ_RECEIPTS,
+                settings.SYNC_SETTLE_SECONDS)
+    settings.SYNC_MAX_MESSAGES, settings.SYNC_MAX_CONVERSATIONS, settings.SYNC_MAX_READ_RECEIPTS = 7, 3, 4
+    settings.SYNC_SETTLE_SECONDS = 0
+    try:
+        room_membership.invalidate_user(USER_ID)
+        database = SyncDatabase()
+        start = await call_sync(database)
+        for index in range(30):
+            message = database.add_message(USER_ID if index % 3 == 0 else 2, 2 if index % 3 == 0 else USER_ID)
+            if index % 3 == 0:
+                database.mark_read(message, datetime.utcnow() + timedelta(microseconds=index))
+        for peer in range(2, 12):
+            database.touch_summary(peer_id=peer)
+        message_ids, receipt_ids, conversations, _, calls = await sync_all(database, start.cursor)
+        print_test(
+            "按上限分页，循环拉取无遗漏、无重复",
+            message_ids == list(range(1, 31)) and receipt_ids == list(range(1, 31, 3))
+            and len(conversations) == len(set(conversations)) == 10,
+            f"messages={len(message_ids)}, receipts={len(receipt_ids)}, conversations={len(conversations)}, calls={calls}",
+        )
+        response = await call_sync(database, start.cursor)
+        print_test(
+            "每次响应不超过上限",
+            len(response.messages) <= 7 and len(response.conversations) <= 3 and len(response.read_receipts) <= 4,
+        )
+
+        # 最近的变化：返回但游标不越过
+        settings.SYNC_SETTLE_SECONDS = 5
+        room_membership.invalidate_user(USER_ID)
+        database = SyncDatabase()
+        start = await call_sync(database)
+        database.add_message(2, USER_ID)
+        fresh = database.add_message(2, USER_ID, created_at=datetime.utcnow())
+        database.add_message(2, USER_ID)
+        response = await call_sync(database, start.cursor)
+        cursor = decode_sync_cursor(response.cursor)
+        print_test(
+            "游标只越过早于 SYNC_SETTLE_SECONDS 的消息",
+            [m.id for m in response.messages] == [1, 2, 3] and cursor.message_id == 1,
+            f"cursor.message_id={cursor.message_id}",
+        )
+        again = await call_sync(database, response.cursor)
+        print_test("未稳定的消息下次重复返回（客户端按ID去重）", [m.id for m in again.messages] == [fresh.id, 3])
+
+        for _ in range(10):
+            database.add_message(2, USER_ID, created_at=datetime.utcnow())
+        response = await call_sync(database, response.cursor)
+        print_test("本页未稳定时 has_more 为 false，避免客户端空转", not response.has_more)
+    finally:
+        (settings.SYNC_MAX_MESSAGES, settings.SYNC_MAX_CONVERSATIONS, settings.SYNC_MAX_READ_RECEIPTS,
+         settings.SYNC_SETTLE_SECONDS) = original
+
+
+async def run_summary_checks():
+    statements = []
+
+    class CaptureSession:
+        async def execute(self, stmt):
+            statements.append(str(stmt.compile(dialect=asyncpg.dialect())))
+
+    await record_message(CaptureSession(), Message(id=1, sender_id=1, receiver_id=2, created_at=datetime.utcnow()))
+    await apply_read_receipts(CaptureSession(), 2, [(1, 2, None)])
+    print_test(
+        "会话摘要写入与已读扣减都取新的 sync_seq",
+        len(statements) == 2 and all("nextval('conversation_summaries_sync_seq')" in sql for sql in statements),
+    )
+
+
+def main():
+    asyncio.run(run_cursor_checks())
+    asyncio.run(run_sync_checks())
+    asyncio.run(run_paging_checks())
+    asyncio.run(run_summary_checks())
+    print(f"\n通过 {results['passed']} 项，失败 {results['failed']} 项")
+    sys.exit(0 if results["failed"] == 0 else 1)
+
+
+if __name__ == "__main__":
+    main()
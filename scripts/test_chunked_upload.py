@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+分片上传测试
+校验 app.core.chunked_upload 的 upload_start / upload_chunk / upload_commit 协议：
+- 开始上传返回偏移量 0 与建议分片大小；文件大小无效或超限时拒绝
+- 分片按偏移量顺序写入，偏移量不匹配（重复或跳跃）时拒绝并返回服务器偏移量
+- 断线后以 upload_id 续传取得已接收偏移量，其他用户不能续传
+- 提交：未传完时拒绝；哈希不一致时丢弃会话；成功时以增量计算的 SHA-256 存储并移除会话
+- 每个用户未完成的上传数上限
+- 定期清理：空闲超时的会话与遗留临时文件被删除，进行中会话的临时文件保留
+- 存入内容寻址存储（store_temp_file）：数据库失败时返回 None，删除本次新写入的内容块，提交报错
+
+不需要数据库（文件存储以记录参数的函数代替，数据库会话以假会话代替，文件写入临时目录）。
+
+用法：
+    python scripts/test_chunked_upload.py
+"""
+
+import asyncio
+import hashlib
+import os
+import sys
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from loguru import logger
+
+import app.core.blob_store as blob_module
+import app.core.chunked_upload as upload_module
+import app.db.session as session_module
+from app.core.blob_store import blob_absolute_path
+from app.core.chunked_upload import ChunkedUploadError, ChunkedUploadManager
+from app.core.config import settings
+from app.core.file_dump import store_temp_file
+
+results = {"passed": 0, "failed": 0}
+
+CONTENT = os.urandom(10 * 1024 + 123)
+CHUNK = 4096
+
+
+def print_test(name, status, details=""):
+    """打印测试结果"""
+    status_symbol = "[通过]" if status else "[失败]"
+    print(f"{status_symbol} {name}")
+    if details:
+        print(f"   详情: {details}")
+    results["passed" if status else "failed"] += 1
+
+
+stored = []
+
+
+async def fake_store_temp_file(temp_path, file_size, content_hash, sender_id, file_type, mime_type, file_name=None):
+    stored.append({"data": temp_path.read_bytes(), "sha256": content_hash, "size": file_size, "type": file_type})
+    temp_path.unlink()
+    return {"file_id": len(stored), "file_url": f"/files/{len(stored)}", "sha256": content_hash}
+
+
+async def expect_error(coro):
+    """返回 ChunkedUploadError（未抛出时返回 None）"""
+    try:
+        await coro
+    except ChunkedUploadError as e:
+        return e
+    return None
+
+
+async def run_protocol_checks():
+    manager = ChunkedUploadManager()
+    error = await expect_error(manager.start(1, "a.bin", 0))
+    too_large = await expect_error(manager.start(1, "a.bin", settings.CHUNKED_UPLOAD_MAX_SIZE + 1))
+    print_test("文件大小无效或超限时拒绝", error is not None and too_large is not None)
+
+    upload = await manager.start(1, "photo.jpg", len(CONTENT), "image/jpeg", "image")
+    ready = upload.to_dict()
+    print_test(
+        "开始上传返回偏移量 0 与建议分片大小，临时文件已创建",
+        ready["offset"] == 0 and ready["chunk_size"] == settings.CHUNKED_UPLOAD_CHUNK_SIZE
+        and upload.temp_path.exists() and upload.file_type == "image",
+        str(ready),
+    )
+
+    await manager.write_chunk(1, upload.upload_id, 0, CONTENT[:CHUNK])
+    duplicate = await expect_error(manager.write_chunk(1, upload.upload_id, 0, CONTENT[:CHUNK]))
+    skipped = await expect_error(manager.write_chunk(1, upload.upload_id, CHUNK * 2, CONTENT[CHUNK * 2:CHUNK * 3]))
+    print_test(
+        "偏移量不匹配（重复或跳跃的分片）时拒绝并返回服务器偏移量",
+        duplicate is not None and duplicate.offset == CHUNK and skipped is not None and skipped.offset == CHUNK
+        and upload.temp_path.stat().st_size == CHUNK,
+    )
+
+    incomplete = await expect_error(manager.commit(1, upload.upload_id))
+    print_test("未传完时提交被拒绝并返回已接收偏移量", incomplete is not None and incomplete.offset == CHUNK)
+
+    # 断线重连后续传
+    other_user = await expect_error(manager.start(2, "", 0, upload_id=upload.upload_id))
+    resumed = await manager.start(1, "", 0, upload_id=upload.upload_id)
+    print_test(
+        "以 upload_id 续传取得已接收偏移量，其他用户不能续传",
+        resumed is upload and resumed.to_dict()["offset"] == CHUNK and other_user is not None,
+    )
+
+    offset = resumed.offset
+    while offset < len(CONTENT):
+        await manager.write_chunk(1, upload.upload_id, offset, CONTENT[offset:offset + CHUNK])
+        offset += CHUNK
+    file_info = await manager.commit(1, upload.upload_id, hashlib.sha256(CONTENT).hexdigest().upper())
+    print_test(
+        "提交后以增量计算的 SHA-256 存储完整文件，会话移除",
+        file_info["file_id"] == 1 and stored[-1]["data"] == CONTENT
+        and stored[-1]["sha256"] == hashlib.sha256(CONTENT).hexdigest()
+        and await expect_error(manager.write_chunk(1, upload.upload_id, offset, b"x")) is not None,
+    )
+
+    upload = await manager.start(1, "b.bin", 4)
+    await manager.write_chunk(1, upload.upload_id, 0, b"abcd")
+    mismatch = await expect_error(manager.commit(1, upload.upload_id, "0" * 64))
+    print_test(
+        "哈希不一致时丢弃会话与临时文件",
+        mismatch is not None and not upload.temp_path.exists() and upload.upload_id not in manager._sessions,
+    )
+
+
+async def run_limit_checks():
+    original = settings.CHUNKED_UPLOAD_MAX_SESSIONS_PER_USER
+    settings.CHUNKED_UPLOAD_MAX_SESSIONS_PER_USER = 2
+    try:
+        manager = ChunkedUploadManager()
+        first = await manager.start(1, "1.bin", 10)
+        await manager.start(1, "2.bin", 10)
+        limited = await expect_error(manager.start(1, "3.bin", 10))
+        other_user = await manager.start(2, "4.bin", 10)
+        await manager.abort(1, first.upload_id)
+        after_abort = await manager.start(1, "5.bin", 10)
+    finally:
+        settings.CHUNKED_UPLOAD_MAX_SESSIONS_PER_USER = original
+    print_test(
+        "每个用户未完成的上传数上限，取消后可再开始",
+        limited is not None and other_user is not None and after_abort is not None
+        and not first.temp_path.exists(),
+        limited.message if limited else "",
+    )
+
+
+async def run_sweep_checks(tmp_dir: Path):
+    manager = ChunkedUploadManager()
+    idle = await manager.start(1, "idle.bin", 10)
+    active = await manager.start(2, "active.bin", 10)
+    orphan = tmp_dir / "orphan.part"
+    orphan.write_bytes(b"left over")
+    ttl = settings.CHUNKED_UPLOAD_SESSION_TTL
+    old = time.time() - ttl - 10
+    os.utime(orphan, (old, old))
+    os.utime(active.temp_path, (old, old))
+    idle.updated_at -= ttl + 10
+
+    original = settings.CHUNKED_UPLOAD_SWEEP_INTERVAL
+    settings.CHUNKED_UPLOAD_SWEEP_INTERVAL = 0.05
+    try:
+        # 启动时先清理一次，之后无需新的上传也会定期清理
+        await manager.start_sweeper()
+        first_pass = not orphan.exists() and not idle.temp_path.exists()
+        late_orphan = tmp_dir / "late.part"
+        late_orphan.write_bytes(b"x")
+        os.utime(late_orphan, (old, old))
+        await asyncio.sleep(0.2)
+        await manager.stop_sweeper()
+    finally:
+        settings.CHUNKED_UPLOAD_SWEEP_INTERVAL = original
+    print_test(
+        "定期清理空闲超时会话与遗留临时文件，保留进行中会话的临时文件",
+        first_pass and not late_orphan.exists() and idle.upload_id not in manager._sessions
+        and active.temp_path.exists() and active.upload_id in manager._sessions,
+    )
+
+
+class FakeSession:
+    """acquire_blob 的 upsert 直接成功；flush 按 fail 抛出数据库错误或分配文件ID"""
+
+    def __init__(self, fail):
+        self.fail = fail
+        self.added = []
+        self.rolled_back = False
+
+    async def execute(self, statement):
+        return None
+
+    def add(self, obj):
+        self.added.append(obj)
+
+    async def flush(self):
+        if self.fail:
+            raise ConnectionResetError("数据库连接被重置")
+        for index, obj in enumerate(self.added, start=1):
+            obj.id = index
+
+    async def commit(self):
+        pass
+
+
+def patch_unit_of_work(session):
+    @asynccontextmanager
+    async def fake_unit_of_work(read_only=False):
+        try:
+            yield session
+        except Exception:
+            session.rolled_back = True
+            raise
+
+    session_module.unit_of_work = fake_unit_of_work
+
+
+async def run_store_checks():
+    manager = ChunkedUploadManager()
+    upload = await manager.start(1, "doc.pdf", len(CONTENT))
+    await manager.write_chunk(1, upload.upload_id, 0, CONTENT)
+    session = FakeSession(fail=True)
+    patch_unit_of_work(session)
+    # 提交走真实的 store_temp_file
+    upload_module.store_temp_file = store_temp_file
+    failed = await expect_error(manager.commit(1, upload.upload_id))
+    blob = blob_absolute_path(hashlib.sha256(CONTENT).hexdigest())
+    print_test(
+        "数据库失败时提交报错，删除本次新写入的内容块与临时文件",
+        failed is not None and session.rolled_back and not blob.exists() and not upload.temp_path.exists(),
+        failed.message if failed else "",
+    )
+
+    temp_path = Path(upload_module.UPLOAD_TMP_DIR) / "again.part"
+    temp_path.write_bytes(CONTENT)
+    patch_unit_of_work(FakeSession(fail=False))
+    file_info = await store_temp_file(temp_path, len(CONTENT), hashlib.sha256(CONTENT).hexdigest(), 1, "file",
+                                      "application/pdf", "doc.pdf")
+    print_test(
+        "保存成功时返回文件ID，内容块已放置",
+        file_info is not None and file_info["file_id"] == 1 and blob.read_bytes() == CONTENT,
+        str(file_info and file_info["file_url"]),
+    )
+
+
+def main():
+    logger.disable("app.core.chunked_upload")
+    logger.disable("app.core.file_dump")
+    original_dir, original_store = upload_module.UPLOAD_TMP_DIR, upload_module.store_temp_file
+    original_base, original_uow = blob_module.UPLOAD_BASE_DIR, session_module.unit_of_work
+    with tempfile.TemporaryDirectory() as tmp, tempfile.TemporaryDirectory() as uploads:
+        upload_module.UPLOAD_TMP_DIR = Path(tmp)
+        upload_module.store_temp_file = fake_store_temp_file
+        blob_module.UPLOAD_BASE_DIR = Path(uploads)
+        try:
+            asyncio.run(run_protocol_checks())
+            asyncio.run(run_limit_checks())
+            asyncio.run(run_sweep_checks(Path(tmp)))
+            asyncio.run(run_store_checks())
+        finally:
+            upload_module.UPLOAD_TMP_DIR, upload_module.store_temp_file = original_dir, original_store
+            blob_module.UPLOAD_BASE_DIR, session_module.unit_of_work = original_base, original_uow
+    print(f"\n通过 {results['passed']} 项，失败 {results['failed']} 项")
+    sys.exit(0 if results["failed"] == 0 else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+会话列表测试
+调用 GET /chat/conversations 处理函数（伪数据库记录执行的 SQL）：
+- is_super_admin 是普通函数，返回布尔值（不再被同名依赖函数覆盖为协程）
+- 普通用户从会话摘要表按本人读取，不做消息表聚合，分页游标正确
+- 超级管理员仍从消息表实时聚合全部会话
+- get_super_admin_user 依赖拒绝普通用户
+
+不需要数据库与 Redis。
+
+用法：
+    python scripts/test_conversation_list.py
+"""
+
+import asyncio
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+from types import SimpleNamespace
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from fastapi import HTTPException
+from sqlalchemy.dialects.postgresql import asyncpg
+
+from app.api.v1.chat import _decode_conversation_cursor, get_conversations
+from app.core.permissions import get_super_admin_user, is_super_admin
+from app.core.user_cache import AuthUser
+
+results = {"passed": 0, "failed": 0}
+
+USER = AuthUser(id=1, username="member", nickname="成员", role="user", is_admin=False,
+                is_disabled=False, language="zh_CN")
+ADMIN = AuthUser(id=2, username="root", nickname="管理员", role="super_admin", is_admin=False,
+                 is_disabled=False, language="zh_CN")
+
+
+def print_test(name, status, details=""):
+    """打印测试结果"""
+    status_symbol = "[通过]" if status else "[失败]"
+    print(f"{status_symbol} {name}")
+    if details:
+        print(f"   详情: {details}")
+    results["passed" if status else "failed"] += 1
+
+
+class FakeResult:
+    def __init__(self, rows):
+        self._rows = rows
+
+    def all(self):
+        return self._rows
+
+
+class CaptureDatabase:
+    """记录执行的 SQL，返回预设的会话行；也用作写操作日志的主库会话"""
+
+    def __init__(self, rows=()):
+        self.rows = list(rows)
+        self.statements = []
+        self.added = []
+
+    async def execute(self, stmt):
+        compiled = stmt.compile(dialect=asyncpg.dialect())
+        self.statements.append((str(compiled), compiled.params))
+        return FakeResult(self.rows)
+
+    def add(self, obj):
+        self.added.append(obj)
+
+    async def commit(self):
+        pass
+
+
+def conversation_rows(count):
+    now = datetime(2026, 10, 17, 12, 0)
+    return [
+        SimpleNamespace(user_id=10 + index, room_id=None, last_message=f"m{index}", nickname=f"好友{index}",
+                        room_name=None, last_message_time=now - timedelta(minutes=index),
+                        last_message_id=100 - index, unread_count=index)
+        for index in range(count)
+    ]
+
+
+async def call_conversations(user, rows, limit=None):
+    read_db, db = CaptureDatabase(rows), CaptureDatabase()
+    request = SimpleNamespace(client=None, headers={})
+    response = await get_conversations(request, limit=limit, cursor=None, current_user=user, db=db, read_db=read_db)
+    return response, read_db
+
+
+async def run_endpoint_checks():
+    print_test(
+        "is_super_admin 返回布尔值",
+        is_super_admin(USER) is False and is_super_admin(ADMIN) is True,
+        repr(is_super_admin(USER)),
+    )
+
+    response, read_db = await call_conversations(USER, conversation_rows(3), limit=2)
+    sql, params = read_db.statements[0]
+    print_test(
+        "普通用户从会话摘要表读取本人的会话",
+        len(read_db.statements) == 1 and "FROM conversation_summaries" in sql
+        and "conversation_summaries.owner_id = $" in sql and params.get("owner_id_1") == USER.id
+        and "row_number()" not in sql,
+        sql.split("FROM")[1].split("\n")[0].strip(),
+    )
+    print_test(
+        "普通用户分页：返回 limit 条与指向最后一条的游标",
+        [c.user_id for c in response.conversations] == [10, 11]
+        and _decode_conversation_cursor(response.next_cursor)[1] == 99,
+        response.next_cursor,
+    )
+
+    response, read_db = await call_conversations(ADMIN, conversation_rows(1))
+    sql, _ = read_db.statements[0]
+    print_test(
+        "超级管理员从消息表聚合全部会话",
+        "row_number()" in sql and "FROM messages" in sql and "conversation_summaries" not in sql,
+    )
+
+
+async def run_dependency_checks():
+    try:
+        await get_super_admin_user(USER)
+        denied = None
+    except HTTPException as e:
+        denied = e.status_code
+    print_test("get_super_admin_user 拒绝普通用户", denied == 403, str(denied))
+    print_test("get_super_admin_user 放行超级管理员", await get_super_admin_user(ADMIN) is ADMIN)
+
+
+def main():
+    asyncio.run(run_endpoint_checks())
+    asyncio.run(run_dependency_checks())
+    print(f"\n通过 {results['passed']} 项，失败 {results['failed']} 项")
+    sys.exit(0 if results["failed"] == 0 else 1)
+
+
+if __name__ == "__main__":
+    main()
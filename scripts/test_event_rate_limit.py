@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Socket.io 事件限流测试
+校验 app.core.event_rate_limit 与 socketio.rate_limited：
+- 限流配置解析（无效项忽略、速率 0 不限流、未配置事件共用通配令牌桶）
+- 连接级令牌桶：突发容量用尽后拒绝，按速率补充
+- 用户级令牌桶：同一用户多个连接合计
+- 处理中上限（背压）与 release
+- 被拒绝的事件不执行处理函数，回调返回 rate_limited，rate_limited 帧每秒至多一次
+- Redis 失败时降级为本 worker 令牌桶，计数器正确
+
+不需要数据库与 Redis。
+
+用法：
+    python scripts/test_event_rate_limit.py
+"""
+
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from loguru import logger
+
+from app.core import socketio as sio_module
+from app.core.config import settings
+from app.core.connection_registry import ConnectionRecord
+from app.core.event_rate_limit import EventRateLimiter, event_rate_limiter, parse_limits
+
+results = {"passed": 0, "failed": 0}
+
+
+def print_test(name, status, details=""):
+    """打印测试结果"""
+    status_symbol = "[通过]" if status else "[失败]"
+    print(f"{status_symbol} {name}")
+    if details:
+        print(f"   详情: {details}")
+    results["passed" if status else "failed"] += 1
+
+
+def make_limiter(sid_spec, user_spec, max_inflight=0):
+    settings.SOCKETIO_RATE_LIMITS, settings.SOCKETIO_USER_RATE_LIMITS = sid_spec, user_spec
+    settings.SOCKETIO_MAX_INFLIGHT_PER_SID = max_inflight
+    return EventRateLimiter()
+
+
+async def take(limiter, sid, user_id, event, count):
+    """连续发起 count 次事件（立即 release），返回放行次数"""
+    allowed = 0
+    for _ in range(count):
+        decision = await limiter.acquire(sid, user_id, event)
+        if decision.allowed:
+            allowed += 1
+            limiter.release(sid)
+    return allowed
+
+
+async def run_limiter_checks():
+    limits = parse_limits("send_message=5/10, bad, get_online_friends=x/1, *=0/1")
+    print_test(
+        "限流配置解析：无效项忽略",
+        limits == {"send_message": (5.0, 10.0), "*": (0.0, 1.0)},
+        str(limits),
+    )
+
+    limiter = make_limiter("send_message=1/5,*=0/1", "")
+    allowed = await take(limiter, "sid-1", 1, "send_message", 8)
+    print_test("连接级：突发容量用尽后拒绝", allowed == 5, f"allowed={allowed}")
+    decision = await limiter.acquire("sid-1", 1, "send_message")
+    print_test(
+        "拒绝时给出原因与重试等待",
+        decision.rejected == "sid" and 0 < decision.retry_after <= 1.0,
+        f"reason={decision.rejected}, retry_after={decision.retry_after:.3f}",
+    )
+    print_test("其他连接不受影响", await take(limiter, "sid-2", 1, "send_message", 3) == 3)
+    print_test("通配令牌桶速率为 0 时不限流", await take(limiter, "sid-1", 1, "upload_chunk", 100) == 100)
+
+    limiter = make_limiter("send_message=1000/2", "")
+    await take(limiter, "sid-1", 1, "send_message", 2)
+    await asyncio.sleep(0.01)
+    print_test("令牌按速率补充", await take(limiter, "sid-1", 1, "send_message", 2) == 2)
+
+    limiter = make_limiter("*=0/1", "call_invitation=0.1/3,*=100/200")
+    allowed = sum([await take(limiter, f"sid-{i}", 7, "call_invitation", 2) for i in range(4)])
+    print_test("用户级：多个连接合计", allowed == 3, f"allowed={allowed}")
+    print_test("用户级：其他用户不受影响", await take(limiter, "sid-9", 8, "call_invitation", 1) == 1)
+    print_test(
+        "未单独配置的事件共用通配令牌桶",
+        await take(limiter, "sid-1", 7, "get_online_friends", 150) + await take(limiter, "sid-1", 7, "ack_delivered", 100) == 200,
+    )
+
+    limiter = make_limiter("*=0/1", "", max_inflight=2)
+    first = await limiter.acquire("sid-1", 1, "send_message")
+    second = await limiter.acquire("sid-1", 1, "send_message")
+    third = await limiter.acquire("sid-1", 1, "send_message")
+    print_test("处理中达到上限时拒绝（背压）", first.allowed and second.allowed and third.rejected == "inflight")
+    limiter.release("sid-1")
+    print_test("处理完毕后恢复", (await limiter.acquire("sid-1", 1, "send_message")).allowed)
+
+    stats = limiter.stats()
+    print_test(
+        "计数器按事件与原因统计拒绝",
+        stats["throttled"] == 1 and stats["throttled_by_scope"] == {"inflight": 1}
+        and stats["throttled_by_event"] == {"send_message": 1} and stats["inflight"] == 2,
+        str(stats),
+    )
+    limiter.forget_sid("sid-1")
+    print_test("断开连接后清理连接级状态", limiter.stats()["inflight"] == 0)
+
+    class FailingScript:
+        async def __call__(self, keys, args):
+            raise ConnectionError("redis down")
+
+    limiter = make_limiter("*=0/1", "send_message=0.1/2")
+    limiter._redis, limiter._take_script = object(), FailingScript()
+    allowed = await take(limiter, "sid-1", 1, "send_message", 4)
+    print_test(
+        "Redis 失败时降级为本 worker 令牌桶",
+        allowed == 2 and limiter.counters["redis_errors"] == 4,
+        f"allowed={allowed}, redis_errors={limiter.counters['redis_errors']}",
+    )
+
+
+async def run_handler_checks():
+    settings.SOCKETIO_RATE_LIMITS, settings.SOCKETIO_USER_RATE_LIMITS = "flood_event=0.001/3", ""
+    settings.SOCKETIO_MAX_INFLIGHT_PER_SID = 16
+    event_rate_limiter.reload()
+    calls, frames = [], []
+
+    async def flood_event(sid, data):
+        calls.append(data)
+        return {"success": True}
+
+    async def capture(event, data, room=None, **kwargs):
+        frames.append((event, data))
+
+    handler = sio_module.rate_limited(flood_event)
+    original_emit = sio_module.sio.emit
+    sio_module.sio.emit = capture
+    sio_module.connections.add("sid-flood", ConnectionRecord(5))
+    try:
+        start = time.perf_counter()
+        replies = [await handler("sid-flood", i) for i in range(1000)]
+        elapsed = time.perf_counter() - start
+    finally:
+        sio_module.sio.emit = original_emit
+        sio_module.connections.remove("sid-flood")
+        event_rate_limiter.forget_sid("sid-flood")
+
+    rejected = [reply for reply in replies if reply.get("error") == "rate_limited"]
+    print_test("被拒绝的事件不执行处理函数", len(calls) == 3 and len(rejected) == 997, f"handled={len(calls)}")
+    print_test(
+        "回调返回 rate_limited 与重试等待",
+        rejected[0]["event"] == "flood_event" and rejected[0]["reason"] == "sid" and rejected[0]["retry_after"] > 0,
+        str(rejected[0]),
+    )
+    print_test(
+        "rate_limited 帧同一事件每秒至多一次",
+        [event for event, _ in frames] == ["rate_limited"],
+        f"frames={len(frames)}",
+    )
+    print_test("拒绝路径开销低", elapsed / 1000 < 0.001, f"{elapsed / 1000 * 1e6:.1f}us/事件")
+    print_test("装饰后保留事件名（@sio.event 按函数名注册）", handler.__name__ == "flood_event")
+
+
+def main():
+    original = (
+        settings.SOCKETIO_RATE_LIMITS, settings.SOCKETIO_USER_RATE_LIMITS, settings.SOCKETIO_MAX_INFLIGHT_PER_SID
+    )
+    logger.disable("app.core.event_rate_limit")
+    try:
+        asyncio.run(run_limiter_checks())
+        asyncio.run(run_handler_checks())
+    finally:
+        (settings.SOCKETIO_RATE_LIMITS, settings.SOCKETIO_USER_RATE_LIMITS,
+         settings.SOCKETIO_MAX_INFLIGHT_PER_SID) = original
+    print(f"\n通过 {results['passed']} 项，失败 {results['failed']} 项")
+    sys.exit(0 if results["failed"] == 0 else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+媒体下载 Range / ETag / 条件请求测试
+直接以 ASGI 方式调用 /files/download 与 /files/photo 使用的响应构造函数，
+校验 206 分段内容、416、If-Range、If-None-Match / If-Modified-Since 返回 304 等行为。
+不需要启动服务，也不访问数据库。
+
+用法：
+    python scripts/test_media_range.py
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from starlette.requests import Request
+
+from app.api.v1.files import _media_file_response, MEDIA_CACHE_CONTROL
+
+ETAG = '"3f2a9c0e5b7d4e1f8a6c2b0d9e8f7a6b5c4d3e2f1a0b9c8d7e6f5a4b3c2d1e0f"'
+CREATED_AT = datetime(2026, 10, 1, 8, 30, 15, 123456)
+
+results = {"passed": 0, "failed": 0}
+
+
+def print_test(name, status, details=""):
+    """打印测试结果"""
+    status_symbol = "[通过]" if status else "[失败]"
+    print(f"{status_symbol} {name}")
+    if details:
+        print(f"   详情: {details}")
+    results["passed" if status else "failed"] += 1
+
+
+async def fetch(path: Path, headers: dict):
+    """构造请求并执行响应，返回 (状态码, 响应头, 响应体)"""
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": "/api/v1/files/download",
+        "query_string": b"",
+        "headers": [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers.items()],
+    }
+    request = Request(scope)
+    response = _media_file_response(
+        request, path, "video/mp4", etag=ETAG, last_modified=CREATED_AT, filename="clip.mp4"
+    )
+
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    await response(scope, receive, send)
+    start = messages[0]
+    response_headers = {k.decode("latin-1"): v.decode("latin-1") for k, v in start["headers"]}
+    body = b"".join(m.get("body", b"") for m in messages[1:])
+    return start["status"], response_headers, body
+
+
+async def run():
+    content = os.urandom(300_000)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "blob"
+        path.write_bytes(content)
+        size = len(content)
+        last_modified = format_datetime(CREATED_AT.replace(tzinfo=timezone.utc), usegmt=True)
+
+        status, headers, body = await fetch(path, {})
+        print_test("完整下载 200", status == 200 and body == content, f"status={status}")
+        print_test(
+            "响应头包含 ETag / Last-Modified / Cache-Control / Accept-Ranges",
+            headers.get("etag") == ETAG
+            and headers.get("last-modified") == last_modified
+            and headers.get("cache-control") == MEDIA_CACHE_CONTROL
+            and headers.get("accept-ranges") == "bytes",
+            str({k: headers.get(k) for k in ("etag", "last-modified", "cache-control", "accept-ranges")}),
+        )
+
+        status, headers, body = await fetch(path, {"Range": "bytes=0-99"})
+        print_test(
+            "Range 开头 100 字节",
+            status == 206 and body == content[:100]
+            and headers.get("content-range") == f"bytes 0-99/{size}"
+            and headers.get("content-length") == "100",
+            f"status={status}, content-range={headers.get('content-range')}",
+        )
+
+        status, headers, body = await fetch(path, {"Range": "bytes=150000-"})
+        print_test(
+            "Range 指定起点到结尾（拖动进度条）",
+            status == 206 and body == content[150000:]
+            and headers.get("content-range") == f"bytes 150000-{size - 1}/{size}",
+            f"status={status}, len={len(body)}",
+        )
+
+        status, headers, body = await fetch(path, {"Range": "bytes=-500"})
+        print_test(
+            "Range 末尾 500 字节",
+            status == 206 and body == content[-500:]
+            and headers.get("content-range") == f"bytes {size - 500}-{size - 1}/{size}",
+            f"status={status}, content-range={headers.get('content-range')}",
+        )
+
+        status, headers, body = await fetch(path, {"Range": f"bytes=1000-{size + 5000}"})
+        print_test(
+            "Range 结束位置超出文件大小时截断",
+            status == 206 and body == content[1000:],
+            f"status={status}, len={len(body)}",
+        )
+
+        status, headers, body = await fetch(path, {"Range": "bytes=0-9,200-209"})
+        print_test(
+            "多段 Range 返回各段内容",
+            status == 206 and content[:10] in body and content[200:210] in body,
+            f"status={status}, len={len(body)}",
+        )
+
+        status, headers, _ = await fetch(path, {"Range": f"bytes={size}-"})
+        print_test(
+            "起点超出文件大小返回 416",
+            status == 416 and headers.get("content-range") == f"*/{size}",
+            f"status={status}",
+        )
+
+        status, _, body = await fetch(path, {"Range": "bytes=0-99", "If-Range": ETAG})
+        print_test("If-Range 匹配 ETag 时返回 206", status == 206 and body == content[:100], f"status={status}")
+
+        status, _, body = await fetch(path, {"Range": "bytes=0-99", "If-Range": '"stale"'})
+        print_test("If-Range 不匹配时返回完整内容", status == 200 and body == content, f"status={status}")
+
+        status, headers, body = await fetch(path, {"If-None-Match": ETAG})
+        print_test(
+            "If-None-Match 命中返回 304",
+            status == 304 and body == b"" and headers.get("etag") == ETAG,
+            f"status={status}",
+        )
+
+        status, _, _ = await fetch(path, {"If-None-Match": f'"other", W/{ETAG}'})
+        print_test("If-None-Match 列表与弱比较命中返回 304", status == 304, f"status={status}")
+
+        status, _, body = await fetch(path, {"If-None-Match": '"other"'})
+        print_test("If-None-Match 不匹配返回 200", status == 200 and body == content, f"status={status}")
+
+        status, _, _ = await fetch(path, {"If-Modified-Since": last_modified})
+        print_test("If-Modified-Since 等于 Last-Modified 返回 304", status == 304, f"status={status}")
+
+        earlier = format_datetime(CREATED_AT.replace(tzinfo=timezone.utc) - timedelta(days=1), usegmt=True)
+        status, _, _ = await fetch(path, {"If-Modified-Since": earlier})
+        print_test("If-Modified-Since 早于 Last-Modified 返回 200", status == 200, f"status={status}")
+
+        status, _, _ = await fetch(path, {"If-None-Match": '"other"', "If-Modified-Since": last_modified})
+        print_test("同时携带时以 If-None-Match 为准", status == 200, f"status={status}")
+
+    print(f"\n通过 {results['passed']} 项，失败 {results['failed']} 项")
+    return results["failed"] == 0
+
+
+def main():
+    ok = asyncio.run(run())
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+消息历史查询索引回归测试
+对 GET /chat/messages 游标模式、GET /chat/messages/since 生成的 SQL 执行 EXPLAIN，
+确认点对点查询命中 ix_messages_sender_receiver_created、房间查询命中 ix_messages_room_created，
+且执行计划中不出现 OFFSET（Limit 节点无 offset）与对 messages 的全表扫描。
+
+用法：
+    python scripts/test_message_indexes.py                 # 需已执行 alembic upgrade head
+    python scripts/test_message_indexes.py --user-a 1 --user-b 2 --room 1
+
+说明：测试库数据量很小时规划器可能倾向顺序扫描，脚本会在当前事务内 SET enable_seqscan = off，
+仅用于验证索引“可被使用”；生产数据量下的实际计划请配合 bench_conversations.py --seed 观察。
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+from datetime import datetime
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from sqlalchemy import and_, select, text
+from sqlalchemy.dialects import postgresql
+
+from app.db.session import db
+from app.db.models import Message
+from app.api.v1.chat import _message_keyset_query, _pair_condition
+
+PAIR_INDEX = "ix_messages_sender_receiver_created"
+ROOM_INDEX = "ix_messages_room_created"
+
+
+def print_test(name, status, details=""):
+    """打印测试结果"""
+    status_symbol = "[通过]" if status else "[失败]"
+    print(f"{status_symbol} {name}")
+    if details:
+        print(f"   详情: {details}")
+
+
+def _walk(plan):
+    """深度优先遍历执行计划节点"""
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from _walk(child)
+
+
+async def explain(session, query):
+    """返回 EXPLAIN (FORMAT JSON) 的根节点"""
+    compiled = query.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True})
+    result = await session.execute(text(f"EXPLAIN (FORMAT JSON) {compiled}"))
+    raw = result.scalar()
+    data = json.loads(raw) if isinstance(raw, str) else raw
+    return data[0]["Plan"]
+
+
+def check_plan(name, plan, expected_index):
+    """检查计划是否使用指定索引且未对 messages 顺序扫描"""
+    nodes = list(_walk(plan))
+    indexes = {n.get("Index Name") for n in nodes if n.get("Index Name")}
+    seq_scans = [n for n in nodes if n.get("Node Type") == "Seq Scan" and n.get("Relation Name") == "messages"]
+    ok = expected_index in indexes and not seq_scans
+    print_test(name, ok, f"使用索引: {sorted(indexes) or '无'}")
+    return ok
+
+
+async def run(user_a: int, user_b: int, room_id: int):
+    await db.initialize()
+    passed = 0
+    failed = 0
+    try:
+        async with db.get_session() as session:
+            await session.execute(text("SET LOCAL enable_seqscan = off"))
+            now = datetime.utcnow()
+
+            cases = [
+                (
+                    "点对点 before_id 游标",
+                    _message_keyset_query([_pair_condition(user_a, user_b)], 1_000_000, now, False, 50),
+                    PAIR_INDEX,
+                ),
+                (
+                    "点对点 after_id 游标",
+                    _message_keyset_query([_pair_condition(user_a, user_b)], 1, now, True, 50),
+                    PAIR_INDEX,
+                ),
+                (
+                    "点对点增量同步 (since)",
+                    select(Message)
+                    .where(and_(Message.room_id.is_(None), _pair_condition(user_a, user_b), Message.id > 1))
+                    .order_by(Message.created_at.asc(), Message.id.asc())
+                    .limit(200),
+                    PAIR_INDEX,
+                ),
+                (
+                    "房间 before_id 游标",
+                    _message_keyset_query([Message.room_id == room_id], 1_000_000, now, False, 50),
+                    ROOM_INDEX,
+                ),
+                (
+                    "房间 after_id 游标",
+                    _message_keyset_query([Message.room_id == room_id], 1, now, True, 50),
+                    ROOM_INDEX,
+                ),
+            ]
+
+            for name, query, index_name in cases:
+                # selectinload 只影响结果加载，不影响主查询计划
+                plan = await explain(session, query)
+                if check_plan(name, plan, index_name):
+                    passed += 1
+                else:
+                    failed += 1
+
+            await session.rollback()
+    finally:
+        await db.close()
+
+    print(f"\n通过 {passed} 项，失败 {failed} 项")
+    return failed == 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="消息历史查询索引回归测试")
+    parser.add_argument("--user-a", type=int, default=1, help="点对点会话用户A")
+    parser.add_argument("--user-b", type=int, default=2, help="点对点会话用户B")
+    parser.add_argument("--room", type=int, default=1, help="房间ID")
+    args = parser.parse_args()
+    ok = asyncio.run(run(args.user_a, args.user_b, args.room))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
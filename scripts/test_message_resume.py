@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+会话序号与重连补发测试
+使用内存伪数据库会话校验：
+- assign_sequences：同一会话连续编号、多会话一条 upsert、会话键与迁移一致
+- record_messages：新摘要行的 last_message_seq / delivered_seq
+- advance_delivered：游标只前进、不超过最后序号
+- 重连补发：只推送 delivered_seq 之后的区间、按 RESUME_BATCH_SIZE 分批、超过 RESUME_MAX_MESSAGES 截断、
+  跳过已离开的房间、连接断开即停止
+
+不需要数据库与 Redis。
+
+用法：
+    python scripts/test_message_resume.py
+"""
+
+import asyncio
+import sys
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from sqlalchemy.dialects.postgresql import asyncpg
+
+from app.core import socketio as sio_module
+from app.core.config import settings
+from app.core.connection_registry import ConnectionRecord
+from app.core.conversation_sequence import advance_delivered, assign_sequences, conversation_key
+from app.core.conversation_summary import record_messages
+from app.core.room_membership import room_membership
+from app.db.models import ConversationSummary, Message
+
+results = {"passed": 0, "failed": 0}
+
+
+def print_test(name, status, details=""):
+    """打印测试结果"""
+    status_symbol = "[通过]" if status else "[失败]"
+    print(f"{status_symbol} {name}")
+    if details:
+        print(f"   详情: {details}")
+    results["passed" if status else "failed"] += 1
+
+
+def compile_pg(stmt):
+    return stmt.compile(dialect=asyncpg.dialect())
+
+
+class FakeResult:
+    def __init__(self, rows=None, scalars=None, rowcount=0):
+        self._rows = rows or []
+        self._scalars = scalars or []
+        self.rowcount = rowcount
+
+    def all(self):
+        return self._rows
+
+    def scalars(self):
+        return FakeResult(rows=self._scalars)
+
+
+class SequenceSession:
+    """模拟 conversation_sequences 计数器表，记录执行的语句"""
+
+    def __init__(self):
+        self.counters = {}
+        self.statements = []
+
+    async def execute(self, stmt):
+        compiled = compile_pg(stmt)
+        self.statements.append(str(compiled))
+        params = compiled.params
+        returned = []
+        index = 0
+        while f"conversation_key_m{index}" in params:
+            key = params[f"conversation_key_m{index}"]
+            self.counters[key] = self.counters.get(key, 0) + params[f"last_seq_m{index}"]
+            returned.append((key, self.counters[key]))
+            index += 1
+        return FakeResult(rows=returned)
+
+
+async def run_sequence_checks():
+    session = SequenceSession()
+    batch = [
+        Message(sender_id=1, receiver_id=2),
+        Message(sender_id=2, receiver_id=1),
+        Message(sender_id=3, room_id=9),
+        Message(sender_id=1, receiver_id=2),
+        Message(sender_id=4, room_id=9),
+    ]
+    await assign_sequences(session, batch)
+    print_test(
+        "同一会话按传入顺序连续编号",
+        [m.seq for m in batch] == [1, 2, 1, 3, 2],
+        f"seqs={[m.seq for m in batch]}",
+    )
+    print_test(
+        "批内多个会话合并为一条 upsert ... RETURNING",
+        len(session.statements) == 1 and "ON CONFLICT" in session.statements[0] and "RETURNING" in session.statements[0],
+    )
+    more = [Message(sender_id=2, receiver_id=1)]
+    await assign_sequences(session, more)
+    print_test("后续批次在计数器基础上继续编号", more[0].seq == 4, f"seq={more[0].seq}")
+    print_test(
+        "会话键：房间按房间ID，点对点按用户对（与方向无关）",
+        conversation_key(9, 3, None) == "room:9" and conversation_key(None, 5, 2) == conversation_key(None, 2, 5) == "direct:2:5",
+    )
+
+    now = datetime.utcnow()
+    for index, message in enumerate(batch, start=1):
+        message.id, message.created_at = index, now
+    captured = []
+
+    class CaptureSession:
+        async def execute(self, stmt):
+            captured.append(compile_pg(stmt).params)
+
+    await record_messages(CaptureSession(), batch)
+    direct = captured[0]
+    receiver_row = next(i for i in range(4) if direct.get(f"owner_id_m{i}") == 2)
+    print_test(
+        "新摘要行 last_message_seq 为会话最后序号，delivered_seq 为批内首条之前",
+        direct[f"last_message_seq_m{receiver_row}"] == 3 and direct[f"delivered_seq_m{receiver_row}"] == 0,
+        f"last={direct[f'last_message_seq_m{receiver_row}']}, delivered={direct[f'delivered_seq_m{receiver_row}']}",
+    )
+    room_params = list(captured[1].values())
+    print_test("房间摘要同样携带序号", 2 in room_params and 0 in room_params)
+
+    statements = []
+
+    class UpdateSession:
+        async def execute(self, stmt):
+            statements.append(str(compile_pg(stmt)))
+            return FakeResult(rowcount=1)
+
+    updated = await advance_delivered(UpdateSession(), 1, [(None, 2, 5), (None, 2, 3), (9, None, 7)])
+    print_test(
+        "同一会话多次确认只执行一次，游标只前进且不超过最后序号",
+        updated == 2 and len(statements) == 2
+        and all("delivered_seq <" in sql and "least(" in sql for sql in statements),
+        f"updated={updated}",
+    )
+
+
+class ResumeDatabase:
+    """模拟补发所需的查询：未送达会话、所在房间、按序号区间的消息"""
+
+    def __init__(self, summaries, messages, rooms):
+        self.summaries = summaries
+        self.messages = messages
+        self.rooms = rooms
+        self.message_queries = 0
+
+    @asynccontextmanager
+    async def unit_of_work(self, read_only=False):
+        yield self
+
+    async def execute(self, stmt):
+        entity = stmt.column_descriptions[0].get("entity")
+        params = compile_pg(stmt).params
+        if entity is ConversationSummary:
+            pending = [s for s in self.summaries if s.last_message_seq > s.delivered_seq]
+            pending.sort(key=lambda s: s.last_message_at, reverse=True)
+            return FakeResult(scalars=pending[:params["param_1"]])
+        if entity is Message:
+            self.message_queries += 1
+            room_id = params.get("room_id_1")
+            after, upto, limit = params["seq_1"], params["seq_2"], params["param_1"]
+            if room_id is not None:
+                rows = [m for m in self.messages if m.room_id == room_id]
+            else:
+                pair = {params["sender_id_1"], params["receiver_id_1"]}
+                rows = [m for m in self.messages if m.room_id is None and {m.sender_id, m.receiver_id} == pair]
+            rows = sorted((m for m in rows if after < m.seq <= upto), key=lambda m: m.seq)
+            return FakeResult(scalars=rows[:limit])
+        return FakeResult(scalars=sorted(self.rooms))
+
+
+def build_resume_fixture(user_id):
+    now = datetime.utcnow()
+    messages = []
+    for seq in range(1, 251):
+        messages.append(Message(id=seq, seq=seq, sender_id=2, receiver_id=user_id, message=f"d{seq}",
+                                message_type="text", is_read=False, created_at=now))
+    for seq in range(1, 31):
+        messages.append(Message(id=1000 + seq, seq=seq, sender_id=3, room_id=9, message=f"r{seq}",
+                                message_type="text", is_read=False, created_at=now))
+        messages.append(Message(id=2000 + seq, seq=seq, sender_id=3, room_id=10, message=f"x{seq}",
+                                message_type="text", is_read=False, created_at=now))
+    summaries = [
+        ConversationSummary(owner_id=user_id, peer_id=2, room_id=None, last_message_seq=250, delivered_seq=40,
+                            last_message_at=now),
+        ConversationSummary(owner_id=user_id, peer_id=None, room_id=9, last_message_seq=30, delivered_seq=25,
+                            last_message_at=now - timedelta(minutes=1)),
+        # 已离开的房间
+        ConversationSummary(owner_id=user_id, peer_id=None, room_id=10, last_message_seq=30, delivered_seq=0,
+                            last_message_at=now - timedelta(minutes=2)),
+        # 已全部送达
+        ConversationSummary(owner_id=user_id, peer_id=5, room_id=None, last_message_seq=8, delivered_seq=8,
+                            last_message_at=now - timedelta(minutes=3)),
+    ]
+    return ResumeDatabase(summaries, messages, rooms={9})
+
+
+async def run_resume(database, user_id, sid, disconnect_after=None):
+    frames = []
+
+    async def capture(event, data, room=None, **kwargs):
+        frames.append((event, data))
+        if disconnect_after is not None and len(frames) >= disconnect_after:
+            sio_module.connections.remove(sid)
+
+    original_uow, original_emit = sio_module.unit_of_work, sio_module.sio.emit
+    sio_module.unit_of_work, sio_module.sio.emit = database.unit_of_work, capture
+    room_membership.invalidate_user(user_id)
+    sio_module.connections.add(sid, ConnectionRecord(user_id))
+    try:
+        await sio_module._resume_delivery(sid, user_id)
+    finally:
+        sio_module.unit_of_work, sio_module.sio.emit = original_uow, original_emit
+        sio_module.connections.remove(sid)
+    return frames
+
+
+async def run_resume_checks():
+    original = (settings.RESUME_BATCH_SIZE, settings.RESUME_MAX_MESSAGES)
+    settings.RESUME_BATCH_SIZE, settings.RESUME_MAX_MESSAGES = 100, 2000
+    try:
+        frames = await run_resume(build_resume_fixture(1), 1, "sid-resume-1")
+        backlog = [data for event, data in frames if event == "message_backlog"]
+        direct_seqs = [m["seq"] for data in backlog if data["peer_id"] == 2 for m in data["messages"]]
+        room_seqs = [m["seq"] for data in backlog if data["room_id"] == 9 for m in data["messages"]]
+        print_test(
+            "只补发 delivered_seq 之后的区间且按序号升序",
+            direct_seqs == list(range(41, 251)) and room_seqs == list(range(26, 31)),
+            f"direct={len(direct_seqs)}, room={len(room_seqs)}",
+        )
+        sizes = [len(data["messages"]) for data in backlog]
+        print_test("每批不超过 RESUME_BATCH_SIZE", max(sizes) <= 100 and sizes[:3] == [100, 100, 10], f"sizes={sizes}")
+        print_test("跳过已离开的房间与已送达的会话", all(data["room_id"] != 10 and data["peer_id"] != 5 for data in backlog))
+        complete = frames[-1]
+        print_test(
+            "结束时发送 backlog_complete（未截断）",
+            complete[0] == "backlog_complete" and complete[1]["messages"] == 215 and not complete[1]["truncated"],
+            str(complete[1]),
+        )
+
+        settings.RESUME_MAX_MESSAGES = 150
+        frames = await run_resume(build_resume_fixture(1), 1, "sid-resume-2")
+        sent = sum(len(data["messages"]) for event, data in frames if event == "message_backlog")
+        print_test(
+            "超过 RESUME_MAX_MESSAGES 时截断并提示改用 HTTP",
+            sent == 150 and frames[-1][1]["truncated"],
+            f"sent={sent}",
+        )
+
+        settings.RESUME_MAX_MESSAGES = 2000
+        database = build_resume_fixture(1)
+        frames = await run_resume(database, 1, "sid-resume-3", disconnect_after=1)
+        print_test(
+            "连接断开后停止补发",
+            len(frames) == 1 and database.message_queries == 1,
+            f"frames={len(frames)}, queries={database.message_queries}",
+        )
+    finally:
+        settings.RESUME_BATCH_SIZE, settings.RESUME_MAX_MESSAGES = original
+
+
+def main():
+    asyncio.run(run_sequence_checks())
+    asyncio.run(run_resume_checks())
+    print(f"\n通过 {results['passed']} 项，失败 {results['failed']} 项")
+    sys.exit(0 if results["failed"] == 0 else 1)
+
+
+if __name__ == "__main__":
+    main()
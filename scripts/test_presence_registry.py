@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+在线状态注册表测试
+校验 app.core.presence：
+- 单 worker：关闭时本地连接的用户全部触发离线回调
+- Redis：关闭时只对在集群内完全离线的用户触发离线回调，仍在其他 worker 在线的用户不触发
+- 被其他 worker 当作宕机清理后，下次心跳重新登记本地连接，并对被判定离线的用户触发上线回调
+- 在线状态推送关闭时立即推送宽限期中的下线
+
+不需要 Redis（以进程内的假 Redis 代替，Lua 脚本按 presence 模块中的语义实现）。
+
+用法：
+    python scripts/test_presence_registry.py
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from loguru import logger
+
+from app.core import presence as presence_module
+from app.core.presence import PresenceRegistry
+from app.core.presence_fanout import PresenceFanout
+
+results = {"passed": 0, "failed": 0}
+
+
+def print_test(name, status, details=""):
+    """打印测试结果"""
+    status_symbol = "[通过]" if status else "[失败]"
+    print(f"{status_symbol} {name}")
+    if details:
+        print(f"   详情: {details}")
+    results["passed" if status else "failed"] += 1
+
+
+class FakeRedis:
+    """presence 模块用到的 Redis 命令（多个注册表共享同一实例即模拟多个 worker）"""
+
+    def __init__(self):
+        self.hashes = {}
+        self.sets = {}
+        self.zsets = {}
+        self.strings = {}
+
+    def register_script(self, script):
+        if script == presence_module._ADD_SID_SCRIPT:
+            return self._add_sid
+        return self._remove_sid
+
+    async def _add_sid(self, keys, args):
+        sid, user_id, worker_id = args
+        self.hashes.setdefault(keys[0], {})[sid] = worker_id
+        self.sets.setdefault(keys[1], set()).add(f"{user_id}:{sid}")
+        self.sets.setdefault(keys[2], set()).add(str(user_id))
+        return len(self.hashes[keys[0]])
+
+    async def _remove_sid(self, keys, args):
+        sid, user_id = args
+        self.hashes.setdefault(keys[0], {}).pop(sid, None)
+        self.sets.setdefault(keys[1], set()).discard(f"{user_id}:{sid}")
+        remaining = len(self.hashes[keys[0]])
+        if remaining == 0:
+            self.sets.setdefault(keys[2], set()).discard(str(user_id))
+        return remaining
+
+    async def zadd(self, key, mapping):
+        zset = self.zsets.setdefault(key, {})
+        added = sum(1 for member in mapping if member not in zset)
+        zset.update(mapping)
+        return added
+
+    async def zrem(self, key, member):
+        self.zsets.get(key, {}).pop(member, None)
+
+    async def zrangebyscore(self, key, low, high):
+        return [member for member, score in self.zsets.get(key, {}).items() if score <= high]
+
+    async def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.strings:
+            return None
+        self.strings[key] = value
+        return True
+
+    async def smembers(self, key):
+        return set(self.sets.get(key, ()))
+
+    async def smismember(self, key, members):
+        return [str(member) in self.sets.get(key, ()) for member in members]
+
+    async def delete(self, key):
+        self.sets.pop(key, None)
+
+    async def close(self):
+        pass
+
+
+def make_registry(redis=None) -> PresenceRegistry:
+    registry = PresenceRegistry()
+    if redis is not None:
+        registry._redis = redis
+        registry._add_script = redis.register_script(presence_module._ADD_SID_SCRIPT)
+        registry._remove_script = redis.register_script(presence_module._REMOVE_SID_SCRIPT)
+    return registry
+
+
+def recorder(events, kind):
+    async def callback(user_id):
+        events.append((kind, user_id))
+    return callback
+
+
+async def run_shutdown_checks():
+    events = []
+    registry = make_registry()
+    registry.on_user_offline = recorder(events, "offline")
+    await registry.add(1, "a")
+    await registry.add(1, "b")
+    await registry.add(2, "c")
+    await registry.stop()
+    print_test(
+        "单 worker 关闭时本地用户全部触发离线回调",
+        sorted(events) == [("offline", 1), ("offline", 2)] and not registry._local,
+        str(events),
+    )
+
+    redis = FakeRedis()
+    events = []
+    worker_a, worker_b = make_registry(redis), make_registry(redis)
+    worker_a.on_user_offline = recorder(events, "offline")
+    await worker_a.add(1, "a1")
+    await worker_a.add(2, "a2")
+    await worker_b.add(2, "b2")
+    await worker_a.release()
+    await worker_a.stop()
+    print_test(
+        "Redis 关闭时只对完全离线的用户触发离线回调",
+        events == [("offline", 1)] and await worker_b.filter_online([1, 2]) == [2],
+        str(events),
+    )
+
+
+async def run_reregister_checks():
+    redis = FakeRedis()
+    events = []
+    stalled, survivor = make_registry(redis), make_registry(redis)
+    stalled.on_user_online = recorder(events, "online")
+    await redis.zadd(presence_module._WORKERS_KEY, {stalled.worker_id: 0, survivor.worker_id: 0})
+    await stalled.add(1, "s1")
+    await stalled.add(2, "s2")
+    await survivor.add(2, "v2")
+
+    # 存活 worker 把心跳超时的 worker 当作宕机清理
+    await survivor._reap_dead_worker(stalled.worker_id)
+    reaped = await survivor.filter_online([1, 2])
+
+    # 阻塞的 worker 恢复后的下一次心跳
+    if await redis.zadd(presence_module._WORKERS_KEY, {stalled.worker_id: 1}):
+        await stalled._reregister_local()
+    restored = await survivor.filter_online([1, 2])
+    print_test(
+        "被误清理后重新登记本地连接",
+        reaped == [2] and restored == [1, 2]
+        and redis.sets[presence_module._worker_key(stalled.worker_id)] == {"1:s1", "2:s2"},
+        f"清理后 {reaped}，重新登记后 {restored}",
+    )
+    print_test("只对清理期间被判定离线的用户触发上线回调", events == [("online", 1)], str(events))
+
+
+async def run_fanout_checks():
+    frames = []
+
+    async def load_subscribers(user_ids):
+        return {uid: {100} for uid in user_ids}
+
+    async def filter_online(user_ids):
+        return [uid for uid in user_ids if uid == 100]
+
+    async def send_frame(subscriber_id, frame):
+        frames.append((subscriber_id, frame["offline"]))
+
+    fanout = PresenceFanout(load_subscribers=load_subscribers, filter_online=filter_online)
+    fanout.send_frame = send_frame
+    fanout.mark_offline(1)
+    fanout.mark_offline(2, immediate=True)
+    await fanout.stop()
+    print_test("推送关闭时立即推送宽限期中的下线", frames == [(100, [1, 2])], str(frames))
+
+
+def main():
+    logger.disable("app.core.presence")
+    logger.disable("app.core.presence_fanout")
+    asyncio.run(run_shutdown_checks())
+    asyncio.run(run_reregister_checks())
+    asyncio.run(run_fanout_checks())
+    print(f"\n通过 {results['passed']} 项，失败 {results['failed']} 项")
+    sys.exit(0 if results["failed"] == 0 else 1)
+
+
+if __name__ == "__main__":
+    main()
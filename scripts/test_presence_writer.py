@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+在线状态写回测试
+校验 app.core.presence_writer 的批量写回：
+- 同一用户多次上下线只写回最后一次
+- 多个 worker 写回顺序颠倒时（A 的离线晚于 B 的上线写回），库中较新的状态不被覆盖
+- 在线用户数增量只按实际更新的行计算
+
+不需要数据库（以按 SQL 语义更新内存中 users 行的假会话代替）。
+
+用法：
+    python scripts/test_presence_writer.py
+"""
+
+import asyncio
+import sys
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from loguru import logger
+from sqlalchemy.dialects.postgresql import asyncpg
+
+import app.db.session as session_module
+from app.core.presence_writer import PresenceWriter
+from app.core.stats_rollup import stats_rollup
+
+results = {"passed": 0, "failed": 0}
+
+
+def print_test(name, status, details=""):
+    """打印测试结果"""
+    status_symbol = "[通过]" if status else "[失败]"
+    print(f"{status_symbol} {name}")
+    if details:
+        print(f"   详情: {details}")
+    results["passed" if status else "failed"] += 1
+
+
+class FakeResult:
+    def __init__(self, rows):
+        self._rows = rows
+
+    def all(self):
+        return self._rows
+
+
+class UsersTable:
+    """内存中的 users 行：{user_id: [is_online, last_active_at]}，按写回语句的 WHERE 条件更新"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.statements = []
+
+    async def execute(self, stmt):
+        compiled = stmt.compile(dialect=asyncpg.dialect())
+        sql = str(compiled)
+        self.statements.append(sql)
+        guarded = "changes.last_active_at >= users.last_active_at" in sql
+        params = [value for key, value in compiled.params.items() if key.startswith("param_")]
+        returned = []
+        for start in range(0, len(params), 3):
+            user_id, is_online, changed_at = params[start:start + 3]
+            if user_id not in self.rows:
+                continue
+            was_online, last_active_at = self.rows[user_id]
+            if guarded and last_active_at is not None and changed_at < last_active_at:
+                continue
+            self.rows[user_id] = [is_online, changed_at]
+            returned.append((is_online, was_online))
+        return FakeResult(returned)
+
+    @asynccontextmanager
+    async def unit_of_work(self, read_only=False):
+        yield self
+
+
+async def run_flush_checks():
+    base = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(hours=1)
+    table = UsersTable({1: [False, None], 2: [True, base], 3: [False, base]})
+    session_module.unit_of_work = table.unit_of_work
+    deltas = []
+    stats_rollup.add = lambda name, delta=1, scope=0: deltas.append(delta)
+
+    writer = PresenceWriter()
+    writer.enqueue(1, True)
+    writer.enqueue(1, False)
+    writer.enqueue(1, True)
+    written = await writer.flush()
+    print_test(
+        "同一用户多次上下线只写回最后一次",
+        written == 1 and table.rows[1][0] is True and writer.counters["collapsed"] == 2 and deltas == [1],
+        f"{table.rows[1]} 增量 {deltas}",
+    )
+
+    # 用户 2 在 worker A 断开、在 worker B 重连：B 的上线已写回，A 的离线较晚写回
+    worker_a, worker_b = PresenceWriter(), PresenceWriter()
+    worker_a.enqueue(2, False)
+    worker_b.enqueue(2, True)
+    worker_b.enqueue(3, True)
+    await worker_b.flush()
+    restored = list(table.rows[2])
+    deltas.clear()
+    await worker_a.flush()
+    print_test(
+        "较早的离线晚于较新的上线写回时不覆盖上线状态",
+        restored[1] > base and table.rows[2] == restored and worker_a.counters["stale_skipped"] == 1
+        and worker_a.counters["rows_written"] == 0,
+        str(table.rows[2]),
+    )
+    print_test("跳过的行不计入在线用户数增量", deltas == [0], str(deltas))
+
+    # 之后的真实离线正常写回
+    deltas.clear()
+    worker_b.enqueue(3, False)
+    await worker_b.flush()
+    print_test("较新的离线正常写回并减少在线用户数", table.rows[3][0] is False and deltas == [-1], str(deltas))
+
+
+def main():
+    logger.disable("app.core.presence_writer")
+    original_uow, original_add = session_module.unit_of_work, stats_rollup.add
+    try:
+        asyncio.run(run_flush_checks())
+    finally:
+        session_module.unit_of_work, stats_rollup.add = original_uow, original_add
+    print(f"\n通过 {results['passed']} 项，失败 {results['failed']} 项")
+    sys.exit(0 if results["failed"] == 0 else 1)
+
+
+if __name__ == "__main__":
+    main()
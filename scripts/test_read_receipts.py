@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+已读回执合并测试
+使用内存伪数据库校验 mark_message_read（Socket.io）与 PUT /chat/messages/mark-read：
+- 一条 UPDATE ... RETURNING（CTE）按发送者分组，会话未读数按分组扣减
+- 每个发送者一帧 messages_read（携带消息ID列表）；弃用期内同时逐条推送旧的 message_read，关闭后不再推送
+- 水位模式 {peer_id, up_to_id}：只标记对方发给自己的消息，帧中只有 up_to_id
+- 已读过的消息不重复计数、不推送；普通用户不能标记别人的消息
+- 房间消息：每个成员按自己的已读水位扣减房间未读数，与共用的 is_read 是否已被其他成员标记无关
+
+不需要数据库与 Redis。
+
+用法：
+    python scripts/test_read_receipts.py
+"""
+
+import asyncio
+import sys
+from contextlib import asynccontextmanager
+from datetime import datetime
+from pathlib import Path
+from types import SimpleNamespace
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from sqlalchemy.dialects.postgresql import asyncpg
+
+from app.api.v1.chat import MarkReadRequest, mark_messages_read
+from app.core import socketio as sio_module
+from app.core.config import settings
+from app.core.connection_registry import ConnectionRecord
+from app.core.user_cache import AuthUser
+
+results = {"passed": 0, "failed": 0}
+
+READER_ID = 1
+
+
+def print_test(name, status, details=""):
+    """打印测试结果"""
+    status_symbol = "[通过]" if status else "[失败]"
+    print(f"{status_symbol} {name}")
+    if details:
+        print(f"   详情: {details}")
+    results["passed" if status else "failed"] += 1
+
+
+class FakeResult:
+    def __init__(self, rows):
+        self._rows = rows
+
+    def all(self):
+        return self._rows
+
+    def one_or_none(self):
+        return self._rows[0] if self._rows else None
+
+
+class ReadDatabase:
+    """模拟 messages 表的已读更新（按 CTE 参数过滤并分组）与会话摘要扣减"""
+
+    def __init__(self, messages, room_summaries=None):
+        self.messages = {m.id: m for m in messages}
+        self.read_statements = 0
+        self.summary_decrements = []
+        # {(成员ID, 房间ID): [read_seq, unread_count]}
+        self.room_summaries = room_summaries or {}
+
+    @asynccontextmanager
+    async def unit_of_work(self, read_only=False):
+        yield self
+
+    def add(self, obj):
+        pass
+
+    async def commit(self):
+        pass
+
+    async def execute(self, stmt):
+        compiled = stmt.compile(dialect=asyncpg.dialect())
+        sql, params = str(compiled), compiled.params
+        if "UPDATE conversation_summaries" in sql and "room_reads" in sql:
+            self.advance_room_reads(params["owner_id_1"], params["id_1"])
+            return FakeResult([])
+        if "UPDATE conversation_summaries" in sql:
+            self.summary_decrements.append((params["owner_id_1"], params.get("peer_id_1"), params["unread_count_1"]))
+            return FakeResult([])
+        self.read_statements += 1
+        if "messages.id IN" in sql:
+            matched = [self.messages[i] for i in params["id_1"] if i in self.messages]
+            if "receiver_id_1" in params:
+                matched = [m for m in matched if m.receiver_id == params["receiver_id_1"]]
+        else:
+            matched = [
+                m for m in self.messages.values()
+                if m.sender_id == params["sender_id_1"] and m.receiver_id == params["receiver_id_1"]
+                and m.room_id is None and m.id <= params["id_1"]
+            ]
+        groups = {}
+        for message in sorted(matched, key=lambda m: m.id):
+            if message.is_read:
+                continue
+            message.is_read, message.read_at = True, params["param_2"]
+            groups.setdefault((message.sender_id, message.receiver_id, message.room_id), []).append(message.id)
+        rows = [
+            SimpleNamespace(sender_id=sender_id, receiver_id=receiver_id, room_id=room_id,
+                            max_id=max(ids), count=len(ids), message_ids=ids)
+            for (sender_id, receiver_id, room_id), ids in sorted(groups.items())
+        ]
+        return FakeResult(rows)
+
+    def advance_room_reads(self, reader_id, message_ids):
+        """按 advance_room_reads 的语义推进成员水位：扣减原水位与新水位之间非自己发送的消息数"""
+        up_to = {}
+        for message_id in message_ids:
+            message = self.messages.get(message_id)
+            if message is not None and message.room_id:
+                up_to[message.room_id] = max(up_to.get(message.room_id, 0), message.seq)
+        for room_id, up_to_seq in up_to.items():
+            summary = self.room_summaries.get((reader_id, room_id))
+            if summary is None or summary[0] >= up_to_seq:
+                continue
+            newly_read = sum(
+                1 for m in self.messages.values()
+                if m.room_id == room_id and summary[0] < m.seq <= up_to_seq and m.sender_id != reader_id
+            )
+            summary[:] = [up_to_seq, max(summary[1] - newly_read, 0)]
+
+
+def build_backlog():
+    """3 个发送者各 100 条未读 + 别人的消息 + 已读消息"""
+    messages, next_id = [], 1
+    for index in range(300):
+        messages.append(SimpleNamespace(id=next_id, sender_id=2 + index % 3, receiver_id=READER_ID,
+                                        room_id=None, is_read=False, read_at=None))
+        next_id += 1
+    messages.append(SimpleNamespace(id=next_id, sender_id=2, receiver_id=9, room_id=None, is_read=False, read_at=None))
+    messages.append(SimpleNamespace(id=next_id + 1, sender_id=2, receiver_id=READER_ID, room_id=None,
+                                    is_read=True, read_at=datetime.utcnow()))
+    return messages
+
+
+async def call_socket(database, data, user_id=READER_ID):
+    frames = []
+
+    async def capture(event, payload, room=None, **kwargs):
+        frames.append((event, payload, room))
+
+    original_uow, original_emit = sio_module.unit_of_work, sio_module.sio.emit
+    sio_module.unit_of_work, sio_module.sio.emit = database.unit_of_work, capture
+    sio_module.connections.add("sid-reader", ConnectionRecord(user_id))
+    try:
+        await sio_module.mark_message_read("sid-reader", data)
+    finally:
+        sio_module.unit_of_work, sio_module.sio.emit = original_uow, original_emit
+        sio_module.connections.remove("sid-reader")
+        sio_module.event_rate_limiter.forget_sid("sid-reader")
+    return frames
+
+
+async def run_socket_checks():
+    database = ReadDatabase(build_backlog())
+    frames = await call_socket(database, {"message_ids": list(range(1, 303))})
+    receipts = [(room, payload) for event, payload, room in frames if event == "messages_read"]
+    print_test(
+        "300 条积压只推送 3 帧 messages_read（每个发送者一帧）",
+        len(receipts) == 3 and sorted(room for room, _ in receipts) == ["user_2", "user_3", "user_4"],
+        f"messages_read={[room for room, _ in receipts]}",
+    )
+    print_test(
+        "回执帧携带该发送者的消息ID列表与条数",
+        all(len(p["message_ids"]) == p["count"] == 100 and p["read_by"] == READER_ID for _, p in receipts)
+        and receipts[0][1]["message_ids"][:3] == [1, 4, 7],
+    )
+    legacy = [(room, payload) for event, payload, room in frames if event == "message_read"]
+    print_test(
+        "弃用期内同时逐条推送旧的 message_read（点对点消息）",
+        len(legacy) == 300 and legacy[0] == ("user_2", {"message_id": 1, "read_by": READER_ID,
+                                                       "read_at": legacy[0][1]["read_at"]}),
+        f"{len(legacy)} 帧",
+    )
+    print_test("标记已读只执行一条 UPDATE ... RETURNING", database.read_statements == 1)
+    print_test(
+        "会话未读数按发送者分组扣减",
+        sorted(database.summary_decrements) == [(READER_ID, 2, 100), (READER_ID, 3, 100), (READER_ID, 4, 100)],
+        str(database.summary_decrements),
+    )
+    confirmed = [payload for event, payload, _ in frames if event == "message_read_confirmed"]
+    print_test("操作者收到 message_read_confirmed", confirmed and confirmed[0]["updated_count"] == 300)
+    print_test("不标记别人的消息与已读消息", not database.messages[301].is_read and database.messages[302].read_at != database.messages[1].read_at)
+
+    frames = await call_socket(database, {"message_ids": [1, 2, 3]})
+    print_test("重复标记不计数、不推送回执", not [f for f in frames if f[0] == "messages_read"])
+
+    database = ReadDatabase(build_backlog())
+    frames = await call_socket(database, {"peer_id": 3, "up_to_id": 150})
+    receipts = [payload for event, payload, _ in frames if event == "messages_read"]
+    read_ids = sorted(m.id for m in database.messages.values() if m.is_read and m.sender_id == 3 and m.receiver_id == READER_ID)
+    print_test(
+        "水位模式：只标记对方发给自己、ID 不大于 up_to_id 的消息",
+        read_ids == list(range(2, 151, 3)) and not database.messages[151].is_read,
+        f"count={len(read_ids)}",
+    )
+    print_test(
+        "水位模式回执帧只携带 up_to_id，不含逐条消息ID",
+        len(receipts) == 1 and receipts[0]["up_to_id"] == 150 and "message_ids" not in receipts[0]
+        and receipts[0]["count"] == 50,
+        str(receipts),
+    )
+    print_test(
+        "水位模式弃用期内也逐条推送旧的 message_read",
+        [payload["message_id"] for event, payload, _ in frames if event == "message_read"] == read_ids,
+    )
+
+    settings.SOCKETIO_LEGACY_READ_RECEIPTS = False
+    try:
+        frames = await call_socket(ReadDatabase(build_backlog()), {"message_ids": list(range(1, 31))})
+    finally:
+        settings.SOCKETIO_LEGACY_READ_RECEIPTS = True
+    print_test(
+        "关闭 SOCKETIO_LEGACY_READ_RECEIPTS 后不再推送 message_read",
+        not any(event == "message_read" for event, _, _ in frames)
+        and len([f for f in frames if f[0] == "messages_read"]) == 3,
+    )
+
+
+async def run_room_checks():
+    # 房间 7：用户 2 发送 5 条，成员 1 与 5 各有 5 条未读
+    messages = [
+        SimpleNamespace(id=500 + seq, sender_id=2, receiver_id=None, room_id=7, seq=seq, is_read=False, read_at=None)
+        for seq in range(1, 6)
+    ]
+    database = ReadDatabase(messages, {(READER_ID, 7): [0, 5], (5, 7): [0, 5]})
+    await call_socket(database, {"message_ids": [501, 503]})
+    first = list(database.room_summaries[(READER_ID, 7)])
+    # 共用的 is_read 已被其他成员（如超级管理员）标记
+    for message in messages:
+        message.is_read = True
+    await call_socket(database, {"message_ids": [502, 503]}, user_id=5)
+    second = list(database.room_summaries[(5, 7)])
+    await call_socket(database, {"message_ids": [502]})
+    print_test(
+        "房间：每个成员按自己的已读水位扣减未读数，与共用的 is_read 无关",
+        first == [3, 2] and second == [3, 2] and database.room_summaries[(READER_ID, 7)] == [3, 2],
+        str(database.room_summaries),
+    )
+    await call_socket(database, {"message_ids": [505]}, user_id=5)
+    print_test("水位推进到最后一条后未读数为 0", database.room_summaries[(5, 7)] == [5, 0])
+
+
+async def run_rest_checks():
+    database = ReadDatabase(build_backlog())
+    user = AuthUser(id=READER_ID, username="reader", nickname="读者", role="user", is_admin=False,
+                    is_disabled=False, language="zh_CN")
+    frames = []
+
+    async def capture(event, payload, room=None, **kwargs):
+        frames.append((event, payload, room))
+
+    original_emit = sio_module.sio.emit
+    sio_module.sio.emit = capture
+    try:
+        response = await mark_messages_read(
+            MarkReadRequest(message_ids=list(range(1, 31)) + [301]), SimpleNamespace(client=None, headers={}),
+            current_user=user, db=database,
+        )
+        watermark = await mark_messages_read(
+            MarkReadRequest(peer_id=2, up_to_id=300), SimpleNamespace(client=None, headers={}),
+            current_user=user, db=database,
+        )
+    finally:
+        sio_module.sio.emit = original_emit
+    print_test(
+        "REST 标记已读：一条 UPDATE，按发送者推送回执",
+        response["updated_count"] == 30 and database.read_statements == 2
+        and [room for event, _, room in frames if event == "messages_read"][:3] == ["user_2", "user_3", "user_4"],
+        str(response),
+    )
+    print_test(
+        "REST 水位模式",
+        watermark["updated_count"] == 90
+        and [payload for event, payload, _ in frames if event == "messages_read"][-1].get("up_to_id") == 300,
+        str(watermark),
+    )
+
+
+def main():
+    asyncio.run(run_socket_checks())
+    asyncio.run(run_room_checks())
+    asyncio.run(run_rest_checks())
+    print(f"\n通过 {results['passed']} 项，失败 {results['failed']} 项")
+    sys.exit(0 if results["failed"] == 0 else 1)
+
+
+if __name__ == "__main__":
+    main()
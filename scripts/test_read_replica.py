@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+只读副本路由测试
+校验 app.db.read_replica：
+- 未启用副本时读请求使用主库
+- 副本可用且延迟未超限时使用副本；延迟超限、检查失败或检查停滞时回退到主库
+- 读己之写：用户写入后窗口内其读请求使用主库，其他用户不受影响，窗口过后恢复使用副本
+- 会话事件只把非操作日志的写入视为写入，提交后按请求令牌登记用户，回滚后不登记
+- get_read_db 连接副本失败时标记副本不可用
+
+不需要数据库与 Redis。
+
+用法：
+    python scripts/test_read_replica.py
+"""
+
+import asyncio
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from loguru import logger
+from starlette.requests import Request
+
+from app.core.config import settings
+from app.core.security import create_access_token
+from app.db import read_replica
+from app.db.models import Message, OperationLog
+from app.db.read_replica import ReadReplicaRouter, bearer_user_id, get_read_db
+from app.db.session import AsyncSessionLocal
+
+results = {"passed": 0, "failed": 0}
+
+
+def print_test(name, status, details=""):
+    """打印测试结果"""
+    status_symbol = "[通过]" if status else "[失败]"
+    print(f"{status_symbol} {name}")
+    if details:
+        print(f"   详情: {details}")
+    results["passed" if status else "failed"] += 1
+
+
+def make_request(user_id=None) -> Request:
+    headers = []
+    if user_id is not None:
+        token = create_access_token({"sub": str(user_id)})
+        headers.append((b"authorization", f"Bearer {token}".encode()))
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+
+
+class FakeSession:
+    """记录回滚/关闭调用的副本会话"""
+
+    def __init__(self):
+        self.calls = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def rollback(self):
+        self.calls.append("rollback")
+
+    async def close(self):
+        self.calls.append("close")
+
+
+def healthy_router(lag=0.5) -> ReadReplicaRouter:
+    """模拟已启用、最近一次检查成功的副本"""
+    router = ReadReplicaRouter()
+    router.session_factory = FakeSession
+    router.available = True
+    router.lag = lag
+    router.last_checked = time.monotonic()
+    return router
+
+
+async def run_routing_checks():
+    print_test(
+        "从 Bearer 令牌取用户ID，无令牌或令牌无效时为 None",
+        bearer_user_id(make_request(42)) == 42 and bearer_user_id(make_request()) is None
+        and bearer_user_id(Request({"type": "http", "headers": [(b"authorization", b"Bearer bad")]})) is None,
+    )
+
+    router = ReadReplicaRouter()
+    factory = await router.session_factory_for(1)
+    print_test("未启用副本时使用主库", factory is AsyncSessionLocal and router.routed["disabled"] == 1)
+
+    router = healthy_router()
+    print_test("副本可用且延迟未超限时使用副本", await router.session_factory_for(1) is FakeSession)
+
+    router = healthy_router(lag=settings.READ_REPLICA_MAX_LAG + 1)
+    print_test("复制延迟超限时回退到主库", await router.session_factory_for(1) is AsyncSessionLocal
+               and router.routed["lag"] == 1)
+
+    router = healthy_router()
+    router.mark_unavailable(ConnectionRefusedError("副本已停止"))
+    print_test("副本不可用时回退到主库", await router.session_factory_for(1) is AsyncSessionLocal
+               and router.routed["unavailable"] == 1)
+
+    router = healthy_router()
+    router.last_checked -= settings.READ_REPLICA_CHECK_INTERVAL * 4
+    print_test("延迟检查停滞时不再信任上次结果", router.fallback_reason() == "unavailable")
+
+    original = settings.READ_YOUR_WRITES_WINDOW
+    settings.READ_YOUR_WRITES_WINDOW = 0.05
+    try:
+        router = healthy_router()
+        router.mark_write(7)
+        writer = await router.session_factory_for(7)
+        other = await router.session_factory_for(8)
+        await asyncio.sleep(0.06)
+        expired = await router.session_factory_for(7)
+    finally:
+        settings.READ_YOUR_WRITES_WINDOW = original
+    print_test(
+        "读己之写：写入者在窗口内读主库，其他用户读副本，窗口过后恢复",
+        writer is AsyncSessionLocal and other is FakeSession and expired is FakeSession
+        and dict(router.routed) == {"sticky": 1, "replica": 2},
+        str(dict(router.routed)),
+    )
+
+
+def run_session_event_checks():
+    original = read_replica.replica_router
+    router = read_replica.replica_router = healthy_router()
+    try:
+        log_only = SimpleNamespace(new=[OperationLog()], dirty=[], deleted=[], info={})
+        read_replica._track_flush(log_only, None)
+        print_test("只写操作日志不算写入", "read_replica_wrote" not in log_only.info)
+
+        request = make_request(21)
+        wrote = SimpleNamespace(new=[OperationLog(), Message()], dirty=[], deleted=[], info={"request": request})
+        read_replica._track_flush(wrote, None)
+        read_replica._mark_committed_writes(wrote)
+        print_test("提交写入后按请求令牌登记读己之写", 21 in router._sticky and "read_replica_wrote" not in wrote.info)
+
+        rolled_back = SimpleNamespace(new=[Message()], dirty=[], deleted=[], info={"request": make_request(22)})
+        read_replica._track_flush(rolled_back, None)
+        read_replica._discard_rolled_back_writes(rolled_back)
+        read_replica._mark_committed_writes(rolled_back)
+        print_test("回滚的写入不登记", 22 not in router._sticky)
+    finally:
+        read_replica.replica_router = original
+
+
+async def run_dependency_checks():
+    original = read_replica.replica_router
+    router = read_replica.replica_router = healthy_router()
+    try:
+        dependency = get_read_db(make_request(5))
+        session = await dependency.__anext__()
+        try:
+            await dependency.athrow(ConnectionResetError("连接被重置"))
+        except ConnectionResetError:
+            pass
+    finally:
+        read_replica.replica_router = original
+    print_test(
+        "副本连接失败时回滚、关闭会话并标记副本不可用",
+        session.calls == ["rollback", "close"] and not router.available and router.fallback_reason() == "unavailable",
+        str(session.calls),
+    )
+
+
+def main():
+    logger.disable("app.db.read_replica")
+    asyncio.run(run_routing_checks())
+    run_session_event_checks()
+    asyncio.run(run_dependency_checks())
+    print(f"\n通过 {results['passed']} 项，失败 {results['failed']} 项")
+    sys.exit(0 if results["failed"] == 0 else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+运行时指标测试
+校验 app.core.runtime_metrics：
+- 分位数（最近秩法）与样本窗口统计
+- 事件循环延迟采样能发现同步阻塞并计为阻塞次数
+- 数据库引擎使用记录取连接耗时的连接池，连接池峰值/溢出计数
+- unit_of_work：正常退出提交、只读不提交、异常回滚，退出时都关闭会话；Socket.io 与后台任务不再使用 get_db() 或直接 db.get_session()
+
+不需要数据库与 Redis。
+
+用法：
+    python scripts/test_runtime_metrics.py
+"""
+
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from loguru import logger
+
+from app.core.config import settings
+from app.core.runtime_metrics import DbPoolMetrics, EventLoopMonitor, LatencyWindow, percentile
+
+results = {"passed": 0, "failed": 0}
+
+
+def print_test(name, status, details=""):
+    """打印测试结果"""
+    status_symbol = "[通过]" if status else "[失败]"
+    print(f"{status_symbol} {name}")
+    if details:
+        print(f"   详情: {details}")
+    results["passed" if status else "failed"] += 1
+
+
+def run_window_checks():
+    values = list(range(1, 101))
+    print_test(
+        "分位数（最近秩法）",
+        percentile(values, 50) == 50 and percentile(values, 99) == 99 and percentile(values, 100) == 100
+        and percentile([], 99) == 0.0,
+    )
+
+    window = LatencyWindow(size=10)
+    for ms in range(1, 21):
+        window.record(ms / 1000)
+    snapshot = window.snapshot()
+    print_test(
+        "窗口只保留最近样本，累计值覆盖全部样本",
+        snapshot["count"] == 20 and snapshot["p50_ms"] == 15.0 and snapshot["max_ms"] == 20.0
+        and snapshot["avg_ms"] == 10.5,
+        str(snapshot),
+    )
+
+
+async def run_loop_checks():
+    original = settings.LOOP_LAG_SAMPLE_INTERVAL, settings.LOOP_LAG_STALL_THRESHOLD
+    settings.LOOP_LAG_SAMPLE_INTERVAL, settings.LOOP_LAG_STALL_THRESHOLD = 0.01, 0.1
+    monitor = EventLoopMonitor()
+    try:
+        await monitor.start()
+        await asyncio.sleep(0.1)
+        idle = monitor.stats()
+        time.sleep(0.3)  # 模拟同步阻塞
+        await asyncio.sleep(0.05)
+        blocked = monitor.stats()
+    finally:
+        await monitor.stop()
+        settings.LOOP_LAG_SAMPLE_INTERVAL, settings.LOOP_LAG_STALL_THRESHOLD = original
+
+    print_test("空闲时事件循环延迟很小", idle["count"] > 3 and idle["p50_ms"] < 20, str(idle))
+    print_test(
+        "同步阻塞被计为一次阻塞，最大延迟约为阻塞时长",
+        blocked["stalls"] == 1 and 250 <= blocked["max_ms"] < 600,
+        str(blocked),
+    )
+    print_test("停止后不再采样", monitor._task is None)
+
+
+def run_pool_checks():
+    from app.db.session import InstrumentedQueuePool, engine
+
+    print_test("数据库引擎使用记录取连接耗时的连接池", isinstance(engine.pool, InstrumentedQueuePool))
+
+    metrics = DbPoolMetrics()
+    for wait, checked_out, overflow in [(0.001, 3, 0), (0.002, 12, 2), (0.003, 8, 0), (0.004, 11, 1)]:
+        metrics.record_checkout(wait, checked_out, overflow)
+    stats = metrics.stats()
+    print_test(
+        "连接池借出/溢出峰值与溢出取连接次数",
+        stats["peak_checked_out"] == 12 and stats["peak_overflow"] == 2 and stats["overflow_checkouts"] == 2
+        and stats["wait"]["count"] == 4,
+        str(stats),
+    )
+
+
+class FakeSession:
+    """记录提交/回滚/关闭调用的会话"""
+
+    def __init__(self):
+        self.calls = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def commit(self):
+        self.calls.append("commit")
+
+    async def rollback(self):
+        self.calls.append("rollback")
+
+    async def close(self):
+        self.calls.append("close")
+
+
+async def run_unit_of_work_checks():
+    import app.db.session as session_module
+
+    sessions = []
+
+    def factory():
+        sessions.append(FakeSession())
+        return sessions[-1]
+
+    original = session_module.AsyncSessionLocal
+    session_module.AsyncSessionLocal = factory
+    try:
+        async with session_module.unit_of_work():
+            pass
+        async with session_module.unit_of_work(read_only=True):
+            pass
+        try:
+            async with session_module.unit_of_work():
+                raise RuntimeError("写入失败")
+        except RuntimeError:
+            pass
+    finally:
+        session_module.AsyncSessionLocal = original
+
+    print_test("正常退出提交并关闭会话", sessions[0].calls == ["commit", "close"], str(sessions[0].calls))
+    print_test("只读不提交，直接关闭会话", sessions[1].calls == ["close"], str(sessions[1].calls))
+    print_test("异常时回滚并关闭会话", sessions[2].calls == ["rollback", "close"], str(sessions[2].calls))
+
+    root = Path(__file__).parent.parent
+    leftovers = [
+        name for name in (
+            "app/core/socketio.py", "app/core/file_dump.py", "app/core/presence_writer.py",
+            "app/core/presence_fanout.py", "app/core/message_ingest.py", "app/core/blob_store.py",
+        )
+        if any(call in (root / name).read_text(encoding="utf-8") for call in ("get_db()", "db.get_session("))
+    ]
+    print_test("Socket.io 与后台任务只通过 unit_of_work 取会话", not leftovers, ", ".join(leftovers))
+
+
+def main():
+    logger.disable("app.core.runtime_metrics")
+    run_window_checks()
+    asyncio.run(run_loop_checks())
+    run_pool_checks()
+    asyncio.run(run_unit_of_work_checks())
+    print(f"\n通过 {results['passed']} 项，失败 {results['failed']} 项")
+    sys.exit(0 if results["failed"] == 0 else 1)
+
+
+if __name__ == "__main__":
+    main()
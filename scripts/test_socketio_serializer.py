@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Socket.io 按连接协商编码测试
+使用记录收发的伪 Engine.IO 层校验 app.core.socketio_serializer：
+- JSON 客户端（文本 CONNECT 包）收发保持 JSON 文本，与原实现逐字节一致
+- msgpack 客户端（二进制 CONNECT 包）的 CONNECT 应答、事件、ack 都是 MessagePack
+- 广播到混合房间时每种编码只编码一次，各连接收到自己编码的帧
+- bytes 数据发给 msgpack 连接时内联，不拆附件包
+- 未启用 msgpack 时二进制 CONNECT 包的连接被断开
+
+不需要数据库与 Redis（需要安装 msgpack）。
+
+用法：
+    python scripts/test_socketio_serializer.py
+"""
+
+import asyncio
+import itertools
+import sys
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from loguru import logger
+
+from socketio import packet
+from socketio.msgpack_packet import MsgPackPacket
+
+from app.core.socketio_serializer import SerializerAwareManager, SerializerAwareServer
+
+results = {"passed": 0, "failed": 0}
+
+
+def print_test(name, status, details=""):
+    """打印测试结果"""
+    status_symbol = "[通过]" if status else "[失败]"
+    print(f"{status_symbol} {name}")
+    if details:
+        print(f"   详情: {details}")
+    results["passed" if status else "failed"] += 1
+
+
+class FakeEngineIO:
+    """记录发往每个 Engine.IO 会话的数据"""
+
+    def __init__(self):
+        self.sent = {}
+        self.disconnected = []
+        self._ids = itertools.count(1)
+
+        self.tasks = []
+
+    def generate_id(self):
+        return f"sid-{next(self._ids)}"
+
+    def start_background_task(self, target, *args, **kwargs):
+        task = asyncio.ensure_future(target(*args, **kwargs))
+        self.tasks.append(task)
+        return task
+
+    async def drain(self):
+        """等待事件处理任务完成"""
+        tasks, self.tasks = self.tasks, []
+        await asyncio.gather(*tasks)
+
+    async def send(self, eio_sid, data):
+        self.sent.setdefault(eio_sid, []).append(data)
+
+    async def send_packet(self, eio_sid, eio_pkt):
+        self.sent.setdefault(eio_sid, []).append(eio_pkt.data)
+
+    async def disconnect(self, eio_sid):
+        self.disconnected.append(eio_sid)
+
+
+def build_server(msgpack_enabled=True):
+    server = SerializerAwareServer(
+        async_mode='asgi', client_manager=SerializerAwareManager(), msgpack_enabled=msgpack_enabled
+    )
+    server.eio = FakeEngineIO()
+
+    @server.event
+    async def connect(sid, environ, auth=None):
+        await server.enter_room(sid, "chat")
+        return True
+
+    @server.event
+    async def echo(sid, data):
+        return {"echo": data}
+
+    return server
+
+
+def msgpack_frame(packet_type, data=None, id=None):
+    return MsgPackPacket(packet_type, data=data, namespace="/", id=id).encode()
+
+
+def decode(frame):
+    if isinstance(frame, (bytes, bytearray)):
+        return "msgpack", MsgPackPacket(encoded_packet=frame)
+    return "json", packet.Packet(encoded_packet=frame)
+
+
+async def connect_clients(server):
+    for eio_sid in ("eio-json", "eio-msgpack"):
+        await server._handle_eio_connect(eio_sid, {"QUERY_STRING": ""})
+    await server._handle_eio_message("eio-json", "0")
+    await server._handle_eio_message("eio-msgpack", msgpack_frame(packet.CONNECT))
+    sids = {eio_sid: server.manager.sid_from_eio_sid(eio_sid, "/") for eio_sid in ("eio-json", "eio-msgpack")}
+    server.eio.sent.clear()
+    return sids
+
+
+async def run_negotiation_checks():
+    server = build_server()
+    for eio_sid in ("eio-json", "eio-msgpack"):
+        await server._handle_eio_connect(eio_sid, {"QUERY_STRING": ""})
+    await server._handle_eio_message("eio-json", "0")
+    await server._handle_eio_message("eio-msgpack", msgpack_frame(packet.CONNECT))
+
+    json_reply = server.eio.sent["eio-json"][0]
+    kind, msgpack_reply = decode(server.eio.sent["eio-msgpack"][0])
+    print_test("JSON 客户端的 CONNECT 应答为文本", isinstance(json_reply, str) and json_reply.startswith("0{"), json_reply)
+    print_test(
+        "msgpack 客户端的 CONNECT 应答为 MessagePack",
+        kind == "msgpack" and msgpack_reply.packet_type == packet.CONNECT and "sid" in msgpack_reply.data,
+    )
+    stats = server.serializer_stats()
+    print_test("按编码统计连接数", stats["msgpack_connections"] == 1 and stats["json_connections"] == 1, str(stats))
+
+    server.eio.sent.clear()
+    await server._handle_eio_message("eio-json", '21["echo","hi"]')
+    await server._handle_eio_message("eio-msgpack", msgpack_frame(packet.EVENT, ["echo", "hi"], id=7))
+    await server.eio.drain()
+    json_ack = server.eio.sent["eio-json"][0]
+    kind, ack = decode(server.eio.sent["eio-msgpack"][0])
+    print_test("JSON 客户端的 ack 保持原格式", json_ack == '31[{"echo":"hi"}]', json_ack)
+    print_test(
+        "msgpack 客户端的事件按 msgpack 解码，ack 为 MessagePack",
+        kind == "msgpack" and ack.packet_type == packet.ACK and ack.id == 7 and ack.data == [{"echo": "hi"}],
+    )
+
+    await server._handle_eio_disconnect("eio-msgpack")
+    print_test("断开后清理编码登记", not server.has_msgpack_connections)
+
+
+async def run_broadcast_checks():
+    server = build_server()
+    sids = await connect_clients(server)
+    original_encode = MsgPackPacket.encode
+    encode_count = {"msgpack": 0}
+
+    def counting_encode(self):
+        encode_count["msgpack"] += 1
+        return original_encode(self)
+
+    MsgPackPacket.encode = counting_encode
+    try:
+        for index in range(3):
+            eio_sid = f"eio-extra-{index}"
+            await server._handle_eio_connect(eio_sid, {"QUERY_STRING": ""})
+            await server._handle_eio_message(eio_sid, msgpack_frame(packet.CONNECT))
+        server.eio.sent.clear()
+        encode_count["msgpack"] = 0
+        payload = {"friends": [1, 2, 3], "count": 3}
+        await server.emit("online_friends", payload, room="chat")
+    finally:
+        MsgPackPacket.encode = original_encode
+
+    json_frames = server.eio.sent["eio-json"]
+    msgpack_frames = [server.eio.sent[f"eio-extra-{i}"][0] for i in range(3)] + server.eio.sent["eio-msgpack"]
+    print_test("广播：JSON 连接收到文本帧", json_frames == ['2["online_friends",{"friends":[1,2,3],"count":3}]'], str(json_frames))
+    print_test(
+        "广播：msgpack 连接收到同一份 MessagePack 帧",
+        len(msgpack_frames) == 4 and len(set(msgpack_frames)) == 1
+        and decode(msgpack_frames[0])[1].data == ["online_friends", payload],
+    )
+    print_test("广播：msgpack 编码只执行一次", encode_count["msgpack"] == 1, f"encode={encode_count['msgpack']}")
+
+    server.eio.sent.clear()
+    await server.emit("file_chunk", {"data": b"\x00\x01"}, to=sids["eio-msgpack"])
+    await server.emit("file_chunk", {"data": b"\x00\x01"}, to=sids["eio-json"])
+    kind, pkt = decode(server.eio.sent["eio-msgpack"][0])
+    print_test(
+        "bytes 数据发给 msgpack 连接时内联为单帧",
+        len(server.eio.sent["eio-msgpack"]) == 1 and pkt.packet_type == packet.EVENT and pkt.data[1]["data"] == b"\x00\x01",
+    )
+    print_test("bytes 数据发给 JSON 连接时仍拆为附件包", len(server.eio.sent["eio-json"]) == 2)
+
+
+async def run_disabled_checks():
+    server = build_server(msgpack_enabled=False)
+    await server._handle_eio_connect("eio-msgpack", {"QUERY_STRING": ""})
+    await server._handle_eio_message("eio-msgpack", msgpack_frame(packet.CONNECT))
+    print_test(
+        "未启用 msgpack 时断开二进制 CONNECT 的连接",
+        server.eio.disconnected == ["eio-msgpack"] and server.serializer_stats()["rejected_binary_connects"] == 1,
+    )
+    await server._handle_eio_connect("eio-json", {"QUERY_STRING": ""})
+    await server._handle_eio_message("eio-json", "0")
+    print_test("未启用 msgpack 时 JSON 客户端正常连接", server.eio.sent["eio-json"][0].startswith("0{"))
+
+
+def main():
+    logger.disable("app.core.socketio_serializer")
+    asyncio.run(run_negotiation_checks())
+    asyncio.run(run_broadcast_checks())
+    asyncio.run(run_disabled_checks())
+    print(f"\n通过 {results['passed']} 项，失败 {results['failed']} 项")
+    sys.exit(0 if results["failed"] == 0 else 1)
+
+
+if __name__ == "__main__":
+    main()
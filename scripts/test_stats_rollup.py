@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+统计汇总测试
+校验 app.core.stats_rollup：
+- 消息、已读、通话（新建与更新差值）登记的增量
+- 读取时合并本 worker 未写入的增量，不存在的计数器为 0
+- 增量写入为一条累加 upsert，失败时放回缓冲
+- 对账：SQL 可按 PostgreSQL 编译，结果覆盖全局、当日与按用户计数器；其他 worker 正在对账时跳过
+
+不需要数据库与 Redis（数据库会话以记录语句的假会话代替）。
+
+用法：
+    python scripts/test_stats_rollup.py
+"""
+
+import asyncio
+import sys
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from loguru import logger
+from sqlalchemy.dialects import postgresql
+
+import app.core.stats_rollup as rollup_module
+from app.core.config import settings
+from app.core.stats_rollup import (
+    StatsRollup, call_deltas, day_scope,
+    CALLS_AUDIO, CALLS_CONNECTED, CALLS_DURATION, CALLS_TOTAL, CALLS_VIDEO,
+    MESSAGES_DAY, MESSAGES_P2P, MESSAGES_ROOM, MESSAGES_TOTAL, MESSAGES_UNREAD, USERS_ONLINE, USERS_TOTAL,
+)
+from app.db.models import Call, Message
+
+results = {"passed": 0, "failed": 0}
+
+
+def print_test(name, status, details=""):
+    """打印测试结果"""
+    status_symbol = "[通过]" if status else "[失败]"
+    print(f"{status_symbol} {name}")
+    if details:
+        print(f"   详情: {details}")
+    results["passed" if status else "failed"] += 1
+
+
+class FakeResult:
+    def __init__(self, value):
+        self.value = value
+
+    def scalar(self):
+        return self.value
+
+    scalar_one_or_none = scalar
+
+    def one(self):
+        return self.value
+
+    def all(self):
+        return self.value
+
+
+class FakeSession:
+    """按顺序返回预设结果并记录执行的语句"""
+
+    def __init__(self, responses=(), fail=False):
+        self.responses = list(responses)
+        self.statements = []
+        self.fail = fail
+
+    async def execute(self, statement):
+        if self.fail:
+            raise ConnectionRefusedError("数据库不可用")
+        self.statements.append(statement)
+        return FakeResult(self.responses.pop(0) if self.responses else None)
+
+
+def patch_unit_of_work(session):
+    @asynccontextmanager
+    async def fake_unit_of_work(read_only=False):
+        yield session
+
+    rollup_module.unit_of_work = fake_unit_of_work
+
+
+def compile_pg(statement) -> str:
+    return str(statement.compile(dialect=postgresql.dialect()))
+
+
+def run_delta_checks():
+    rollup = StatsRollup()
+    now = datetime(2026, 10, 17, 9, 30)
+    rollup.record_messages([
+        Message(sender_id=1, receiver_id=2, is_read=False, created_at=now),
+        Message(sender_id=1, room_id=5, is_read=False, created_at=now),
+        Message(sender_id=2, receiver_id=1, is_read=True, created_at=now - timedelta(days=1)),
+    ])
+    rollup.record_messages_read(1)
+    pending = rollup._pending
+    print_test(
+        "消息登记总数、点对点/房间、未读与按天增量",
+        pending[(MESSAGES_TOTAL, 0)] == 3 and pending[(MESSAGES_P2P, 0)] == 2 and pending[(MESSAGES_ROOM, 0)] == 1
+        and pending[(MESSAGES_UNREAD, 0)] == 1 and pending[(MESSAGES_DAY, 20261017)] == 2
+        and pending[(MESSAGES_DAY, 20261016)] == 1,
+        str(dict(pending)),
+    )
+
+    rollup = StatsRollup()
+    call = Call(caller_id=1, callee_id=2, call_type="video", call_status="initiated")
+    rollup.record_call(call)
+    previous = call_deltas(call)
+    call.call_status, call.duration = "connected", 30
+    rollup.record_call(call, previous)
+    self_call = Call(caller_id=3, callee_id=3, call_type="audio", call_status="missed")
+    rollup.record_call(self_call)
+    pending = rollup._pending
+    print_test(
+        "通话按参与者登记，更新时只登记差值，自己呼叫自己只计一次",
+        all(pending[(CALLS_TOTAL, uid)] == 1 and pending[(CALLS_VIDEO, uid)] == 1
+            and pending[(CALLS_CONNECTED, uid)] == 1 and pending[(CALLS_DURATION, uid)] == 30 for uid in (1, 2))
+        and pending[(CALLS_TOTAL, 3)] == 1 and pending[(CALLS_AUDIO, 3)] == 1,
+        str({key: delta for key, delta in pending.items() if delta}),
+    )
+
+
+async def run_read_checks():
+    rollup = StatsRollup()
+    rollup.add(USERS_ONLINE, 2)
+    session = FakeSession([[(USERS_TOTAL, 0, 10), (USERS_ONLINE, 0, 3)]])
+    values = await rollup.read(session, USERS_TOTAL, USERS_ONLINE, (MESSAGES_DAY, 20261017))
+    print_test(
+        "读取按主键查询，合并本 worker 未写入的增量，不存在的计数器为 0",
+        values == {USERS_TOTAL: 10, USERS_ONLINE: 5, MESSAGES_DAY: 0}
+        and "(stats_counters.name, stats_counters.scope) IN" in compile_pg(session.statements[0]),
+        str(values),
+    )
+    stale_after = rollup.stale_after()
+    print_test(
+        "stale_after 为当前时间加写入间隔",
+        abs((stale_after - datetime.utcnow()).total_seconds() - settings.STATS_ROLLUP_FLUSH_INTERVAL) < 1,
+    )
+
+
+async def run_flush_checks():
+    rollup = StatsRollup()
+    rollup.add(USERS_TOTAL)
+    rollup.add(USERS_ONLINE, 1)
+    rollup.add(USERS_ONLINE, -1)
+    session = FakeSession()
+    patch_unit_of_work(session)
+    written = await rollup.flush()
+    sql = compile_pg(session.statements[0])
+    print_test(
+        "增量合并为一条累加 upsert，抵消为 0 的计数器不写入",
+        written == 1 and "ON CONFLICT (name, scope) DO UPDATE SET value = (stats_counters.value + excluded.value)" in sql
+        and not any(rollup._pending.values()),
+        sql.split("ON CONFLICT")[1].strip(),
+    )
+
+    rollup.add(USERS_TOTAL, 2)
+    patch_unit_of_work(FakeSession(fail=True))
+    written = await rollup.flush()
+    rollup.add(USERS_TOTAL, 1)
+    print_test("写入失败时增量放回缓冲并与新增量合并", written == 0 and rollup._pending[(USERS_TOTAL, 0)] == 3)
+
+
+async def run_reconcile_checks():
+    rollup = StatsRollup()
+    today = day_scope(datetime.utcnow())
+    session = FakeSession([
+        True,                        # advisory 锁
+        None,                        # 尚未对账
+        (10, 3, 12, 4, 2, 6, 5),     # 用户/在线/设备/房间/活跃房间/邀请码/有效邀请码
+        (100, 7, 60, 40, 9),         # 消息总数/未读/点对点/房间/今日
+        [(1, 2, 1, 1, 1, 0, 45)],    # 用户1的通话
+    ])
+    patch_unit_of_work(session)
+    done = await rollup.reconcile()
+    sqls = [compile_pg(statement) for statement in session.statements]
+    upsert = session.statements[-1]
+    # 多行 VALUES 的参数（键为列对象）
+    rows = [{getattr(column, "key", column): value for column, value in row.items()} for row in upsert._multi_values[0]]
+    rows = {(row["name"], row["scope"]): row["value"] for row in rows}
+    print_test("对账 SQL 可按 PostgreSQL 编译", len(sqls) == 8, str(len(sqls)))
+    print_test(
+        "对账覆盖全局、当日与按用户计数器",
+        done and rows[(USERS_TOTAL, 0)] == 10 and rows[(USERS_ONLINE, 0)] == 3 and rows[(MESSAGES_ROOM, 0)] == 40
+        and rows[(MESSAGES_DAY, today)] == 9 and rows[(CALLS_TOTAL, 1)] == 2 and rows[(CALLS_DURATION, 1)] == 45
+        and "DO UPDATE SET value = excluded.value" in sqls[-1] and "FILTER (WHERE" in sqls[3],
+        str(len(rows)),
+    )
+
+    session = FakeSession([False])
+    patch_unit_of_work(session)
+    skipped = not await rollup.reconcile()
+    session = FakeSession([True, datetime.utcnow() - timedelta(seconds=10)])
+    patch_unit_of_work(session)
+    recent = not await rollup.reconcile()
+    print_test("其他 worker 正在对账或刚完成对账时跳过", skipped and recent and rollup.counters["reconciles"] == 1)
+
+
+def main():
+    logger.disable("app.core.stats_rollup")
+    original = rollup_module.unit_of_work
+    try:
+        run_delta_checks()
+        asyncio.run(run_read_checks())
+        asyncio.run(run_flush_checks())
+        asyncio.run(run_reconcile_checks())
+    finally:
+        rollup_module.unit_of_work = original
+    print(f"\n通过 {results['passed']} 项，失败 {results['failed']} 项")
+    sys.exit(0 if results["failed"] == 0 else 1)
+
+
+if __name__ == "__main__":
+    main()
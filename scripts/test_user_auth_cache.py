@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+用户鉴权缓存测试
+使用计数的伪数据库会话驱动 get_current_user 依赖与 user_auth_cache，校验命中、TTL 过期、LRU 淘汰、
+显式失效，并模拟一段请求流量统计命中率与每请求的 users 查询数。
+不需要数据库与 Redis。
+
+用法：
+    python scripts/test_user_auth_cache.py [--requests 20000] [--users 500]
+"""
+
+import argparse
+import asyncio
+import random
+import sys
+import time
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from fastapi import HTTPException
+
+from app.api.v1.auth import get_current_user
+from app.core.config import settings
+from app.core.security import create_access_token
+from app.core.user_cache import UserAuthCache
+
+results = {"passed": 0, "failed": 0}
+
+
+def print_test(name, status, details=""):
+    """打印测试结果"""
+    status_symbol = "[通过]" if status else "[失败]"
+    print(f"{status_symbol} {name}")
+    if details:
+        print(f"   详情: {details}")
+    results["passed" if status else "failed"] += 1
+
+
+class FakeResult:
+    def __init__(self, row):
+        self._row = row
+
+    def one_or_none(self):
+        return self._row
+
+
+class FakeSession:
+    """按 user_id 返回鉴权字段行，并统计查询次数"""
+
+    def __init__(self, users):
+        self.users = users
+        self.queries = 0
+
+    async def execute(self, stmt):
+        self.queries += 1
+        user_id = stmt.compile().params["id_1"]
+        return FakeResult(self.users.get(user_id))
+
+
+def make_users(count: int):
+    return {
+        uid: (uid, f"user{uid}", f"昵称{uid}", "user", False, False, "zh_CN")
+        for uid in range(1, count + 1)
+    }
+
+
+async def run_checks():
+    users = make_users(10)
+    session = FakeSession(users)
+    cache = UserAuthCache()
+
+    user = await cache.load(session, 1)
+    again = await cache.load(session, 1)
+    print_test(
+        "首次未命中查询数据库，再次命中不查询",
+        user is not None and again is user and session.queries == 1,
+        f"queries={session.queries}",
+    )
+
+    missing = await cache.load(session, 999)
+    await cache.load(session, 999)
+    print_test("不存在的用户不缓存", missing is None and session.queries == 3, f"queries={session.queries}")
+
+    users[1] = (1, "user1", "昵称1", "user", False, True, "zh_CN")
+    stale = await cache.load(session, 1)
+    await cache.invalidate(1)
+    fresh = await cache.load(session, 1)
+    print_test(
+        "失效后重新加载最新的禁用状态",
+        stale.is_disabled is False and fresh.is_disabled is True,
+        f"stale={stale.is_disabled}, fresh={fresh.is_disabled}",
+    )
+
+    original_ttl = settings.USER_CACHE_LOCAL_TTL
+    settings.USER_CACHE_LOCAL_TTL = 0.05
+    try:
+        await cache.load(session, 2)
+        before = session.queries
+        time.sleep(0.06)
+        await cache.load(session, 2)
+        print_test("TTL 过期后重新查询", session.queries == before + 1, f"queries={session.queries - before}")
+    finally:
+        settings.USER_CACHE_LOCAL_TTL = original_ttl
+
+    original_size = settings.USER_CACHE_MAX_SIZE
+    settings.USER_CACHE_MAX_SIZE = 3
+    try:
+        lru = UserAuthCache()
+        for uid in (1, 2, 3):
+            await lru.load(session, uid)
+        await lru.load(session, 1)  # 1 变为最近使用
+        await lru.load(session, 4)  # 淘汰最久未使用的 2
+        before = session.queries
+        await lru.load(session, 1)
+        await lru.load(session, 2)
+        print_test(
+            "LRU 淘汰最久未使用的条目",
+            session.queries == before + 1 and len(lru._local) == 3,
+            f"queries={session.queries - before}, size={len(lru._local)}",
+        )
+    finally:
+        settings.USER_CACHE_MAX_SIZE = original_size
+
+    token = create_access_token({"sub": "3"})
+    first = await get_current_user(token=token, db=session)
+    before = session.queries
+    second = await get_current_user(token=token, db=session)
+    print_test(
+        "get_current_user 命中缓存时不查询数据库",
+        first.id == 3 and second is first and session.queries == before,
+        f"queries={session.queries - before}",
+    )
+    try:
+        await get_current_user(token=create_access_token({"sub": "999"}), db=session)
+        print_test("不存在的用户返回 401", False)
+    except HTTPException as e:
+        print_test("不存在的用户返回 401", e.status_code == 401, f"status={e.status_code}")
+
+    stats = cache.stats()
+    print_test("统计包含命中率与节省的查询数", "hit_rate" in stats and stats["db_queries_saved"] > 0, str(stats))
+
+
+async def simulate(requests: int, user_count: int):
+    """模拟请求流量：少量活跃用户贡献大部分请求，期间偶尔修改用户并失效"""
+    users = make_users(user_count)
+    session = FakeSession(users)
+    cache = UserAuthCache()
+    weights = [1 / rank for rank in range(1, user_count + 1)]
+    ids = random.choices(range(1, user_count + 1), weights=weights, k=requests)
+    for index, uid in enumerate(ids):
+        if index % 1000 == 0:
+            await cache.invalidate(random.randint(1, user_count))
+        await cache.load(session, uid)
+    stats = cache.stats()
+    print("-" * 60)
+    print(f"模拟 {requests} 次请求 / {user_count} 个用户：")
+    print(f"  命中率 {stats['hit_rate']:.2%}，users 查询 {session.queries} 次（无缓存时 {requests} 次）")
+    print(f"  每请求查询数 {session.queries / requests:.4f}，节省 {stats['db_queries_saved']} 次")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="用户鉴权缓存测试")
+    parser.add_argument("--requests", type=int, default=20000, help="模拟请求数")
+    parser.add_argument("--users", type=int, default=500, help="模拟用户数")
+    args = parser.parse_args()
+
+    random.seed(42)
+    asyncio.run(run_checks())
+    asyncio.run(simulate(args.requests, args.users))
+    print(f"\n通过 {results['passed']} 项，失败 {results['failed']} 项")
+    sys.exit(0 if results["failed"] == 0 else 1)
+
+
+if __name__ == "__main__":
+    main()
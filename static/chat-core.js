@@ -278,10 +278,20 @@
             }
         });
         
-        state.socket.on('message_read', (data) => {
-            if (window.ChatMessages && window.ChatMessages.updateReadStatus) {
-                window.ChatMessages.updateReadStatus(data.message_id, data.read_at);
+        // 已读回执：每个阅读者一帧，携带消息ID列表或水位 up_to_id（对方已读自己发给他的、ID 不大于该值的消息）
+        state.socket.on('messages_read', (data) => {
+            if (!window.ChatMessages || !window.ChatMessages.updateReadStatus) {
+                return;
             }
+            let messageIds = data.message_ids || [];
+            if (data.up_to_id) {
+                messageIds = (state.chatMessages || [])
+                    .filter(msg => msg.receiver_id === data.read_by && msg.id <= data.up_to_id && !msg.is_read)
+                    .map(msg => msg.id);
+            }
+            messageIds.forEach(msgId => {
+                window.ChatMessages.updateReadStatus(msgId, data.read_at);
+            });
         });
         
         state.socket.on('message_read_confirmed', (data) => {